@@ -7,15 +7,19 @@ Date Created: January 26, 2020
 """
 
 import time
+import random
 import os.path
 import logging
+import threading
+import concurrent.futures
 import requests
 import numpy as np
-import matplotlib.pyplot as plt
+from urllib3.exceptions import NewConnectionError
 
 # import modules from project MicroscopeAutomation
 from microscope_automation.util.automation_exceptions import (
     HardwareError,
+    HardwareTimeoutError,
     LoadNotDefinedError,
     WorkNotDefinedError,
     HardwareCommandNotDefinedError,
@@ -25,6 +29,7 @@ from microscope_automation.settings.slidebook_experiment_info import (
     SlidebookExperiment,
 )
 from microscope_automation.util.image_AICS import ImageAICS
+from microscope_automation.util import polling
 
 try:
     from microscope_automation.hardware.RS232 import Braintree
@@ -34,9 +39,65 @@ except ImportError:
 # Create Logger
 log = logging.getLogger(__name__)
 
+# timeouts in s to connect to service and to wait for response between bytes
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 30
+# number of times a failed request is repeated
+RETRIES = 3
+# wait before first retry and maximum wait between retries in s.
+# Waits double after each retry and are randomized to avoid requests in lock step.
+RETRY_WAIT = 0.05
+RETRY_MAX_WAIT = 1
+# status codes of responses that indicate that service is temporarily not available
+RETRY_STATUS_CODES = (502, 503, 504)
+# methods that can be repeated without side effects
+IDEMPOTENT_METHODS = ("GET", "HEAD", "DELETE")
+# maximum number of open connections kept for each service
+POOL_SIZE = 4
+# images are streamed from data service in chunks of CHUNK_SIZE bytes
+CHUNK_SIZE = 1 << 20
+# time to wait for next image when prefetching in s
+PREFETCH_TIMEOUT = 60
+# longest interval between checks for new image when prefetching in s
+PREFETCH_MAX_INTERVAL = 0.2
+
+
+def backoff_wait(attempt, wait=RETRY_WAIT, max_wait=RETRY_MAX_WAIT):
+    """Time to wait before next attempt with exponential backoff and full jitter.
+
+    Input:
+     attempt: number of failed attempts so far (starting with 0)
+
+     wait: wait before first retry in s
+
+     max_wait: upper limit for wait in s
+
+    Output:
+     wait_time: random time between 0 and wait * 2**attempt, at most max_wait
+    """
+    return random.uniform(0, min(max_wait, wait * 2**attempt))
+
+
+def request_not_sent(error):
+    """Check if request failed before it reached the service,
+    e.g. because the connection was refused or timed out.
+
+    Input:
+     error: requests.exceptions.ConnectionError raised by request
+
+    Output:
+     not_sent: True if request can be repeated without side effects
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
 
 def show_image(image, meta_data):
     """Show image"""
+    import matplotlib.pyplot as plt
+
     plt.imshow(image)
     plt.title(meta_data["time_stamp"])
     plt.show()
@@ -51,6 +112,8 @@ class ConnectMicroscope:
         data_url="http://127.0.0.1:5100",
         microscope="3iW1-0",
         dummy=False,
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        retries=RETRIES,
     ):
         """Connect to command and data services that function as bridge
         to the MatLab macro that controls 3i Slidebook
@@ -62,6 +125,11 @@ class ConnectMicroscope:
 
             microscope: microscope that should have connected to command and data server
 
+            timeout: tuple with timeouts to connect and to read response in s
+
+            retries: number of times a request is repeated if service
+            is not available
+
         Output:
          none
         """
@@ -69,6 +137,19 @@ class ConnectMicroscope:
         self.data_url = data_url + "/data"
         self.microscope = microscope
         self.dummy = dummy
+        self.timeout = timeout
+        self.retries = retries
+
+        # keep connections to services open and reuse them for all requests
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=2, pool_maxsize=POOL_SIZE
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # background download of next image (see load_image)
+        self._executor = None
+        self._prefetch = None
 
         if self.dummy:
             self.default_experiment = {
@@ -95,7 +176,7 @@ class ConnectMicroscope:
         # Test commands server. This server send commands to the microscope.
         # The commands are stored in a queue and worked on in the order they were posted
         try:
-            cmd_response = requests.get(self.cmd_url + "/about")
+            cmd_response = self._request("GET", self.cmd_url + "/about")
             # Raise if bad status code
             cmd_response.raise_for_status()
             self.cmd_server_info = cmd_response.json()
@@ -105,7 +186,7 @@ class ConnectMicroscope:
 
         # Test data server.
         # This server will receive images form microscope and store them in a queue.
-        data_response = requests.get(self.data_url + "/about")
+        data_response = self._request("GET", self.data_url + "/about")
         # Raise if bad status code
         data_response.raise_for_status()
         self.data_server_info = data_response.json()
@@ -126,6 +207,65 @@ class ConnectMicroscope:
             "status": "none",
         }
 
+    def close(self):
+        """Stop prefetching and close connections to command and data services.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        self._cancel_prefetch()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.session.close()
+
+    def _request(self, method, url, **kwargs):
+        """Send request to command or data service using pooled connections.
+        Repeat request with increasing random waits if service
+        is not reachable or temporarily not available.
+        Requests with side effects (e.g. post experiment) are only repeated
+        if the connection could not be established (refused or timed out).
+
+        Input:
+         method: http method ('GET', 'POST', 'DELETE')
+
+         url: url of resource
+
+         kwargs: additional parameters for requests.Session.request
+         (e.g. json, data)
+
+        Output:
+         response: requests.Response from service
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as error:
+                if attempt == self.retries or not (
+                    idempotent or request_not_sent(error)
+                ):
+                    raise
+                log.debug("Retry %s %s after %s", method, url, error)
+            else:
+                if (
+                    not idempotent
+                    or response.status_code not in RETRY_STATUS_CODES
+                    or attempt == self.retries
+                ):
+                    return response
+                log.debug(
+                    "Retry %s %s after status %s", method, url, response.status_code
+                )
+            time.sleep(backoff_wait(attempt))
+
     def not_implemented(self, method_name):
         """Raise exception if method is not implemented.
 
@@ -179,7 +319,7 @@ class ConnectMicroscope:
     def get_about_command_service(self):
         """Retrieve information about command service"""
 
-        about_response = requests.get(self.cmd_url + "/about")
+        about_response = self._request("GET", self.cmd_url + "/about")
         # Raise if bad status code
         about_response.raise_for_status()
         return about_response.json()
@@ -187,7 +327,7 @@ class ConnectMicroscope:
     def get_about_data_service(self):
         """Retrieve information about data service"""
 
-        about_response = requests.get(self.data_url + "/about")
+        about_response = self._request("GET", self.data_url + "/about")
         # Raise if bad status code
         about_response.raise_for_status()
         return about_response.json()
@@ -212,7 +352,140 @@ class ConnectMicroscope:
         """
         self.not_implemented("save_image")
 
-    def load_image(self, image, get_meta_data=False):
+    def _read_binary(self, meta_data, memmap_path=None):
+        """Stream image from data service into preallocated array.
+        The image is read in chunks and does not exist twice in memory.
+
+        Input:
+         meta_data: meta data of image as returned by data service
+
+         memmap_path: path to file on local disk. If not None, image is written
+         into numpy.memmap instead of memory (Default: None)
+
+        Output:
+         image_data: numpy array or numpy.memmap with image
+        """
+        shape = tuple(meta_data["image_dimensions"])
+        dtype = np.dtype(meta_data["format"])
+        if memmap_path is None:
+            image_data = np.empty(shape, dtype=dtype)
+        else:
+            image_data = np.memmap(memmap_path, dtype=dtype, mode="w+", shape=shape)
+        buffer = memoryview(image_data.reshape(-1).view(np.uint8))
+
+        response = self._request(
+            "GET", self.data_url + "/binary/" + meta_data["data_id"], stream=True
+        )
+        with response:
+            # Raise if bad status code
+            response.raise_for_status()
+            offset = 0
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                end = offset + len(chunk)
+                if end > buffer.nbytes:
+                    raise HardwareError(
+                        "Image {} is larger than expected".format(meta_data["data_id"])
+                    )
+                buffer[offset:end] = chunk
+                offset = end
+        if offset != buffer.nbytes:
+            raise HardwareError(
+                "Received {} of {} bytes for image {}".format(
+                    offset, buffer.nbytes, meta_data["data_id"]
+                )
+            )
+        if memmap_path is not None:
+            image_data.flush()
+        return image_data
+
+    def _prefetch_next_image(self, data_id, cancel_event):
+        """Wait for new image on data service and download it.
+        Runs in background thread.
+
+        Input:
+         data_id: id of image that was loaded last
+
+         cancel_event: threading.Event to stop waiting
+
+        Output:
+         meta_data: meta data of new image
+
+         image_data: numpy array with new image
+        """
+
+        def new_meta_data():
+            response = self._request("GET", self.data_url + "/last")
+            response.raise_for_status()
+            if response.status_code == 200:
+                meta_data = response.json()
+                if meta_data["data_id"] != data_id:
+                    return meta_data
+            return None
+
+        meta_data = polling.wait_until(
+            new_meta_data,
+            name="slidebook.prefetch_image",
+            timeout=PREFETCH_TIMEOUT,
+            cancel_event=cancel_event,
+            max_interval=PREFETCH_MAX_INTERVAL,
+        )
+        return meta_data, self._read_binary(meta_data)
+
+    def _start_prefetch(self, data_id):
+        """Download next image in background while caller processes current image.
+
+        Input:
+         data_id: id of current image
+
+        Output:
+         none
+        """
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        cancel_event = threading.Event()
+        future = self._executor.submit(self._prefetch_next_image, data_id, cancel_event)
+        self._prefetch = (future, cancel_event, data_id)
+
+    def _cancel_prefetch(self):
+        """Stop download of next image.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        if self._prefetch is not None:
+            self._prefetch[1].set()
+            self._prefetch = None
+
+    def _get_prefetched_image(self, data_id):
+        """Retrieve prefetched image if it is the image with data_id.
+
+        Input:
+         data_id: id of most recent image on data service
+
+        Output:
+         image_data: numpy array with image, None if image was not prefetched
+        """
+        if self._prefetch is None:
+            return None
+        future, cancel_event, previous_data_id = self._prefetch
+        self._prefetch = None
+        if data_id == previous_data_id:
+            # no new image was acquired
+            cancel_event.set()
+            return None
+        try:
+            prefetched_meta_data, image_data = future.result()
+        except Exception as error:
+            log.debug("Prefetching image failed: %s", error)
+            return None
+        if prefetched_meta_data["data_id"] != data_id:
+            return None
+        return image_data
+
+    def load_image(self, image, get_meta_data=False, memmap_path=None, prefetch=False):
         """Load most recent image from data service and return it a class ImageAICS
 
         Input:
@@ -220,11 +493,19 @@ class ConnectMicroscope:
 
          get_meta: if true, retrieve meta data from file. Default is False
 
+         memmap_path: path to file on local disk. If not None, stream image into
+         numpy.memmap instead of memory (Default: None)
+
+         prefetch: if True, download next image in background after this image
+         was loaded. The next call of load_image will use the downloaded image
+         if it is the most recent image on the data service (Default: False)
+
         Output:
          image: image with data and meta data as ImageAICS class
         """
-        # Retrieve most recent meta data from data queue
-        meta_response = requests.get(self.data_url + "/last")
+        # Retrieve most recent meta data from data queue.
+        # A prefetched image is downloaded in parallel.
+        meta_response = self._request("GET", self.data_url + "/last")
         # Raise if bad status code
         meta_response.raise_for_status()
 
@@ -232,12 +513,18 @@ class ConnectMicroscope:
             # get meta data
             meta_data = meta_response.json()
 
-            # get image and decode
-            response = requests.get(self.data_url + "/binary/" + meta_data["data_id"])
-            image_data = np.frombuffer(
-                response.content, dtype=meta_data["format"]
-            ).reshape(meta_data["image_dimensions"])
+            # get image
+            image_data = None
+            if memmap_path is None:
+                image_data = self._get_prefetched_image(meta_data["data_id"])
+            else:
+                self._cancel_prefetch()
+            if image_data is None:
+                image_data = self._read_binary(meta_data, memmap_path)
+            if prefetch:
+                self._start_prefetch(meta_data["data_id"])
         else:
+            self._cancel_prefetch()
             image_data = None
             meta_data = None
         # show_image(image_data, meta_data)
@@ -287,7 +574,7 @@ class ConnectMicroscope:
         Output:
          none
         """
-        response = requests.delete(self.data_url + "/clear")
+        response = self._request("DELETE", self.data_url + "/clear")
         # Raise if bad status code
         response.raise_for_status()
 
@@ -298,29 +585,52 @@ class ConnectMicroscope:
     ############################################################################
     def clear_experiments(self):
         """Clear experiments queue"""
-        experiments_response = requests.delete(self.cmd_url + "/experiments/clear")
+        experiments_response = self._request(
+            "DELETE", self.cmd_url + "/experiments/clear"
+        )
         # Raise if bad status code
         experiments_response.raise_for_status()
 
     def count_experiments(self):
         """Return number of experiments inqueue"""
-        experiments_response = requests.get(self.cmd_url + "/experiments/count")
+        experiments_response = self._request("GET", self.cmd_url + "/experiments/count")
         # Raise if bad status code
         experiments_response.raise_for_status()
         return experiments_response.json()
 
     def post_experiment(self, experiment):
         """Post experiment as last entry on queue and return updated experiment"""
-        experiments_response = requests.post(
-            self.cmd_url + "/experiments", json=experiment
+        experiments_response = self._request(
+            "POST", self.cmd_url + "/experiments", json=experiment
         )
         # Raise if bad status code
         experiments_response.raise_for_status()
         return experiments_response.json()
 
+    def post_experiments(self, experiments):
+        """Post list of experiments with a single request as last entries on queue.
+        Falls back to posting experiments one by one
+        if command service does not provide endpoint /cmd/experiments/bulk.
+
+        Input:
+         experiments: list with experiments
+
+        Output:
+         posted_experiments: list with updated experiments in order of queue
+        """
+        experiments_response = self._request(
+            "POST", self.cmd_url + "/experiments/bulk", json=experiments
+        )
+        if experiments_response.status_code in (404, 405):
+            log.debug("Command service does not support bulk posting of experiments")
+            return [self.post_experiment(experiment) for experiment in experiments]
+        # Raise if bad status code
+        experiments_response.raise_for_status()
+        return experiments_response.json()
+
     def get_next_experiment(self):
         """Return next (oldest) experiments in queue"""
-        experiments_response = requests.get(self.cmd_url + "/experiments/next")
+        experiments_response = self._request("GET", self.cmd_url + "/experiments/next")
         # Raise if bad status code
         experiments_response.raise_for_status()
         if experiments_response.status_code == 204:
@@ -330,8 +640,8 @@ class ConnectMicroscope:
 
     def get_experiment(self, experiment_id):
         """Return experiment by id"""
-        experiments_response = requests.get(
-            self.cmd_url + "/experiments/" + experiment_id
+        experiments_response = self._request(
+            "GET", self.cmd_url + "/experiments/" + experiment_id
         )
         # Raise if bad status code
         experiments_response.raise_for_status()
@@ -339,8 +649,8 @@ class ConnectMicroscope:
 
     def delete_experiment(self, experiment_id):
         """Delete experiment by id"""
-        experiments_response = requests.delete(
-            self.cmd_url + "/experiments/" + experiment_id
+        experiments_response = self._request(
+            "DELETE", self.cmd_url + "/experiments/" + experiment_id
         )
         # Raise if bad status code
         experiments_response.raise_for_status()
@@ -348,7 +658,7 @@ class ConnectMicroscope:
 
     def get_experiment_dict(self):
         """Retrieve dictionary with all experiments on queue"""
-        experiments_response = requests.get(self.cmd_url + "/experiments")
+        experiments_response = self._request("GET", self.cmd_url + "/experiments")
         # Raise if bad status code
         experiments_response.raise_for_status()
         return experiments_response.json()
@@ -379,7 +689,7 @@ class ConnectMicroscope:
         if self.dummy:
             return {"microscope": ""}
 
-        response = requests.post(self.cmd_url + "/experiments", json=experiment)
+        response = self._request("POST", self.cmd_url + "/experiments", json=experiment)
         # raise exception if request was not successful
         response.raise_for_status()
         return response.json()
@@ -405,7 +715,7 @@ class ConnectMicroscope:
         experiment["objective"] = objective
         experiment["microscope_action"] = "move_snap"
 
-        response = requests.post(self.cmd_url + "/experiments", json=experiment)
+        response = self._request("POST", self.cmd_url + "/experiments", json=experiment)
         success = response.status_code == requests.codes.ok
         return success
 
@@ -447,21 +757,29 @@ class ConnectMicroscope:
         """Return most recent position of Microscope stage.
 
         Input:
-         repetitions: number of times to try to get a response
-
-         wait: wait time per repetition in sec
+         repetitions, wait: wait at most repetitions * wait sec for a response.
+         Intervals between requests start short and grow up to wait sec.
 
         Output:
          xPos, yPos, zPos: x and y position of stage in micrometer
         """
-        for i in range(repetitions):
-            response = requests.get(self.cmd_url + "/recent_position")
+
+        def recent_position():
+            response = self._request("GET", self.cmd_url + "/recent_position")
             # Raise if bad status code
             response.raise_for_status()
-            if len(response.json()) > 0:
-                return response.json()["stage_location"]
-            time.sleep(wait)
-        raise requests.exceptions.Timeout()
+            return response.json()
+
+        try:
+            position = polling.wait_until(
+                recent_position,
+                name="slidebook.get_stage_pos",
+                timeout=repetitions * wait,
+                max_interval=wait,
+            )
+        except HardwareTimeoutError:
+            raise requests.exceptions.Timeout()
+        return position["stage_location"]
 
     def move_stage_to(self, xPos, yPos, zPos, capture_settings=None, test=False):
         """Move stage to new position.
@@ -492,7 +810,7 @@ class ConnectMicroscope:
         experiment["microscope_action"] = "move"
         experiment["capture_settings"] = []
 
-        requests.post(self.cmd_url + "/experiments", json=experiment)
+        self._request("POST", self.cmd_url + "/experiments", json=experiment)
         return [xPos, yPos, zPos]
 
     ############################################################################
@@ -14,10 +14,14 @@ from microscope_automation.util.automation_exceptions import (
 )
 import os
 from microscope_automation.util.image_AICS import ImageAICS
+from microscope_automation.util.polling import wait_until
 
 # Create Logger
 log = logging.getLogger(__name__)
 
+# maximum time in s to wait for experiment or objective
+WAIT_TIMEOUT = 120
+
 
 class ConnectMicroscope:
     def __init__(self):
@@ -704,7 +708,7 @@ class ConnectMicroscope:
         )
         return image
 
-    def wait_for_experiment(self, experiment):
+    def wait_for_experiment(self, experiment, timeout=WAIT_TIMEOUT, cancel_event=None):
         """Function to wait till the given experiment is loaded and is active.
         For this we will use the function get_active_experiment and compare it
         to the param experiment.
@@ -712,16 +716,25 @@ class ConnectMicroscope:
         Input:
          experiment:  Name of the experiment settings
 
+         timeout: maximum time to wait in s. None: wait without deadline
+
+         cancel_event: threading.Event to stop waiting from other thread
+
         Output:
          none
+
+         Raises HardwareTimeoutError if experiment is not active after timeout.
         """
         # if experiment name contains extension (.czexp), remove it
         target_experiment = os.path.splitext(experiment)[0]
-        while True:
-            active_experiment = self.get_active_experiment()
-            log.info("Active experiment = {}".format(active_experiment))
-            if target_experiment == active_experiment:
-                break
+        wait_until(
+            lambda: self.get_active_experiment() == target_experiment,
+            name="zen_black.wait_for_experiment",
+            timeout=timeout,
+            cancel_event=cancel_event,
+            error_component=experiment,
+        )
+        log.info("Active experiment = {}".format(target_experiment))
 
     def set_autofocus_ready(self):
         """Function to update autofocusReady flag to True.
@@ -934,19 +947,30 @@ class ConnectMicroscope:
         log.info("moved focus to load position: %s.", str(zFocus))
         return zFocus
 
-    def wait_for_objective(self, target_objective):
+    def wait_for_objective(
+        self, target_objective, timeout=WAIT_TIMEOUT, cancel_event=None
+    ):
         """Function to wait till the correct objective is in place.
 
         Input:
          target_objective: Name of the objective (string)
 
+         timeout: maximum time to wait in s. None: wait without deadline
+
+         cancel_event: threading.Event to stop waiting from other thread
+
         Output:
          none
+
+         Raises HardwareTimeoutError if objective is not in place after timeout.
         """
-        while True:
-            current_objective = self.get_objective_name()
-            if current_objective == target_objective:
-                break
+        wait_until(
+            lambda: self.get_objective_name() == target_objective,
+            name="zen_black.wait_for_objective",
+            timeout=timeout,
+            cancel_event=cancel_event,
+            error_component=target_objective,
+        )
 
     def get_all_objectives(self, n_positions):
         """Function to retrieve the name and magnification of all objectives.
@@ -21,6 +21,7 @@ from microscope_automation.util.automation_exceptions import (
     ExperimentNotExistError,
 )
 from microscope_automation.settings.zen_experiment_info import ZenExperiment
+from microscope_automation.util.polling import wait_until
 
 try:
     from microscope_automation.hardware.RS232 import Braintree
@@ -30,6 +31,9 @@ except ImportError:
 # Create Logger
 log = logging.getLogger(__name__)
 
+# maximum time in s to wait for experiment or objective
+WAIT_TIMEOUT = 120
+
 ################################################################################
 #
 # Class to control Zeiss hardware through the Zeiss software Zen blue
@@ -251,38 +255,63 @@ class ConnectMicroscope:
         )
         return user_document_path
 
-    def wait_for_experiment(self, experiment):
+    def wait_for_experiment(self, experiment, timeout=WAIT_TIMEOUT, cancel_event=None):
         """Wait until experimentis active experiment.
 
         Input:
          experiment: string with name of experiment defined within Microscope software.
 
+         timeout: maximum time to wait in s. None: wait without deadline
+
+         cancel_event: threading.Event to stop waiting from other thread
+
         Output:
          none
+
+         Raises HardwareTimeoutError if experiment is not active after timeout.
         """
         # if experiment name contains extension remove it
         target_experiment = os.path.splitext(experiment)[0]
-        while True:
+
+        def is_active():
             active_experiment = os.path.splitext(
                 self.Zen.Acquisition.Experiments.ActiveExperiment.name
             )[0]
-            print(active_experiment)
-            if target_experiment == active_experiment:
-                break
+            return target_experiment == active_experiment
+
+        wait_until(
+            is_active,
+            name="zen_blue.wait_for_experiment",
+            timeout=timeout,
+            cancel_event=cancel_event,
+            error_component=experiment,
+        )
+        log.info("Active experiment = {}".format(target_experiment))
 
-    def wait_for_objective(self, target_objective):
+    def wait_for_objective(
+        self, target_objective, timeout=WAIT_TIMEOUT, cancel_event=None
+    ):
         """Wait until objective is in place.
 
         Input:
          target_objective: string with name of objective.
 
+         timeout: maximum time to wait in s. None: wait without deadline
+
+         cancel_event: threading.Event to stop waiting from other thread
+
         Output:
          None
+
+         Raises HardwareTimeoutError if objective is not in place after timeout.
         """
-        while True:
-            current_objective = self.get_objective_name()
-            if current_objective == target_objective:
-                break
+        wait_until(
+            lambda: self.get_objective_name() == target_objective,
+            name="zen_blue.wait_for_objective",
+            timeout=timeout,
+            cancel_event=cancel_event,
+            error_component=target_objective,
+        )
 
     def set_experiment(self, experiment=None, pos_list=None):
         """Sets the experiment with ZEN API
@@ -1175,6 +1204,19 @@ class ConnectMicroscope:
         log.info("This class controls the microscope: " + name)
         return name
 
+    def get_simulated_clock(self):
+        """Return clock of simulated microscope that predicts duration
+        of hardware operations.
+
+        Input:
+         none
+
+        Output:
+         simulated_clock: object of class connect_zen_blue_dummy.SimulatedClock.
+         None if connected to real microscope.
+        """
+        return getattr(self.Zen, "simulated_clock", None)
+
     def stop(self):
         """Stop Microscope immediately"""
         log.info("Microscope operation aborted")
@@ -4,6 +4,8 @@ Created on Sep 23, 2016
 
 @author: winfriedw
 """
+import collections
+import math
 from shutil import copy2
 
 try:
@@ -16,6 +18,214 @@ import os
 test_messages = False
 
 
+######################################################################################
+#
+# Timing model and simulated clock
+#
+######################################################################################
+
+
+class TimingModel(object):
+    """Predict how long the real microscope needs for hardware operations.
+    Default values are typical for a Zeiss spinning disk microscope.
+    """
+
+    def __init__(
+        self,
+        stage_speed=20000,
+        stage_acceleration=100000,
+        focus_speed=2000,
+        objective_switch_time=2.0,
+        definite_focus_time=1.0,
+        exposure_time=0.1,
+        readout_time=0.05,
+        save_bandwidth=200e6,
+    ):
+        """Define speed of hardware.
+
+        Input:
+         stage_speed: maximum speed of stage in um/s for each axis
+
+         stage_acceleration: acceleration and deceleration of stage in um/s**2
+
+         focus_speed: speed of focus drive in um/s
+
+         objective_switch_time: time to change objective in s
+
+         definite_focus_time: time for find surface and recall focus in s
+
+         exposure_time: exposure time per tile in s
+
+         readout_time: time to read image from camera per tile in s
+
+         save_bandwidth: bytes per s written when images are saved
+
+        Output:
+         none
+        """
+        self.stage_speed = stage_speed
+        self.stage_acceleration = stage_acceleration
+        self.focus_speed = focus_speed
+        self.objective_switch_time = objective_switch_time
+        self.definite_focus_time = definite_focus_time
+        self.exposure_time = exposure_time
+        self.readout_time = readout_time
+        self.save_bandwidth = save_bandwidth
+
+    def stage_axis_time(self, distance):
+        """Time for stage axis to travel distance.
+        Stage accelerates to maximum speed, travels, and decelerates.
+        For short moves the stage decelerates before it reaches maximum speed.
+
+        Input:
+         distance: travel distance in um
+
+        Output:
+         time: travel time in s
+        """
+        distance = abs(distance)
+        if distance == 0:
+            return 0.0
+        # distance needed to accelerate to maximum speed and stop again
+        ramp_distance = self.stage_speed**2 / self.stage_acceleration
+        if distance < ramp_distance:
+            return 2 * math.sqrt(distance / self.stage_acceleration)
+        return distance / self.stage_speed + self.stage_speed / self.stage_acceleration
+
+    def stage_move_time(self, x_start, y_start, x_end, y_end):
+        """Time to move stage. Both axes move at the same time.
+
+        Input:
+         x_start, y_start: stage position before move in um
+
+         x_end, y_end: stage position after move in um
+
+        Output:
+         time: travel time in s
+        """
+        return max(
+            self.stage_axis_time(x_end - x_start), self.stage_axis_time(y_end - y_start)
+        )
+
+    def focus_move_time(self, z_start, z_end):
+        """Time to move focus drive.
+
+        Input:
+         z_start, z_end: focus position before and after move in um
+
+        Output:
+         time: travel time in s
+        """
+        return abs(z_end - z_start) / self.focus_speed
+
+    def tile_time(self, number_tiles=1):
+        """Time to expose and read out tiles.
+
+        Input:
+         number_tiles: number of tiles acquired
+
+        Output:
+         time: acquisition time in s
+        """
+        return number_tiles * (self.exposure_time + self.readout_time)
+
+    def save_time(self, number_bytes):
+        """Time to save image.
+
+        Input:
+         number_bytes: size of image file in bytes
+
+        Output:
+         time: time to write file in s
+        """
+        return number_bytes / self.save_bandwidth
+
+
+class SimulatedClock(object):
+    """Clock that advances by the predicted duration of hardware operations
+    instead of waiting. Durations are collected for each workflow step
+    and each type of operation.
+    """
+
+    def __init__(self):
+        """Start clock at 0 s.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        self.reset()
+
+    def reset(self):
+        """Set clock to 0 s and remove all collected durations.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        self.time = 0.0
+        self.step = None
+        self.step_times = collections.OrderedDict()
+        self.operation_times = collections.OrderedDict()
+
+    def start_step(self, step):
+        """Assign following operations to new workflow step.
+
+        Input:
+         step: name of workflow step
+
+        Output:
+         none
+        """
+        self.step = step
+        self.step_times.setdefault(step, 0.0)
+
+    def advance(self, duration, operation):
+        """Advance clock by duration of hardware operation.
+
+        Input:
+         duration: duration of operation in s
+
+         operation: type of operation (e.g. 'stage', 'focus', 'acquisition')
+
+        Output:
+         time: simulated time after operation in s
+        """
+        self.time += duration
+        self.operation_times[operation] = (
+            self.operation_times.get(operation, 0.0) + duration
+        )
+        if self.step is not None:
+            self.step_times[self.step] += duration
+        return self.time
+
+    def get_step_times(self):
+        """Predicted duration of each workflow step.
+
+        Input:
+         none
+
+        Output:
+         step_times: dictionary {step name: duration in s}
+        """
+        return dict(self.step_times)
+
+    def get_operation_times(self):
+        """Predicted duration of each type of hardware operation.
+
+        Input:
+         none
+
+        Output:
+         operation_times: dictionary {operation: duration in s}
+        """
+        return dict(self.operation_times)
+
+
 class MicroscopeStatus(object):
     """Create instance of this class to keeps track of microscope status.
 
@@ -26,12 +236,65 @@ class MicroscopeStatus(object):
      none
     """
 
-    def __init__(self):
+    def __init__(self, timing_model=None, clock=None):
         self._xPos = 60000
         self._yPos = 40000
         self._zPos = 500
         self._objective_position = 0
         self._objective_name = "Dummy Objective"
+        # predict time of hardware operations without waiting
+        self.timing_model = TimingModel() if timing_model is None else timing_model
+        self.clock = SimulatedClock() if clock is None else clock
+
+    def move_stage(self, x, y):
+        """Move stage and advance simulated clock by travel time.
+
+        Input:
+         x, y: new stage position in um
+
+        Output:
+         none
+        """
+        if None not in (x, y, self._xPos, self._yPos):
+            self.clock.advance(
+                self.timing_model.stage_move_time(self._xPos, self._yPos, x, y),
+                "stage",
+            )
+        self.xPos = x
+        self.yPos = y
+
+    def move_focus(self, z):
+        """Move focus drive and advance simulated clock by travel time.
+
+        Input:
+         z: new focus position in um
+
+        Output:
+         none
+        """
+        # the dummy accepts undefined positions, they do not take time
+        if z is not None and self._zPos is not None:
+            self.clock.advance(
+                self.timing_model.focus_move_time(self._zPos, z), "focus"
+            )
+        self.zPos = z
+
+    def switch_objective(self, objective_position, objective_name=None):
+        """Change objective and advance simulated clock if objective changed.
+
+        Input:
+         objective_position: new position of objective changer
+
+         objective_name: name of new objective, None: do not change name
+
+        Output:
+         none
+        """
+        if objective_position != self._objective_position:
+            self.clock.advance(self.timing_model.objective_switch_time, "objective")
+        self.objective_position = objective_position
+        if objective_name is not None:
+            self.objective_name = objective_name
 
     @property
     def xPos(self):
@@ -158,7 +421,7 @@ class Focus(object):
         Output:
          none
         """
-        self._microscope_status.zPos = self.TargetPosition
+        self._microscope_status.move_focus(self.TargetPosition)
 
     def MoveTo(self, z):
         """Moves to the specified focus position.
@@ -169,7 +432,7 @@ class Focus(object):
         Output:
          none
         """
-        self._microscope_status.zPos = z
+        self._microscope_status.move_focus(z)
         return None
 
 
@@ -190,7 +453,7 @@ class ObjectiveChanger(object):
         return self._microscope_status.objective_position
 
     def Apply(self):
-        self._microscope_status.objective_position = self.TargetPosition
+        self._microscope_status.switch_objective(self.TargetPosition)
 
     def GetMagnificationByPosition(self, position):
         return ""
@@ -201,9 +464,35 @@ class ObjectiveChanger(object):
 
 class Stage(object):
     def __init__(self, microscope_status):
-        self.TargetPositionY = 0
+        # targets not set since last Apply stay at actual position
+        self._target_x = None
+        self._target_y = None
         self._microscope_status = microscope_status
 
+    @property
+    def TargetPositionX(self):
+        """Get target x position for stage"""
+        if self._target_x is None:
+            return self._microscope_status._xPos
+        return self._target_x
+
+    @TargetPositionX.setter
+    def TargetPositionX(self, x):
+        """Set target x position for stage"""
+        self._target_x = x
+
+    @property
+    def TargetPositionY(self):
+        """Get target y position for stage"""
+        if self._target_y is None:
+            return self._microscope_status._yPos
+        return self._target_y
+
+    @TargetPositionY.setter
+    def TargetPositionY(self, y):
+        """Set target y position for stage"""
+        self._target_y = y
+
     @property
     def ActualPositionX(self):
         """Get actual x position for stage"""
@@ -215,8 +504,9 @@ class Stage(object):
         return self._microscope_status.yPos
 
     def Apply(self):
-        self._microscope_status.xPos = self.TargetPositionX
-        self._microscope_status.yPos = self.TargetPositionY
+        self._microscope_status.move_stage(self.TargetPositionX, self.TargetPositionY)
+        self._target_x = None
+        self._target_y = None
 
 
 class Devices(object):
@@ -236,12 +526,49 @@ class Devices(object):
 ######################################################################################
 
 
+class Experiment(str):
+    """Simulated ZEN experiment. Behaves like experiment name,
+    but keeps track of positions for multi-position acquisitions."""
+
+    def __new__(cls, name):
+        experiment = super(Experiment, cls).__new__(cls, name)
+        experiment.positions = []
+        return experiment
+
+    def ClearTileRegionsAndPositions(self, block_index):
+        """Remove all tile regions and positions from experiment block.
+
+        Input:
+         block_index: index of experiment block
+
+        Output:
+         none
+        """
+        self.positions = []
+
+    def AddSinglePosition(self, block_index, x, y, z):
+        """Add position to experiment block.
+
+        Input:
+         block_index: index of experiment block
+
+         x, y, z: stage position in um
+
+        Output:
+         none
+        """
+        self.positions.append((x, y, z))
+
+
 class Experiments(object):
     def __init__(self, microscope_status):
         self._microscope_status = microscope_status
+        self._experiments = {}
 
     def GetByName(self, experiment):
-        return experiment
+        if experiment not in self._experiments:
+            self._experiments[experiment] = Experiment(experiment)
+        return self._experiments[experiment]
 
     def ActiveExperiment(self):
         return "Experiment"
@@ -251,10 +578,35 @@ class Experiments(object):
 
 
 class Image(object):
+    def __init__(self, positions=None, microscope_status=None):
+        """Simulated ZEN image.
+
+        Input:
+         positions: list with stage positions (x, y, z) images were acquired at.
+         Default: None = single image at current position
+
+         microscope_status: MicroscopeStatus with simulated clock for save time.
+         Default: None = do not simulate time
+
+        Output:
+         none
+        """
+        if positions is None:
+            positions = []
+        self.positions = list(positions)
+        self._microscope_status = microscope_status
+
     def Save_2(self, fileName):
         if not (os.path.exists(fileName)):
             exampleImage = "../data/testImages/WellEdge_0.czi"
             copy2(exampleImage, fileName)
+        if self._microscope_status is not None:
+            self._microscope_status.clock.advance(
+                self._microscope_status.timing_model.save_time(
+                    os.path.getsize(fileName)
+                ),
+                "save",
+            )
 
 
 class Acquisition(object):
@@ -268,25 +620,37 @@ class Acquisition(object):
     def _set_objective(self, experiment):
         """Sets for debug purposes active objective name based on experiment name."""
         if "10x" in experiment:
-            self._microscope_status.objective_name = "Plan-Apochromat 10x/0.45"
-            self._microscope_status.objective_position = 1
+            self._microscope_status.switch_objective(1, "Plan-Apochromat 10x/0.45")
         if "20x" in experiment:
-            self._microscope_status.objective_name = "Plan-Apochromat 20x/0.8 M27"
-            self._microscope_status.objective_position = 2
+            self._microscope_status.switch_objective(2, "Plan-Apochromat 20x/0.8 M27")
         if "100x" in experiment:
-            self._microscope_status.objective_name = (
-                "C-Apochromat 100x/1.25 W Korr UV VIS IR"
+            self._microscope_status.switch_objective(
+                3, "C-Apochromat 100x/1.25 W Korr UV VIS IR"
             )
-            self._microscope_status.objective_position = 3
+
+    def _acquire_tile(self):
+        """Advance simulated clock by exposure and read out of one tile."""
+        self._microscope_status.clock.advance(
+            self._microscope_status.timing_model.tile_time(), "acquisition"
+        )
 
     def Execute(self, experiment):
         self._set_objective(experiment)
-        im = Image()
+        positions = getattr(experiment, "positions", [])
+        # multi-position experiments leave stage at last position
+        for x, y, z in positions:
+            self._microscope_status.move_stage(x, y)
+            self._microscope_status.move_focus(z)
+            self._acquire_tile()
+        if not positions:
+            self._acquire_tile()
+        im = Image(positions, self._microscope_status)
         return im
 
     def AcquireImage_3(self, expClass):
         self._set_objective(expClass)
-        im = Image()
+        self._acquire_tile()
+        im = Image(microscope_status=self._microscope_status)
         return im
 
     def StartLive(self):
@@ -313,6 +677,9 @@ class Acquisition(object):
         Output:
          none
         """
+        self._microscope_status.clock.advance(
+            self._microscope_status.timing_model.definite_focus_time, "autofocus"
+        )
         self._microscope_status.zPos = 9000
         return None
 
@@ -337,6 +704,9 @@ class Acquisition(object):
         Output
          none
         """
+        self._microscope_status.clock.advance(
+            self._microscope_status.timing_model.definite_focus_time, "autofocus"
+        )
         self._microscope_status.zPos = self.storedAutofocus + 100
         return None
 
@@ -421,11 +791,36 @@ class Application(object):
 class GetActiveObject(object):
     """Simulation for connection to ZEN blue software."""
 
-    def __init__(self, name):
+    def __init__(self, name, timing_model=None):
         """
         Simmulation: Connect to Carl Zeiss ZEN blue Python API
+
+        Input:
+         name: name of ZEN API object
+
+         timing_model: TimingModel to predict duration of hardware operations.
+         None: use default TimingModel
+
+        Output:
+         none
         """
-        microscope_status = MicroscopeStatus()
+        microscope_status = MicroscopeStatus(timing_model)
         self.Devices = Devices(microscope_status)
         self.Acquisition = Acquisition(microscope_status)
         self.Application = Application(microscope_status)
+        self._microscope_status = microscope_status
+
+    @property
+    def simulated_clock(self):
+        """SimulatedClock with predicted time of all hardware operations"""
+        return self._microscope_status.clock
+
+    @property
+    def timing_model(self):
+        """TimingModel used to predict duration of hardware operations"""
+        return self._microscope_status.timing_model
+
+    @timing_model.setter
+    def timing_model(self, timing_model):
+        """Set TimingModel used to predict duration of hardware operations"""
+        self._microscope_status.timing_model = timing_model
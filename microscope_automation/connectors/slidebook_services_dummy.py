@@ -0,0 +1,464 @@
+"""
+Local stand-in for the commands_service and data_service used by connect_slidebook.
+The services are small WSGI applications that keep experiments and images in memory.
+They allow to test and benchmark connect_slidebook without Slidebook and MatLab.
+"""
+import json
+import socket
+import sys
+import time
+import uuid
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+################################################################################
+#
+# WSGI applications
+#
+################################################################################
+
+
+class ServiceApp(object):
+    """Base class for WSGI applications with json responses."""
+
+    name = "Service_API"
+
+    def __init__(self, port=None):
+        """Create service.
+
+        Input:
+         port: port reported by /about
+
+        Output:
+         none
+        """
+        self.port = port
+        self.number_requests = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        """WSGI entry point.
+
+        Input:
+         environ: WSGI environment
+
+         start_response: WSGI function to start response
+
+        Output:
+         body: list with response body as bytes
+        """
+        method = environ["REQUEST_METHOD"]
+        path = environ.get("PATH_INFO", "").rstrip("/").split("/")[1:]
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        body = environ["wsgi.input"].read(length) if length else b""
+        with self._lock:
+            self.number_requests += 1
+            status, content, content_type = self.handle(method, path, body)
+        if content is None:
+            data = b""
+        elif content_type == "application/json":
+            data = json.dumps(content).encode()
+        else:
+            data = content
+        start_response(
+            status,
+            [("Content-Type", content_type), ("Content-Length", str(len(data)))],
+        )
+        return [data]
+
+    def about(self):
+        """Information about service.
+
+        Input:
+         none
+
+        Output:
+         about: dictionary with name and port of service
+        """
+        return {"name": self.name, "IP": "127.0.0.1", "port": self.port}
+
+    def handle(self, method, path, body):
+        """Process request. Implemented in sub classes.
+
+        Input:
+         method: http method ('GET', 'POST', 'DELETE')
+
+         path: list with parts of url path
+
+         body: request body as bytes
+
+        Output:
+         status: http status line
+
+         content: content of response
+
+         content_type: mime type of content
+        """
+        return "404 Not Found", {"message": "Unknown resource"}, "application/json"
+
+
+class CommandService(ServiceApp):
+    """Queue with experiments as provided by commands_service."""
+
+    name = "Command_API"
+
+    def __init__(self, port=None, stage_location=None):
+        """Create empty experiments queue.
+
+        Input:
+         port: port reported by /about
+
+         stage_location: (x, y, z) position reported by /recent_position.
+         None: no position was posted by microscope
+
+        Output:
+         none
+        """
+        super().__init__(port)
+        self.experiments = collections.OrderedDict()
+        self.id_counter = 0
+        self.recent_position = {}
+        if stage_location is not None:
+            self.recent_position = {"stage_location": list(stage_location)}
+
+    def add_experiment(self, experiment):
+        """Add experiment at end of queue.
+
+        Input:
+         experiment: dictionary with experiment
+
+        Output:
+         experiment: experiment with id and counter assigned by service
+        """
+        self.id_counter += 1
+        experiment = dict(
+            experiment,
+            experiment_id=uuid.uuid4().hex,
+            id_counter=self.id_counter,
+            status="queued",
+        )
+        self.experiments[experiment["experiment_id"]] = experiment
+        return experiment
+
+    def handle(self, method, path, body):
+        """Process request to commands service.
+
+        Input:
+         method: http method ('GET', 'POST', 'DELETE')
+
+         path: list with parts of url path
+
+         body: request body as bytes
+
+        Output:
+         status: http status line
+
+         content: content of response
+
+         content_type: mime type of content
+        """
+        ok = "200 OK"
+        json_type = "application/json"
+        if path and path[0] == "cmd":
+            path = path[1:]
+        if path == ["about"] and method == "GET":
+            return ok, self.about(), json_type
+        if path == ["recent_position"]:
+            if method == "POST":
+                self.recent_position = json.loads(body)
+            return ok, self.recent_position, json_type
+        if not path or path[0] != "experiments":
+            return super().handle(method, path, body)
+
+        if len(path) == 1:
+            if method == "POST":
+                return ok, self.add_experiment(json.loads(body)), json_type
+            return ok, dict(self.experiments), json_type
+        if path[1] == "bulk" and method == "POST":
+            experiments = [self.add_experiment(e) for e in json.loads(body)]
+            return ok, experiments, json_type
+        if path[1] == "clear" and method == "DELETE":
+            self.experiments.clear()
+            return ok, {}, json_type
+        if path[1] == "count":
+            return ok, len(self.experiments), json_type
+        if path[1] == "next":
+            if not self.experiments:
+                return "204 No Content", None, json_type
+            return ok, next(iter(self.experiments.values())), json_type
+        if method == "DELETE":
+            self.experiments.pop(path[1], None)
+            return ok, dict(self.experiments), json_type
+        return ok, self.experiments.get(path[1], {}), json_type
+
+
+class DataService(ServiceApp):
+    """Queue with images and meta data as provided by data_service."""
+
+    name = "Data_API"
+
+    def __init__(self, port=None):
+        """Create empty image queue.
+
+        Input:
+         port: port reported by /about
+
+        Output:
+         none
+        """
+        super().__init__(port)
+        self.meta_data = collections.OrderedDict()
+        self.images = {}
+
+    def handle(self, method, path, body):
+        """Process request to data service.
+
+        Input:
+         method: http method ('GET', 'POST', 'DELETE')
+
+         path: list with parts of url path
+
+         body: request body as bytes
+
+        Output:
+         status: http status line
+
+         content: content of response
+
+         content_type: mime type of content
+        """
+        ok = "200 OK"
+        json_type = "application/json"
+        if path and path[0] == "data":
+            path = path[1:]
+        if path == ["about"] and method == "GET":
+            return ok, self.about(), json_type
+        if path == ["meta_data"] and method == "POST":
+            meta_data = dict(json.loads(body), data_id=uuid.uuid4().hex)
+            self.meta_data[meta_data["data_id"]] = meta_data
+            return ok, meta_data, json_type
+        if path == ["last"] and method == "GET":
+            if not self.meta_data:
+                return "204 No Content", None, json_type
+            return ok, next(reversed(self.meta_data.values())), json_type
+        if path == ["clear"] and method == "DELETE":
+            self.meta_data.clear()
+            self.images.clear()
+            return ok, {}, json_type
+        if len(path) == 2 and path[0] == "binary":
+            if method == "POST":
+                self.images[path[1]] = body
+                return ok, {"data_id": path[1]}, json_type
+            if path[1] in self.images:
+                return ok, self.images[path[1]], "application/octet-stream"
+        return super().handle(method, path, body)
+
+
+################################################################################
+#
+# Server
+#
+################################################################################
+
+
+class WSGIRequestHandler(BaseHTTPRequestHandler):
+    """Minimal WSGI gateway with HTTP/1.1 keep-alive.
+    wsgiref.simple_server closes the connection after each request
+    and can therefore not be used to measure the benefit of connection pooling.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        """Count new connections."""
+        super().setup()
+        # send responses immediately, headers and body are written separately
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.count_connection()
+
+    def _run_application(self):
+        """Call WSGI application and send response."""
+        path, _, query = self.path.partition("?")
+        environ = {
+            "REQUEST_METHOD": self.command,
+            "PATH_INFO": path,
+            "QUERY_STRING": query,
+            "CONTENT_LENGTH": self.headers.get("Content-Length", ""),
+            "CONTENT_TYPE": self.headers.get("Content-Type", ""),
+            "SERVER_NAME": self.server.server_name,
+            "SERVER_PORT": str(self.server.server_port),
+            "SERVER_PROTOCOL": self.request_version,
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": self.rfile,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = status
+            response["headers"] = headers
+
+        body = b"".join(self.server.application(environ, start_response))
+        code, _, reason = response["status"].partition(" ")
+        self.send_response(int(code), reason)
+        for key, value in response["headers"]:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _run_application
+    do_POST = _run_application
+    do_DELETE = _run_application
+
+    def log_message(self, format, *args):
+        """Do not log every request."""
+        pass
+
+
+class LocalServer(ThreadingHTTPServer):
+    """Serve WSGI application in background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, application, host="127.0.0.1", port=0):
+        """Create server. Use port 0 to select free port.
+
+        Input:
+         application: WSGI application, e.g. CommandService
+
+         host: host name or IP address
+
+         port: port number, 0 selects free port
+
+        Output:
+         none
+        """
+        super().__init__((host, port), WSGIRequestHandler)
+        self.application = application
+        if getattr(application, "port", None) is None:
+            application.port = self.server_port
+        self.url = "http://{}:{}".format(host, self.server_port)
+        self.number_connections = 0
+        self._connection_lock = threading.Lock()
+        self._thread = None
+
+    def count_connection(self):
+        """Count accepted connection.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        with self._connection_lock:
+            self.number_connections += 1
+
+    def start(self):
+        """Start serving in background thread.
+
+        Input:
+         none
+
+        Output:
+         url: url of server
+        """
+        # short poll interval to stop server quickly
+        self._thread = threading.Thread(
+            target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        """Stop server and close socket.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def start_services(cmd_port=0, data_port=0, stage_location=(0, 0, 0)):
+    """Start command and data service in background threads.
+
+    Input:
+     cmd_port, data_port: ports for services, 0 selects free ports
+
+     stage_location: (x, y, z) stage position reported by command service
+
+    Output:
+     cmd_server, data_server: objects of class LocalServer.
+     Use attribute url to connect and method stop to shut down.
+    """
+    cmd_server = LocalServer(
+        CommandService(stage_location=stage_location), port=cmd_port
+    )
+    data_server = LocalServer(DataService(), port=data_port)
+    cmd_server.start()
+    data_server.start()
+    return cmd_server, data_server
+
+
+def benchmark_commands(connection, number_commands=200, experiment=None):
+    """Measure throughput of commands send to command service.
+
+    Input:
+     connection: object of class connect_slidebook.ConnectMicroscope
+
+     number_commands: number of stage position requests and experiments to post
+
+     experiment: experiment to post. If None use default experiment of connection
+
+    Output:
+     results: dictionary with commands per second for
+      'get_stage_pos': stage position requests
+
+      'post_experiment': experiments posted one by one
+
+      'post_experiments': experiments posted with a single request
+    """
+    if experiment is None:
+        experiment = connection.default_experiment
+    results = {}
+
+    start_time = time.perf_counter()
+    for _ in range(number_commands):
+        connection.get_stage_pos()
+    results["get_stage_pos"] = number_commands / (time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    for _ in range(number_commands):
+        connection.post_experiment(experiment)
+    results["post_experiment"] = number_commands / (time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    connection.post_experiments([experiment] * number_commands)
+    results["post_experiments"] = number_commands / (time.perf_counter() - start_time)
+    connection.clear_experiments()
+    return results
+
+
+if __name__ == "__main__":
+    # run services at default ports used by connect_slidebook
+    cmd_server = LocalServer(CommandService(), port=5000)
+    data_server = LocalServer(DataService(), port=5100)
+    print("Command service at {}".format(cmd_server.start()))
+    print("Data service at {}".format(data_server.start()))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        cmd_server.stop()
+        data_server.stop()
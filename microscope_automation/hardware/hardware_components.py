@@ -9,12 +9,10 @@ Split into hardware_control and hardware_components on May 25, 2020
 @author: winfriedw
 """
 
-import matplotlib.pyplot as plt
-from matplotlib.path import Path as mpl_path
-import matplotlib.patches as patches
-from matplotlib import cm
-import math
+import numpy
 import inspect
+import collections
+import threading
 
 # import modules from project microscope_automation
 from microscope_automation.util.image_AICS import ImageAICS
@@ -97,6 +95,168 @@ def log_warning(message, methodName=None):
 ################################################################################
 
 
+class HardwareStateCache(object):
+    """Write-through cache for hardware state (e.g. stage position, objective name).
+    Values read from hardware or returned by move commands are reused
+    until the hardware might have changed in other ways
+    (experiments, live mode, dialogs for user interaction, errors, or recovery).
+    The cache can be used from several threads.
+    """
+
+    def __init__(self):
+        """Create empty cache.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        self._states = {}
+        # incremented whenever state changes, keys are None (all components),
+        # component id, or (component id, key)
+        self._generations = collections.Counter()
+        self._dialog_count = message.get_dialog_count()
+        self.statistics = collections.Counter()
+        # reentrant, invalidate is called while lock is held
+        self._lock = threading.RLock()
+
+    def _check_user_interaction(self):
+        """Invalidate cache if dialogs were shown since last access.
+        The user might have operated the microscope while dialog was open.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        with self._lock:
+            dialog_count = message.get_dialog_count()
+            if dialog_count != self._dialog_count:
+                self._dialog_count = dialog_count
+                self.invalidate()
+
+    def _get_generation(self, state_id):
+        """Get generation of state, changes whenever state is updated or invalidated.
+        Has to be called while lock is held.
+
+        Input:
+         state_id: tuple (component id, key)
+
+        Output:
+         generation: tuple with generations of all components, component, and state
+        """
+        return (
+            self._generations[None],
+            self._generations[state_id[0]],
+            self._generations[state_id],
+        )
+
+    def get(self, component_id, key, query):
+        """Get state from cache, query hardware if state is not known.
+
+        Input:
+         component_id: string with unique component id
+
+         key: name of state (e.g. 'position')
+
+         query: function without arguments that retrieves state from hardware
+
+        Output:
+         value: state of hardware
+        """
+        self._check_user_interaction()
+        state_id = (component_id, key)
+        with self._lock:
+            if state_id in self._states:
+                self.statistics["hits"] += 1
+                return self._states[state_id]
+            self.statistics["queries"] += 1
+            generation = self._get_generation(state_id)
+        # do not block other threads while hardware is queried
+        value = query()
+        with self._lock:
+            # do not overwrite state that was updated or invalidated during query
+            if self._get_generation(state_id) == generation:
+                self._states[state_id] = value
+        return value
+
+    def update(self, component_id, key, value):
+        """Store state after hardware was changed, e.g. position after move.
+
+        Input:
+         component_id: string with unique component id
+
+         key: name of state (e.g. 'position')
+
+         value: new state of hardware
+
+        Output:
+         none
+        """
+        self._check_user_interaction()
+        with self._lock:
+            self.statistics["updates"] += 1
+            self._generations[(component_id, key)] += 1
+            self._states[(component_id, key)] = value
+
+    def invalidate(self, component_id=None, key=None):
+        """Forget state, next request will query hardware.
+
+        Input:
+         component_id: string with unique component id.
+         None: forget state of all components (Default: None)
+
+         key: name of state (e.g. 'position').
+         None: forget all states of component (Default: None)
+
+        Output:
+         none
+        """
+        with self._lock:
+            if component_id is None:
+                self._generations[None] += 1
+                self._states.clear()
+            elif key is None:
+                self._generations[component_id] += 1
+                for state_id in [
+                    state_id for state_id in self._states if state_id[0] == component_id
+                ]:
+                    del self._states[state_id]
+            else:
+                self._generations[(component_id, key)] += 1
+                self._states.pop((component_id, key), None)
+            self.statistics["invalidations"] += 1
+
+    def get_statistics(self):
+        """Get statistics of cache usage.
+
+        Input:
+         none
+
+        Output:
+         statistics: dictionary with
+          'RoundTripsSaved': number of requests answered from cache
+
+          'RoundTrips': number of requests sent to hardware
+
+          'Updates': number of states stored after move commands
+
+          'Invalidations': number of times states were invalidated
+        """
+        with self._lock:
+            return {
+                "RoundTripsSaved": self.statistics["hits"],
+                "RoundTrips": self.statistics["queries"],
+                "Updates": self.statistics["updates"],
+                "Invalidations": self.statistics["invalidations"],
+            }
+
+
+################################################################################
+
+
 class Experiment(object):
     """
     Class to validate, read, and write to experiment files
@@ -383,6 +543,74 @@ class MicroscopeComponent(object):
         """
         return None
 
+    def _get_hardware_state(self):
+        """Get hardware state cache of microscope the component is attached to.
+
+        Input:
+         none
+
+        Output:
+         hardware_state: object of class HardwareStateCache,
+         None if component is not attached to microscope
+        """
+        microscope_object = getattr(self, "microscope", None)
+        if microscope_object is None:
+            microscope_object = getattr(self, "microscope_object", None)
+        hardware_state = getattr(microscope_object, "hardware_state", None)
+        if isinstance(hardware_state, HardwareStateCache):
+            return hardware_state
+        return None
+
+    def _query_hardware_state(self, key, query):
+        """Get state of component from cache or hardware.
+
+        Input:
+         key: name of state (e.g. 'position')
+
+         query: function without arguments that retrieves state from hardware
+
+        Output:
+         value: state of hardware
+        """
+        hardware_state = self._get_hardware_state()
+        if hardware_state is None:
+            return query()
+        return hardware_state.get(self.get_id(), key, query)
+
+    def _update_hardware_state(self, key, value):
+        """Store state of component after it was changed by a command.
+
+        Input:
+         key: name of state (e.g. 'position')
+
+         value: new state of hardware
+
+        Output:
+         none
+        """
+        hardware_state = self._get_hardware_state()
+        if hardware_state is not None:
+            hardware_state.update(self.get_id(), key, value)
+
+    def _invalidate_hardware_state(self, all_components=True):
+        """Forget cached state of all components of microscope.
+        Called after commands that might change other components
+        (e.g. experiments can switch objectives and move focus).
+
+        Input:
+         all_components: if False, forget only state of this component
+         (Default: True)
+
+        Output:
+         none
+        """
+        hardware_state = self._get_hardware_state()
+        if hardware_state is not None:
+            if all_components:
+                hardware_state.invalidate()
+            else:
+                hardware_state.invalidate(self.get_id())
+
 
 ################################################################################
 
@@ -457,6 +685,92 @@ class ControlSoftware(MicroscopeComponent):
 ################################################################################
 
 
+def _path_segments(path):
+    """Get straight segments of matplotlib path.
+
+    Input:
+     path: matplotlib.Path object. Curves are approximated by line segments.
+
+    Output:
+     segments: numpy array of shape (n, 4) with x_start, y_start, x_end, y_end
+    """
+    segments = [
+        numpy.hstack((polyline[:-1], polyline[1:]))
+        for polyline in path.to_polygons(closed_only=False)
+        if len(polyline) > 1
+    ]
+    if not segments:
+        return numpy.zeros((0, 4))
+    return numpy.vstack(segments)
+
+
+def _segments_in_area(segments, area_path, edges):
+    """Test if line segments are completely inside area.
+    Each segment is split where it crosses or touches an edge of the area.
+    Between these points a segment is either completely inside or outside,
+    thus testing the midpoints of all pieces and both ends gives the exact result.
+
+    Input:
+     segments: numpy array of shape (m, 4) with x_start, y_start, x_end, y_end
+
+     area_path: matplotlib.Path object of area
+
+     edges: numpy array of shape (k, 4) with all edges of area_path
+
+    Output:
+     is_inside: numpy array of shape (m,) with True for segments inside area
+    """
+    if len(segments) == 0:
+        return numpy.ones(0, dtype=bool)
+    start = segments[:, numpy.newaxis, 0:2]
+    direction = segments[:, numpy.newaxis, 2:4] - start
+    edge_start = edges[numpy.newaxis, :, 0:2]
+    edge_end = edges[numpy.newaxis, :, 2:4]
+    edge_direction = edge_end - edge_start
+
+    def cross(a, b):
+        return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+    def dot(a, b):
+        return a[..., 0] * b[..., 0] + a[..., 1] * b[..., 1]
+
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        # position of crossing with edge along segment (0: start, 1: end)
+        denominator = cross(direction, edge_direction)
+        t_cross = cross(edge_start - start, edge_direction) / denominator
+        u_cross = cross(edge_start - start, direction) / denominator
+        t_cross[(u_cross < 0) | (u_cross > 1)] = numpy.nan
+        # edges parallel to segment can overlap with it, split at their ends
+        length_squared = dot(direction, direction)
+        t_start = dot(edge_start - start, direction) / length_squared
+        t_end = dot(edge_end - start, direction) / length_squared
+        parallel = denominator == 0
+        t_start[~parallel] = numpy.nan
+        t_end[~parallel] = numpy.nan
+
+    number_segments = len(segments)
+    t = numpy.hstack(
+        (
+            numpy.zeros((number_segments, 1)),
+            numpy.ones((number_segments, 1)),
+            t_cross,
+            t_start,
+            t_end,
+        )
+    )
+    t[~((t >= 0) & (t <= 1))] = numpy.nan
+    # nan values are sorted to the end and their midpoints are nan
+    t = numpy.sort(t, axis=1)
+    t = numpy.hstack((t, (t[:, :-1] + t[:, 1:]) / 2))
+    segment_index, t_index = numpy.nonzero(~numpy.isnan(t))
+    t = t[segment_index, t_index, numpy.newaxis]
+    points = segments[segment_index, 0:2] + t * (
+        segments[segment_index, 2:4] - segments[segment_index, 0:2]
+    )
+    is_outside = ~area_path.contains_points(points)
+    return numpy.bincount(segment_index[is_outside], minlength=number_segments) == 0
+
+
 class Safety(MicroscopeComponent):
     """Class with methods to avoid hardware damage of microscope."""
 
@@ -472,6 +786,8 @@ class Safety(MicroscopeComponent):
         log_method(self, "__init__")
         super(Safety, self).__init__(safety_id)
         self.safe_areas = {}
+        # safe areas with precomputed edges, keys are safe area ids
+        self._safety_models = {}
 
     def add_safe_area(self, safe_vertices, safe_area_id, z_max):
         """Set safe travel area for microscope stage.
@@ -487,6 +803,8 @@ class Safety(MicroscopeComponent):
         Output:
          none
         """
+        from matplotlib.path import Path as mpl_path
+
         log_method(self, "add_safe_area")
         safe_verts = safe_vertices + [safe_vertices[0]]
         safe_codes = (
@@ -497,6 +815,65 @@ class Safety(MicroscopeComponent):
         safe_area = {"path": mpl_path(safe_verts, safe_codes), "z_max": z_max}
         self.safe_areas[safe_area_id] = safe_area
 
+    def _get_safety_model(self, safe_area_id="Compound"):
+        """Get safe area together with edges of its perimeter.
+        The compound area is only created again if safe areas were changed.
+
+        Input:
+         safe_area_id: unique string to identify safe area.
+         Default: 'Compound' = combination of all safe areas
+
+        Output:
+         safety_model: dictionary of the form:
+          path: matplotlib path object of safe area's perimeter
+
+          z_max: maximum value the microscope can safely move in the z direction
+
+          edges: numpy array of shape (k, 4) with x_start, y_start, x_end, y_end
+          for all edges of path
+
+         None if safe area does not exist
+        """
+        from matplotlib.path import Path as mpl_path
+
+        if safe_area_id in self.safe_areas:
+            safe_areas = [self.safe_areas[safe_area_id]]
+        elif safe_area_id == "Compound":
+            safe_areas = list(self.safe_areas.values())
+        else:
+            return None
+
+        # safe areas are kept in model, their ids cannot be reused
+        key = [(id(safe_area["path"]), safe_area["z_max"]) for safe_area in safe_areas]
+        safety_model = self._safety_models.get(safe_area_id)
+        if safety_model is not None and safety_model["key"] == key:
+            return safety_model
+
+        # create compound area out of all safe areas
+        compound_path = None
+        edges = []
+        for safe_area in safe_areas:
+            safe_path = safe_area["path"]
+            if compound_path is None:
+                compound_path = safe_path
+                z_max = safe_area["z_max"]
+            else:
+                compound_path = mpl_path.make_compound_path(compound_path, safe_path)
+                z_max = min((z_max, safe_area["z_max"]))
+            edges.extend(
+                numpy.hstack((polygon[:-1], polygon[1:]))
+                for polygon in safe_path.to_polygons(closed_only=True)
+            )
+        safety_model = {
+            "key": key,
+            "safe_areas": safe_areas,
+            "path": compound_path,
+            "z_max": z_max,
+            "edges": numpy.vstack(edges) if edges else numpy.zeros((0, 4)),
+        }
+        self._safety_models[safe_area_id] = safety_model
+        return safety_model
+
     def get_safe_area(self, safe_area_id="Compound"):
         """Get safe travel area for microscope stage. Create compound area if requested.
         This compound area is a union of the x-y plane's areas with the minimum z value.
@@ -516,20 +893,8 @@ class Safety(MicroscopeComponent):
             return self.safe_areas[safe_area_id]
 
         if safe_area_id == "Compound":
-            # create compound area out of all existing safe areas
-            compound_path = None
-            for safe_area_name, safe_area in self.safe_areas.items():
-                safe_path = safe_area["path"]
-                if compound_path is None:
-                    compound_path = safe_path
-                    z_max = safe_area["z_max"]
-                else:
-                    compound_path = mpl_path.make_compound_path(
-                        compound_path, safe_path
-                    )
-                    z_max = min((z_max, safe_area["z_max"]))
-
-            safe_area = {"path": compound_path, "z_max": z_max}
+            safety_model = self._get_safety_model(safe_area_id)
+            safe_area = {"path": safety_model["path"], "z_max": safety_model["z_max"]}
             return safe_area
 
     def is_safe_position(self, x, y, z, safe_area_id="Compound"):
@@ -548,7 +913,7 @@ class Safety(MicroscopeComponent):
          is_safe: True if position is safe, otherwise False
         """
         log_method(self, "is_safe_position")
-        safe_area = self.get_safe_area(safe_area_id)
+        safe_area = self._get_safety_model(safe_area_id)
 
         is_safe = safe_area["path"].contains_point([x, y]) and safe_area["z_max"] > z
         return is_safe
@@ -571,30 +936,79 @@ class Safety(MicroscopeComponent):
          is_safe: True if path is safe, otherwise False
         """
         log_method(self, "is_safe_travel_path")
-        safe_area = self.get_safe_area(safe_area_id)
-
-        # Interpolate path. Path.contains_path appears to test only vertices.
-        # Find necessary density for interpolation steps
-        # Length of path
-        length = 0.0
-        is_safe = False
-        for vert in path.iter_segments():
-            if vert[1] == mpl_path.MOVETO:
-                start = vert[0]
-            if vert[1] == mpl_path.LINETO:
-                length = length + math.sqrt(
-                    (vert[0][0] - start[0]) ** 2 + (vert[0][1] - start[1]) ** 2
-                )
-                start = vert[0]
-        if int(length) > 0:
-            is_safe = (
-                safe_area["path"].contains_path(path.interpolated(int(length)))
-                and safe_area["z_max"] > z
-            )
-        else:
-            is_safe = True
+        segments = _path_segments(path)
+        if not numpy.any(segments[:, 0:2] != segments[:, 2:4]):
+            # stage does not move
+            return True
+        safe_area = self._get_safety_model(safe_area_id)
+        if not safe_area["z_max"] > z:
+            return False
+        return bool(
+            _segments_in_area(segments, safe_area["path"], safe_area["edges"]).all()
+        )
 
-        return is_safe
+    def check_travel_segments(
+        self, start_positions, end_positions, safe_area_id="Compound"
+    ):
+        """Test for many straight moves in one pass if they stay within safe area.
+        Focus positions are not tested.
+
+        Input:
+         start_positions, end_positions: lists or arrays with (x, y) stage positions
+         in um at start and end of each move
+
+         safe_area_id: unique string to identify safe area.
+         Default: 'Compound' = combination of all safe areas
+
+        Output:
+         is_safe: numpy array with True for each move within safe area
+        """
+        log_method(self, "check_travel_segments")
+        start_positions = numpy.asarray(start_positions, dtype=float).reshape(-1, 2)
+        end_positions = numpy.asarray(end_positions, dtype=float).reshape(-1, 2)
+        safe_area = self._get_safety_model(safe_area_id)
+        return _segments_in_area(
+            numpy.hstack((start_positions, end_positions)),
+            safe_area["path"],
+            safe_area["edges"],
+        )
+
+    def is_safe_route(self, route, z_max_pos, safe_area_id="Compound", verbose=False):
+        """Test if stage can safely travel along a route with several moves.
+
+        Input:
+         route: list or array with stage positions [(x1, y1), (x2, y2), ...]
+         or [(x1, y1, z1), (x2, y2, z2), ...] in um visited in this order.
+         The stage moves along straight lines between positions.
+
+         z_max_pos: the highest position for z focus during travel
+
+         safe_area_id: unique string to identify safe area.
+         Default: 'Compound' = combination of all safe areas
+
+         verbose: if True, show travel path and safe area. Default: False
+
+        Output:
+         is_safe: True if all positions and moves are safe, otherwise False
+        """
+        from matplotlib.path import Path as mpl_path
+
+        log_method(self, "is_safe_route")
+        route = numpy.asarray(route, dtype=float)
+        if verbose:
+            self.show_safe_areas(path=mpl_path(route[:, 0:2]), point=route[0, 0:2])
+        safe_area = self._get_safety_model(safe_area_id)
+        if not safe_area["z_max"] > z_max_pos:
+            return False
+        if route.shape[1] > 2 and not numpy.all(safe_area["z_max"] > route[:, 2]):
+            return False
+        if not safe_area["path"].contains_points(route[:, 0:2]).all():
+            return False
+        return bool(
+            self.check_travel_segments(
+                route[:-1, 0:2], route[1:, 0:2], safe_area_id
+            ).all()
+        )
 
     def is_safe_move_from_to(
         self,
@@ -658,6 +1072,11 @@ class Safety(MicroscopeComponent):
         Output:
          none
         """
+        from matplotlib.path import Path as mpl_path
+        import matplotlib.pyplot as plt
+        import matplotlib.patches as patches
+        from matplotlib import cm
+
         log_method(self, "show_safe_areas")
         # setup figure
         fig = plt.figure()
@@ -800,6 +1219,8 @@ class Camera(MicroscopeComponent, ImageAICS):
         # call snap_image method in ConnectMicroscope instance.
         # This instance will be based on a microscope specific connect module.
         communication_object.snap_image(experiment)
+        # experiments can move stage, focus, and objective
+        self._invalidate_hardware_state()
         image = ImageAICS(meta={"aics_Experiment": experiment})
         image.add_meta(self.settings)
         return image
@@ -818,6 +1239,8 @@ class Camera(MicroscopeComponent, ImageAICS):
         log_method(self, "live_mode_start")
         communication_object.live_mode_start(experiment)
         self.live_mode_on = True
+        # user can operate the microscope while live mode is on
+        self._invalidate_hardware_state()
 
     def live_mode_stop(self, communication_object, experiment=None):
         """Stop live mode of ZEN software.
@@ -834,6 +1257,7 @@ class Camera(MicroscopeComponent, ImageAICS):
         log_method(self, "live_mode_stop")
         communication_object.live_mode_stop(experiment)
         self.live_mode_on = False
+        self._invalidate_hardware_state()
 
 
 ################################################################################
@@ -930,7 +1354,9 @@ class Stage(MicroscopeComponent):
          z is optional depending on microscope used.
         """
         log_method(self, "get_information")
-        positions = communication_object.get_stage_pos()
+        positions = self._query_hardware_state(
+            "position", communication_object.get_stage_pos
+        )
         if positions is None:
             positions = (None, None, None)
 
@@ -967,6 +1393,8 @@ class Stage(MicroscopeComponent):
          zStage: position of stage after movement in mum
          (optional depending on whether a z value was input)
         """
+        from matplotlib.path import Path as mpl_path
+
         log_method(self, "move_to_position")
         if test:
             xy_path = communication_object.move_stage_to(x, y, zPos=z, test=test)
@@ -975,6 +1403,14 @@ class Stage(MicroscopeComponent):
         if experiment is None:
             experiment = self.default_experiment
         positions = communication_object.move_stage_to(x, y, z, experiment)
+        if len(positions) == 3 and positions[2] is not None:
+            # stage moved focus drive as well
+            self._invalidate_hardware_state()
+        if None in positions:
+            # only cache positions reported by hardware
+            self._invalidate_hardware_state(all_components=False)
+        else:
+            self._update_hardware_state("position", tuple(positions))
         if len(positions) == 2:
             return positions[0], positions[1]
         else:
@@ -1162,7 +1598,9 @@ class ObjectiveChanger(MicroscopeComponent):
         """
         log_method(self, "get_objective_magnification")
         # get magnification from hardware
-        magnification = communication_object.get_objective_magnification()
+        magnification = self._query_hardware_state(
+            "magnification", communication_object.get_objective_magnification
+        )
         return magnification
 
     def get_objective_information(self, communication_object):
@@ -1186,7 +1624,9 @@ class ObjectiveChanger(MicroscopeComponent):
           'experiment': 'name'
         """
         log_method(self, "get_objective_information")
-        objective_name = communication_object.get_objective_name()
+        objective_name = self._query_hardware_state(
+            "name", communication_object.get_objective_name
+        )
         if objective_name in self.objective_information:
             objective_information = self.objective_information[objective_name]
         else:
@@ -1256,9 +1696,13 @@ class ObjectiveChanger(MicroscopeComponent):
         """
         log_method(self, "get_information")
         # get name of objective from hardware
-        objective_name = communication_object.get_objective_name()
+        objective_name = self._query_hardware_state(
+            "name", communication_object.get_objective_name
+        )
         objective_magnification = self.get_objective_magnification(communication_object)
-        objective_position = communication_object.get_objective_position()
+        objective_position = self._query_hardware_state(
+            "position", communication_object.get_objective_position
+        )
         init_experiment = self.objective_information[objective_name]["experiment"]
         return {
             "name": objective_name,
@@ -1314,6 +1758,8 @@ class ObjectiveChanger(MicroscopeComponent):
         objective_name = communication_object.switch_objective(
             objective["Position"], load=load
         )
+        # switching objectives moves focus drive
+        self._invalidate_hardware_state()
         return objective_name
 
     def change_position(self, position, communication_object, load=True):
@@ -1332,6 +1778,8 @@ class ObjectiveChanger(MicroscopeComponent):
         """
         log_method(self, "change_position")
         objective_name = communication_object.switch_objective(position, load=load)
+        # switching objectives moves focus drive
+        self._invalidate_hardware_state()
         return objective_name
 
 
@@ -1471,7 +1919,9 @@ class FocusDrive(MicroscopeComponent):
         """
         log_method(self, "get_abs_position")
         # get current absolute focus position w/o any drift corrections
-        absZ = communication_object.get_focus_pos()
+        absZ = self._query_hardware_state(
+            "position", communication_object.get_focus_pos
+        )
         return absZ
 
     def get_information(self, communication_object):
@@ -1534,6 +1984,7 @@ class FocusDrive(MicroscopeComponent):
         log_method(self, "move_to_position")
 
         zFocus = communication_object.move_focus_to(z)
+        self._update_hardware_state("position", zFocus)
         return zFocus
 
     def goto_load(self, communication_object):
@@ -1552,6 +2003,7 @@ class FocusDrive(MicroscopeComponent):
         except LoadNotDefinedError as error:
             # add focus drive instance to exception
             raise LoadNotDefinedError(message=error.message, error_component=self)
+        self._update_hardware_state("position", z_load)
         return z_load
 
     def goto_work(self, communication_object):
@@ -1565,6 +2017,7 @@ class FocusDrive(MicroscopeComponent):
         """
         log_method(self, "goto_work")
         z_work = communication_object.move_focus_to_work()
+        self._update_hardware_state("position", z_work)
         return z_work
 
     def define_load_position(self, communication_object):
@@ -1889,6 +2342,7 @@ class AutoFocus(MicroscopeComponent):
          z: position of focus drive after find surface
         """
         log_method(self, "find_surface")
+        self._invalidate_hardware_state()
         z = communication_object.find_surface()
         #         self.store_focus()
         return z
@@ -1982,6 +2436,8 @@ class AutoFocus(MicroscopeComponent):
             delta_z = self.last_delta_z
             return delta_z
 
+        # autofocus moves focus drive, also if it fails
+        self._invalidate_hardware_state()
         try:
             z = communication_object.recall_focus(pre_set_focus=pre_set_focus)
             if verbose:
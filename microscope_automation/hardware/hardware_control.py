@@ -65,6 +65,9 @@ class BaseMicroscope(object):
 
         self.name = name
 
+        # cache for stage, focus, and objective positions to reduce requests to hardware
+        self.hardware_state = hardware_components.HardwareStateCache()
+
         # add control software object (only one is allowed) to Microscope
         self.add_control_software(control_software_object)
 
@@ -97,6 +100,8 @@ class BaseMicroscope(object):
         Output:
          return_dialog: value of the error dialog
         """
+        # hardware might be in unknown state after error or was changed by user
+        self.invalidate_hardware_state()
 
         if isinstance(error, AutofocusError):
             return_dialog = error.error_dialog()
@@ -202,6 +207,53 @@ class BaseMicroscope(object):
         """
         hardware_components.log_method(self, "add_control_software")
         self.__control_software = control_software_object
+        self.invalidate_hardware_state()
+
+    def invalidate_hardware_state(self):
+        """Forget cached positions of all components.
+        Next request will retrieve positions from hardware.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        self.hardware_state.invalidate()
+
+    def get_hardware_state_statistics(self):
+        """Get number of requests to hardware saved by hardware state cache.
+
+        Input:
+         none
+
+        Output:
+         statistics: dictionary with
+          'RoundTripsSaved': number of requests answered from cache
+
+          'RoundTrips': number of requests sent to hardware
+
+          'Updates': number of positions stored after move commands
+
+          'Invalidations': number of times cache was cleared
+        """
+        return self.hardware_state.get_statistics()
+
+    def get_simulated_clock(self):
+        """Return clock of simulated microscope that predicts duration
+        of hardware operations.
+
+        Input:
+         none
+
+        Output:
+         simulated_clock: object with methods start_step and get_step_times.
+         None if microscope is not simulated.
+        """
+        try:
+            return self._get_control_software().connection.get_simulated_clock()
+        except AttributeError:
+            return None
 
     def _get_control_software(self):
         """Returns object that connects this code to the vendor specific
@@ -368,6 +368,8 @@ class SpinningDisk3i(BaseMicroscope):
             self.last_experiment = capture_settings
         except AutomationError as error:
             self.recover_hardware(error)
+        # experiments move stage and focus
+        self.invalidate_hardware_state()
 
         timeEnd = datetime.datetime.now()
 
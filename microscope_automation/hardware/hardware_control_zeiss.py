@@ -9,7 +9,6 @@ Split into hardware_control and hardware_control_zeiss on Sept. 22 2020
 """
 
 import datetime
-import time
 import os
 import collections
 from microscope_automation.util import automation_messages_form_layout as message
@@ -26,8 +25,11 @@ from microscope_automation.util.automation_exceptions import (
     AutofocusNoReferenceObjectError,
     FileExistsError,
     HardwareNotReadyError,
+    HardwareTimeoutError,
+    HardwareCommandNotDefinedError,
 )
 from microscope_automation.util.image_AICS import ImageAICS
+from microscope_automation.util.polling import wait_until
 
 # setup logging
 import logging
@@ -78,6 +80,9 @@ class SpinningDiskZeiss(BaseMicroscope):
 
         self.name = name
 
+        # cache for stage, focus, and objective positions to reduce requests to hardware
+        self.hardware_state = hardware_components.HardwareStateCache()
+
         # add control software object (only one is allowed) to Microscope
         self.add_control_software(control_software_object)
 
@@ -106,6 +111,8 @@ class SpinningDiskZeiss(BaseMicroscope):
         Output:
          return_dialog: value of the error dialog
         """
+        # hardware might be in unknown state after error or was changed by user
+        self.invalidate_hardware_state()
         if isinstance(error, AutofocusError):
             return_dialog = error.error_dialog()
             if return_dialog == 1:
@@ -1101,24 +1108,30 @@ class SpinningDiskZeiss(BaseMicroscope):
         )
         objective_changer_object.get_objective_information(communication_object)
 
-        counter = 0
-        while (
-            experiment_object.get_objective_position()
-            != objective_changer_object.get_information(communication_object)[
-                "position"
-            ]
-        ):
-            # wait one second
-            time.sleep(1)
-
-            counter = counter + 1
-            if counter == 5:
-                raise HardwareNotReadyError(
-                    message="Objective not ready for experiment {}.".format(
-                        objective_changer_object.get_init_experiment()
-                    ),
-                    error_component=objective_changer_object,
-                )
+        def objective_in_position():
+            # objective might still be moving, do not use cached position
+            self.hardware_state.invalidate(objective_changer_id, "position")
+            return (
+                experiment_object.get_objective_position()
+                == objective_changer_object.get_information(communication_object)[
+                    "position"
+                ]
+            )
+
+        try:
+            wait_until(
+                objective_in_position,
+                name="zeiss.wait_for_objective_position",
+                timeout=5,
+                error_component=objective_changer_object,
+            )
+        except HardwareTimeoutError:
+            raise HardwareNotReadyError(
+                message="Objective not ready for experiment {}.".format(
+                    objective_changer_object.get_init_experiment()
+                ),
+                error_component=objective_changer_object,
+            )
 
         # if reference position is not set, set it,
         # otherwise use stored reference position and correct for offset.
@@ -1295,6 +1308,8 @@ class SpinningDiskZeiss(BaseMicroscope):
                     )
                 success = True
             except AutomationError as error:
+                # do not trust cached positions after failed move
+                self.invalidate_hardware_state()
                 trials_count = trials_count - 1
                 if trials_count > 0:
 
@@ -1305,6 +1320,116 @@ class SpinningDiskZeiss(BaseMicroscope):
                     raise
         return x_final, y_final, z_final
 
+    def validate_position_list(
+        self,
+        position_list,
+        stage_id=None,
+        focus_drive_id=None,
+        objective_changer_id=None,
+        auto_focus_id=None,
+        safety_id=None,
+        safe_area="Compound",
+        reference_object_id=None,
+        verbose=False,
+    ):
+        """Correct list of positions for objective offset and autofocus drift and test
+        if stage can safely travel along all positions.
+        Used to acquire multiple positions with a single experiment.
+        The microscope software does not retract focus or recall focus
+        between positions. The stage travels with focus at the imaging positions
+        and the autofocus drift stored with the last recall is used for all positions.
+
+        Input:
+         position_list: list with positions [(x1, y1, z1), (x2, y2, z2), ...]
+         in absolute system coordinates
+
+         stage_id, focus_drive_id: strings to identify stage and focus drive
+
+         objective_changer_id: string to identify objective changer
+
+         auto_focus_id: string to identify autofocus.
+         Autofocus must not be in use.
+
+         safety_id: string to identify safety object
+
+         safe_area: name of safe area withing safety object
+         (default: 'compound' = combine all areas)
+
+         reference_object_id: ID of object of type sample (ImagingSystem).
+         Used to correct for xyz offset between different objectives
+
+         verbose: if True, show travel path and safe area (Default: False)
+
+        Output:
+         stage_position_list: list with positions corrected for objective offset
+         and autofocus drift
+        """
+        from matplotlib.path import Path as mpl_path
+
+        hardware_components.log_method(self, "validate_position_list")
+
+        focus_drive_object = self._get_microscope_object(focus_drive_id)
+        objective_changer_object = self._get_microscope_object(objective_changer_id)
+        auto_focus_object = self._get_microscope_object(auto_focus_id)
+        stage_object = self._get_microscope_object(stage_id)
+        safety_object = self._get_microscope_object(safety_id)
+        communication_object = self._get_control_software().connection
+
+        if auto_focus_object.get_use_autofocus():
+            raise HardwareCommandNotDefinedError(
+                message="Cannot use autofocus when acquiring multiple positions "
+                "with a single experiment.",
+                error_component=auto_focus_object,
+            )
+        # autofocus is not in use, returns drift stored with last recall
+        delta_z = auto_focus_object.recall_focus(
+            communication_object, reference_object_id, verbose=verbose
+        )
+        if delta_z is None:
+            delta_z = 0
+
+        stage_info = stage_object.get_information(communication_object)
+        focus_drive_info = focus_drive_object.get_information(communication_object)
+        offset = objective_changer_object.get_objective_information(
+            communication_object
+        )
+        stage_position_list = [
+            (
+                x + offset["x_offset"],
+                y + offset["y_offset"],
+                z + offset["z_offset"] + delta_z,
+            )
+            for x, y, z in position_list
+        ]
+
+        # focus is not retracted between positions
+        z_targets = [z for _, _, z in stage_position_list]
+        z_max_pos = max([focus_drive_info["absolute"]] + z_targets)
+
+        # stage moves first along x and than along y axis (see move_stage_to)
+        # focus is at most at z_max_pos while stage travels between positions
+        x_current, y_current = stage_info["absolute"][0:2]
+        route = [(x_current, y_current, focus_drive_info["absolute"])]
+        for x_target, y_target, z_target in stage_position_list:
+            route.extend(
+                [(x_target, route[-1][1], z_max_pos), (x_target, y_target, z_target)]
+            )
+        xy_path = [(x, y) for x, y, _ in route]
+        is_safe = safety_object.is_safe_route(
+            route, z_max_pos, safe_area, verbose=verbose
+        )
+        if not is_safe:
+            safety_object.show_safe_areas(path=mpl_path(xy_path))
+            raise CrashDangerError(
+                "Danger of hardware crash detected when attempting to acquire images at {} positions starting at ({}, {}, {})".format(  # noqa
+                    len(stage_position_list),
+                    x_current,
+                    y_current,
+                    focus_drive_info["absolute"],
+                )
+            )
+        return stage_position_list
+
     def run_macro(self, macro_name=None, macro_param=None):
         """Function to run a given Macro in the Zen Software
 
@@ -1316,9 +1441,16 @@ class SpinningDiskZeiss(BaseMicroscope):
         """
         communication_object = self._get_control_software().connection
         communication_object.run_macro(macro_name, macro_param)
+        # macros can operate any hardware
+        self.invalidate_hardware_state()
 
     def execute_experiment(
-        self, experiment=None, file_path=None, z_start="C", interactive=False
+        self,
+        experiment=None,
+        file_path=None,
+        z_start="C",
+        interactive=False,
+        position_list=None,
     ):
         """Trigger microscope to execute experiment defined within vendor software.
         Class ImageAICS is a container for meta and image data.
@@ -1336,6 +1468,11 @@ class SpinningDiskZeiss(BaseMicroscope):
 
          interactive: if True, allow user to modify file name if file exists
 
+         position_list: list with stage coordinates [(x1, y1, z1), (x2 ...].
+         If not None acquire images at all positions with one experiment.
+         Positions have to be corrected for objective offset
+         and validated with validate_position_list. Default: None
+
         Output:
          image: image of class ImageAICS to hold metadata.
          Does not contain image data at this moment.
@@ -1346,6 +1483,8 @@ class SpinningDiskZeiss(BaseMicroscope):
         timeStart = datetime.datetime.now()
 
         communication_object = self._get_control_software().connection
+        # experiments move stage and focus
+        self.invalidate_hardware_state()
 
         # adjust position for z-stack and tile scan
         # ZEN acquires z-stack with center of current positions
@@ -1361,7 +1500,7 @@ class SpinningDiskZeiss(BaseMicroscope):
             if z_start == "L":
                 communication_object.z_down_relative(z_stack_range / 2)
 
-        if experiment_object.is_tile_scan():
+        if position_list is None and experiment_object.is_tile_scan():
             # use current position and set as center of tile_scan
             x, y = communication_object.get_stage_pos()
             z = communication_object.get_focus_pos()
@@ -1370,11 +1509,17 @@ class SpinningDiskZeiss(BaseMicroscope):
             communication_object.close_experiment(experiment)
 
         try:
-            communication_object.execute_experiment(experiment)
+            if position_list is None:
+                communication_object.execute_experiment(experiment)
+            else:
+                communication_object.execute_experiment(
+                    experiment, pos_list=position_list
+                )
             self.last_experiment = experiment
             self.last_objective_position = communication_object.get_objective_position()
         except AutomationError as error:
             self.recover_hardware(error)
+        self.invalidate_hardware_state()
 
         timeEnd = datetime.datetime.now()
 
@@ -4,8 +4,11 @@ Created on Aug 23, 2018
 Tools to find positions for imaging
 @author: winfriedw
 """
+from concurrent.futures import ProcessPoolExecutor
 from microscope_automation.samples import samples
-from microscope_automation.samples.well_overview_segmentation import WellSegmentation
+
+# segmentation modules import scikit-image and scipy,
+# they are imported when images are segmented
 
 
 def copy_zero_position(sample_object, output_class, image, z_center_background=0):
@@ -213,6 +216,10 @@ def segmentation(image_data, segmentation_type="colony", segmentation_settings=N
     Output:
      segmented_position_list: list with (x, y) positions
     """
+    from microscope_automation.samples.well_overview_segmentation import (
+        WellSegmentation,
+    )
+
     if segmentation_type == "colony":
         # 1. Call segment well module to find imageable positions
         filters = segmentation_settings.getPref("Filters")
@@ -239,6 +246,84 @@ def segmentation(image_data, segmentation_type="colony", segmentation_settings=N
     return segmented_position_list
 
 
+def segment_well_image(image_data, segmentation_settings=None):
+    """Find imageable positions in well overview image.
+    Module level function to allow execution in separate process.
+
+    Input:
+     image_data: 2D numpy array with image data
+
+     segmentation_settings: dictionary with keyword arguments for
+     well_segmentation_refined.WellSegmentation (e.g. colony_filters_dict, mode).
+     Default (None) use default settings
+
+    Output:
+     segmented_position_list: list with (x, y) positions
+    """
+    from microscope_automation.samples import well_segmentation_refined
+
+    if segmentation_settings is None:
+        segmentation_settings = {}
+    segmented_well = well_segmentation_refined.WellSegmentation(
+        image_data, **segmentation_settings
+    )
+    segmented_well.segment_and_find_positions()
+    return segmented_well.point_locations
+
+
+def segment_well_images(image_data_list, segmentation_settings=None, workers=0):
+    """Segment well overview images in parallel processes.
+    Results are returned in order of image_data_list as soon as they are available,
+    the first result can be used while later images are still segmented.
+
+    Input:
+     image_data_list: list with 2D numpy arrays with image data
+
+     segmentation_settings: dictionary with keyword arguments for
+     well_segmentation_refined.WellSegmentation.
+     Default (None) use default settings
+
+     workers: number of processes used for segmentation.
+     0: segment each image in calling process when requested (Default: 0)
+
+    Output:
+     generator returning tuples (index, segmented_position_list, error)
+     for each image. error is None if segmentation was successful,
+     otherwise it is the exception raised and segmented_position_list is None
+    """
+    if workers <= 0 or len(image_data_list) < 2:
+        for index, image_data in enumerate(image_data_list):
+            try:
+                result = (
+                    index,
+                    segment_well_image(image_data, segmentation_settings),
+                    None,
+                )
+            except Exception as error:
+                result = (index, None, error)
+            yield result
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    futures = [
+        executor.submit(segment_well_image, image_data, segmentation_settings)
+        for image_data in image_data_list
+    ]
+    try:
+        for index, future in enumerate(futures):
+            try:
+                result = (index, future.result(), None)
+            except Exception as error:
+                # failure of one well does not stop segmentation of other wells
+                result = (index, None, error)
+            yield result
+    finally:
+        # do not wait for wells nobody will look at
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
 def find_interactive_distance_map(
     sample_object, output_class, image, segmentation_settings=None, app=None
 ):
@@ -22,9 +22,9 @@ import argparse
 import string
 import inspect
 import copy
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
-from matplotlib.pyplot import imsave
 
 from microscope_automation.settings import preferences
 from microscope_automation.util import automation_messages_form_layout as message
@@ -55,21 +55,20 @@ from microscope_automation.util.automation_exceptions import (
 )
 from microscope_automation.util.software_state import State
 from microscope_automation.orchestrator.find_positions import (
+    segment_well_images,
     create_output_objects_from_parent_object,
     convert_location_list,
 )
 from microscope_automation.orchestrator.write_zen_tiles_experiment import PositionWriter
+from microscope_automation.orchestrator.route_planner import plan_route
 from microscope_automation.util.image_AICS import ImageAICS
-from microscope_automation.samples.well_segmentation_refined import WellSegmentation
+from microscope_automation.util import image_writer
 
 import pickle
-import pyqtgraph
-from pyqtgraph.Qt import QtGui
-from aicsimageio import AICSImage
 import csv
 
-import tkinter as tk
-from tkinter import filedialog
+# scientific and GUI packages (matplotlib, aicsimageio, pyqtgraph, tkinter)
+# are imported in the functions using them to keep start up of automation fast
 
 ################################################################################
 #
@@ -117,6 +116,57 @@ VALID_FINDTYPE = [
 ]
 VALID_WELLS = [x + str(y) for x in string.ascii_uppercase[0:8] for y in range(1, 13)]
 VALID_BLOCKING = [True, False]
+INTERACTIVE_FINDTYPE = ["Interactive", "InteractiveDistanceMap"]
+VALID_ROUTESTRATEGY = ["None", "Serpentine", "NearestNeighbour", "TwoOpt"]
+VALID_BATCHACQUISITION = [True, False]
+
+# preferences of experiments in workflow that are validated before workflow starts
+# keys are preference names, values are lists with valid values
+EXPERIMENT_PREFS_SCHEMA = {
+    "FunctionName": VALID_FUNCTIONNAME,
+    "Verbose": VALID_VERBOSE,
+    "Blocking": VALID_BLOCKING,
+    "Wells": VALID_WELLS,
+    "Load": VALID_LOAD,
+    "LoadBetweenWells": VALID_LOADBETWEENWELLS,
+    "UseAutoFocus": VALID_USEAUTOFOCUS,
+    "UseReference": VALID_USEREFERENCE,
+    "ManualRefocus": VALID_MANUELREFOCUS,
+    "SnapImage": VALID_SNAPIMAGE,
+    "FindType": VALID_FINDTYPE,
+    "Tile": VALID_TILE_OBJECT,
+    "AddImmersionWater": VALID_ADDIMERSIONWATER,
+    "UsePump": VALID_USEPUMP,
+    "Koehler": VALID_KOEHLER,
+    "LaserSafety": VALID_LASERSAFETY,
+    "CopyColonyFile": VALID_COPYCOLONYFILES,
+    "AddColonies": VALID_ADDCOLONIES,
+    "RouteStrategy": VALID_ROUTESTRATEGY,
+    "BatchAcquisition": VALID_BATCHACQUISITION,
+}
+# preferences that have to be defined for experiments,
+# keys are function names, None for preferences required by all functions
+EXPERIMENT_REQUIRED_PREFS = {
+    None: ["FunctionName", "Wait"],
+    "scan_plate": [
+        "Experiment",
+        "Camera",
+        "NumberTrials",
+        "UseAutoFocus",
+        "UseReference",
+        "ManualRefocus",
+        "SnapImage",
+        "FindType",
+        "Tile",
+        "Load",
+        "LoadBetweenWells",
+        "AddImmersionWater",
+        "Folder",
+        "FileName",
+    ],
+    "segment_wells": ["Wells", "SourceFolder", "PositionCsv", "Folder"],
+}
+EXPERIMENT_REQUIRED_PREFS["scan_samples"] = EXPERIMENT_REQUIRED_PREFS["scan_plate"]
 
 
 class MicroscopeAutomation(object):
@@ -134,6 +184,9 @@ class MicroscopeAutomation(object):
 
         self.failed_wells = []
 
+        # predicted duration of workflow steps in s when microscope is simulated
+        self.predicted_step_times = None
+
         # instead of using a global variable, make the GUI an attribute
         self.app = app
 
@@ -1113,19 +1166,7 @@ class MicroscopeAutomation(object):
         )
 
         # Allow user to manually adjust focus position selected by auto focus
-        manual_refocus = imaging_settings.get_pref(
-            "ManualRefocus", valid_values=VALID_MANUELREFOCUS
-        )
-        if manual_refocus:
-            manual_refocus_after_repetitions = imaging_settings.get_pref(
-                "ManualRefocusAfterRepetitions"
-            )
-            if manual_refocus_after_repetitions == 0:
-                if repetition > 0:
-                    manual_refocus = False
-            else:
-                if repetition % manual_refocus_after_repetitions != 0:
-                    manual_refocus = False
+        manual_refocus = self._get_manual_refocus(imaging_settings, repetition)
 
         if verbose:
             print("Image Object ", sample_object.get_name())
@@ -1196,24 +1237,15 @@ class MicroscopeAutomation(object):
                     sample_object.get_image(),
                 )
 
-        if (
-            imaging_settings.get_pref("SnapImage", valid_values=VALID_SNAPIMAGE)
-            or (
-                (
-                    imaging_settings.get_pref("FindType", valid_values=VALID_FINDTYPE)
-                    is not None
-                )
-                and (
-                    imaging_settings.get_pref("FindType", valid_values=VALID_FINDTYPE)
-                    != "None"
-                )
-                and (
-                    imaging_settings.get_pref("FindType", valid_values=VALID_FINDTYPE)
-                    != "Copy"
-                )
+        acquire = imaging_settings.get_pref("SnapImage", valid_values=VALID_SNAPIMAGE)
+        if not acquire:
+            find_type = imaging_settings.get_pref(
+                "FindType", valid_values=VALID_FINDTYPE
             )
-            and sample_object.get_image()
-        ):
+            acquire = (
+                find_type not in [None, "None", "Copy"] and sample_object.get_image()
+            )
+        if acquire:
 
             tile_object = imaging_settings.get_pref(
                 "Tile", valid_values=VALID_TILE_OBJECT
@@ -1221,6 +1253,10 @@ class MicroscopeAutomation(object):
             pos_list = sample_object.get_tile_positions_list(
                 imaging_settings, tile_object=tile_object, verbose=verbose
             )
+            # acquire all tiles with a single experiment
+            batch_acquisition = imaging_settings.get_pref(
+                "BatchAcquisition", valid_values=VALID_BATCHACQUISITION, default=False
+            )
             images = sample_object.acquire_images(
                 experiment,
                 camera_id,
@@ -1232,6 +1268,7 @@ class MicroscopeAutomation(object):
                 use_auto_focus=use_auto_focus,
                 meta_dict=meta_dict,
                 verbose=verbose,
+                batch=batch_acquisition,
             )
             return_dict["Image"] = images
         else:
@@ -1242,6 +1279,126 @@ class MicroscopeAutomation(object):
 
     ################################################################################
 
+    def _get_manual_refocus(self, imaging_settings, repetition):
+        """Check if user adjusts focus position manually during this repetition.
+
+        Input:
+         imaging_settings: dictionary with preferences
+
+         repetition: counter for time lapse experiments
+
+        Output:
+         manual_refocus: True if user adjusts focus position of each object
+        """
+        manual_refocus = imaging_settings.get_pref(
+            "ManualRefocus", valid_values=VALID_MANUELREFOCUS
+        )
+        if manual_refocus:
+            manual_refocus_after_repetitions = imaging_settings.get_pref(
+                "ManualRefocusAfterRepetitions"
+            )
+            if manual_refocus_after_repetitions == 0:
+                if repetition > 0:
+                    manual_refocus = False
+            else:
+                if repetition % manual_refocus_after_repetitions != 0:
+                    manual_refocus = False
+        return manual_refocus
+
+    def _load_next_images(self, imaging_settings, sample_object, images):
+        """Stitch or load images of object for finding objects for next experiment.
+        Reads images through the microscope connection and has to be called
+        from the thread that controls the hardware.
+
+        Input:
+         imaging_settings: dictionary with preferences
+
+         sample_object: object images were acquired for
+
+         images: list with ImageAICS objects acquired for sample_object
+
+        Output:
+         tile_image: ImageAICS object with data and meta data
+        """
+        if len(images) > 1:
+            # border lists are not used for segmentation, yet
+            tile_image, _, _ = sample_object.tile_images(images, imaging_settings)
+        else:
+            image = images[0]
+            tile_image = sample_object.get_microscope().load_image(
+                image, get_meta=True
+            )  # loads the image & metadata
+        return tile_image
+
+    def _find_next_objects(
+        self, imaging_settings, sample_object, tile_image, experiment, find_type
+    ):
+        """Find objects for next experiment in image returned by _load_next_images.
+        Does not access microscope and can be executed in a separate thread
+        for non interactive find types.
+
+        Input:
+         imaging_settings: dictionary with preferences
+
+         sample_object: object images were acquired for
+
+         tile_image: ImageAICS object with data for sample_object
+
+         experiment: dictionary with keys 'Experiment', Repetitions', 'Input',
+         'Output', 'WorkflowList', 'WorflowType', 'ObjectsDict' and 'OriginalWorkflow'
+
+         find_type: method used to determine imaging locations
+
+        Output:
+         output_objects: list with tuples (output_name, new_objects_list,
+         new_objects_dict) for all requested output lists
+        """
+        # iterate over all requested output lists and find next objects
+        output_objects = []
+        for output_name, output_class in experiment["Output"].items():
+            next_experiment_objects_list = create_output_objects_from_parent_object(
+                find_type=find_type,
+                sample_object=sample_object,
+                imaging_settings=imaging_settings,
+                image=tile_image,
+                output_class=output_class,
+                app=self.app,
+                offset=(0, 0, 0),
+            )
+            output_objects.append(
+                (
+                    output_name,
+                    next_experiment_objects_list[0],
+                    next_experiment_objects_list[1],
+                )
+            )
+        return output_objects
+
+    def _add_next_objects(self, plate_object, output_objects, all_objects_dict):
+        """Add objects found with _find_next_objects to plate.
+
+        Input:
+         plate_object: object sample list belongs to
+
+         output_objects: list with tuples (output_name, new_objects_list,
+         new_objects_dict) as returned by _find_next_objects
+
+         all_objects_dict: dictionary with objects for multiple wells/colonies/cells.
+         Will be updated with new objects.
+
+        Output:
+         next_experiment_objects: list with objects for last output list
+        """
+        next_experiment_objects = []
+        for output_name, next_experiment_objects, new_objects_dict in output_objects:
+            plate_object.add_to_image_dir(
+                list_name=output_name, sample_object=next_experiment_objects
+            )
+            # Populate objects for multiple wells/colonies/cells
+            # in one common dictionary
+            all_objects_dict.update(new_objects_dict)
+        return next_experiment_objects
+
     def scan_all_objects(
         self,
         imaging_settings,
@@ -1290,7 +1447,20 @@ class MicroscopeAutomation(object):
         verbose = imaging_settings.get_pref("Verbose", valid_values=VALID_VERBOSE)
 
         find_type = imaging_settings.get_pref("FindType", valid_values=VALID_FINDTYPE)
-        tile_image = None
+
+        # Reorder objects to reduce stage travel. Objects within a well stay together.
+        route_strategy = imaging_settings.get_pref(
+            "RouteStrategy", valid_values=VALID_ROUTESTRATEGY, default="None"
+        )
+        if route_strategy != "None":
+            sample_list, route_info = plan_route(sample_list, strategy=route_strategy)
+            print(
+                "Route {}: estimated stage travel {:.0f} um, saved {:.0f} um".format(
+                    route_strategy,
+                    route_info["PlannedDistance"],
+                    route_info["SavedDistance"],
+                )
+            )
 
         # Define and if necessary create folder for images
         object_folder = imaging_settings.get_pref("Folder")
@@ -1356,129 +1526,155 @@ class MicroscopeAutomation(object):
         next_experiment_objects = []
         all_objects_dict = {}
         all_objects_list = []
-        for sample_counter, sample_object in enumerate(sample_list, 1):
-            # move stage and focus to new object
-            if current_well != sample_object.get_well_object():
-                if add_immersion_water:
-                    immersion_delivery.count_and_get_water(
-                        objective_magnification=magnification_immersion_system,
-                        verbose=verbose,
-                        automatic=use_pump,
-                    )
-                if load_between_wells:
-                    load = True  # noqa
-            # Removed, stage will move in scan_single_ROI
-            # _, _, _ = sampleObject.move_to_zero(load = load, verbose = verbose)
-            current_well = sample_object.get_well_object()
-            # load = load_between_objects
-
-            meta_dict = {
-                "aics_well": current_well.get_name(),
-                "aics_SampleType": sample_object.get_sample_type(),
-                "aics_SampleName": sample_object.get_name(),
-                "aics_barcode": sample_object.get_barcode(),
-                "aics_repetition": repetition,
-            }
 
-            print(
-                "{} {} is {} {} out of {} in {}. Repetition: {}".format(
-                    sample_object.get_sample_type(),
-                    sample_object.get_name(),
-                    sample_object.get_sample_type(),
-                    sample_counter,
-                    len(sample_list),
-                    plate_object.get_name(),
-                    repetition,
-                )
+        # Find objects for next experiment in separate threads.
+        # Hardware is only controlled from this thread.
+        # Interactive find types require user interface and run in this thread.
+        analysis_workers = imaging_settings.get_pref("AnalysisWorkers", default=0)
+        analysis_executor = None
+        in_flight = deque()
+        if analysis_workers > 0 and find_type not in INTERACTIVE_FINDTYPE:
+            max_in_flight = imaging_settings.get_pref(
+                "AnalysisMaxInFlight", default=2 * analysis_workers
             )
+            analysis_executor = ThreadPoolExecutor(max_workers=analysis_workers)
+        try:
+            for sample_counter, sample_object in enumerate(sample_list, 1):
+                # move stage and focus to new object
+                if current_well != sample_object.get_well_object():
+                    if add_immersion_water:
+                        immersion_delivery.count_and_get_water(
+                            objective_magnification=magnification_immersion_system,
+                            verbose=verbose,
+                            automatic=use_pump,
+                        )
+                    if load_between_wells:
+                        load = True  # noqa
+                # Removed, stage will move in scan_single_ROI
+                # _, _, _ = sampleObject.move_to_zero(load = load, verbose = verbose)
+                current_well = sample_object.get_well_object()
+                # load = load_between_objects
+
+                meta_dict = {
+                    "aics_well": current_well.get_name(),
+                    "aics_SampleType": sample_object.get_sample_type(),
+                    "aics_SampleName": sample_object.get_name(),
+                    "aics_barcode": sample_object.get_barcode(),
+                    "aics_repetition": repetition,
+                }
 
-            return_dict = self.scan_single_ROI(
-                imaging_settings=imaging_settings,
-                experiment_dict=experiment,
-                sample_object=sample_object,
-                reference_object=plate_object.get_reference_object(),
-                image_path=image_path,
-                meta_dict=meta_dict,
-                verbose=verbose,
-                number_selected_postions=len(next_experiment_objects),
-                repetition=repetition,
-            )
-            images = return_dict["Image"]
+                print(
+                    "{} {} is {} {} out of {} in {}. Repetition: {}".format(
+                        sample_object.get_sample_type(),
+                        sample_object.get_name(),
+                        sample_object.get_sample_type(),
+                        sample_counter,
+                        len(sample_list),
+                        plate_object.get_name(),
+                        repetition,
+                    )
+                )
 
-            # Update the positions that are imaged - for substeps in 100X z-stack scans
-            if isinstance(sample_object, samples.Cell):
-                self.state.add_last_experiment_object(sample_object.get_name())
-                # Autosave
-                self.state.save_state()
+                # number of selected positions is shown to user during refocus
+                if in_flight and self._get_manual_refocus(imaging_settings, repetition):
+                    while in_flight:
+                        next_experiment_objects = self._add_next_objects(
+                            plate_object, in_flight.popleft().result(), all_objects_dict
+                        )
 
-            # Find objects for next experiment (e.g. cells within colonies)
-            # check if output list was requested
-            if experiment["Output"] != "None":
-                # create tile
-                x_border_list = (
-                    []
-                )  # list of border coordinates when tiles images are put together
-                y_border_list = (
-                    []
-                )  # Used for segmentation later when recommending imageable locations
-
-                tile_image = None
-                try:
-                    if len(images) > 1:
-                        (
+                return_dict = self.scan_single_ROI(
+                    imaging_settings=imaging_settings,
+                    experiment_dict=experiment,
+                    sample_object=sample_object,
+                    reference_object=plate_object.get_reference_object(),
+                    image_path=image_path,
+                    meta_dict=meta_dict,
+                    verbose=verbose,
+                    number_selected_postions=len(next_experiment_objects),
+                    repetition=repetition,
+                )
+                images = return_dict["Image"]
+
+                # Update the positions that are imaged
+                # - for substeps in 100X z-stack scans
+                if isinstance(sample_object, samples.Cell):
+                    self.state.add_last_experiment_object(sample_object.get_name())
+                    # Autosave
+                    self.state.save_state()
+
+                # Find objects for next experiment (e.g. cells within colonies)
+                # check if output list was requested
+                if experiment["Output"] != "None":
+                    tile_image = self._load_next_images(
+                        imaging_settings, sample_object, images
+                    )
+                    if analysis_executor is None:
+                        output_objects = self._find_next_objects(
+                            imaging_settings,
+                            sample_object,
                             tile_image,
-                            x_border_list,
-                            y_border_list,
-                        ) = sample_object.tile_images(images, imaging_settings)
+                            experiment,
+                            find_type,
+                        )
+                        next_experiment_objects = self._add_next_objects(
+                            plate_object, output_objects, all_objects_dict
+                        )
                     else:
-                        image = images[0]
-                        tile_image = sample_object.get_microscope().load_image(
-                            image, get_meta=True
-                        )  # loads the image & metadata
-                except Exception:
-                    tile_image = None
-                    raise
+                        # analyze images while next object is acquired
+                        in_flight.append(
+                            analysis_executor.submit(
+                                self._find_next_objects,
+                                imaging_settings,
+                                sample_object,
+                                tile_image,
+                                experiment,
+                                find_type,
+                            )
+                        )
+                        # limit number of objects waiting for analysis
+                        while len(in_flight) >= max_in_flight:
+                            next_experiment_objects = self._add_next_objects(
+                                plate_object,
+                                in_flight.popleft().result(),
+                                all_objects_dict,
+                            )
 
-                # iterate over all requested output lists and find next objects
-                for output_name, output_class in experiment["Output"].items():
-                    next_experiment_objects_list = (
-                        create_output_objects_from_parent_object(
-                            find_type=find_type,
-                            sample_object=sample_object,
-                            imaging_settings=imaging_settings,
-                            image=tile_image,
-                            output_class=output_class,
-                            app=self.app,
-                            offset=(0, 0, 0),
+                # Wait for user interaction before continuing
+                if wait_after_image["Status"]:
+                    if self.less_dialog:
+                        # Fake user press (return False) if less dialog option
+                        # is enabled
+                        wait_after_image["Status"] = False
+                    else:
+                        wait_after_image["Status"] = message.wait_message(
+                            "Remove image on display and continue imaging"
                         )
-                    )
-                    next_experiment_objects = next_experiment_objects_list[0]
-                    plate_object.add_to_image_dir(
-                        list_name=output_name, sample_object=next_experiment_objects
-                    )
-                    # Populate objects for multiple wells/colonies/cells
-                    # in one common dictionary
-                    next_experiment_objects_dict = next_experiment_objects_list[1]
-                    for object in next_experiment_objects_dict:
-                        all_objects_dict[object] = next_experiment_objects_dict[object]
 
-            # Wait for user interaction before continuing
-            if wait_after_image["Status"]:
-                if self.less_dialog:
-                    # Fake user press (return False) if less dialog option is enabled
-                    wait_after_image["Status"] = False
-                else:
-                    wait_after_image["Status"] = message.wait_message(
-                        "Remove image on display and continue imaging"
-                    )
+                # close all images in microscope software
+                sample_object.remove_images()
 
-            # close all images in microscope software
-            sample_object.remove_images()
+                if not return_dict["Continue"]:
+                    raise StopCollectingError(
+                        "Stop collecting {}".format(sample_object.get_sample_type())
+                    )
 
-            if not return_dict["Continue"]:
-                raise StopCollectingError(
-                    "Stop collecting {}".format(sample_object.get_sample_type())
+            # add remaining objects in original order
+            while in_flight:
+                next_experiment_objects = self._add_next_objects(
+                    plate_object, in_flight.popleft().result(), all_objects_dict
                 )
+        except BaseException:
+            # keep objects found for all objects imaged before scan stopped
+            while in_flight:
+                future = in_flight.popleft()
+                if future.exception() is None:
+                    self._add_next_objects(
+                        plate_object, future.result(), all_objects_dict
+                    )
+            raise
+        finally:
+            if analysis_executor is not None:
+                analysis_executor.shutdown(wait=True)
 
         self.state.add_next_experiment_object(
             experiment["Experiment"], all_objects_list
@@ -1552,6 +1748,8 @@ class MicroscopeAutomation(object):
         Output:
          none
         """
+        from aicsimageio import AICSImage
+
         # Get the well names and plates
         well_names_list = imaging_settings.get_pref("Wells", valid_values=VALID_WELLS)
         plates = plate_holder_object.get_plates()
@@ -1588,56 +1786,49 @@ class MicroscopeAutomation(object):
                     }
                     images_list.append(ImageAICS(image_data, image_meta))
 
-        segmentation_info_dict = OrderedDict()
-        # Segment each image and store the points found
-        for plate_counter, (plate_name, plate_object) in enumerate(plates.items(), 1):
-            for image in images_list:
-                well_name = image.get_meta("aics_well")
-                image_data = image.get_data()
-                if image_data.ndim == 3:
-                    # Remove the channel dimension before calling the location_picker
-                    image_data = image_data[:, :, 0]
-                # Call segment well module to find imageable positions
-                filters = imaging_settings.get_pref("Filters")
-                segmented_well = None
-                try:
-                    canny_sigma = imaging_settings.get_pref("CannySigma")
-                    canny_low_threshold = imaging_settings.get_pref("CannyLowThreshold")
-                    remove_small_holes_area_threshold = imaging_settings.get_pref(
-                        "RemoveSmallHolesAreaThreshold"
-                    )
-
-                    #Determine imaging mode, default to A if not available.
-                    imaging_mode = "A"
-                    try:
-                        imaging_mode = imaging_settings.get_pref("ImagingMode")
-                    finally:
-                        segmented_well = WellSegmentation(
-                            image_data,
-                            colony_filters_dict=filters,
-                            mode=imaging_mode,
-                            canny_sigma=canny_sigma,
-                            canny_low_threshold=canny_low_threshold,
-                            remove_small_holes_area_threshold=remove_small_holes_area_threshold,  # noqa
-                        )
-                except Exception:
-                    # if the preferences are not set, call with default ones
-                    segmented_well = WellSegmentation(
-                        image_data, colony_filters_dict=filters
-                    )
-
-                segmented_well.segment_and_find_positions()
-                segmented_position_list = segmented_well.point_locations
-
-                well_object = plate_object.get_well(well_name)
-                segmentation_info_dict.update(
-                    {
-                        well_object: {
-                            "image": image,
-                            "position_list": segmented_position_list,
-                        }
-                    }
-                )
+        # Segmentation settings are identical for all wells
+        filters = imaging_settings.get_pref("Filters")
+        try:
+            segmentation_settings = {
+                "colony_filters_dict": filters,
+                "canny_sigma": imaging_settings.get_pref("CannySigma"),
+                "canny_low_threshold": imaging_settings.get_pref("CannyLowThreshold"),
+                "remove_small_holes_area_threshold": imaging_settings.get_pref(
+                    "RemoveSmallHolesAreaThreshold"
+                ),
+                "mode": imaging_settings.get_pref("ImagingMode"),
+            }
+        except Exception:
+            # if the preferences are not set, call with default ones
+            segmentation_settings = {"colony_filters_dict": filters}
+
+        image_data_list = []
+        for image in images_list:
+            image_data = image.get_data()
+            if image_data.ndim == 3:
+                # Remove the channel dimension before calling the location_picker
+                image_data = image_data[:, :, 0]
+            image_data_list.append(image_data)
+
+        # Segment wells in separate processes, wells are returned in order
+        # and can be approved while remaining wells are segmented
+        segmentation_workers = imaging_settings.get_pref(
+            "SegmentationWorkers", default=0
+        )
+        segmentation_results = segment_well_images(
+            image_data_list, segmentation_settings, workers=segmentation_workers
+        )
+        segmented_position_lists = []
+        approval_list = [
+            (
+                plate_object,
+                plate_object.get_well(image.get_meta("aics_well")),
+                image,
+                index,
+            )
+            for plate_object in plates.values()
+            for index, image in enumerate(images_list)
+        ]
 
         all_objects_dict = {}
         all_objects_list = []
@@ -1665,11 +1856,23 @@ class MicroscopeAutomation(object):
         )
         try:
             # Display each image for point approval
-            for well_object in segmentation_info_dict.keys():
-                image_data = segmentation_info_dict[well_object]["image"].get_data()
-                segmented_position_list = segmentation_info_dict[well_object][
-                    "position_list"
-                ]
+            for plate_object, well_object, image, index in approval_list:
+                image_data = image.get_data()
+                # wait for segmentation of this well, results are reused for all plates
+                while len(segmented_position_lists) <= index:
+                    _, position_list, error = next(segmentation_results)
+                    if error is not None:
+                        logging.getLogger(__name__).error(
+                            "Segmentation of well {} failed: {}".format(
+                                well_object.get_name(), error
+                            )
+                        )
+                    segmented_position_lists.append((position_list, error))
+                segmented_position_list, error = segmented_position_lists[index]
+                if error is not None:
+                    # failed segmentation does not stop approval of other wells
+                    self.failed_wells.append(well_object)
+                    continue
                 # Store each image (with red +) in the target folder
                 # location_list will be an empty list if user determines well is failed
                 location_list = well_object.set_interactive_positions(
@@ -1741,6 +1944,8 @@ class MicroscopeAutomation(object):
                     for object in new_objects_dict:
                         all_objects_dict[object] = new_objects_dict[object]
         finally:
+            # stop segmentation of wells that will not be approved
+            segmentation_results.close()
             # write each position to the file
             with open(str(position_csv_filepath), mode="a") as position_file:
                 position_writer = csv.writer(
@@ -1769,7 +1974,7 @@ class MicroscopeAutomation(object):
                 fail_position_writer.writerow(["well_id", "plate_barcode"])
                 for failed in self.failed_wells:
                     fail_position_writer.writerow(
-                        [failed.im_self.name, failed.im_self.container.barcode]
+                        [failed.get_name(), failed.get_container().get_barcode()]
                     )
 
         self.state.add_next_experiment_object(
@@ -1810,7 +2015,7 @@ class MicroscopeAutomation(object):
             )
             pos_list_saver = PositionWriter(
                 self.prefs.prefs["Info"]["System"],
-                plate_object.get_barcode(),
+                barcode,
                 daily_folder,
             )
             print(position_list_for_csv)
@@ -2096,6 +2301,8 @@ class MicroscopeAutomation(object):
         image_path = image_aics.create_file_name(
             (segmented_image_dir, image_file_name_template)
         )
+        from matplotlib.pyplot import imsave
+
         imsave(image_path, image_data_save.squeeze().T, cmap="gray")
 
     ############################################################################
@@ -2280,6 +2487,41 @@ class MicroscopeAutomation(object):
     #
     ################################################################################
 
+    def compile_workflow_prefs(self, experiments):
+        """Read and validate preferences for all experiments in workflow.
+        Missing or invalid preferences are reported together before
+        the workflow starts.
+
+        Input:
+         experiments: list with names of experiments in workflow
+
+        Output:
+         experiment_prefs: dictionary with experiment names as keys and
+         preferences.PreferencesSnapshot objects as values
+        """
+        experiment_prefs, problems = preferences.compile_workflow(
+            self.prefs,
+            schema=EXPERIMENT_PREFS_SCHEMA,
+            required_prefs=EXPERIMENT_REQUIRED_PREFS,
+            experiments=experiments,
+        )
+        if problems:
+            logger = logging.getLogger(__name__)
+            for problem in problems:
+                logger.warning("Preferences: {}".format(problem))
+            if not self.less_dialog:
+                return_code = message.information_message(
+                    "Problems in preferences",
+                    "The following preferences are missing or not valid:\n{}\n"
+                    "You will be asked for these values during the workflow.".format(
+                        "\n".join(problems)
+                    ),
+                    return_code=True,
+                )
+                if return_code == 0:
+                    self.state.save_state_and_exit()
+        return experiment_prefs
+
     def microscope_automation(self):
         """Main script for Microscope automation.
 
@@ -2410,6 +2652,9 @@ class MicroscopeAutomation(object):
             else:
                 objects_dict = next_objects_dict
 
+        # read and validate preferences for all experiments before plate is scanned
+        experiment_prefs = self.compile_workflow_prefs(workflow_experiments)
+
         # setup plate holder with plate, wells, and colonies
         colony_file = None
         barcode = None
@@ -2477,9 +2722,14 @@ class MicroscopeAutomation(object):
         meta_data_file_object = MetaDataFile(meta_data_file_path, meta_data_format)
         plate_holder_object.add_meta_data_file(meta_data_file_object)
 
+        # predict duration of workflow steps if microscope is simulated
+        simulated_clock = microscope_object.get_simulated_clock()
+
         for barcode, plate_object in plates.items():
             # execute each measurement based on experiment in workflow
             for experiment in workflow:
+                if simulated_clock is not None:
+                    simulated_clock.start_step(experiment["Experiment"])
                 # attach additional parameters to experiment to propagate
                 # into all the scanning functions
                 experiment["WorkflowList"] = workflow_experiments
@@ -2501,7 +2751,11 @@ class MicroscopeAutomation(object):
                 if workflow_type == "continue":
                     experiment["ObjectsDict"] = objects_dict
                     experiment["LastExpObjects"] = last_experiment_objects
-                imaging_settings = self.prefs.get_pref_as_meta(experiment["Experiment"])
+                imaging_settings = experiment_prefs.get(experiment["Experiment"])
+                if imaging_settings is None:
+                    imaging_settings = self.prefs.get_pref_as_meta(
+                        experiment["Experiment"]
+                    )
                 self.validate_experiment(imaging_settings, microscope_object)
 
                 # read wait preferences as dictionary to determine whether to wait after
@@ -2573,10 +2827,28 @@ class MicroscopeAutomation(object):
                         )
                         wait_after_image["Status"] = wait_after_image["Repetition"]
 
+        try:
+            # stitched images are written in background processes
+            image_writer.flush_writer_pool()
+        finally:
+            meta_data_file_object.close()
+        logger.info(
+            "Hardware state cache: {}".format(
+                microscope_object.get_hardware_state_statistics()
+            )
+        )
+        if simulated_clock is not None:
+            self.predicted_step_times = simulated_clock.get_step_times()
+            for step, duration in self.predicted_step_times.items():
+                print("Predicted time for {}: {:.1f} s".format(step, duration))
+            logger.info("Predicted step times: {}".format(self.predicted_step_times))
         print("Finished with plate scan")
 
 
 def main():
+    import pyqtgraph
+    from pyqtgraph.Qt import QtGui
+
     # Regularized argument parsing
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument("-p", "--preferences", help="path to the preferences file")
@@ -2586,6 +2858,9 @@ def main():
         prefs_path = args.preferences
     else:
         # Use UI file selector to prompt user for preferences file
+        import tkinter as tk
+        from tkinter import filedialog
+
         fSelect = tk.Tk()
         fSelect.withdraw()
         prefs_path = filedialog.askopenfilename(title="Select Preferences File to Use")
@@ -0,0 +1,302 @@
+"""
+Plan the order in which sample objects are visited to reduce stage travel.
+Samples that belong to the same well stay together,
+functions like counting wells for immersion water rely on this grouping.
+"""
+import re
+import logging
+from collections import OrderedDict
+import numpy
+
+logger = logging.getLogger(__name__.split(".")[0])
+
+
+################################################################################
+#
+# Helper functions
+#
+################################################################################
+
+
+def get_positions(sample_list):
+    """Retrieve center of sample objects in absolute stage coordinates.
+
+    Input:
+     sample_list: list with sample objects
+
+    Output:
+     positions: numpy array of shape (n, 2) with x, y stage positions in um
+    """
+    positions = [
+        sample_object.get_abs_zero(verbose=False)[0:2] for sample_object in sample_list
+    ]
+    return numpy.array(positions, dtype=float).reshape(-1, 2)
+
+
+def route_length(positions, start_position=None):
+    """Calculate length of path visiting positions in the given order.
+
+    Input:
+     positions: numpy array of shape (n, 2) with x, y positions
+
+     start_position: (x, y) position of stage before first move.
+     None: start at first position (Default: None)
+
+    Output:
+     length: length of path in units of positions
+    """
+    positions = numpy.asarray(positions, dtype=float).reshape(-1, 2)
+    if start_position is not None:
+        positions = numpy.vstack((numpy.asarray(start_position[0:2]), positions))
+    if len(positions) < 2:
+        return 0.0
+    steps = numpy.diff(positions, axis=0)
+    return float(numpy.hypot(steps[:, 0], steps[:, 1]).sum())
+
+
+def _nearest_neighbour_order(points, start_position=None):
+    """Greedy path, always move to closest position not visited yet.
+
+    Input:
+     points: numpy array of shape (n, 2) with x, y positions
+
+     start_position: (x, y) position of stage before first move.
+     None: start with first point (Default: None)
+
+    Output:
+     order: list with indices into points
+    """
+    number_points = len(points)
+    if number_points == 0:
+        return []
+    visited = numpy.zeros(number_points, dtype=bool)
+    if start_position is None:
+        current = 0
+    else:
+        distances = numpy.hypot(*(points - numpy.asarray(start_position[0:2])).T)
+        current = int(numpy.argmin(distances))
+    order = [current]
+    visited[current] = True
+    for _ in range(number_points - 1):
+        distances = numpy.hypot(*(points - points[current]).T)
+        distances[visited] = numpy.inf
+        current = int(numpy.argmin(distances))
+        order.append(current)
+        visited[current] = True
+    return order
+
+
+def _two_opt_order(points, order, start_position=None, max_iterations=100):
+    """Improve open path by reversing segments until no reversal shortens it (2-opt).
+
+    Input:
+     points: numpy array of shape (n, 2) with x, y positions
+
+     order: list with indices into points used as initial path
+
+     start_position: (x, y) position of stage before first move.
+     None: first point of order stays fixed (Default: None)
+
+     max_iterations: maximum number of passes over all segments (Default: 100)
+
+    Output:
+     order: list with indices into points
+    """
+    order = list(order)
+    if start_position is None:
+        if len(order) < 3:
+            return order
+        fixed, order = order[0:1], order[1:]
+        anchor = points[fixed[0]]
+    else:
+        fixed = []
+        anchor = numpy.asarray(start_position[0:2], dtype=float)
+    order = numpy.array(order)
+    number_nodes = len(order)
+    for _ in range(max_iterations):
+        improved = False
+        for i in range(number_nodes - 1):
+            # gain when reversing path[i:j + 1] for all j > i,
+            # the end of an open path is free
+            path = points[order]
+            before = anchor if i == 0 else path[i - 1]
+            candidates = path[i + 1 :]
+            following = numpy.vstack((path[i + 2 :], [[numpy.nan, numpy.nan]]))
+            old_first = numpy.hypot(*(path[i] - before))
+            new_first = numpy.hypot(*(candidates - before).T)
+            old_second = numpy.hypot(*(following - candidates).T)
+            new_second = numpy.hypot(*(following - path[i]).T)
+            old_second[-1] = 0.0
+            new_second[-1] = 0.0
+            gain = old_first + old_second - new_first - new_second
+            k = int(numpy.argmax(gain))
+            if gain[k] > 1e-9:
+                j = i + 1 + k
+                order[i : j + 1] = order[i : j + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return fixed + order.tolist()
+
+
+def _well_row_column(well_object):
+    """Get row and column of well from well name (e.g. 'B12').
+
+    Input:
+     well_object: object of class Well
+
+    Output:
+     row, column: row and column as integers, None if name cannot be interpreted
+    """
+    match = re.match(r"^([A-Za-z]+)(\d+)$", str(well_object.get_name()))
+    if match is None:
+        return None
+    row = 0
+    for letter in match.group(1).upper():
+        row = row * 26 + ord(letter) - ord("A") + 1
+    return row, int(match.group(2))
+
+
+def _serpentine_order(wells, centers):
+    """Visit wells row by row, change direction for every other row.
+
+    Input:
+     wells: list with well objects
+
+     centers: numpy array of shape (n, 2) with x, y centers of samples in wells
+
+    Output:
+     order: list with indices into wells
+    """
+    row_columns = [_well_row_column(well) for well in wells]
+    if None in row_columns:
+        # names are not standard well names, define rows by stage position
+        y_values = numpy.sort(centers[:, 1])
+        gaps = numpy.diff(y_values)
+        tolerance = numpy.median(gaps[gaps > 0]) / 2 if numpy.any(gaps > 0) else 0
+        row_ids = numpy.zeros(len(wells), dtype=int)
+        if tolerance > 0:
+            row_starts = y_values[numpy.concatenate(([True], gaps > tolerance))]
+            row_ids = numpy.searchsorted(row_starts, centers[:, 1], side="right")
+        row_columns = [(row_ids[i], centers[i, 0]) for i in range(len(wells))]
+    rows = sorted(set(row for row, _ in row_columns))
+    order = []
+    for row_number, row in enumerate(rows):
+        in_row = [i for i, (r, _) in enumerate(row_columns) if r == row]
+        in_row.sort(key=lambda i: row_columns[i][1], reverse=row_number % 2 == 1)
+        order.extend(in_row)
+    return order
+
+
+################################################################################
+#
+# Route planning
+#
+################################################################################
+
+
+def plan_route(sample_list, strategy="NearestNeighbour", start_position=None):
+    """Reorder sample objects to reduce travel distance of stage.
+    Samples within the same well are kept together.
+
+    Input:
+     sample_list: list with sample objects (e.g. wells, colonies, or cells)
+
+     strategy: strategy used to order wells and samples within wells
+
+      None: keep original order
+
+      Serpentine: wells row by row in alternating direction,
+      samples within well by nearest neighbour
+
+      NearestNeighbour: wells and samples within wells by nearest neighbour
+
+      TwoOpt: nearest neighbour followed by 2-opt improvement
+
+     start_position: (x, y) stage position before first move.
+     None: start with first sample in sample_list (Default: None)
+
+    Output:
+     ordered_list: list with sample objects in new order
+
+     route_info: dictionary with keys 'Strategy', 'OriginalDistance',
+     'PlannedDistance', and 'SavedDistance' (distances in um)
+    """
+    if strategy not in route_strategies:
+        raise ValueError("Unknown route strategy {}".format(strategy))
+
+    positions = get_positions(sample_list)
+    if start_position is None and len(positions):
+        start_position = positions[0]
+    original_distance = route_length(positions, start_position)
+    route_info = {
+        "Strategy": strategy,
+        "OriginalDistance": original_distance,
+        "PlannedDistance": original_distance,
+        "SavedDistance": 0.0,
+    }
+    if strategy == "None" or len(sample_list) < 2:
+        return list(sample_list), route_info
+
+    # group samples by well, keep order of first appearance
+    well_groups = OrderedDict()
+    for index, sample_object in enumerate(sample_list):
+        well_groups.setdefault(sample_object.get_well_object(), []).append(index)
+    wells = list(well_groups.keys())
+    centers = numpy.array(
+        [positions[indices].mean(axis=0) for indices in well_groups.values()]
+    )
+
+    well_order = route_strategies[strategy](wells, centers, start_position)
+
+    new_order = []
+    current_position = start_position
+    for well_index in well_order:
+        indices = well_groups[wells[well_index]]
+        points = positions[indices]
+        order = _nearest_neighbour_order(points, current_position)
+        if strategy == "TwoOpt":
+            order = _two_opt_order(points, order, current_position)
+        new_order.extend(indices[i] for i in order)
+        current_position = points[order[-1]]
+
+    planned_distance = route_length(positions[new_order], start_position)
+    if planned_distance >= original_distance:
+        logger.info(
+            "Route strategy {} does not shorten path, keep original order".format(
+                strategy
+            )
+        )
+        return list(sample_list), route_info
+
+    route_info["PlannedDistance"] = planned_distance
+    route_info["SavedDistance"] = original_distance - planned_distance
+    logger.info(
+        "Route strategy {}: stage travel {:.0f} um instead of {:.0f} um".format(
+            strategy, planned_distance, original_distance
+        )
+    )
+    return [sample_list[i] for i in new_order], route_info
+
+
+def _order_wells_serpentine(wells, centers, start_position):
+    return _serpentine_order(wells, centers)
+
+
+def _order_wells_nearest_neighbour(wells, centers, start_position):
+    return _nearest_neighbour_order(centers, start_position)
+
+
+def _order_wells_two_opt(wells, centers, start_position):
+    order = _nearest_neighbour_order(centers, start_position)
+    return _two_opt_order(centers, order, start_position)
+
+
+# strategies to order wells, samples within wells are always ordered by
+# nearest neighbour (with 2-opt improvement for strategy TwoOpt)
+route_strategies = {
+    "None": None,
+    "Serpentine": _order_wells_serpentine,
+    "NearestNeighbour": _order_wells_nearest_neighbour,
+    "TwoOpt": _order_wells_two_opt,
+}
@@ -9,6 +9,13 @@ Created on 18 Jan 2017
 
 @author: winfriedw
 """
+import tempfile
+import threading
+
+import numpy as np
+
+# black references and gain maps with more bytes are memory-mapped
+MEMMAP_THRESHOLD = 256 * 1024 * 1024
 
 
 def fixed_pattern_correction(image, black_reference):
@@ -57,3 +64,209 @@ def illumination_correction(image, black_reference, illumination_reference):
     corrected_image = pattern_corrected_image / pattern_corrected_illumination_reference
     # correctedImage *= 65535 # prepare for conversion into uint8
     return corrected_image
+
+
+################################################################################
+#
+# Cached flat-field correction of image stacks
+#
+################################################################################
+
+
+def reciprocal_gain(black_reference, illumination_reference):
+    """Reciprocal gain of camera pixels.
+
+    Multiplying a black reference corrected image with the reciprocal gain gives
+    the same result as illumination_correction without a division per image.
+
+    Input:
+     black_reference: correction image acquired with identical exposure settings
+     but camera blocked
+
+     illumination_reference: correction image acquired without sample (brightfield)
+     or dye solution (fluorescence)
+
+    Output:
+     gain: float32 array with 1 / (illumination_reference - black_reference).
+     Pixels without signal in illumination_reference are inf.
+    """
+    gain = np.subtract(illumination_reference, black_reference, dtype=np.float32)
+    with np.errstate(divide="ignore"):
+        np.reciprocal(gain, out=gain)
+    return gain
+
+
+class FlatFieldCache(object):
+    """Black references and reciprocal gain maps for all channels
+    of an experiment, objective, and camera.
+    Gain maps are calculated once and applied to whole stacks of images.
+    """
+
+    def __init__(self, memmap_threshold=MEMMAP_THRESHOLD, memmap_dir=None):
+        """Create empty cache.
+
+        Input:
+         memmap_threshold: maps with more bytes are stored in temporary
+         memory-mapped files instead of memory
+
+         memmap_dir: directory for memory-mapped files.
+         None: use system temporary directory
+
+        Output:
+         none
+        """
+        self.memmap_threshold = memmap_threshold
+        self.memmap_dir = memmap_dir
+        self._flat_fields = {}
+        self._lock = threading.Lock()
+        self.number_registered = 0
+
+    def _create_map(self, shape):
+        """Create float32 array for black references or gain map.
+
+        Input:
+         shape: shape of map (Y, X, C)
+
+        Output:
+         field_map: numpy array or numpy memmap if map is larger than
+         memmap_threshold. The temporary file is deleted with the map.
+        """
+        if np.prod(shape) * np.dtype(np.float32).itemsize <= self.memmap_threshold:
+            return np.empty(shape, dtype=np.float32)
+        return np.memmap(
+            tempfile.TemporaryFile(dir=self.memmap_dir),
+            dtype=np.float32,
+            mode="w+",
+            shape=shape,
+        )
+
+    def register(self, key, black_references, illumination_references, names=()):
+        """Calculate and store black references and reciprocal gain for all channels.
+
+        Input:
+         key: hashable key for flat-field, e.g. (experiment, objective, camera)
+
+         black_references, illumination_references: lists with one 2D array
+         per channel. Channels with None in either list are not corrected.
+
+         names: names of reference images, used to remove flat-field
+         if a reference image is replaced
+
+        Output:
+         none
+        """
+        shapes = set(
+            np.shape(reference)
+            for reference in black_references + illumination_references
+            if reference is not None
+        )
+        if len(shapes) != 1:
+            raise ValueError(
+                "Reference images for {} have different or no shapes: {}".format(
+                    key, shapes
+                )
+            )
+        shape = shapes.pop() + (len(black_references),)
+        black_map = self._create_map(shape)
+        gain_map = self._create_map(shape)
+        for channel, (black_reference, illumination_reference) in enumerate(
+            zip(black_references, illumination_references)
+        ):
+            if black_reference is None or illumination_reference is None:
+                black_map[:, :, channel] = 0
+                gain_map[:, :, channel] = 1
+            else:
+                black_map[:, :, channel] = black_reference
+                gain_map[:, :, channel] = reciprocal_gain(
+                    black_reference, illumination_reference
+                )
+        with self._lock:
+            self._flat_fields[key] = (black_map, gain_map, set(names))
+            self.number_registered += 1
+
+    def is_registered(self, key):
+        """Test if flat-field for key is in cache.
+
+        Input:
+         key: key used with register
+
+        Output:
+         registered: True if flat-field is in cache
+        """
+        with self._lock:
+            return key in self._flat_fields
+
+    def remove_reference(self, name):
+        """Remove all flat-fields calculated from reference image.
+
+        Input:
+         name: name of reference image
+
+        Output:
+         none
+        """
+        with self._lock:
+            for key in [
+                key for key, (_, _, names) in self._flat_fields.items() if name in names
+            ]:
+                del self._flat_fields[key]
+
+    def clear(self):
+        """Remove all flat-fields, e.g. at start of new run.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        with self._lock:
+            self._flat_fields.clear()
+
+    def correct(self, key, data):
+        """Apply flat-field correction to stack of images in one pass.
+
+        Input:
+         key: key used with register
+
+         data: numpy array with images (Y, X), (Y, X, C), or (N, Y, X, C).
+         float32 arrays are corrected in place, other arrays are converted.
+
+        Output:
+         corrected: float32 array with shape of data after correction.
+         Identical to (data - black_reference) / (illumination - black_reference).
+        """
+        with self._lock:
+            black_map, gain_map, _ = self._flat_fields[key]
+        data = np.asarray(data)
+        if data.dtype != np.float32 or not data.flags.writeable:
+            data = data.astype(np.float32)
+        channels = data if data.ndim > 2 else data[:, :, np.newaxis]
+        number_channels = min(channels.shape[-1], gain_map.shape[-1])
+        channels = channels[..., :number_channels]
+        channels -= black_map[:, :, :number_channels]
+        # pixels without signal in black reference and illumination become nan
+        with np.errstate(invalid="ignore"):
+            channels *= gain_map[:, :, :number_channels]
+        return data
+
+
+# cache used by samples without a plate holder, created on first use
+_flat_field_cache = None
+_flat_field_cache_lock = threading.Lock()
+
+
+def get_flat_field_cache():
+    """Retrieve shared flat-field cache, create cache if necessary.
+
+    Input:
+     none
+
+    Output:
+     cache: object of class FlatFieldCache
+    """
+    global _flat_field_cache
+    with _flat_field_cache_lock:
+        if _flat_field_cache is None:
+            _flat_field_cache = FlatFieldCache()
+        return _flat_field_cache
@@ -2,9 +2,10 @@ import pyqtgraph
 from pyqtgraph.Qt import QtGui, QtCore
 
 # from PySide import QtGui, QtCore
+import math
 import numpy
-from aicsimageio import AICSImage
 import logging
+from microscope_automation.util.image_writer import downsample_level
 
 log = logging.getLogger(__name__)
 
@@ -17,6 +18,9 @@ KEY_UNDO = "\\"
 ADD_MODE = "add"
 DELETE_MODE = "delete"
 NEUTRAL_MODE = "neutral"
+# images are displayed with reduced resolution levels that fit into DISPLAY_SIZE
+# pixels when zoomed out, finer levels are used for the visible region when zoomed in
+DISPLAY_SIZE = 2048
 
 
 class KeyPressWindow(pyqtgraph.GraphicsWindow):
@@ -45,6 +49,8 @@ class ImageLocationPicker(object):
         spot_brush="r",
         spot_symbol="+",
         spot_pen="r",
+        pyramid=None,
+        channel=0,
     ):
         """
         Input:
@@ -56,11 +62,27 @@ class ImageLocationPicker(object):
          app: QtGui application object initialized in the beginning
          to automation software in microscope_automation.py
 
+         pyramid: list with reduced resolution levels of image starting with level 1,
+         each level reduced by factor 2. Levels are 2D arrays in orientation of image
+         or (C, Y, X) arrays as returned by image_writer.read_pyramid_level
+         for the file image was written to.
+         Missing levels are calculated when they are displayed. Default: None
+
+         channel: channel used from (C, Y, X) pyramid levels. Default: 0
+
         Output:
          none
         """
         # flip image to have same orientation than in ZEN software
         self.image = numpy.fliplr(image)
+        # resolution levels in orientation of image, level 0 is full resolution
+        self._levels = [image] + [
+            level[channel] if numpy.ndim(level) == 3 else level
+            for level in pyramid or []
+        ]
+        self._display_levels = None
+        self._displayed = None
+        self.image_item = None
 
         # ZEN and pyQTgraph have different coordinate origins
         self.location_list = self.flip_coordinates(location_list)
@@ -99,6 +121,115 @@ class ImageLocationPicker(object):
     def failed_image(self):
         return self._failed_image
 
+    def get_number_levels(self):
+        """Number of resolution levels used for display.
+        The coarsest level fits into DISPLAY_SIZE.
+
+        Input:
+         none
+
+        Output:
+         number_levels: number of levels including full resolution
+        """
+        size = max(self.image.shape[:2])
+        number_levels = 1
+        while size > DISPLAY_SIZE:
+            size //= 2
+            number_levels += 1
+        return number_levels
+
+    def get_pyramid_level(self, level):
+        """Image with reduced resolution. Levels are calculated on first use.
+
+        Input:
+         level: resolution level, each level is reduced by factor 2
+
+        Output:
+         data: numpy array with image data in orientation of original image
+        """
+        while len(self._levels) <= level:
+            self._levels.append(downsample_level(self._levels[-1][numpy.newaxis])[0])
+        return self._levels[level]
+
+    def select_level(self, pixel_size):
+        """Select coarsest resolution level that shows all details on screen.
+
+        Input:
+         pixel_size: size of screen pixel in full resolution image pixels
+
+        Output:
+         level: resolution level
+        """
+        if pixel_size <= 1:
+            return 0
+        return min(int(math.log2(pixel_size)), self.get_number_levels() - 1)
+
+    def get_display_region(self, level, view_range):
+        """Crop resolution level to visible region with margin for panning.
+
+        Input:
+         level: resolution level
+
+         view_range: visible region ((x_min, x_max), (y_min, y_max))
+         in full resolution pixels
+
+        Output:
+         data: numpy array with flipped image data to display
+
+         rect: position and size (x, y, width, height) of data
+         in full resolution pixels
+        """
+        factor = 2**level
+        # flip level as full resolution image, dropped border pixels shift origin
+        data = numpy.fliplr(self.get_pyramid_level(level))
+        offsets = (0, self.image.shape[1] - data.shape[1] * factor)
+        crop = []
+        for axis, (view_min, view_max) in enumerate(view_range):
+            start = (view_min - offsets[axis]) / factor
+            end = (view_max - offsets[axis]) / factor
+            margin = (end - start) / 2
+            start = max(0, int(math.floor(start - margin)))
+            end = min(data.shape[axis], int(math.ceil(end + margin)))
+            crop.append((start, max(start, end)))
+        data = data[crop[0][0] : crop[0][1], crop[1][0] : crop[1][1]]
+        rect = (
+            crop[0][0] * factor,
+            offsets[1] + crop[1][0] * factor,
+            (crop[0][1] - crop[0][0]) * factor,
+            (crop[1][1] - crop[1][0]) * factor,
+        )
+        return data, rect
+
+    def update_display(self, view_box):
+        """Display resolution level and region that matches view.
+        The image is placed in full resolution coordinates,
+        clicked positions are in full resolution pixels for all levels.
+
+        Input:
+         view_box: pyqtgraph ViewBox with image
+
+        Output:
+         none
+        """
+        view_range = view_box.viewRange()
+        pixel_size = min(view_box.viewPixelSize())
+        level = self.select_level(pixel_size)
+        if self._displayed is not None:
+            displayed_level, (x, y, width, height) = self._displayed
+            # keep display while visible region is inside displayed data
+            if (
+                displayed_level == level
+                and (x <= max(view_range[0][0], 0))
+                and (x + width >= min(view_range[0][1], self.image.shape[0]))
+                and (y <= max(view_range[1][0], 0))
+                and (y + height >= min(view_range[1][1], self.image.shape[1]))
+            ):
+                return
+        data, rect = self.get_display_region(level, view_range)
+        self.image_item.setImage(data, autoLevels=False, levels=self._display_levels)
+        self.image_item.setRect(QtCore.QRectF(*rect))
+        self._displayed = (level, rect)
+
     def flip_coordinates(self, location_list):
         """ZEN has the image origin in the upper left corner,
         QTgraph in the lower left corner.
@@ -167,8 +298,20 @@ class ImageLocationPicker(object):
                 # Keep track of numbering added to scatterplot to be taken out
                 w.addItem(point_index)
 
-        image = pyqtgraph.ImageItem(self.image)
-        w.addItem(image)
+        # show whole image with coarsest resolution level,
+        # finer levels are shown when user zooms in
+        coarsest_level = self.get_pyramid_level(self.get_number_levels() - 1)
+        self._display_levels = (coarsest_level.min(), coarsest_level.max())
+        self._displayed = None
+        self.image_item = pyqtgraph.ImageItem()
+        w.addItem(self.image_item)
+        full_range = ((0, self.image.shape[0]), (0, self.image.shape[1]))
+        data, rect = self.get_display_region(self.get_number_levels() - 1, full_range)
+        self.image_item.setImage(data, autoLevels=False, levels=self._display_levels)
+        self.image_item.setRect(QtCore.QRectF(*rect))
+        self._displayed = (self.get_number_levels() - 1, rect)
+        w.vb.setRange(xRange=full_range[0], yRange=full_range[1], padding=0)
+        w.vb.sigRangeChanged.connect(lambda view_box, _: self.update_display(view_box))
         w.addItem(self.help_text)
         # Add points to the plot + image
         self.scatterplot = pyqtgraph.ScatterPlotItem(
@@ -350,6 +493,8 @@ def test_ImageLocationPicker(prefs, image_save_path, app, verbose=False):
 def test_offline():
     # pyqt = os.path.dirname(PyQt5.__file__)
     # QtGui.QApplication.addLibraryPath(os.path.join(pyqt, "plugins"))
+    from aicsimageio import AICSImage
+
     app = QtGui.QApplication([])
     # Path of test image
     image_path = r"D:\Winfried\Automation\TestFiles\Capture 2_XY1580769716_Z0_T0_C0.tif"
@@ -6,7 +6,6 @@ Created on Aug 14, 2017
 """
 
 import numpy
-import matplotlib.pyplot as plt
 import math
 
 VALID_TILE_TYPE = ["none", "rectangle", "ellipse"]
@@ -252,6 +251,8 @@ class CreateTilePositions(object):
         Output:
          none
         """
+        import matplotlib.pyplot as plt
+
         # create data
         pos_list = self.get_pos_list(center)
         x_pos = [xyz[0] for xyz in pos_list]
@@ -8,10 +8,11 @@ Created on Jul 11, 2016
 import logging
 import math
 import string
-import pandas
+import copy
 import numpy
 from os import path
 import warnings
+import weakref
 from collections import OrderedDict
 
 # import modules from project microscope_automation
@@ -20,16 +21,12 @@ from microscope_automation.util.get_path import (
     add_suffix,
     get_well_edge_path,
 )
-from microscope_automation.samples.draw_plate import draw_plate
 from microscope_automation.util import automation_messages_form_layout as message
-from microscope_automation.samples import find_well_center
 from microscope_automation.samples import correct_background
-from microscope_automation.samples import tile_images
-from microscope_automation.util.load_image_czi import LoadImageCzi
 from microscope_automation.samples.positions_list import CreateTilePositions
-from microscope_automation.samples.interactive_location_picker_pyqtgraph import (
-    ImageLocationPicker,
-)  # noqa
+
+# modules depending on pandas, matplotlib, scikit-image, aicsimageio, or pyqtgraph
+# (e.g. find_well_center, tile_images) are imported in the methods using them
 from microscope_automation.util.automation_exceptions import (
     ObjectiveNotDefinedError,
     FileExistsError,
@@ -152,6 +149,73 @@ def create_rect_tile(n_col, n_row, x_pitch, y_pitch, z_pos=0):
     return pos_list
 
 
+################################################################################
+#
+# Coordinate transformations
+#
+################################################################################
+
+# Changing any of these attributes changes the transformation between
+# object and stage coordinates for the object and all objects it contains
+TRANSFORM_ATTRIBUTES = frozenset(
+    [
+        "container",
+        "x_zero",
+        "y_zero",
+        "z_zero",
+        "x_flip",
+        "y_flip",
+        "z_flip",
+        "x_correction",
+        "y_correction",
+        "z_correction",
+        "z_correction_x_slope",
+        "z_correction_y_slope",
+        "z_correction_z_slope",
+        "z_correction_offset",
+    ]
+)
+
+# Cached transformations {sample object: (generation, to_abs, from_abs)}.
+# Kept outside of objects, thus they are not pickled with the objects.
+_transform_cache = weakref.WeakKeyDictionary()
+
+
+def _apply_transform(matrix, positions):
+    """Apply affine transformation to positions.
+
+    Input:
+     matrix: 4x4 numpy array with affine transformation
+
+     positions: numpy array of shape (n, 3) with x, y, z positions
+
+    Output:
+     transformed: numpy array of shape (n, 3) with transformed positions
+    """
+    return positions @ matrix[0:3, 0:3].T + matrix[0:3, 3]
+
+
+def _as_positions(positions):
+    """Convert list of positions into numpy array.
+
+    Input:
+     positions: list or array with (x, y) or (x, y, z) positions.
+     Missing z positions are set to 0.
+
+    Output:
+     positions: numpy array of shape (n, 3)
+
+     has_z: False if input did not include z positions
+    """
+    positions = numpy.asarray(positions, dtype=float)
+    if positions.ndim == 1:
+        positions = positions.reshape(1, -1)
+    has_z = positions.shape[1] > 2
+    if not has_z:
+        positions = numpy.hstack((positions, numpy.zeros((len(positions), 1))))
+    return positions[:, 0:3], has_z
+
+
 ################################################################################
 #
 # Classes for sample hierarchy
@@ -160,6 +224,17 @@ def create_rect_tile(n_col, n_row, x_pitch, y_pitch, z_pos=0):
 
 
 class ImagingSystem(object):
+    # Incremented whenever an attribute in TRANSFORM_ATTRIBUTES of any object
+    # changes, cached transformations from older generations are recalculated.
+    _transform_generation = 0
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        # new generation only after value is set, otherwise transforms computed
+        # in between with old value would be cached for new generation
+        if name in TRANSFORM_ATTRIBUTES:
+            ImagingSystem._transform_generation += 1
+
     def __init__(
         self,
         container=None,
@@ -403,6 +478,10 @@ class ImagingSystem(object):
         Output:
          location_list: Returns the list of colonies selected by the user
         """
+        from microscope_automation.samples.interactive_location_picker_pyqtgraph import (  # noqa
+            ImageLocationPicker,
+        )
+
         # Using pyqtgraph module
         interactive_plot = ImageLocationPicker(tile_image_data, location_list, app)
         interactive_plot.plot_points("Well Overview Image")
@@ -1272,28 +1351,31 @@ class ImagingSystem(object):
          x_pos, y_pos, z_pos: current or position passed in stage coordinate
          returned in object coordinates
         """
-        if self.get_container() is None:
-            if (x is None) or (y is None) or (z is None):
-                x_stage, y_stage, z_stage = self.get_corrected_stage_position()
+        if (x is None) or (y is None) or (z is None):
+            # current position is measured by highest level object
+            top_object = self
+            while top_object.get_container() is not None:
+                top_object = top_object.get_container()
+            x_stage, y_stage, z_stage = top_object.get_corrected_stage_position()
             if x is None:
                 x = x_stage
             if y is None:
                 y = y_stage
             if z is None:
                 z = z_stage
-            x_pos = x - self.x_zero
-            y_pos = y - self.y_zero
-            z_pos = z - self.z_zero
-        else:
-            (
-                x_container,
-                y_container,
-                z_container,
-            ) = self.get_container().get_pos_from_abs_pos(x, y, z, verbose=verbose)
-            x_pos, y_pos, z_pos = self.get_obj_pos_from_container_pos(
-                x_container, y_container, z_container, verbose=verbose
+        _, from_abs, _ = self._get_transforms()
+        x_pos, y_pos, z_pos = _apply_transform(
+            from_abs, numpy.array([[float(x), float(y), float(z)]])
+        )[0]
+        if verbose:
+            print(
+                "\nResults from method get_pos_from_abs_pos for {}".format(
+                    self.get_name()
+                )
             )
-        return (x_pos, y_pos, z_pos)
+            print(" Stage coordinates: ", x, y, z)
+            print(" Object coordinates: ", x_pos, y_pos, z_pos)
+        return (float(x_pos), float(y_pos), float(z_pos))
 
     ##############################################################################
     #
@@ -1380,23 +1462,199 @@ class ImagingSystem(object):
         Output:
          x, y, z: coordinates in absolute stage coordinates in mum
         """
-        x_container, y_container, z_container = self.get_container_pos_from_obj_pos(
-            x_object, y_object, z_object, verbose
+        # float raises TypeError for missing positions
+        position = numpy.array(
+            [[float(x_object), float(y_object), float(z_object or 0)]]
         )
-        if self.get_container() is None:
-            return x_container, y_container, z_container
+        to_abs, _, z_defined = self._get_transforms()
+        self._check_transform(to_abs, z_defined, z_object is not None)
+        x, y, z = _apply_transform(to_abs, position)[0]
+        if z_object is None:
+            z = None
         else:
-            x_object = x_container
-            y_object = y_container
-            z_object = z_container
-            (
-                x_container,
-                y_container,
-                z_container,
-            ) = self.get_container().get_abs_pos_from_obj_pos(
-                x_object, y_object, z_object, verbose
+            z = float(z)
+        if verbose:
+            print(
+                "\nResults from method get_abs_pos_from_obj_pos for {}".format(
+                    self.get_name()
+                )
+            )
+            print(" Object coordinates: ", x_object, y_object, z_object)
+            print(" Stage coordinates: ", x, y, z)
+        return float(x), float(y), z
+
+    def get_abs_pos_from_obj_pos_many(self, positions):
+        """Convert list of object coordinates into stage coordinates.
+
+        Input:
+         positions: list or numpy array of shape (n, 3) with x, y, z
+         object coordinates in mum. If shape is (n, 2), z positions are ignored.
+
+        Output:
+         abs_positions: numpy array of shape (n, 3) or (n, 2)
+         with stage coordinates in mum
+        """
+        positions, has_z = _as_positions(positions)
+        to_abs, _, z_defined = self._get_transforms()
+        self._check_transform(to_abs, z_defined, has_z)
+        abs_positions = _apply_transform(to_abs, positions)
+        return abs_positions if has_z else abs_positions[:, 0:2]
+
+    def get_pos_from_abs_pos_many(self, positions):
+        """Convert list of stage coordinates into object coordinates.
+
+        Input:
+         positions: list or numpy array of shape (n, 3) with x, y, z
+         stage coordinates in mum. If shape is (n, 2), z positions are ignored.
+
+        Output:
+         object_positions: numpy array of shape (n, 3) or (n, 2)
+         with object coordinates in mum
+        """
+        positions, has_z = _as_positions(positions)
+        _, from_abs, _ = self._get_transforms()
+        object_positions = _apply_transform(from_abs, positions)
+        return object_positions if has_z else object_positions[:, 0:2]
+
+    def get_container_pos_from_obj_pos_many(self, positions):
+        """Convert list of object coordinates into container coordinates.
+
+        Input:
+         positions: list or numpy array of shape (n, 3) with x, y, z
+         object coordinates in mum. If shape is (n, 2), z positions are ignored.
+
+        Output:
+         container_positions: numpy array of shape (n, 3) or (n, 2)
+         with container coordinates in mum
+        """
+        positions, has_z = _as_positions(positions)
+        to_container, _, z_defined = self._get_level_transforms()
+        self._check_transform(to_container, z_defined, has_z)
+        container_positions = _apply_transform(to_container, positions)
+        return container_positions if has_z else container_positions[:, 0:2]
+
+    def _check_transform(self, to_abs, z_defined, use_z):
+        """Raise ZeroDivisionError if transformation into container
+        or stage coordinates is not defined, as single position methods would.
+
+        Input:
+         to_abs: 4x4 numpy array with transformation
+
+         z_defined: False if z positions cannot be transformed
+
+         use_z: True if z positions are transformed
+
+        Output:
+         none
+        """
+        if numpy.isnan(to_abs[0, 0]) or (use_z and not z_defined):
+            raise ZeroDivisionError(
+                "Correction term is 0 for {} or its containers".format(self.get_name())
+            )
+
+    def _get_level_transforms(self):
+        """Affine transformations between object and container coordinates.
+        Same calculations as in get_container_pos_from_obj_pos and
+        get_obj_pos_from_container_pos including slope correction.
+
+        Input:
+         none
+
+        Output:
+         to_container: 4x4 numpy array to transform object into container coordinates.
+         Contains NaN if transformation is not defined.
+
+         from_container: 4x4 numpy array to transform container into
+         object coordinates
+
+         z_defined: False if z positions cannot be transformed into
+         container coordinates because z_correction is 0
+        """
+        # transformation into container coordinates is not defined
+        # for correction terms of 0, z positions are not always used
+        z_defined = self.z_correction != 0
+        if self.x_correction == 0 or self.y_correction == 0:
+            scale_to_container = numpy.full((4, 4), numpy.nan)
+        else:
+            scale_to_container = numpy.diag(
+                [
+                    self.x_flip / self.x_correction,
+                    self.y_flip / self.y_correction,
+                    self.z_flip / self.z_correction if z_defined else 0.0,
+                    1.0,
+                ]
+            )
+        scale_to_container[0:3, 3] = (self.x_zero, self.y_zero, self.z_zero)
+        scale_from_container = numpy.diag(
+            [
+                self.x_flip * self.x_correction,
+                self.y_flip * self.y_correction,
+                self.z_flip * self.z_correction,
+                1.0,
+            ]
+        )
+        scale_from_container[0:3, 3] = -(
+            scale_from_container[0:3, 0:3] @ (self.x_zero, self.y_zero, self.z_zero)
+        )
+
+        # slope correction is linear in x and y
+        # (see calculate_slope_correction)
+        slope_to_container = numpy.identity(4)
+        slope_from_container = numpy.identity(4)
+        if self.z_correction_z_slope != 0:
+            slope = (
+                -self.z_correction_x_slope / self.z_correction_z_slope,
+                -self.z_correction_y_slope / self.z_correction_z_slope,
             )
-            return x_container, y_container, z_container
+            offset = self.z_correction_offset / self.z_correction_z_slope
+            slope_to_container[2, 0:2] = slope
+            slope_to_container[2, 3] = offset
+            slope_from_container[2, 0:2] = (-slope[0], -slope[1])
+            slope_from_container[2, 3] = -offset
+        return (
+            slope_to_container @ scale_to_container,
+            slope_from_container @ scale_from_container,
+            z_defined,
+        )
+
+    def _get_transforms(self):
+        """Affine transformations between object and stage coordinates.
+        Transformations are cached until object or any of its containers change.
+
+        Input:
+         none
+
+        Output:
+         to_abs: 4x4 numpy array to transform object into stage coordinates
+
+         from_abs: 4x4 numpy array to transform stage into object coordinates
+
+         z_defined: False if z positions cannot be transformed into
+         stage coordinates
+        """
+        generation = ImagingSystem._transform_generation
+        cached = _transform_cache.get(self)
+        if cached is not None and cached[0] == generation:
+            return cached[1:]
+
+        to_container, from_container, z_defined = self._get_level_transforms()
+        container = self.get_container()
+        if container is None:
+            to_abs = to_container
+            # get_pos_from_abs_pos does not flip or correct highest level object
+            from_abs = numpy.identity(4)
+            from_abs[0:3, 3] = (-self.x_zero, -self.y_zero, -self.z_zero)
+        else:
+            (
+                container_to_abs,
+                container_from_abs,
+                container_z_defined,
+            ) = container._get_transforms()
+            to_abs = container_to_abs @ to_container
+            from_abs = from_container @ container_from_abs
+            z_defined = z_defined and container_z_defined
+        _transform_cache[self] = (generation, to_abs, from_abs, z_defined)
+        return to_abs, from_abs, z_defined
 
     ###############################################################
     #
@@ -1510,42 +1768,14 @@ class ImagingSystem(object):
         """
         self.container.live_mode_stop(camera_id, experiment)
 
-    def execute_experiment(
-        self,
-        experiment,
-        camera_id,
-        reference_object=None,
-        file_path=None,
-        meta_dict={},
-        verbose=True,
-    ):
-        """Acquire single image using settings defined in microscope software
-        and optionally save.
-
-
-        Methods calls method of container instance until container has
-        method implemented that actually performs action.
+    def _add_object_meta(self, meta_dict):
+        """Add name, type, position, and corrections of object to meta data.
 
         Input:
-         experiment: string with experiment name as defined within microscope software
-
-         camera_id: string with unique camera ID
-
-         reference_object: object of type sample (ImagingSystem) used to correct
-         for xyz offset between different objectives
-
-         file_path: filename with path to save image in original format.
-         Default=None: no saving
-
-         meta_dict: directory with additional meta data, e.g. {'aics_well':, 'A1'}
-
-         focus: use autofocus (default = False)
-
-         verbose: if True print debug information (Default = True)
+         meta_dict: directory with meta data, e.g. {'aics_well':, 'A1'}
 
         Output:
-         image: ImageAICS object. At this moment they do not include the pixel data.
-         Get pixel data with load_image.
+         meta_dict: directory with added meta data
         """
         # add name and type of object to meta data
         class_name = self.__class__.__name__
@@ -1589,15 +1819,19 @@ class ImagingSystem(object):
             {"aics_xFlip": flip[0], "aics_yFlip": flip[1], "aics_zFlip": flip[2]}
         )
 
-        image = self.container.execute_experiment(
-            experiment,
-            camera_id,
-            reference_object=reference_object,
-            file_path=file_path,
-            meta_dict=meta_dict,
-            verbose=verbose,
-        )
+        return meta_dict
+
+    def _add_object_position_meta(self, image, verbose=True):
+        """Add position of image in object coordinates to meta data of image.
+
+        Input:
+         image: ImageAICS object with stage positions in meta data
 
+         verbose: if True print debug information (Default = True)
+
+        Output:
+         image: ImageAICS object with added meta data
+        """
         # use x, y, z values corrected for objective offset to calculate object
         # positions, otherwise they would be different for different objectives
         x_abs = image.get_meta("aics_imagePosX (centricity_corrected)")
@@ -1621,6 +1855,108 @@ class ImagingSystem(object):
         )
         return image
 
+    def execute_experiment(
+        self,
+        experiment,
+        camera_id,
+        reference_object=None,
+        file_path=None,
+        meta_dict={},
+        verbose=True,
+    ):
+        """Acquire single image using settings defined in microscope software
+        and optionally save.
+
+
+        Methods calls method of container instance until container has
+        method implemented that actually performs action.
+
+        Input:
+         experiment: string with experiment name as defined within microscope software
+
+         camera_id: string with unique camera ID
+
+         reference_object: object of type sample (ImagingSystem) used to correct
+         for xyz offset between different objectives
+
+         file_path: filename with path to save image in original format.
+         Default=None: no saving
+
+         meta_dict: directory with additional meta data, e.g. {'aics_well':, 'A1'}
+
+         focus: use autofocus (default = False)
+
+         verbose: if True print debug information (Default = True)
+
+        Output:
+         image: ImageAICS object. At this moment they do not include the pixel data.
+         Get pixel data with load_image.
+        """
+        meta_dict = self._add_object_meta(meta_dict)
+        image = self.container.execute_experiment(
+            experiment,
+            camera_id,
+            reference_object=reference_object,
+            file_path=file_path,
+            meta_dict=meta_dict,
+            verbose=verbose,
+        )
+        self._add_object_position_meta(image, verbose=verbose)
+        return image
+
+    def execute_experiment_batch(
+        self,
+        experiment,
+        camera_id,
+        pos_list,
+        reference_object=None,
+        file_path=None,
+        meta_dict={},
+        verbose=True,
+    ):
+        """Acquire images at multiple positions with a single experiment
+        and optionally save.
+
+        Methods calls method of container instance until container has
+        method implemented that actually performs action.
+
+        Input:
+         experiment: string with experiment name as defined within microscope software
+
+         camera_id: string with unique camera ID
+
+         pos_list: coordinates of images as absolute stage positions in mum
+         not corrected for objective offset [(x1, y1, z1), (x2, y2, z2), ...]
+
+         reference_object: object of type sample (ImagingSystem) used to correct
+         for xyz offset between different objectives
+
+         file_path: filename with path to save image in original format.
+         Default=None: no saving
+
+         meta_dict: directory with additional meta data, e.g. {'aics_well':, 'A1'}
+
+         verbose: if True print debug information (Default = True)
+
+        Output:
+         images: list with ImageAICS objects, one for each position in pos_list.
+         At this moment they do not include the pixel data.
+         Get pixel data with load_image.
+        """
+        meta_dict = self._add_object_meta(meta_dict)
+        images = self.container.execute_experiment_batch(
+            experiment,
+            camera_id,
+            pos_list,
+            reference_object=reference_object,
+            file_path=file_path,
+            meta_dict=meta_dict,
+            verbose=verbose,
+        )
+        for image in images:
+            self._add_object_position_meta(image, verbose=verbose)
+        return images
+
     def acquire_images(
         self,
         experiment,
@@ -1633,6 +1969,7 @@ class ImagingSystem(object):
         use_auto_focus=False,
         meta_dict={},
         verbose=True,
+        batch=False,
     ):
         """Acquire image or set of images using settings defined in microscope software
         and optionally save.
@@ -1667,11 +2004,43 @@ class ImagingSystem(object):
 
          verbose: if True print debug information (Default = True)
 
+         batch: if True acquire all positions in pos_list with a single experiment.
+         Travel path is validated once for all positions.
+         Requires load = False and autofocus not in use,
+         otherwise positions are acquired one by one. Default: False
+
         Output:
          images: list with ImageAICS objects. Does not include the pixel data.
          Get pixel data with load_image.
         """
-        if pos_list is None:
+        # single experiment cannot load focus or recall focus between positions
+        if pos_list is not None and batch and not load and not self.get_use_autofocus():
+            # check if microscope is ready and initialize if necessary
+            self.microscope_is_ready(
+                experiment=experiment,
+                reference_object=reference_object,
+                load=load,
+                use_reference=use_reference,
+                use_auto_focus=use_auto_focus,
+                make_ready=True,
+                verbose=verbose,
+            )
+            if meta_dict is not None:
+                meta_dict.update({"aics_objectName": self.get_name()})
+                try:
+                    meta_dict.update({"aics_positionNumber": self.position_number})
+                except AttributeError:
+                    pass
+            images = self.execute_experiment_batch(
+                experiment,
+                camera_id,
+                pos_list,
+                reference_object=reference_object,
+                file_path=file_path,
+                meta_dict=meta_dict,
+                verbose=verbose,
+            )
+        elif pos_list is None:
             images = [
                 self.execute_experiment(
                     experiment,
@@ -1894,6 +2263,75 @@ class ImagingSystem(object):
                     )
         return self.image_dict
 
+    def get_flat_field_cache(self):
+        """Return cache with flat-fields used for background correction.
+
+        Input:
+         none
+
+        Output:
+         cache: object of class FlatFieldCache from module correct_background
+        """
+        try:
+            cache = self.container.get_flat_field_cache()
+        except AttributeError:
+            cache = correct_background.get_flat_field_cache()
+        return cache
+
+    def get_flat_field_key(self, image, settings):
+        """Register flat-field for image with cache if not done before.
+
+        Flat-fields are calculated once for each experiment, objective,
+        and camera from background images attached to object
+        or one of it's superclasses.
+
+        Input:
+         image: object of class ImageAICS with meta data
+
+         settings: object of class Preferences which holds image settings
+
+        Output:
+         key: key of flat-field in cache,
+         None if no channel has background images attached
+        """
+        reference_names = tuple(
+            (
+                channel_pref.get("BlackReference"),
+                channel_pref.get("BackgroundCorrection"),
+            )
+            for channel_pref in settings.get_pref("ChannelDefinitions")
+        )
+        key = (
+            str(image.get_meta("aics_Experiment")),
+            str(image.get_meta("aics_objectiveName")),
+            str(image.get_meta("aics_cameraID")),
+            reference_names,
+        )
+        cache = self.get_flat_field_cache()
+        if cache.is_registered(key):
+            return key
+
+        black_references = []
+        illumination_references = []
+        for black_reference_name, background_name in reference_names:
+            black_reference = self.get_attached_image(black_reference_name)
+            background = self.get_attached_image(background_name)
+            if black_reference is None or background is None:
+                black_references.append(None)
+                illumination_references.append(None)
+            else:
+                black_references.append(black_reference.get_data())
+                illumination_references.append(background.get_data())
+        if all(reference is None for reference in black_references):
+            return None
+        cache.register(
+            key,
+            black_references,
+            illumination_references,
+            names=[name for names in reference_names for name in names],
+        )
+        return key
+
     def background_correction(self, uncorrected_image, settings):
         """Correct background using background images attached to object
         or one of it's superclasses.
@@ -1906,34 +2344,44 @@ class ImagingSystem(object):
         Output:
          corrected: object of class ImageAICS after background correction.
         """
-        image = self.load_image(uncorrected_image, get_meta=True)
-        image_data = uncorrected_image.get_data()
-        if len(image_data.shape) == 2:
-            image_data = image_data[:, :, numpy.newaxis]
-        n_channels = image_data.shape[2]
-        prefs = settings.get_pref("ChannelDefinitions")
-
-        # iterate through channels and apply appropriate background correction
-        for ch, channelPref in enumerate(prefs):
-            if ch >= n_channels:
-                continue
-            background_name = channelPref.get("BackgroundCorrection")
-            black_reference_name = channelPref.get("BlackReference")
-            background = self.get_attached_image(background_name)
-            black_reference = self.get_attached_image(black_reference_name)
-            if black_reference is None or background is None:
-                continue
-            background_data = background.get_data()
-            black_reference_data = black_reference.get_data()
-            channel_data = image_data[:, :, ch]
-            corrected_data = correct_background.illumination_correction(
-                channel_data, black_reference_data, background_data
-            )
-            # corrected_data = channel_data
-            image_data[:, :, ch] = corrected_data
+        return self.background_correction_images([uncorrected_image], settings)[0]
 
-        image.add_data(image_data)
-        return image
+    def background_correction_images(self, uncorrected_images, settings):
+        """Correct background of images using background images attached to object
+        or one of it's superclasses.
+        Images acquired with identical settings are corrected as one stack.
+
+        Input:
+         uncorrected_images: list with objects of class ImageAICS
+
+         settings: object of class Preferences which holds image settings
+
+        Output:
+         corrected_images: list with objects of class ImageAICS
+         after background correction. Corrected data are float32 (Y, X, C).
+        """
+        stacks = OrderedDict()
+        corrected_images = []
+        for uncorrected_image in uncorrected_images:
+            image = self.load_image(uncorrected_image, get_meta=True)
+            image_data = uncorrected_image.get_data()
+            if image_data.ndim == 2:
+                image_data = image_data[:, :, numpy.newaxis]
+            image.add_data(image_data)
+            corrected_images.append(image)
+            key = self.get_flat_field_key(image, settings)
+            if key is not None:
+                stacks.setdefault((key, image_data.shape), []).append(image)
+
+        cache = self.get_flat_field_cache()
+        for (key, shape), images in stacks.items():
+            stack = numpy.empty((len(images),) + shape, dtype=numpy.float32)
+            for i, image in enumerate(images):
+                stack[i] = image.get_data()
+            cache.correct(key, stack)
+            for i, image in enumerate(images):
+                image.add_data(stack[i])
+        return corrected_images
 
     def tile_images(self, images, settings):
         """Create tile of all images associated with object.
@@ -1946,25 +2394,26 @@ class ImagingSystem(object):
         Output:
          tile: ImageAICS object with tile
         """
+        from microscope_automation.samples import tile_images
+
         # Information about tiling should be int he image meta data
         # (e.g. image positions)
         #         if not settings.get_pref('Tile', validValues = VALID_TILE):
         #             return images[(len(images)-1)/2] # return the x-0, y-0 image
 
         # apply background correction
-        corrected_images = []
-
         ######################################################################
         #
         # Todo: Catch if background image does not exist
         #
         ######################################################################
-        for i, image in enumerate(images):
-            if settings.get_pref("CorrectBackground"):
-                # TODO: figure out if this can be a float with negative values
-                corrected_images.append(self.background_correction(image, settings))
-            else:
-                corrected_images.append(self.load_image(image, get_meta=True))
+        if settings.get_pref("CorrectBackground"):
+            # corrected images are float32 and can have negative values
+            corrected_images = self.background_correction_images(images, settings)
+        else:
+            corrected_images = [
+                self.load_image(image, get_meta=True) for image in images
+            ]
 
         print("Done with Background correction")
         # create path and filename for tiled image
@@ -1977,13 +2426,21 @@ class ImagingSystem(object):
         file_name = images[int(len(images) / 2)].create_file_name(file_name_pattern)
         image_output_path = path.normpath(path.join(folder_path, file_name))
         # use tiling method 'anyShape' for arbitrary shaped tile regions, use 'stack'
-        # if tile region is a rectangle.
+        # if tile region is a rectangle, and 'registration' for overlapping tiles.
         # return _ list = [return_image, x_pos_list, y_pos_list]
+        tile_method = settings.get_pref(
+            "TileMethod",
+            valid_values=["stack", "anyShape", "registration"],
+            default="anyShape",
+        )
         tiled_image, x_border_list, y_border_list = tile_images.tile_images(
             corrected_images,
-            method="anyShape",
+            method=tile_method,
             output_image=True,
             image_output_path=image_output_path,
+            # tiles are loaded again from file if needed
+            release_tiles=True,
+            pyramid=settings.get_pref("TilePyramid", default=False),
         )
         return [tiled_image, x_border_list, y_border_list]
 
@@ -1999,6 +2456,8 @@ class ImagingSystem(object):
          none
         """
         self.image_dict.update({key: image})
+        # flat-fields calculated from a replaced image are no longer valid
+        self.get_flat_field_cache().remove_reference(key)
 
     def get_attached_image(self, key):
         """Retrieve attached image.
@@ -2379,6 +2838,8 @@ class PlateHolder(ImagingSystem):
          none
         """
         self.immersion_delivery_system = immersion_delivery
+        # flat-fields for background correction are calculated once per run
+        self.flat_field_cache = correct_background.FlatFieldCache()
         self.slides = {}
         self.plates = {}  # will hold plate objects
         super(PlateHolder, self).__init__(
@@ -2418,6 +2879,17 @@ class PlateHolder(ImagingSystem):
         """
         return self.microscope
 
+    def get_flat_field_cache(self):
+        """Return cache with flat-fields used for background correction.
+
+        Input:
+         none
+
+        Output:
+         cache: object of class FlatFieldCache from module correct_background
+        """
+        return self.flat_field_cache
+
     def get_camera_ids(self):
         """Return a list of camera objects associated with this sample
 
@@ -2815,6 +3287,102 @@ class PlateHolder(ImagingSystem):
             image = self.save_image(file_path, camera_id, image)
         return image
 
+    def execute_experiment_batch(
+        self,
+        experiment,
+        camera_id,
+        pos_list,
+        reference_object=None,
+        file_path=None,
+        meta_dict={},
+        verbose=True,
+    ):
+        """Acquire images at multiple positions with a single experiment
+        and optionally save. The travel path for all positions is validated once
+        before the position list is send to the microscope software.
+        Focus is not moved to load position and autofocus is not used
+        between positions.
+
+        Input:
+         experiment: string with experiment name as defined within microscope software
+
+         camera_id: string with unique camera ID
+
+         pos_list: coordinates of images as absolute stage positions in mum
+         not corrected for objective offset [(x1, y1, z1), (x2, y2, z2), ...]
+
+         reference_object: object of type sample (ImagingSystem) used to correct for
+         xyz offset between different objectives
+
+         file_path: filename with path to save image in original format.
+         Default=None: no saving
+
+         meta_dict: directory with additional meta data, e.g. {'aics_well':, 'A1'}
+
+         verbose: if True print debug information (Default = True)
+
+        Output:
+          images: list with images of class ImageAICS, one for each position.
+          All images refer to the same file, the position is stored as 'aics_scene'.
+        """
+        if reference_object:
+            reference_object_id = reference_object.get_name()
+        else:
+            reference_object_id = None
+
+        microscope_instance = self.get_microscope()
+        stage_pos_list = microscope_instance.validate_position_list(
+            pos_list,
+            stage_id=self.stage_id,
+            focus_drive_id=self.focus_id,
+            objective_changer_id=self.objective_changer_id,
+            auto_focus_id=self.auto_focus_id,
+            safety_id=self.safety_id,
+            reference_object_id=reference_object_id,
+            verbose=verbose,
+        )
+        image = microscope_instance.execute_experiment(
+            experiment, position_list=stage_pos_list
+        )
+        image.add_meta({"aics_cameraID": camera_id})
+
+        information_dict = microscope_instance.get_information()
+        if self.objective_changer_id in information_dict.keys():
+            image.add_meta(
+                {
+                    "aics_objectiveMagnification": int(
+                        information_dict[self.objective_changer_id]["magnification"]
+                    ),
+                    "aics_objectiveName": information_dict[self.objective_changer_id][
+                        "name"
+                    ],
+                }
+            )
+        image.add_meta(meta_dict)
+
+        if file_path:
+            image = self.save_image(file_path, camera_id, image)
+
+        # split result into one image object for each position
+        images = []
+        for scene, (position, stage_position) in enumerate(
+            zip(pos_list, stage_pos_list)
+        ):
+            tile_image = copy.deepcopy(image)
+            tile_image.add_meta(
+                {
+                    "aics_scene": scene,
+                    "aics_imagePosX (absolute)": stage_position[0],
+                    "aics_imagePosY (absolute)": stage_position[1],
+                    "aics_imagePosZ (absolute)": stage_position[2],
+                    "aics_imagePosX (centricity_corrected)": position[0],
+                    "aics_imagePosY (centricity_corrected)": position[1],
+                    "aics_imagePosZ (focality_drift_corrected)": position[2],
+                }
+            )
+            images.append(tile_image)
+        return images
+
     def recall_focus(self, auto_focus_id, pre_set_focus=True):
         """Find difference between stored focus position and actual autofocus position.
         Recall focus will move the focus drive to it's stored position.
@@ -3393,6 +3961,8 @@ class Plate(ImagingSystem):
         Output:
          none
         """
+        from microscope_automation.samples.draw_plate import draw_plate
+
         draw_plate(n_col, n_row, pitch, diameter)
 
 
@@ -3538,6 +4108,10 @@ class Well(ImagingSystem):
         Output:
          location_list: Returns the list of colonies selected by the user
         """
+        from microscope_automation.samples.interactive_location_picker_pyqtgraph import (  # noqa
+            ImageLocationPicker,
+        )
+
         if location_list is None:
             location_list = []
         # Using pyqtgraph module
@@ -3840,6 +4414,8 @@ class Well(ImagingSystem):
          x_center, y_center, z_center: Center of well in absolute stage coordinates
          in mum. z after drift correction (as if no drift had occured)
         """
+        from microscope_automation.samples import find_well_center
+
         # user positioned right well edge in center of 10x FOW
         # acquire image and find edge coordinates
         name = self.get_name()
@@ -4252,6 +4828,10 @@ class Colony(ImagingSystem):
         Output:
          location_list: Returns the list of cells selected by the user
         """
+        from microscope_automation.samples.interactive_location_picker_pyqtgraph import (  # noqa
+            ImageLocationPicker,
+        )
+
         # Using pyqtgraph module
         if location_list is None:
             location_list = []
@@ -4393,6 +4973,7 @@ class Colony(ImagingSystem):
          none
         """
         from microscope_automation.samples import find_cells
+        from microscope_automation.util.load_image_czi import LoadImageCzi
 
         if image.get_data() is None:
             # TODO: Works only with Zeiss, not with 3i
@@ -4474,6 +5055,58 @@ class Colony(ImagingSystem):
         )
         return image
 
+    def execute_experiment_batch(
+        self,
+        experiment,
+        camera_id,
+        pos_list,
+        reference_object=None,
+        file_path=None,
+        meta_dict={},
+        verbose=True,
+    ):
+        """Acquire images at multiple positions with a single experiment
+        and optionally save.
+
+        Input:
+         experiment: string with experiment name as defined within microscope software
+
+         camera_id: string with unique camera ID
+
+         pos_list: coordinates of images as absolute stage positions in mum
+         not corrected for objective offset [(x1, y1, z1), (x2, y2, z2), ...]
+
+         reference_object: object of type sample (ImagingSystem) used to correct for
+         xyz offset between different objectives
+
+         file_path: filename with path to save image in original format.
+         Default=None: no saving
+
+         meta_dict: directory with additional meta data, e.g. {'aics_well':, 'A1'}
+
+         verbose: if True print debug information (Default = True)
+
+        Output:
+         images: list with ImageAICS objects, one for each position in pos_list.
+        """
+        if meta_dict is None:
+            meta_dict = {}
+        meta_dict.update(
+            {
+                "aics_colonyClone": self.get_clone(),
+                "aics_colonyCellLine": self.get_cell_line(),
+            }
+        )
+        return self.container.execute_experiment_batch(
+            experiment,
+            camera_id,
+            pos_list,
+            reference_object=reference_object,
+            file_path=file_path,
+            meta_dict=meta_dict,
+            verbose=verbose,
+        )
+
 
 position_number = 1
 
@@ -4594,6 +5227,10 @@ class Cell(ImagingSystem):
         Output:
         location_list: Returns the list of objects selected by the user
         """
+        from microscope_automation.samples.interactive_location_picker_pyqtgraph import (  # noqa
+            ImageLocationPicker,
+        )
+
         # Using pyqtgraph module
         interactive_plot = ImageLocationPicker(image_data, location_list)
         interactive_plot.plot_points("Cell Overview Image")
@@ -4652,6 +5289,58 @@ class Cell(ImagingSystem):
 
         return image
 
+    def execute_experiment_batch(
+        self,
+        experiment,
+        camera_id,
+        pos_list,
+        reference_object=None,
+        file_path=None,
+        meta_dict={},
+        verbose=True,
+    ):
+        """Acquire images at multiple positions with a single experiment
+        and optionally save.
+
+        Input:
+         experiment: string with experiment name as defined within microscope software
+
+         camera_id: string with unique camera ID
+
+         pos_list: coordinates of images as absolute stage positions in mum
+         not corrected for objective offset [(x1, y1, z1), (x2, y2, z2), ...]
+
+         reference_object: object of type sample (ImagingSystem) used to correct for
+         xyz offset between different objectives
+
+         file_path: filename with path to save image in original format.
+         Default=None: no saving
+
+         meta_dict: directory with additional meta data, e.g. {'aics_well':, 'A1'}
+
+         verbose: if True print debug information (Default = True)
+
+        Output:
+         images: list with ImageAICS objects, one for each position in pos_list.
+        """
+        if meta_dict is None:
+            meta_dict = {}
+        meta_dict.update(
+            {
+                "aics_cellClone": self.get_clone(),
+                "aics_cellCellLine": self.get_cell_line(),
+            }
+        )
+        return self.container.execute_experiment_batch(
+            experiment,
+            camera_id,
+            pos_list,
+            reference_object=reference_object,
+            file_path=file_path,
+            meta_dict=meta_dict,
+            verbose=verbose,
+        )
+
 
 #################################################################
 #
@@ -4662,6 +5351,8 @@ class Cell(ImagingSystem):
 
 def create_plate_holder_manually(m, prefs):
     """Create plate holder manually instead of using setup_samples."""
+    import pandas
+
     # create plate holder and fill with plate, wells, colonies, cells, & water delivery
     # create plate holder and connect it to microscope
     ph = PlateHolder(
@@ -1,105 +1,226 @@
 import numpy
 from scipy import ndimage
-import math
 
 
-def filter_by_size(input_image, filter_values):
-    """Function to filter segmented objects by their area.
+class LabelTable(object):
+    """Objects of a segmented image with their sizes and centers.
+    The image is labelled once. Filters remove objects by updating the boolean
+    mask keep over the labels, chained filters do not label the image again.
+    """
+
+    def __init__(self, input_image):
+        """Label objects and measure their sizes.
+
+        Input:
+         input_image: The image (numpy array) with objects (non-zero)
+         and background (0)
+
+        Output:
+         none
+        """
+        self.input_image = numpy.asarray(input_image)
+        self.labels, self.number_labels = ndimage.label(self.input_image)
+        self.label_list = self.labels.ravel()
+        self.sizes = numpy.bincount(self.label_list, minlength=self.number_labels + 1)
+        # background (label 0) is never kept
+        self.keep = numpy.ones(self.number_labels + 1, dtype=bool)
+        self.keep[0] = False
+        self._centers = None
+
+    def get_sizes(self):
+        """Sizes of objects that are kept, index 0 is the size of the background
+        including removed objects.
+
+        Input:
+         none
+
+        Output:
+         sizes: numpy array with size for each label, 0 for removed objects
+        """
+        sizes = numpy.where(self.keep, self.sizes, 0)
+        sizes[0] = self.label_list.size - sizes.sum()
+        return sizes
+
+    def get_centers(self):
+        """Center of mass of all objects weighted with input image
+        as calculated by ndimage.center_of_mass.
+
+        Input:
+         none
+
+        Output:
+         centers: numpy array with (row, column) for each label.
+         nan for background
+        """
+        if self._centers is None:
+            weights = self.input_image.ravel().astype(float)
+            rows, columns = numpy.indices(self.labels.shape)
+            minlength = self.number_labels + 1
+            total = numpy.bincount(self.label_list, weights, minlength=minlength)
+            total[0] = numpy.nan
+            self._centers = (
+                numpy.column_stack(
+                    [
+                        numpy.bincount(
+                            self.label_list,
+                            weights * coordinates.ravel(),
+                            minlength=minlength,
+                        )
+                        for coordinates in (rows, columns)
+                    ]
+                )
+                / total[:, numpy.newaxis]
+            )
+        return self._centers
+
+    def get_distances_from_center(self):
+        """Distance of object centers from center of image.
+
+        Input:
+         none
+
+        Output:
+         distances: numpy array with distance for each label, nan for background
+        """
+        center_image = numpy.array(self.labels.shape) / 2
+        return numpy.linalg.norm(self.get_centers() - center_image, axis=1)
+
+    def get_image(self):
+        """Mask with all objects that are kept.
+
+        Input:
+         none
+
+        Output:
+         filtered_image: boolean image (numpy array)
+        """
+        return self.keep[self.labels]
+
+    def get_labels(self):
+        """Objects that are kept, labelled as ndimage.label would label them.
+
+        Input:
+         none
+
+        Output:
+         labels: image (numpy array) with objects labelled 1, 2, ...
+
+         number_labels: number of objects
+        """
+        new_labels = numpy.cumsum(self.keep) * self.keep
+        return new_labels[self.labels], int(new_labels.max(initial=0))
+
+
+def size_mask(label_table, filter_values):
+    """Select objects by their area.
 
     Input:
-     input_image: The image (numpy array) to the filter to be applied on
+     label_table: object of class LabelTable
 
      filter_values: (list) [minimum area, maximum area (optional)]
 
     Output:
-     filtered_image: Image (numpy array) after applying the filter mask
+     mask: boolean numpy array, True for labels of objects that pass the filter
     """
     # Error Checking - there should be at least one value in the list - for the min area
-    min_area = 0
     if not filter_values:
         raise ValueError(
             "Filter Values not provided." " Please check the preference file."
         )
     min_area = filter_values[0]
-    label_objects, nb_labels = ndimage.label(input_image)
     # Calculating the sizes of the object
-    sizes = numpy.bincount(label_objects.ravel())
+    sizes = label_table.get_sizes()
     if len(filter_values) == 2:
         max_area = filter_values[1]
     else:
         max_area = max(sizes)
     # Selecting objects above a certain size threshold
-    size_mask = (sizes > min_area) & (sizes < max_area)
-    size_mask[0] = 0
-    filtered = label_objects.copy()
-    filtered_image = size_mask[filtered]
-    return filtered_image
+    mask = (sizes > min_area) & (sizes < max_area)
+    mask[0] = False
+    return mask
 
 
-def filter_by_distance(input_image, filter_values):
-    """
-    Function to filter segmented objects by their distance from the center of the image
+def distance_mask(label_table, filter_values):
+    """Select the largest objects close to the center of the image.
+    Of objects with identical size the objects with higher labels are selected.
 
     Input:
-     input_image: The image (numpy array) to the filter to be applied on
+     label_table: object of class LabelTable
 
      filter_values: (list) [max distance from the center, number of objects requested]
 
     Output:
-     filtered_image: Image (numpy array) after applying the filter mask
+     mask: boolean numpy array, True for labels of objects that pass the filter
     """
-    xdim = input_image.shape[0]
-    ydim = input_image.shape[1]
     if not filter_values:
         raise ValueError(
             "Filter Values not provided. Please check the preference file."
         )
     max_distance = filter_values[0]
     num_objects_requested = filter_values[1]
-    center_image = (xdim / 2, ydim / 2)
-    label_objects, nb_labels = ndimage.label(input_image)
-    center_objects = ndimage.measurements.center_of_mass(
-        input_image, label_objects, range(1, nb_labels + 1)
-    )
-    distance_from_center = []
-    for item in center_objects:
-        xdata = item[0] - center_image[0]
-        ydata = item[1] - center_image[1]
-        distance = math.sqrt(xdata * xdata + ydata * ydata)
-        distance_from_center.append(distance)
-    bool_dist = [
-        False,
-    ]
-    # Get the list of index of colonies that pass through the distance filter
-    dist_filter_index_list = []
-    for index, dist in enumerate(distance_from_center):
-        if dist < max_distance:
-            bool_dist.append(True)
-            dist_filter_index_list.append(index)
-        else:
-            bool_dist.append(False)
+    # Get the colonies that pass through the distance filter
+    mask = label_table.keep & (label_table.get_distances_from_center() < max_distance)
     # Rank the colonies based on size
-    sizes = numpy.bincount(label_objects.ravel())
-    sizes[0] = 0
-    # Get the sizes that passed through the distance filter
-    filtered_sizes = sizes * bool_dist
-    # Calculate how many objects need to be returned
-    if num_objects_requested > len(bool_dist):
-        num_objects_requested = len(bool_dist)
-
-    # Pick the last n indices based on the size
-    top_sizes_indices = []
+    filtered_sizes = numpy.where(mask, label_table.sizes, 0)
+    # Pick the largest n objects
+    top_sizes = numpy.zeros(mask.shape, dtype=bool)
     if num_objects_requested != 0:
-        top_sizes_indices = numpy.argsort(filtered_sizes)[-num_objects_requested:]
-
-    # Update everything but those indices to be False in the mask
-    for index, value in enumerate(bool_dist):
-        if index not in top_sizes_indices:
-            bool_dist[index] = False
-    # Apply the mask
-    distance_mask = numpy.asarray(bool_dist)
-    filtered_image = distance_mask[label_objects]
-    return filtered_image
+        top_sizes[
+            numpy.argsort(filtered_sizes, kind="stable")[-num_objects_requested:]
+        ] = True
+    return mask & top_sizes
+
+
+LABEL_FILTER_MAPPING = {"minArea": size_mask, "distFromCenter": distance_mask}
+
+
+def apply_filters(input_image, filters_dict):
+    """Apply chain of filters to segmented objects with a single labelling pass.
+
+    Input:
+     input_image: The image (numpy array) to the filters to be applied on
+
+     filters_dict: dictionary of filters to be applied in order
+     {filter_name: filter_values}
+
+    Output:
+     label_table: object of class LabelTable with objects that passed all filters
+    """
+    label_table = LabelTable(input_image)
+    for filter_name, filter_values in filters_dict.items():
+        label_table.keep &= LABEL_FILTER_MAPPING[filter_name](
+            label_table, filter_values
+        )
+    return label_table
+
+
+def filter_by_size(input_image, filter_values):
+    """Function to filter segmented objects by their area.
+
+    Input:
+     input_image: The image (numpy array) to the filter to be applied on
+
+     filter_values: (list) [minimum area, maximum area (optional)]
+
+    Output:
+     filtered_image: Image (numpy array) after applying the filter mask
+    """
+    return apply_filters(input_image, {"minArea": filter_values}).get_image()
+
+
+def filter_by_distance(input_image, filter_values):
+    """
+    Function to filter segmented objects by their distance from the center of the image
+
+    Input:
+     input_image: The image (numpy array) to the filter to be applied on
+
+     filter_values: (list) [max distance from the center, number of objects requested]
+
+    Output:
+     filtered_image: Image (numpy array) after applying the filter mask
+    """
+    return apply_filters(input_image, {"distFromCenter": filter_values}).get_image()
 
 
 FILTER_MAPPING = {"minArea": filter_by_size, "distFromCenter": filter_by_distance}
@@ -7,7 +7,6 @@ Split into it's own module: 05/21/2020
 """
 # import standard Python modules
 import string
-import pandas
 import numpy
 import math
 
@@ -44,6 +43,8 @@ def get_colony_data(prefs, colony_file):
     Output:
      colonies: pandas frame with content of .csv file
     """
+    import pandas
+
     # setup logging
     logger = logging.getLogger(__name__)  # noqa
 
@@ -127,6 +128,8 @@ def filter_colonies(prefs, colonies, well_dict):
     Output:
      slected_colonies: subset of colonies to be imaged
     """
+    import pandas
+
     # get names of wells to scan
     well_list = well_dict.keys()
     wells_select = colonies["Well"].isin(well_list)
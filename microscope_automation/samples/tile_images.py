@@ -2,30 +2,66 @@ import numpy as np
 from microscope_automation.util.image_AICS import ImageAICS
 import os
 import logging
-
-# from aicsimagetools.ome_tiff_writer import ome_tiff_writer
-from aicsimageio.writers import ome_tiff_writer
-import multiprocessing
+from microscope_automation.util import image_writer
 
 log = logging.getLogger(__name__)
 
+# parameters for method "registration"
+# overlaps are downsampled by this factor before phase correlation
+REGISTRATION_DOWNSAMPLE = 2
+# minimum overlap of neighbouring tiles in pixels to estimate offset
+MIN_OVERLAP = 16
+# offsets with lower phase correlation peak are ignored
+MIN_CORRELATION = 0.05
+# weight that keeps tiles close to their stage positions in least-squares placement
+STAGE_POSITION_WEIGHT = 0.01
+
 
-def tile_images(images, method="stack", output_image=True, image_output_path=None):
+def tile_images(
+    images,
+    method="stack",
+    output_image=True,
+    image_output_path=None,
+    memmap_path=None,
+    release_tiles=False,
+    pyramid=False,
+):
     """Restitch tiled images based off of location
 
     Input:
      images: (list, ImageAICS) images to tile
 
-     method: (string) tiling method to use, currently only method is "stack"
+     method: (string) tiling method to use:
+      "stack": tiles in rectangle without overlap
+
+      "anyShape": tiles in arbitrary shape without overlap
+
+      "registration": overlapping tiles registered by phase correlation
 
      output_image: (bool) flag to output image
 
      image_output_path: (string) specified image output path
 
+     memmap_path: (string) file for memory mapped tiled image.
+     Default: None = keep tiled image in memory
+
+     release_tiles: (bool) remove data from images after they were added to tile.
+     The data can be loaded again from file.
+
+     pyramid: (bool) write tiled image as pyramidal OME-TIFF with reduced
+     resolution levels. Read levels with image_writer.read_pyramid_level.
+
     Output:
      img: tiled image of type ImageAICS
+
+     Raises TypeError if tiled image cannot be written to OME-TIFF file.
+     Raises IOError if an earlier tiled image could not be written.
     """
-    func_map = {"stack": _tile_hard_rectangle, "anyShape": _tile_hard_any_shape}
+    func_map = {
+        "stack": _tile_hard_rectangle,
+        "anyShape": _tile_hard_any_shape,
+        "registration": _tile_registered,
+    }
     if not func_map.get(method, None):
         raise ValueError("Not a valid tiling method")
     # copy over all metadata from center image of tile
@@ -43,22 +79,44 @@ def tile_images(images, method="stack", output_image=True, image_output_path=Non
                 tile_meta["aics_SampleName"] + "_tiled.ome.tif",
             )
     # Now the function returns a list of images & borders
-    tiled_image_list = func_map[method](images, tile_meta)
+    tiled_image_list = func_map[method](
+        images, tile_meta, memmap_path=memmap_path, release_tiles=release_tiles
+    )
     # borders are needed for segmentation
     tiled_image = tiled_image_list[0]
 
     if output_image:
-        writer = ome_tiff_writer.OmeTiffWriter(
-            tile_meta["aics_filePath"], overwrite_file=True
-        )
-        proc = multiprocessing.Process(
-            target=writer.save, args=[np.transpose(tiled_image.get_data(), (2, 0, 1))]
+        # writer processes receive image through shared memory,
+        # submit blocks if too many images are waiting to be written
+        image_writer.get_writer_pool().submit(
+            np.transpose(tiled_image.get_data(), (2, 0, 1)),
+            tile_meta["aics_filePath"],
+            pyramid=pyramid,
         )
-        proc.start()
     return tiled_image_list
 
 
-def _tile_hard_any_shape(images, tile_metadata):
+def _create_canvas(shape, dtype, memmap_path=None):
+    """Preallocate array for tiled image.
+
+    Input:
+     shape: (tuple) shape of tiled image
+
+     dtype: numpy data type of tiled image
+
+     memmap_path: (string) file for memory mapped array.
+     Default: None = allocate array in memory
+
+    Output:
+     canvas: numpy array or numpy memmap filled with zeros
+    """
+    if memmap_path is None:
+        return np.zeros(shape, dtype=dtype)
+    # new memory mapped files are filled with zeros
+    return np.memmap(memmap_path, dtype=dtype, mode="w+", shape=shape)
+
+
+def _tile_hard_any_shape(images, tile_metadata, memmap_path=None, release_tiles=False):
     """Restitch tiled images. Does not assume overlap of tiles.
     This method should be shape invariant
 
@@ -67,12 +125,15 @@ def _tile_hard_any_shape(images, tile_metadata):
 
      tile_metadata: (dictionary) metadata to tag to tiled image
 
+     memmap_path: (string) file for memory mapped tiled image (Default: None)
+
+     release_tiles: (bool) remove data from images after they were added to tile
+
     Output:
      img: (ImageAICS) tiled image
     """
-    # Get meta list, data list, and position list
+    # Get meta list and position list
     meta_list = [img.get_meta() for img in images]
-    data_list = [img.get_data() for img in images]
 
     # find out how large the final, rectangular image has to be and create empty array
     # find the maximum number of tiles in x and y
@@ -83,12 +144,12 @@ def _tile_hard_any_shape(images, tile_metadata):
 
     # assume that all tiles have the identical number of pixels, dimensions,
     # and data type
-    number_pixels_x, number_pixels_y, dimensions = data_list[0].shape
+    number_pixels_x, number_pixels_y, dimensions = images[0].get_data().shape
     dtype = meta_list[0]["Type"]
     container_pixels_x = number_pixels_x * number_tiles_x
     container_pixels_y = number_pixels_y * number_tiles_y
-    tiles_container = np.zeros(
-        (container_pixels_x, container_pixels_y, dimensions), dtype=dtype
+    tiles_container = _create_canvas(
+        (container_pixels_x, container_pixels_y, dimensions), dtype, memmap_path
     )
 
     # calibrate pixel size, assuming that individual tiles are flush to each other
@@ -135,13 +196,16 @@ def _tile_hard_any_shape(images, tile_metadata):
             container_pixels_y - yPos, container_pixels_y - yPos - image_pixels_y
         )
         tiles_container[xPos : xPos + image_pixels_x, y_low:y_high, :] = data
+        if release_tiles:
+            del data
+            image.data = None
 
     return_image = ImageAICS(data=tiles_container, meta=tile_metadata)
     # Returns tiled image plus borders for segmentation if necessary
     return [return_image, x_pos_list, y_pos_list]
 
 
-def _tile_hard_rectangle(images, tile_metadata):
+def _tile_hard_rectangle(images, tile_metadata, memmap_path=None, release_tiles=False):
     """Restitch tiled images given 3x3 array using array stack method.
     Performs as follows:
      from (min x to max x):
@@ -152,12 +216,18 @@ def _tile_hard_rectangle(images, tile_metadata):
      hstack(ims_x)
 
     This method assumes the tiles are laid out in a rectangular pattern.
+    The size of the tiled image is calculated first
+    and each tile is copied once into the preallocated image.
 
     Input:
      images: (list, ImageAICS) images to tile
 
      tile_metadata: (dictionary) metadata to tag to tiled image
 
+     memmap_path: (string) file for memory mapped tiled image (Default: None)
+
+     release_tiles: (bool) remove data from images after they were added to tile
+
     Output:
      img: (ImageAICS) tiled image
     """
@@ -169,9 +239,8 @@ def _tile_hard_rectangle(images, tile_metadata):
     # Might be needed for segmentation later. Only added for consistency here
     x_border_list = []
     y_border_list = []
-    # Get meta list, data list, and position list
+    # Get meta list and position list
     meta_list = [img.get_meta() for img in images]
-    data_list = [img.get_data() for img in images]
     # the -y is here because the y axis is flipped for colony objects
     # TODO: make this more robust
     pos_list = [
@@ -179,15 +248,322 @@ def _tile_hard_rectangle(images, tile_metadata):
         for ind, meta in enumerate(meta_list)
     ]
     srt = sorted(pos_list, key=lambda m: (m[Y], m[X]))
-    hstack_list = []
+    # group tiles in rows with identical y position
+    rows = []
     i = 0
     while i < len(srt):
         y = int(srt[i][Y])
-        img_y = []
+        row = []
         while i < len(srt) and int(srt[i][Y]) == y:
-            # Images are YXC format, for accurate tiling this needs to be XYC
-            img_y.append(np.transpose(data_list[srt[i][INDEX]], (1, 0, 2)))
+            row.append(srt[i][INDEX])
             i += 1
-        hstack_list.append(np.hstack(img_y))
-    vstack = np.vstack(hstack_list)
-    return [ImageAICS(data=vstack, meta=tile_metadata), x_border_list, y_border_list]
+        rows.append(row)
+
+    # Images are YXC format, for accurate tiling this needs to be XYC.
+    # Rows are stacked along first axis, tiles within row along second axis.
+    shapes = [images[index].get_data().shape for index in range(len(images))]
+    row_heights = []
+    width = None
+    for row in rows:
+        row_height = shapes[row[0]][1]
+        row_width = 0
+        for index in row:
+            if shapes[index][1] != row_height or shapes[index][2] != shapes[0][2]:
+                raise ValueError("Tiles in row {} have different sizes".format(row))
+            row_width += shapes[index][0]
+        if width is None:
+            width = row_width
+        elif row_width != width:
+            raise ValueError("Rows of tiles have different widths")
+        row_heights.append(row_height)
+    # same data type as np.hstack and np.vstack would create
+    dtype = np.result_type(*{image.get_data().dtype for image in images})
+    tiles_container = _create_canvas(
+        (sum(row_heights), width, shapes[0][2]), dtype, memmap_path
+    )
+
+    x_start = 0
+    for row, row_height in zip(rows, row_heights):
+        y_start = 0
+        for index in row:
+            data = images[index].get_data()
+            tiles_container[
+                x_start : x_start + row_height, y_start : y_start + data.shape[0], :
+            ] = np.transpose(data, (1, 0, 2))
+            y_start += data.shape[0]
+            if release_tiles:
+                del data
+                images[index].data = None
+        x_start += row_height
+    return [
+        ImageAICS(data=tiles_container, meta=tile_metadata),
+        x_border_list,
+        y_border_list,
+    ]
+
+
+################################################################################
+#
+# Registration of overlapping tiles
+#
+################################################################################
+
+
+def _get_pixel_positions(meta_list, shapes):
+    """Convert stage positions of tiles to pixel positions in tiled image.
+
+    Input:
+     meta_list: (list, dictionary) metadata of tiles with stage positions in um
+
+     shapes: (list, tuple) shapes of tiles (x, y, channels)
+
+    Output:
+     positions: (numpy array) position of upper left corner of each tile along
+     first and second axis of tiled image. The y axis is flipped.
+    """
+    stage_positions = np.array(
+        [
+            [meta["aics_imageObjectPosX"], meta["aics_imageObjectPosY"]]
+            for meta in meta_list
+        ],
+        dtype=float,
+    )
+    pixel_size = []
+    for axis, key in enumerate(["PhysicalSizeX", "PhysicalSizeY"]):
+        size = meta_list[0].get(key)
+        if not size:
+            # without pixel size assume that tiles are flush to each other
+            steps = np.diff(np.unique(stage_positions[:, axis]))
+            size = steps.min() / shapes[0][axis] if len(steps) else 1
+        pixel_size.append(size)
+    positions = stage_positions / pixel_size
+    positions[:, 0] -= positions[:, 0].min()
+    positions[:, 1] = positions[:, 1].max() - positions[:, 1]
+    return positions
+
+
+def _find_neighbours(positions, shapes, min_overlap=MIN_OVERLAP):
+    """Find pairs of tiles that overlap at their stage positions.
+
+    Input:
+     positions: (numpy array) pixel positions of tiles
+
+     shapes: (list, tuple) shapes of tiles
+
+     min_overlap: (int) minimum overlap in pixels along both axes
+
+    Output:
+     pairs: (list, tuple) (index tile 1, index tile 2, overlap slices in tile 1,
+     overlap slices in tile 2)
+    """
+    corners = np.rint(positions).astype(int)
+    pairs = []
+    for i in range(len(corners)):
+        for j in range(i + 1, len(corners)):
+            low = np.maximum(corners[i], corners[j])
+            high = np.minimum(corners[i] + shapes[i][:2], corners[j] + shapes[j][:2])
+            if np.all(high - low >= min_overlap):
+                slices_1 = (
+                    slice(low[0] - corners[i][0], high[0] - corners[i][0]),
+                    slice(low[1] - corners[i][1], high[1] - corners[i][1]),
+                )
+                slices_2 = (
+                    slice(low[0] - corners[j][0], high[0] - corners[j][0]),
+                    slice(low[1] - corners[j][1], high[1] - corners[j][1]),
+                )
+                pairs.append((i, j, slices_1, slices_2))
+    return pairs
+
+
+def _downsample(data, factor):
+    """Reduce size of stack of 2D images by averaging blocks of pixels.
+
+    Input:
+     data: (numpy array) images with shape (number images, x, y)
+
+     factor: (int) size of averaged blocks
+
+    Output:
+     downsampled: (numpy array) float32 images
+    """
+    number_images, size_x, size_y = data.shape
+    size_x, size_y = size_x // factor, size_y // factor
+    data = data[:, : size_x * factor, : size_y * factor].astype(np.float32)
+    return data.reshape(number_images, size_x, factor, size_y, factor).mean(axis=(2, 4))
+
+
+def _phase_correlation(stack_1, stack_2):
+    """Estimate shifts between pairs of images with phase correlation.
+    All pairs are processed with one FFT per stack.
+
+    Input:
+     stack_1, stack_2: (numpy array) images with shape (number pairs, x, y)
+
+    Output:
+     shifts: (numpy array) shift (x, y) for each pair with
+     stack_2[n, x, y] = stack_1[n, x + shift_x, y + shift_y]
+
+     peaks: (numpy array) height of correlation peak for each pair (0 to 1)
+    """
+    number_pairs, size_x, size_y = stack_1.shape
+    # window reduces influence of image borders
+    window = np.outer(np.hanning(size_x), np.hanning(size_y)).astype(np.float32)
+    stack_1 = (stack_1 - stack_1.mean(axis=(1, 2), keepdims=True)) * window
+    stack_2 = (stack_2 - stack_2.mean(axis=(1, 2), keepdims=True)) * window
+    cross_power = np.fft.rfft2(stack_1) * np.conj(np.fft.rfft2(stack_2))
+    cross_power /= np.abs(cross_power) + 1e-12
+    correlation = np.fft.irfft2(cross_power, s=(size_x, size_y))
+
+    flat_index = correlation.reshape(number_pairs, -1).argmax(axis=1)
+    peak_x, peak_y = np.unravel_index(flat_index, (size_x, size_y))
+    pair_index = np.arange(number_pairs)
+    peaks = correlation[pair_index, peak_x, peak_y]
+    shifts = np.zeros((number_pairs, 2))
+    for axis, (peak, size) in enumerate([(peak_x, size_x), (peak_y, size_y)]):
+        # sub pixel position from parabola through peak and neighbours
+        before = [peak_x, peak_y]
+        after = [peak_x, peak_y]
+        before[axis] = (peak - 1) % size
+        after[axis] = (peak + 1) % size
+        value_before = correlation[pair_index, before[0], before[1]]
+        value_after = correlation[pair_index, after[0], after[1]]
+        denominator = value_before - 2 * peaks + value_after
+        offset = np.where(
+            denominator < 0, 0.5 * (value_before - value_after) / denominator, 0
+        )
+        # peaks beyond half the image size are negative shifts
+        shifts[:, axis] = np.where(peak > size // 2, peak - size, peak) + offset
+    return shifts, peaks
+
+
+def _solve_positions(positions, pairs, offsets, weights):
+    """Find tile positions that agree best with measured offsets of neighbours.
+
+    Input:
+     positions: (numpy array) pixel positions of tiles from stage positions
+
+     pairs: (list, tuple) indices (i, j) of neighbouring tiles
+
+     offsets: (numpy array) measured position of tile j relative to tile i
+
+     weights: (numpy array) weight of each offset
+
+    Output:
+     positions: (numpy array) positions of tiles from least-squares fit
+    """
+    number_tiles = len(positions)
+    # weak constraints keep tiles without registered neighbours at stage position
+    matrix = [np.eye(number_tiles) * STAGE_POSITION_WEIGHT]
+    target = [positions * STAGE_POSITION_WEIGHT]
+    if len(pairs):
+        rows = np.zeros((len(pairs), number_tiles))
+        rows[np.arange(len(pairs)), [j for _, j in pairs]] = weights
+        rows[np.arange(len(pairs)), [i for i, _ in pairs]] = -weights
+        matrix.append(rows)
+        target.append(offsets * weights[:, np.newaxis])
+    solution = np.linalg.lstsq(np.vstack(matrix), np.vstack(target), rcond=None)[0]
+    return solution
+
+
+def _tile_registered(images, tile_metadata, memmap_path=None, release_tiles=False):
+    """Restitch overlapping tiles. Start with stage positions and correct them
+    with offsets between neighbouring tiles measured by phase correlation.
+    Overlapping tiles are blended linearly.
+
+    Input:
+     images: (list, ImageAICS) images to tile
+
+     tile_metadata: (dictionary) metadata to tag to tiled image
+
+     memmap_path: (string) file for memory mapped tiled image (Default: None)
+
+     release_tiles: (bool) remove data from images after they were added to tile
+
+    Output:
+     img: (ImageAICS) tiled image
+    """
+    meta_list = [img.get_meta() for img in images]
+    shapes = [img.get_data().shape for img in images]
+    positions = _get_pixel_positions(meta_list, shapes)
+
+    # measure offsets of neighbours, pairs with same overlap size share one FFT
+    pairs = _find_neighbours(positions, shapes)
+    groups = {}
+    for pair in pairs:
+        overlap_shape = tuple(part.stop - part.start for part in pair[2])
+        # do not downsample narrow overlaps
+        factor = REGISTRATION_DOWNSAMPLE
+        if min(overlap_shape) // factor < MIN_OVERLAP:
+            factor = 1
+        groups.setdefault((overlap_shape, factor), []).append(pair)
+    registered_pairs = []
+    offsets = []
+    weights = []
+    for (_, factor), group in groups.items():
+        stacks = []
+        for tile in (0, 1):
+            stack = np.stack(
+                [
+                    images[pair[tile]].get_data()[pair[tile + 2]].mean(axis=2)
+                    for pair in group
+                ]
+            )
+            stacks.append(_downsample(stack, factor))
+        shifts, peaks = _phase_correlation(*stacks)
+        for pair, shift, peak in zip(group, shifts, peaks):
+            if peak < MIN_CORRELATION:
+                continue
+            i, j = pair[:2]
+            registered_pairs.append((i, j))
+            offsets.append(
+                np.rint(positions[j]) - np.rint(positions[i]) + shift * factor
+            )
+            weights.append(peak)
+    log.debug(
+        "Registered {} of {} pairs of tiles".format(len(registered_pairs), len(pairs))
+    )
+    positions = _solve_positions(
+        positions, registered_pairs, np.array(offsets), np.array(weights)
+    )
+    corners = np.rint(positions - positions.min(axis=0)).astype(int)
+
+    # blend tiles with weights that decrease linearly towards tile borders
+    size_x = max(corner[0] + shape[0] for corner, shape in zip(corners, shapes))
+    size_y = max(corner[1] + shape[1] for corner, shape in zip(corners, shapes))
+    dtype = np.result_type(*{image.get_data().dtype for image in images})
+    weighted_sum = np.zeros((size_x, size_y, shapes[0][2]), dtype=np.float32)
+    weight_sum = np.zeros((size_x, size_y), dtype=np.float32)
+    x_pos_list = []
+    y_pos_list = []
+    for image, corner, shape in zip(images, corners, shapes):
+        ramp_x = np.minimum(np.arange(1, shape[0] + 1), np.arange(shape[0], 0, -1))
+        ramp_y = np.minimum(np.arange(1, shape[1] + 1), np.arange(shape[1], 0, -1))
+        weight = np.outer(ramp_x, ramp_y).astype(np.float32)
+        region = (
+            slice(corner[0], corner[0] + shape[0]),
+            slice(corner[1], corner[1] + shape[1]),
+        )
+        weighted_sum[region] += image.get_data() * weight[:, :, np.newaxis]
+        weight_sum[region] += weight
+        if release_tiles:
+            image.data = None
+        # borders in same coordinates as _tile_hard_any_shape
+        x_pos = int(corner[0])
+        y_pos = int(size_y - corner[1] - shape[1])
+        if x_pos not in x_pos_list and x_pos != 0:
+            x_pos_list.append(x_pos)
+        if y_pos not in y_pos_list and y_pos != 0:
+            y_pos_list.append(y_pos)
+
+    tiles_container = _create_canvas(weighted_sum.shape, dtype, memmap_path)
+    np.divide(
+        weighted_sum,
+        np.maximum(weight_sum, 1e-12)[:, :, np.newaxis],
+        out=weighted_sum,
+    )
+    if np.issubdtype(dtype, np.integer):
+        np.rint(weighted_sum, out=weighted_sum)
+    tiles_container[...] = weighted_sum
+    del weighted_sum, weight_sum
+    return_image = ImageAICS(data=tiles_container, meta=tile_metadata)
+    return [return_image, x_pos_list, y_pos_list]
@@ -97,12 +97,12 @@ class WellSegmentation:
         print("Starting erosion")
         eroded = morphology.erosion(filled, morphology.diamond(3))
         print("Applying filters")
-        filtered_image = eroded
-        if self.colony_filters_dict is not None:
-            for filter_name in self.colony_filters_dict.keys():
-                filtered_image = segmentation_filters.apply_filter(
-                    filter_name, filtered_image, self.colony_filters_dict[filter_name]
-                )
+        # objects are labelled once for all filters and point selection
+        label_table = segmentation_filters.apply_filters(
+            eroded,
+            self.colony_filters_dict if self.colony_filters_dict is not None else {},
+        )
+        filtered_image = label_table.get_image()
 
         colony_edges = morphology.dilation(feature.canny(filtered_image, 0.01))
         print("Starting outlining")
@@ -111,7 +111,7 @@ class WellSegmentation:
         distance = ndimage.distance_transform_edt(filtered_image)
         smoothed_well = ndimage.gaussian_filter(downsized_image, 0.35)
         outline.copy()
-        objs, num_objs = ndimage.label(filtered_image)
+        objs, num_objs = label_table.get_labels()
         print("Applying filters for points")
         if self.mode == "A":
             # point selection: Smoothest point in the center region
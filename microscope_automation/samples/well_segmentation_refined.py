@@ -12,12 +12,62 @@ from skimage import (
     measure,
     segmentation,
 )
-import pandas as pd
+from microscope_automation.samples import segmentation_filters
 
 DOWNSCALING_FACTOR = 4
+# pixels added around bounding boxes of colonies. Edge detection and distance maps
+# in the padded box give the same results as in the full image.
+COLONY_MARGIN = 2
 rcParams["figure.figsize"] = 15, 12
 
 
+def dilate_disk(binary_image, radius):
+    """Binary dilation with a disk, calculated from the distance map.
+    The distance map is faster than the neighbourhood of the disk
+    for large radii.
+
+    Input:
+     binary_image: image with objects (> 0) and background (0)
+
+     radius: radius of disk
+
+    Output:
+     dilated: boolean image, identical to morphology.dilation with
+     morphology.disk(radius)
+    """
+    background = np.asarray(binary_image) <= 0
+    if background.all():
+        return ~background
+    return ndimage.distance_transform_edt(background) <= radius
+
+
+def find_local_maxima(image, size):
+    """Find local maxima within a square neighbourhood.
+    The separable maximum filter compares each pixel with its neighbours
+    along rows and columns instead of the full size x size neighbourhood.
+
+    Input:
+     image: 2D image, e.g. distance map
+
+     size: edge length of square neighbourhood in pixels
+
+    Output:
+     peaks: boolean image with peaks, identical to
+     feature.peak_local_max(image, footprint=np.ones((size, size))).
+     All pixels of a plateau are peaks,
+     pixels at the border or with the minimum value of image are not.
+    """
+    image_max = ndimage.maximum_filter(image, size=size, mode="nearest")
+    peaks = image == image_max
+    if peaks.all():
+        # no peaks in flat image
+        peaks[:] = False
+    peaks &= image > image.min()
+    peaks[[0, -1], :] = False
+    peaks[:, [0, -1]] = False
+    return peaks
+
+
 class WellSegmentation:
     def __init__(
         self,
@@ -36,6 +86,7 @@ class WellSegmentation:
         """
         self._point_locations = []
         self.segmented_colonies = None
+        self._colony_edges = None
         # Downscale the colony dictionary
         self.colony_filters_dict = self.downscale_filter_dictionary(colony_filters_dict)
         # Downsize the image
@@ -90,7 +141,7 @@ class WellSegmentation:
         rescaled_image = self.preprocessing_image()
         binary_colony_mask = self.segment_colonies(rescaled_image)
         self.process_colonies(binary_colony_mask)
-        self.find_positions(modeA=self.mode)
+        self.find_positions(mode=self.mode)
 
     def preprocessing_image(self):
         """To pre-process input image with correction for uneven illumination
@@ -231,35 +282,80 @@ class WellSegmentation:
         """
         # --------------------------------------------------------------------------
         # Colony partition
-        # Create distance map and 'cut' weak bondings between separating colonies
-        erode = morphology.erosion(binary_colony_mask, morphology.disk(20))
-        distance_map = ndimage.morphology.distance_transform_edt(erode)
-        distance_map[distance_map < 10] = 0
-
         # Create distance map for all colonies
         distance_map_max = ndimage.morphology.distance_transform_edt(binary_colony_mask)
+        markers = self.find_colony_markers(distance_map_max)
+        # Apply watershed segmentation
+        labelled_colonies = segmentation.watershed(
+            -distance_map_max, markers, mask=binary_colony_mask
+        )
+        print("Identified and labelled separate colonies from binary colony mask")
+
+        # Partition big colonies into few smaller ones
+        sizes = np.bincount(labelled_colonies.ravel())
+        # Set minimum colony size to be split
+        big_obj_to_split = sizes > 90000
+        big_obj_to_split[0] = False
+        mask = big_obj_to_split[labelled_colonies].astype(float)
+        # Apply distance mapping to the large colony and try to separate the colony
+        # by finding peaks in the distance map
+        dis_map = ndimage.morphology.distance_transform_edt(mask)
+        local_maxi = find_local_maxima(dis_map, 100)
+        dilate = dilate_disk(local_maxi, 10)
+        seed = measure.label(dilate)
+        # Apply watershed segmentation on the colony with new seeds to partition
+        split = segmentation.watershed(-dis_map, seed, mask=mask)
+        print("Partitioned big colonies to smaller colonies")
+
+        # Adjust labeling with new partitioned colonies.
+        # Each partition is relabelled within its bounding box.
+        new_label = np.max(labelled_colonies)
+        for obj, obj_slice in enumerate(ndimage.find_objects(split), 1):
+            if obj_slice is None:
+                continue
+            new_label += 1
+            labelled_colonies[obj_slice][split[obj_slice] == obj] = new_label
+        self.segmented_colonies = labelled_colonies
+        self._colony_edges = None
+        print("Done Segmenting colonies")
+
+    def find_colony_markers(self, distance_map_max):
+        """To find markers for watershed segmentation of colonies
+        from the distance map of the binary colony mask.
+        Markers are identical to the markers found with morphology.erosion,
+        morphology.dilation, and feature.peak_local_max with the same
+        disks and footprints (tolerance 0 pixels).
+
+        Input:
+         distance_map_max: distance map of binary colony mask
+
+        Output:
+         markers: labelled markers of big and small colonies
+        """
+        # Create distance map and 'cut' weak bondings between separating colonies.
+        # Erosion with morphology.disk(20) keeps pixels more than 20 pixels
+        # away from background.
+        erode = distance_map_max > 20
+        distance_map = ndimage.morphology.distance_transform_edt(erode)
+        distance_map[distance_map < 10] = 0
 
         # Identify local maximum from filtered distance map and
         # use maximum as markers for watershed. This method will
         # identify centers of big colonies
-        local_maxi = feature.peak_local_max(
-            distance_map, indices=False, footprint=np.ones((200, 200))
-        )
-        dilate_maxi = morphology.dilation(local_maxi, selem=morphology.disk(10))
+        local_maxi = find_local_maxima(distance_map, 200)
+        dilate_maxi = dilate_disk(local_maxi, 10)
 
-        dis_obj = np.zeros(distance_map.shape)
-        dis_obj[distance_map > 0] = 1
-        dilate_dis_obj = morphology.dilation(dis_obj, selem=morphology.disk(10))
+        dilate_dis_obj = dilate_disk(distance_map > 0, 10)
         lab_dis_obj = measure.label(dilate_dis_obj)
 
         union_obj = np.unique(
             lab_dis_obj[np.where((dilate_maxi > 0) & (lab_dis_obj > 0))]
         )
-        obj_to_add = []
-        for obj in np.unique(lab_dis_obj):
-            if (obj not in union_obj) & (obj > 0):
-                obj_to_add.append(obj)
-                dilate_maxi[lab_dis_obj == obj] = 1
+        # add objects without marker as a whole
+        obj_to_add = np.ones(lab_dis_obj.max() + 1, dtype=bool)
+        obj_to_add[union_obj] = False
+        obj_to_add[0] = False
+        dilate_maxi[obj_to_add[lab_dis_obj]] = 1
 
         # As overall colony segmentation was not able to separate colonies
         # that are close to each other and tend to merge neighboring colonies,
@@ -272,191 +368,198 @@ class WellSegmentation:
 
         remove_small = self.filter_small_objects(filter_max, area=2500)
         small_obj = filter_max - remove_small
-        final_small = morphology.dilation(small_obj, selem=morphology.disk(5))
+        final_small = dilate_disk(small_obj, 5)
 
         # Merge markers from big and small colonies
         total = np.logical_or(dilate_maxi, final_small)
         markers = measure.label(total)
-        # Apply watershed segmentation
-        labelled_colonies = segmentation.watershed(
-            -distance_map_max, markers, mask=binary_colony_mask
-        )
-        print("Identified and labelled separate colonies from binary colony mask")
-
-        # Partition big colonies into few smaller ones
-        sizes = np.bincount(labelled_colonies.ravel())
-        # Set minimum colony size to be split
-        big_obj_to_split = []
-        for i in range(1, len(sizes)):
-            if sizes[i] > 90000:
-                big_obj_to_split.append(i)
-
-        mask = np.zeros(labelled_colonies.shape)
-        for obj in big_obj_to_split:
-            mask[labelled_colonies == obj] = 1
-        # Apply distance mapping to the large colony and try to separate the colony
-        # by finding peaks in the distance map
-        dis_map = ndimage.morphology.distance_transform_edt(mask)
-        local_maxi = feature.peak_local_max(
-            dis_map, indices=False, footprint=np.ones((100, 100))
-        )
-        dilate = morphology.dilation(local_maxi, selem=morphology.disk(10))
-        seed = measure.label(dilate)
-        # Apply watershed segmentation on the colony with new seeds to partition
-        split = segmentation.watershed(-dis_map, seed, mask=mask)
-        print("Partitioned big colonies to smaller colonies")
+        return markers
 
-        # Adjust labeling with new partitioned colonies
-        for obj in range(1, len(np.unique(split))):
-            labelled_colonies[split == obj] = np.max(labelled_colonies) + 1
-        self.segmented_colonies = labelled_colonies
-        print("Done Segmenting colonies")
+    def get_colony_edges(self):
+        """Edges of all segmented colonies. Calculated once after segmentation.
 
+        Input:
+         none
 
-    def find_edge_ridge_pair(self, colony_mask, center_pos, dist_well=30.):
-        """
-        A method to find a pair of edge and ridge point in a colony that is far away from each other and the center position
-        :param colony_mask: a binary colony mask
-        :param center_pos: a tuple (y, x) of the center position
-        :param dist_well: a float > 1 to indicate the size of the well that should be masked out
-        :return:
+        Output:
+         colony_edges: binary image with edges of segmented colonies
         """
-        mask = self.create_circular_mask(radius=(self.height / 2.1) - dist_well)
-
-        all_edges = feature.canny(self.segmented_colonies > 0, sigma=0.1)
-        col_edge = colony_mask * mask * all_edges
-
-        all_edges = np.where(col_edge == np.min(col_edge[np.nonzero(col_edge)]))
-
-        df = pd.DataFrame()
-        for i in range (0, len(all_edges[0])):
-            edge_y, edge_x = all_edges[0][i], all_edges[1][i]
-            # if not ((edge_y in out_mask[0]) & (edge_x in out_mask[1])):
-            row = {}
-            row['edge_x'] = edge_x
-            row['edge_y'] = edge_y
-            df = df.append(row, ignore_index=True)
-
-        # for each edge pt, find the other edge that's furthest away from it and save out as a pair, with distance from
-        # center of colony
-        df['opp_edge_x'] = None
-        df['opp_edge_y'] = None
-
-        if len(df) > 100:
-            df = df.sample(n=100)
-
-        for index, row in df.iterrows():
-            edge_x = row['edge_x']
-            edge_y = row['edge_y']
-
-            max_dist = 0
-            furthest_loc = None
-
-            for index_compare, row_compare in df.iterrows():
-                dist = spatial.distance.euclidean((edge_y, edge_x), (row_compare['edge_y'], row_compare['edge_x']))
-                if dist > max_dist:
-                    max_dist = dist
-                    furthest_loc = (row_compare['edge_y'], row_compare['edge_x'])
-
-            if len(df.loc[(df['edge_y'] == furthest_loc[0]) & (df['edge_x'] == furthest_loc[1]) & (df['opp_edge_x'] == None)]) == 0:
-                df.loc[index, 'opp_edge_x'] = furthest_loc[1]
-                df.loc[index, 'opp_edge_y'] = furthest_loc[0]
-                df.loc[index, 'dist'] = max_dist
-
-                dist_to_center = spatial.distance.euclidean(center_pos, furthest_loc) + spatial.distance.euclidean(center_pos, (edge_y, edge_x))
-                df.loc[index, 'dist_to_center'] = dist_to_center
-
-        edge_pt = (
-            int(df.loc[df['dist_to_center'] == df['dist_to_center'].max(), 'edge_x'].values.tolist()[0]),
-            int(df.loc[df['dist_to_center'] == df['dist_to_center'].max(), 'edge_y'].values.tolist()[0])
-        )
+        if self._colony_edges is None:
+            self._colony_edges = feature.canny(self.segmented_colonies > 0, sigma=0.1)
+        return self._colony_edges
 
-        ridge_pt = (
-            int(df.loc[df['dist_to_center'] == df['dist_to_center'].max(), 'opp_edge_x'].values.tolist()[0]),
-            int(df.loc[df['dist_to_center'] == df['dist_to_center'].max(), 'opp_edge_y'].values.tolist()[0])
-        )
+    def get_colony_rois(self, labelled_colonies, margin=COLONY_MARGIN):
+        """Padded bounding boxes of labelled colonies.
 
-        return edge_pt, ridge_pt
+        Input:
+         labelled_colonies: image with colonies labelled 1, 2, ...
 
+         margin: pixels added on each side of bounding boxes
 
-    def find_edge_position(self, colony_mask):
+        Output:
+         rois: list with tuple of slices (y, x) for each label.
+         None if label does not exist
         """
-        Function to find edge position from a colony mask
+        rois = []
+        for obj_slice in ndimage.find_objects(labelled_colonies):
+            if obj_slice is None:
+                rois.append(None)
+                continue
+            rois.append(
+                tuple(
+                    slice(
+                        max(dim_slice.start - margin, 0),
+                        min(dim_slice.stop + margin, size),
+                    )
+                    for dim_slice, size in zip(obj_slice, labelled_colonies.shape)
+                )
+            )
+        return rois
 
-        :param colony_mask: a [0, 1] image showing the segmentation of 1 colony
-        :return:
-            edge_position: a tuple (y, x) of the selected edge position in the downsampled well overview image
+    def get_roi(self, roi=None):
+        """Return region of interest, full downsized image if roi is None.
+
+        Input:
+         roi: tuple of slices (y, x) or None
+
+        Output:
+         roi: tuple of slices (y, x) with defined start
         """
-        all_edges = feature.canny(self.segmented_colonies > 0, sigma=0.1)
+        if roi is None:
+            roi = (slice(0, self.height), slice(0, self.width))
+        return roi
 
-        col_edge = colony_mask * all_edges
+    def find_edge_ridge_pair(self, colony_mask, center_pos, dist_well=30.0, roi=None):
+        """Find a pair of edge and ridge point in a colony that are far away
+        from each other and the center position.
 
-        edge_pt = np.where(col_edge == np.min(col_edge[np.nonzero(col_edge)]))
-        edge_position = edge_pt[0][0], edge_pt[1][0]
+        Input:
+         colony_mask: a binary colony mask cropped to roi
 
-        return edge_position
+         center_pos: a tuple (y, x) of the center position in the downsampled well
+         overview image
+
+         dist_well: a float > 1 to indicate the size of the well that should be
+         masked out
 
+         roi: tuple of slices (y, x) of colony_mask in the downsampled well overview
+         image. None: colony_mask covers full image
 
-    def find_ridge_position(self, colony_mask, edge_position):
+        Output:
+         edge_pt, ridge_pt: tuples (x, y) of the selected edge and ridge position
+         in the downsampled well overview image
         """
-        Function to find ridge position, optimized by selecting a position in a colony furthest away from the edge position
-        :param colony_mask: a [0, 1] image showing the segmentation of 1 colony
-        :param edge_position: a tuple (y, x) of the selected edge position in the downsampled well overview image
-        :return:
+        roi = self.get_roi(roi)
+        mask = self.create_circular_mask(
+            radius=(self.height / 2.1) - dist_well, roi=roi
+        )
+        col_edge = colony_mask * mask * self.get_colony_edges()[roi]
+        edges = np.argwhere(col_edge) + (roi[0].start, roi[1].start)
+
+        # use at most 100 edge points in random order
+        if len(edges) > 100:
+            edges = edges[np.random.choice(len(edges), 100, replace=False)]
+
+        # for each edge point, find the other edge point that is furthest away
+        # from it and save out as a pair, with distance from center of colony
+        opposite_edges = edges[np.argmax(spatial.distance.cdist(edges, edges), axis=1)]
+        dist_to_center = np.linalg.norm(
+            opposite_edges - center_pos, axis=1
+        ) + np.linalg.norm(edges - center_pos, axis=1)
+        best = np.argmax(dist_to_center)
+
+        edge_pt = (int(edges[best][1]), int(edges[best][0]))
+        ridge_pt = (int(opposite_edges[best][1]), int(opposite_edges[best][0]))
+        return edge_pt, ridge_pt
+
+    def find_edge_position(self, colony_mask, roi=None):
+        """Find edge position from a colony mask.
+
+        Input:
+         colony_mask: a [0, 1] image showing the segmentation of 1 colony
+         cropped to roi
+
+         roi: tuple of slices (y, x) of colony_mask in the downsampled well overview
+         image. None: colony_mask covers full image
+
+        Output:
+         edge_position: a tuple (y, x) of the selected edge position
+         in the downsampled well overview image
         """
-        all_edges = feature.canny(self.segmented_colonies > 0, sigma=0.1)
-
-        col_edge = colony_mask * all_edges
-
-        edge_pt = np.where(col_edge == np.min(col_edge[np.nonzero(col_edge)]))
-        edge_tuples = []
-        for i in range(0, len(edge_pt[0])):
-            new_tuple = (edge_pt[0][i], edge_pt[1][i])
-            edge_tuples.append(new_tuple)
-
-        # find the tuple that is the furthest away from [0][0]
-        max_dist = 0
-        for y, x in edge_tuples:
-            dist = np.sqrt((y - edge_position[0]) ** 2 + (x - edge_position[1]) ** 2)
-
-            if dist>max_dist:
-                max_dist = dist
-                ridge_position = (y, x)
-
-        # to show image for rnd
-        # if (ridge_position[0] > 10) & (ridge_position[0] < (colony_mask.shape[0] - 10)) & \
-        #     (ridge_position[1] > 10) & (ridge_position[1] < (colony_mask.shape[1] - 10)) & \
-        #     (edge_position[0] > 10) & (edge_position[0] < (colony_mask.shape[0] - 10)) & \
-        #     (edge_position[1] > 10) & (edge_position[1] < (colony_mask.shape[1] - 10)):
-        #
-        #     loc_mask = colony_mask.copy()
-        #     loc_mask[ridge_position[0]-10:ridge_position[0]+10, ridge_position[1]-10:ridge_position[1]+10] = 10
-        #     loc_mask[edge_position[0]-10:edge_position[0]+10, edge_position[1]-10:edge_position[1]+10] = 10
-        #
-        #     plt.figure()
-        #     plt.imshow(loc_mask)
-        #     plt.show()
+        roi = self.get_roi(roi)
+        col_edge = colony_mask * self.get_colony_edges()[roi]
+        edge_y, edge_x = np.nonzero(col_edge)
+        edge_position = edge_y[0] + roi[0].start, edge_x[0] + roi[1].start
+        return edge_position
+
+    def find_ridge_position(self, colony_mask, edge_position, roi=None):
+        """Find ridge position, optimized by selecting a position in a colony
+        furthest away from the edge position.
+
+        Input:
+         colony_mask: a [0, 1] image showing the segmentation of 1 colony
+         cropped to roi
+
+         edge_position: a tuple (y, x) of the selected edge position
+         in the downsampled well overview image
 
+         roi: tuple of slices (y, x) of colony_mask in the downsampled well overview
+         image. None: colony_mask covers full image
+
+        Output:
+         ridge_position: a tuple (y, x) of the selected ridge position
+         in the downsampled well overview image
+        """
+        roi = self.get_roi(roi)
+        col_edge = colony_mask * self.get_colony_edges()[roi]
+        edge_y, edge_x = np.nonzero(col_edge)
+        edge_y = edge_y + roi[0].start
+        edge_x = edge_x + roi[1].start
+
+        # find the edge point that is the furthest away from edge_position
+        furthest = np.argmax(
+            (edge_y - edge_position[0]) ** 2 + (edge_x - edge_position[1]) ** 2
+        )
+        ridge_position = (edge_y[furthest], edge_x[furthest])
         return ridge_position
 
+    def find_center_position(self, mask, distance, smoothed_well, roi=None):
+        """Find smoothest point in center region of a colony.
+
+        Input:
+         mask: a binary colony mask cropped to roi
+
+         distance: distance map of all colonies in the downsampled well overview
+         image
 
-    def find_center_position(self, mask, distance, smoothed_well):
-        dist_mask = distance * mask
+         smoothed_well: smoothed downsampled well overview image
+
+         roi: tuple of slices (y, x) of mask in the downsampled well overview
+         image. None: mask covers full image
+
+        Output:
+         smooth_point: a tuple (y, x) of the selected center position
+         in the downsampled well overview image
+        """
+        roi = self.get_roi(roi)
+        dist_mask = distance[roi] * mask
         # for each colony, find the maximum distance from the two fold distance map.
         # The edge is at 0% and the center of the colony is at 100%
         d_max = dist_mask.max()
         # Getting the points which is at least 40% away from the edge
         top_percent = dist_mask > (d_max * 0.30)
-        colony_mask = smoothed_well * top_percent
+        colony_mask = smoothed_well[roi] * top_percent
         colony_edges = feature.canny(colony_mask, sigma=0.1)
         # applying the second distance transform
         # to find the smoothest point in the correct region
         inner_edges = ndimage.distance_transform_edt(~colony_edges * top_percent)
         smooth_point = np.where(inner_edges == inner_edges.max())
-        smooth_point = (smooth_point[0][0], smooth_point[1][0])
+        smooth_point = (
+            smooth_point[0][0] + roi[0].start,
+            smooth_point[1][0] + roi[1].start,
+        )
         return smooth_point
 
-
     def find_positions(self, mode="A"):
         """To find a position in a colony that passes the size filter,
         and is positioned 40% from the edge of colony, maximum in distance map
@@ -481,7 +584,8 @@ class WellSegmentation:
         obj_number_keep = np.where(size_mask)[0]
         num_colonies_final = self.colony_filters_dict["distFromCenter"][1]
 
-        filtered = np.zeros(self.segmented_colonies.shape)
+        # new label for each colony, colonies with label 0 are removed
+        new_labels = np.zeros(len(sizes), dtype=int)
 
         # TODO  - Test for 0 position
         # If there is equal or less # colonies segmented than wanted,
@@ -494,29 +598,23 @@ class WellSegmentation:
         # that are from a slightly smaller colony but closer to well center)
 
         if len(obj_number_keep) <= num_colonies_final:
-            for obj in obj_number_keep:
-                filtered[np.where(self.segmented_colonies == obj + 1)] = obj + 1
+            new_labels[obj_number_keep + 1] = obj_number_keep + 1
             num_objs = len(obj_number_keep)
             if len(obj_number_keep) < num_colonies_final:
                 print("small colonies in this well")
                 # Get colonies of largest size
                 desc_rank = np.argsort(-sizes_colony)
                 size_index = desc_rank[:num_colonies_final]
-                num_obj = 1
-                for obj in size_index:
-                    filtered[np.where(self.segmented_colonies == obj + 1)] = num_obj
-                    num_obj += 1
-                num_objs = num_obj - 1
+                new_labels[size_index + 1] = np.arange(1, len(size_index) + 1)
+                num_objs = len(size_index)
 
         else:
             desc_rank = np.argsort(-sizes_colony)
             size_index = desc_rank[: (num_colonies_final + 2)]
-            num_obj = 1
-            for obj in size_index:
-                filtered[np.where(self.segmented_colonies == obj + 1)] = num_obj
-                num_obj += 1
-            num_objs = num_obj - 1
+            new_labels[size_index + 1] = np.arange(1, len(size_index) + 1)
+            num_objs = len(size_index)
 
+        filtered = new_labels[self.segmented_colonies]
         filtered_colonies = measure.label(filtered)
         print("Filtered colonies according to size")
         # Select 1 position per colony and populate the point location
@@ -525,16 +623,21 @@ class WellSegmentation:
         smoothed_well = ndimage.gaussian_filter(self.downsized_image, 0.35)
         distance = ndimage.distance_transform_edt(filtered_colonies)
 
+        # process each colony within its bounding box
+        rois = self.get_colony_rois(filtered_colonies)[:num_objs]
         point_locations = []
-        for obj in range(1, num_objs + 1):
+        for obj, roi in enumerate(rois, 1):
             print("On object {} of {}".format(obj, num_objs))
-            mask = filtered_colonies == obj
+            if roi is None:
+                continue
+            mask = filtered_colonies[roi] == obj
             if mode == "C" or mode == "c":
-                center_point = self.find_center_position(mask, distance, smoothed_well)
-                edge_point, ridge_point = self.find_edge_ridge_pair(mask, center_point)
-
-                smooth_point_edge = self.find_edge_position(mask)
-                smooth_point_ridge = self.find_ridge_position(mask, smooth_point_edge)
+                center_point = self.find_center_position(
+                    mask, distance, smoothed_well, roi=roi
+                )
+                edge_point, ridge_point = self.find_edge_ridge_pair(
+                    mask, center_point, roi=roi
+                )
 
                 for point in [center_point, edge_point, ridge_point]:
                     smooth_point_corrected = (
@@ -544,16 +647,15 @@ class WellSegmentation:
                     point_locations.append(smooth_point_corrected)
             else:
                 # If we get an unsupported mode, we will just perform mode A imaging
-                center_point = self.find_center_position(mask, distance, smoothed_well)
+                center_point = self.find_center_position(
+                    mask, distance, smoothed_well, roi=roi
+                )
 
                 center_point_corrected = (
                     center_point[0] * DOWNSCALING_FACTOR,
                     center_point[1] * DOWNSCALING_FACTOR,
                 )
-                point_locations.append(smooth_point_corrected)
-
-
-
+                point_locations.append(center_point_corrected)
 
         print("Calculated point distances from center of well")
 
@@ -582,7 +684,7 @@ class WellSegmentation:
             + " points closest to center of well"
         )
 
-    def create_circular_mask(self, center=None, radius=None):
+    def create_circular_mask(self, center=None, radius=None, roi=None):
         """To create a circular mask over an image, masking out edges of a well
 
         Input:
@@ -590,6 +692,9 @@ class WellSegmentation:
 
          radius: radius of circular mask
 
+         roi: tuple of slices (y, x) to create mask only for part of the image.
+         None: create mask for full image
+
         Output:
          mask: a mask with masked-out area being 0, and in-mask area being 1
         """
@@ -600,7 +705,7 @@ class WellSegmentation:
                 center[0], center[1], self.width - center[0], self.height - center[1]
             )
 
-        Y, X = np.ogrid[: self.height, : self.width]
+        Y, X = np.ogrid[self.get_roi(roi)]
         dist_from_center = np.sqrt((X - center[0]) ** 2 + (Y - center[1]) ** 2)
 
         mask = dist_from_center <= radius
@@ -617,17 +722,8 @@ class WellSegmentation:
         Output:
          int_img: binary image with objects smaller than specified area be filtered out
         """
-        label_objects, nb_labels = ndimage.label(bw_img)
-        sizes = np.bincount(label_objects.ravel())
-        # max_area = max(sizes)
+        label_table = segmentation_filters.LabelTable(bw_img)
         # Selecting objects above a certain size threshold
-        # size_mask = (sizes > area) & (sizes < max_area)
-        size_mask = sizes > area
-        size_mask[0] = 0
-        filtered = label_objects.copy()
-        filtered_image = size_mask[filtered]
-
-        int_img = np.zeros(filtered_image.shape)
-        int_img[filtered_image] = 1
-        int_img = int_img.astype(int)
+        label_table.keep &= label_table.sizes > area
+        int_img = label_table.get_image().astype(int)
         return int_img
@@ -5,31 +5,66 @@ Created on Oct 17, 2016
 @author: winfriedw
 """
 
-import pandas
+import os
+import csv
+import atexit
+import glob
 import datetime
+import importlib.util
+
+# pandas and pyarrow are imported when the first meta data are written.
+# pyarrow is optional and only required for format 'parquet'
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+VALID_FORMATS = ["csv", "parquet"]
+# number of rows collected before they are written to a new parquet file
+ROW_GROUP_SIZE = 100
 
 
 class MetaDataFile:
-    """Class to save meta data associated with samples and images."""
+    """Class to save meta data associated with samples and images.
+    Rows are appended to the file, the time to save a row does not depend
+    on the number of rows already saved."""
 
-    def __init__(self, file_path, format="csv"):
-        """Write meta data to .csv file.
+    def __init__(self, file_path, format="csv", row_group_size=ROW_GROUP_SIZE):
+        """Write meta data to .csv file or parquet files.
 
         Input:
-         file_path: path and name of .csv file. If file does not exist, create new file.
+         file_path: path and name of .csv file. Existing file will be replaced
+         with first meta data written.
+
+         format: format of output file.
 
-         format: format of output file. At this moment only .csv is supported
+          csv: .csv file, new columns are added at the end
+
+          parquet: directory with parquet file for each group of rows.
+          Name of directory is file_path with extension .parquet. Requires pyarrow.
+
+         row_group_size: number of rows written together to parquet file.
+         Not used for .csv files (Default: 100)
 
         Output:
          none
         """
-        if format != "csv":
+        if format not in VALID_FORMATS:
             print("Format {} is not supported.".format(format))
             return
-        else:
-            self.format = format
+        if format == "parquet" and not PYARROW_AVAILABLE:
+            print("Format parquet requires pyarrow. Meta data is saved as csv.")
+            format = "csv"
+        self.format = format
         self.file_path = file_path
-        self.meta_data = pandas.DataFrame()
+        if format == "parquet":
+            self.file_path = os.path.splitext(file_path)[0] + ".parquet"
+        self.row_group_size = row_group_size
+        # columns in the order they were first used
+        self.columns = []
+        self.number_rows = 0
+        self.buffered_rows = []
+        self.number_row_groups = 0
+        if format == "parquet":
+            # do not lose collected rows if automation stops early
+            atexit.register(self.close)
 
     def write_csv(self, meta, file_path):
         """Write meta data to .csv file.
@@ -44,15 +79,135 @@ class MetaDataFile:
         """
         meta.to_csv(file_path, header=True, mode="w", index_label="IndexRow")
 
+    def _migrate_csv(self, new_columns):
+        """Add new columns to existing .csv file.
+        Only called when meta data with new keys is written.
+
+        Input:
+         new_columns: list with names of columns to add at end of each row
+
+        Output:
+         none
+        """
+        temp_path = self.file_path + ".tmp"
+        with open(self.file_path, newline="") as old_file, open(
+            temp_path, "w", newline=""
+        ) as new_file:
+            reader = csv.reader(old_file)
+            writer = csv.writer(new_file)
+            writer.writerow(next(reader) + new_columns)
+            for row in reader:
+                writer.writerow(row + [""] * len(new_columns))
+        os.replace(temp_path, self.file_path)
+
+    def _append_csv(self, rows):
+        """Append rows to .csv file. Create file or add columns if necessary.
+
+        Input:
+         rows: list with dictionaries of meta data
+
+        Output:
+         none
+        """
+        new_columns = [
+            column
+            for column in dict.fromkeys(key for row in rows for key in row)
+            if column not in self.columns
+        ]
+        if self.number_rows == 0:
+            self.columns.extend(new_columns)
+            mode = "w"
+        else:
+            if new_columns:
+                self._migrate_csv(new_columns)
+                self.columns.extend(new_columns)
+            mode = "a"
+
+        with open(self.file_path, mode, newline="") as f:
+            writer = csv.writer(f)
+            if mode == "w":
+                writer.writerow(["IndexRow"] + self.columns)
+            for index, row in enumerate(rows, self.number_rows):
+                writer.writerow(
+                    [index]
+                    + [_format_value(row.get(column)) for column in self.columns]
+                )
+
+    def _append_parquet(self, rows):
+        """Collect rows and write them as new parquet file
+        when row_group_size rows are collected.
+
+        Input:
+         rows: list with dictionaries of meta data
+
+        Output:
+         none
+        """
+        for index, row in enumerate(rows, self.number_rows):
+            self.buffered_rows.append(dict(row, IndexRow=index))
+            for column in row:
+                if column not in self.columns:
+                    self.columns.append(column)
+        if len(self.buffered_rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        """Write collected rows to parquet file.
+        Each group of rows is stored in its own file, columns can differ between files.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        if self.format != "parquet" or not self.buffered_rows:
+            return
+        import pyarrow
+        import pyarrow.parquet
+
+        if self.number_row_groups == 0:
+            # replace data from earlier runs
+            os.makedirs(self.file_path, exist_ok=True)
+            for old_file in glob.glob(os.path.join(self.file_path, "part-*.parquet")):
+                os.remove(old_file)
+        # all values are stored as strings to allow changing types as in .csv file
+        columns = {"IndexRow": [row["IndexRow"] for row in self.buffered_rows]}
+        for column in self.columns:
+            columns[column] = [
+                _format_value(row.get(column)) for row in self.buffered_rows
+            ]
+        table = pyarrow.Table.from_pydict(columns)
+        part_path = os.path.join(
+            self.file_path, "part-{:05}.parquet".format(self.number_row_groups)
+        )
+        pyarrow.parquet.write_table(table, part_path + ".tmp")
+        os.replace(part_path + ".tmp", part_path)
+        self.number_row_groups += 1
+        self.buffered_rows = []
+
+    def close(self):
+        """Write remaining meta data to file.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        self.flush()
+
     def write_meta(self, meta):
-        """Write meta data to .csv file.
+        """Append meta data to file.
 
         Input:
          meta: dictionary or pandas DataFrame with meta data
 
         Output:
-         none
+         metaRow: pandas DataFrame with meta data and time stamp written to file
         """
+        import pandas
+
         # convert meta data to Dataframe if necessary
         if not isinstance(meta, pandas.DataFrame):
             metaRow = pandas.DataFrame.from_dict({1: meta}, orient="index")
@@ -68,14 +223,62 @@ class MetaDataFile:
             index=[1],
         )
         metaRow = metaRow.join(timeStamp)
-        # Append new data to existing data. We will always write
-        # the whole meta data set to disk to ensure that new columns are added
-        # and missing meta data entries do not shift the content in the csv file
-        self.meta_data = self.meta_data.append(metaRow, ignore_index=True)
+        # Append new data to file. New columns are added at the end
+        # and missing meta data entries do not shift the content in the file
+        rows = metaRow.to_dict(orient="records")
 
         if self.format == "csv":
-            self.write_csv(self.meta_data, self.file_path)
+            self._append_csv(rows)
+        elif self.format == "parquet":
+            self._append_parquet(rows)
         else:
             print("Format {} not implemented".format(self.format))
+        self.number_rows += len(rows)
+
+        return metaRow
+
+    def read_meta(self):
+        """Read all meta data written to file.
+
+        Input:
+         none
+
+        Output:
+         meta_data: pandas DataFrame with meta data
+        """
+        import pandas
+
+        if self.format == "parquet":
+            self.flush()
+            parts = sorted(glob.glob(os.path.join(self.file_path, "part-*.parquet")))
+            if not parts:
+                return pandas.DataFrame()
+            meta_data = pandas.concat(
+                [pandas.read_parquet(part) for part in parts], ignore_index=True
+            )
+            return meta_data.set_index("IndexRow")[self.columns]
+        if self.number_rows == 0:
+            return pandas.DataFrame()
+        return pandas.read_csv(self.file_path, index_col="IndexRow")
+
+
+def _format_value(value):
+    """Convert meta data value to entry in file.
+
+    Input:
+     value: meta data value
+
+    Output:
+     entry: string with value, None for missing values
+    """
+    import pandas
 
-        return self.meta_data
+    if value is None:
+        return None
+    try:
+        if pandas.isna(value):
+            return None
+    except (TypeError, ValueError):
+        # lists and arrays
+        pass
+    return str(value)
@@ -5,12 +5,34 @@ Will read and return values for different configuration files
 
 @author: winfriedw
 """
+import copy
+import types
 import yaml
 import logging
+from collections import OrderedDict
 
 # create logger
 module_logger = logging.getLogger(__name__.split(".")[0])
 
+# use fast yaml loader based on libyaml if available
+YAML_LOADER = getattr(yaml, "CFullLoader", yaml.FullLoader)
+
+
+def _is_valid(pref, valid_values):
+    """Test if preference value is valid.
+
+    Input:
+     pref: value of preference. For lists all entries are tested.
+
+     valid_values: list with allowed values
+
+    Output:
+     is_valid: True if value is valid
+    """
+    if isinstance(pref, list):
+        return set(pref) < set(valid_values)
+    return pref in valid_values
+
 
 class Preferences:
     """Reads configuration files and will return Values"""
@@ -44,7 +66,7 @@ class Preferences:
             self.logger.info("read preferences from " + pref_path)
 
             with open(pref_path, "r") as prefsFile:
-                self.prefs = yaml.load(prefsFile, Loader=yaml.FullLoader)
+                self.prefs = yaml.load(prefsFile, Loader=YAML_LOADER)
                 print("\nRead preferences from {}\n".format(pref_path))
                 prefs_info = self.prefs["Info"]
                 for key, value in prefs_info.items():
@@ -73,7 +95,7 @@ class Preferences:
         """
         return self.parent_prefs
 
-    def get_pref(self, name, valid_values=None):
+    def get_pref(self, name, valid_values=None, default=None):
         """Return value for key 'name' in preferences.
 
         Input:
@@ -82,22 +104,32 @@ class Preferences:
          valid_values: list with allowed values. Throw exception if value is not valid.
          Default: do not check.
 
+         default: value returned if key is not defined in preferences
+         or parent preferences. Used for optional keys, the user is not asked.
+         Default: None (ask user if parent preferences exist)
+
         Output:
          pref: value for key 'name' in preferences
         """
-        from microscope_automation.util.automation_messages_form_layout import (
-            pull_down_select_dialog,
-            read_string,
-        )
-
         if not isinstance(self.prefs, type(dict())):
             print("\n")
             print(self.prefs)
         pref = self.prefs.get(name)
+        if pref is None and default is not None:
+            parent_prefs = self.parent_prefs
+            while pref is None and parent_prefs is not None:
+                pref = parent_prefs.prefs.get(name)
+                parent_prefs = parent_prefs.get_parent_prefs()
+            if pref is None:
+                pref = default
         if pref is None and self.parent_prefs is not None:
             parent_pref = self.parent_prefs.get_pref(name)
             if parent_pref is not None:
                 return parent_pref
+            from microscope_automation.util.automation_messages_form_layout import (
+                read_string,
+            )
+
             pref = read_string(
                 "Key " + name + " is not defined and there are no parent preferences",
                 label="Enter a value for " + name + ":",
@@ -108,27 +140,74 @@ class Preferences:
             if pref == 0 or pref == "":
                 pref = None
 
-        if valid_values is not None:
-            if isinstance(pref, list):
-                while not (set(pref) < set(valid_values)):
-                    pref = [
-                        pull_down_select_dialog(
-                            valid_values,
-                            "Please select valid value for preference key {},\ninstead of {}\nor exit program by pressing 'Cancel'.".format(  # noqa
-                                name, pref
-                            ),
-                        )
-                    ]
-            else:
-                while pref not in valid_values:
-                    pref = pull_down_select_dialog(
-                        valid_values,
-                        "Please select valid value for preference key {},\ninstead of {}\nor exit program by pressing 'Cancel'.".format(  # noqa
-                            name, pref
-                        ),
-                    )
+        if valid_values is not None and not _is_valid(pref, valid_values):
+            from microscope_automation.util.automation_messages_form_layout import (
+                pull_down_select_dialog,
+            )
+
+            while not _is_valid(pref, valid_values):
+                selection = pull_down_select_dialog(
+                    valid_values,
+                    "Please select valid value for preference key {},\ninstead of {}\nor exit program by pressing 'Cancel'.".format(  # noqa
+                        name, pref
+                    ),
+                )
+                pref = [selection] if isinstance(pref, list) else selection
+        return pref
+
+    def _resolve_pref(self, name):
+        """Find value for key in preferences or parent preferences without asking user.
+
+        Input:
+         name: string with key name
+
+        Output:
+         pref: value for key 'name', None if not defined
+        """
+        prefs = self
+        pref = None
+        while pref is None and prefs is not None:
+            pref = prefs.prefs.get(name)
+            prefs = prefs.get_parent_prefs()
         return pref
 
+    def compile(self, schema=None, required=None):
+        """Resolve and validate preferences once before they are used.
+
+        Input:
+         schema: dictionary with key names and lists with valid values (Default: None)
+
+         required: list with keys that have to be defined. Keys not defined
+         in these preferences are taken from parent preferences (Default: None)
+
+        Output:
+         snapshot: PreferencesSnapshot with resolved values
+
+         problems: list with strings that describe missing or invalid keys
+        """
+        schema = schema or {}
+        required = required or []
+        values = copy.deepcopy(self.prefs)
+        for name in required:
+            if values.get(name) is None:
+                pref = self._resolve_pref(name)
+                if pref is not None:
+                    values[name] = copy.deepcopy(pref)
+
+        problems = []
+        for name in required:
+            if values.get(name) is None:
+                problems.append("Key {} is not defined".format(name))
+        for name, valid_values in schema.items():
+            pref = values.get(name)
+            if pref is not None and not _is_valid(pref, valid_values):
+                problems.append(
+                    "Value {} for key {} is not valid. Valid values: {}".format(
+                        pref, name, valid_values
+                    )
+                )
+        return PreferencesSnapshot(values, source_prefs=self), problems
+
     def get_pref_as_meta(self, name):
         """Return subset of preferences as preferences object.
 
@@ -149,3 +228,139 @@ class Preferences:
         self.prefs[name] = value
 
     # TODO: Add capacity to save preferences
+
+
+class PreferencesSnapshot(object):
+    """Immutable set of resolved and validated preferences.
+    Values can be accessed as attributes (snapshot.Verbose) or with get_pref.
+    Nested values (e.g. dictionaries) are copies of the original preferences."""
+
+    def __init__(self, values, source_prefs=None):
+        """Create snapshot from dictionary with resolved values.
+        Use Preferences.compile to create snapshot.
+
+        Input:
+         values: dictionary with preferences
+
+         source_prefs: Preferences object snapshot was created from.
+         Used to ask user for keys that are missing or invalid.
+
+        Output:
+         none
+        """
+        object.__setattr__(self, "_values", types.MappingProxyType(dict(values)))
+        object.__setattr__(self, "_source_prefs", source_prefs)
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError("Preferences do not define key {}".format(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Preferences snapshot cannot be changed")
+
+    def __getitem__(self, name):
+        return self._values[name]
+
+    def __contains__(self, name):
+        return name in self._values
+
+    @property
+    def prefs(self):
+        """Read only dictionary with all preferences."""
+        return self._values
+
+    def get_parent_prefs(self):
+        """Return preferences that were source for original preferences.
+
+        Input:
+         none
+
+        Output:
+         parent_prefs: Object of class preferences
+        """
+        if self._source_prefs is None:
+            return None
+        return self._source_prefs.get_parent_prefs()
+
+    def get_pref(self, name, valid_values=None, default=None):
+        """Return value for key 'name' in snapshot.
+        Same interface as Preferences.get_pref. The user is only asked
+        for keys that were not resolved or are not valid.
+
+        Input:
+         name: string with key name
+
+         valid_values: list with allowed values. Default: do not check.
+
+         default: value returned if key is not defined
+
+        Output:
+         pref: value for key 'name' in preferences
+        """
+        pref = self._values.get(name)
+        if pref is not None:
+            if valid_values is None or _is_valid(pref, valid_values):
+                return pref
+        elif default is not None:
+            return default
+        if self._source_prefs is None:
+            return pref
+        return self._source_prefs.get_pref(name, valid_values, default)
+
+    def get_pref_as_meta(self, name):
+        """Return subset of preferences as preferences object.
+
+        Input:
+         name: name of meta data dictionary
+
+        Output:
+         prefsObject: preferences dictionary as preferences object
+        """
+        if self._source_prefs is None:
+            return None
+        return self._source_prefs.get_pref_as_meta(name)
+
+
+def compile_workflow(prefs, schema=None, required_prefs=None, experiments=None):
+    """Compile and validate preferences for all experiments in workflow
+    before the workflow is started.
+
+    Input:
+     prefs: Preferences object with key 'Workflow'
+
+     schema: dictionary with key names and lists with valid values
+
+     required_prefs: dictionary with function names as keys and lists
+     with required keys as values. Key None lists keys required for all functions.
+
+     experiments: list with names of experiments to compile.
+     None: compile all experiments in workflow (Default: None)
+
+    Output:
+     snapshots: OrderedDict with experiment names as keys
+     and PreferencesSnapshot objects as values
+
+     problems: list with strings that describe missing or invalid keys
+    """
+    required_prefs = required_prefs or {}
+    if experiments is None:
+        experiments = [step["Experiment"] for step in prefs.prefs.get("Workflow", [])]
+
+    snapshots = OrderedDict()
+    problems = []
+    for experiment in experiments:
+        experiment_dict = prefs.prefs.get(experiment)
+        if not isinstance(experiment_dict, dict):
+            problems.append("{}: experiment is not defined".format(experiment))
+            continue
+        experiment_prefs = Preferences(pref_dict=experiment_dict, parent_prefs=prefs)
+        required = list(required_prefs.get(None, []))
+        required.extend(required_prefs.get(experiment_dict.get("FunctionName"), []))
+        snapshot, experiment_problems = experiment_prefs.compile(schema, required)
+        problems.extend(
+            "{}: {}".format(experiment, problem) for problem in experiment_problems
+        )
+        snapshots[experiment] = snapshot
+    return snapshots, problems
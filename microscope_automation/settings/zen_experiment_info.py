@@ -1,4 +1,8 @@
 from lxml import etree
+from collections import namedtuple
+import copy
+import os
+import threading
 import logging
 
 try:
@@ -9,6 +13,140 @@ except ImportError:
 
 log = logging.getLogger(__name__)
 
+################################################################################
+#
+# Process wide cache for parsed experiments
+#
+################################################################################
+
+# compiled XPath expressions reused for all experiments
+XPATH_Z_STACK_SETUP = etree.XPath(".//ZStackSetup")
+XPATH_Z_STACK_FIRST = etree.XPath("First/Distance/Value/text()")
+XPATH_Z_STACK_LAST = etree.XPath("Last/Distance/Value/text()")
+XPATH_REGIONS_SETUP = etree.XPath(".//RegionsSetup")
+XPATH_OBJECTIVE_POSITION = etree.XPath(
+    ".//ParameterCollection[@Id = 'MTBObjectiveChanger']/Position/text()"
+)
+XPATH_FOCUS_SETUP = etree.XPath(".//FocusSetup")
+
+# Values extracted from experiment file when it is parsed.
+# Values are None if experiment does not define them.
+ExperimentInfo = namedtuple(
+    "ExperimentInfo",
+    [
+        "experiment_path",
+        "tree",
+        "is_z_stack",
+        "z_stack_range",
+        "is_tile_scan",
+        "objective_position",
+        "focus_settings",
+    ],
+)
+
+# keys are absolute experiment paths,
+# values are tuples (modification time, file size, ExperimentInfo)
+_experiment_cache = {}
+_experiment_cache_lock = threading.Lock()
+
+
+def _first_activated(elements):
+    """Test if first element in list is activated.
+
+    Input:
+     elements: list with lxml elements
+
+    Output:
+     is_activated: True if attribute 'IsActivated' of first element is 'true',
+     None if list is empty
+    """
+    if not elements:
+        return None
+    return elements[0].attrib.get("IsActivated") == "true"
+
+
+def _parse_experiment(experiment_path):
+    """Parse experiment file and extract values used by automation.
+
+    Input:
+     experiment_path: path of the experiment file
+
+    Output:
+     experiment_info: ExperimentInfo with parsed tree and extracted values
+    """
+    tree = etree.parse(experiment_path)
+    root = tree.getroot()
+
+    # use only first z-stack setup, tile region setup, and objective changer
+    z_stack_setups = XPATH_Z_STACK_SETUP(root)
+    is_z_stack = _first_activated(z_stack_setups)
+    z_stack_range = None
+    if is_z_stack is False:
+        z_stack_range = 0
+    elif is_z_stack:
+        first_position = XPATH_Z_STACK_FIRST(z_stack_setups[0])
+        last_position = XPATH_Z_STACK_LAST(z_stack_setups[0])
+        if first_position and last_position:
+            z_stack_range = abs(float(last_position[0]) - float(first_position[0]))
+
+    objective_position = XPATH_OBJECTIVE_POSITION(root)
+    return ExperimentInfo(
+        experiment_path=experiment_path,
+        tree=tree,
+        is_z_stack=is_z_stack,
+        z_stack_range=z_stack_range,
+        is_tile_scan=_first_activated(XPATH_REGIONS_SETUP(root)),
+        objective_position=int(objective_position[0]) if objective_position else None,
+        focus_settings=XPATH_FOCUS_SETUP(root),
+    )
+
+
+def get_experiment_info(experiment_path):
+    """Get parsed experiment from cache.
+    Experiment file is only parsed again if it was modified.
+
+    Input:
+     experiment_path: path of the experiment file
+
+    Output:
+     experiment_info: ExperimentInfo with parsed tree and extracted values
+    """
+    key = os.path.abspath(experiment_path)
+    stat = os.stat(key)
+    with _experiment_cache_lock:
+        cached = _experiment_cache.get(key)
+    if cached is not None and cached[0:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+
+    experiment_info = _parse_experiment(experiment_path)
+    with _experiment_cache_lock:
+        _experiment_cache[key] = (stat.st_mtime_ns, stat.st_size, experiment_info)
+    return experiment_info
+
+
+def clear_experiment_cache(experiment_path=None):
+    """Remove parsed experiments from cache.
+
+    Input:
+     experiment_path: path of the experiment file to remove.
+     None: remove all experiments (Default: None)
+
+    Output:
+     none
+    """
+    with _experiment_cache_lock:
+        if experiment_path is None:
+            _experiment_cache.clear()
+        else:
+            _experiment_cache.pop(os.path.abspath(experiment_path), None)
+
+
+################################################################################
+#
+# Access to Zen experiment files
+#
+################################################################################
+
 
 class ZenExperiment(object):
 
@@ -34,8 +172,10 @@ class ZenExperiment(object):
         self.experiment_path = experiment_path
         self.experiment_name = experiment_name
         if self.experiment_exists():
-            self.tree = etree.parse(self.experiment_path)
+            self.info = get_experiment_info(self.experiment_path)
+            self.tree = self.info.tree
         else:
+            self.info = None
             self.tree = None
 
     def experiment_exists(self):
@@ -81,6 +221,9 @@ class ZenExperiment(object):
         Output:
          none
         """
+        # cached tree is shared with other instances, edit own copy
+        if self.info is not None and self.tree is self.info.tree:
+            self.tree = copy.deepcopy(self.tree)
         root = self.tree.getroot()
         try:
             tag = root.xpath(tag_path)
@@ -93,6 +236,9 @@ class ZenExperiment(object):
                     tag_path, self.experiment_path, err.strerror
                 )
             )
+        finally:
+            # file might have changed, parse file again on next access
+            clear_experiment_cache(self.experiment_path)
 
     def is_tile_scan(self):
         """Test if experiment is tile scan.
@@ -103,11 +249,7 @@ class ZenExperiment(object):
         Output:
          is_tile_scan: True if experiment contains z-stack
         """
-        root = self.tree.getroot()
-        # retrieve all z-stack setups, use only fist
-        RegionsSetup = root.findall(".//RegionsSetup")[0]
-        is_tile_scan = RegionsSetup.attrib["IsActivated"] == "true"
-        return is_tile_scan
+        return self._get_info_value("is_tile_scan", "RegionsSetup")
 
     def update_tile_positions(self, x_value, y_value, z_value):
         """In the tile function, correct the hard coded values of the tile
@@ -137,10 +279,7 @@ class ZenExperiment(object):
         Output:
          focus_settings: All instances of focus settings in experiment file
         """
-        root = self.tree.getroot()
-        # retrieve all focus setups
-        focus_settings = root.findall(".//FocusSetup")
-        return focus_settings
+        return self.info.focus_settings
 
     def get_objective_position(self):
         """Return position of objective used in experiment.
@@ -152,13 +291,7 @@ class ZenExperiment(object):
         Output:
          position: integer with position of objective used in experiment
         """
-        root = self.tree.getroot()
-        # retrieve all objective changers. Use only first
-        objective_changer = root.findall(
-            ".//ParameterCollection[@Id = 'MTBObjectiveChanger']"
-        )[0]
-        position = int(objective_changer.find("Position").text)
-        return position
+        return self._get_info_value("objective_position", "MTBObjectiveChanger")
 
     def is_z_stack(self):
         """Test if experiment is z-stack.
@@ -169,21 +302,7 @@ class ZenExperiment(object):
         Output:
          is_z_stack: True if experiment contains z-stack
         """
-        root = self.tree.getroot()
-        # retrieve all z-stack setups, use only first
-        # TODO:
-        # I would separate this out into two steps -
-        # one where you do the findall and another to access the first item.
-        # That way, you can actually check if the file has any MTBObjectiveChanger
-        # entries in it and throw an appropriate error if they are non, rather
-        # than have the findall return an empty list and
-        # then the [0] access throw an undescriptive IndexError.
-        # It may be helpful to write a common function for this that
-        # will take the result of a findall, ensure that there is
-        # at least one element in it and if not throw a more appropriate exception.
-        ZStackSetup = root.findall(".//ZStackSetup")[0]
-        is_z_stack = ZStackSetup.attrib["IsActivated"] == "true"
-        return is_z_stack
+        return self._get_info_value("is_z_stack", "ZStackSetup")
 
     def z_stack_range(self):
         """Return range of first z-stack in experiment.
@@ -195,13 +314,24 @@ class ZenExperiment(object):
         Output:
          z_stack_range: True if experiment contains z-stack
         """
-        if not self.is_z_stack():
-            return 0
-        else:
-            root = self.tree.getroot()
-            # retrieve all z-stack setups, use only fist
-            ZStackSetup = root.findall(".//ZStackSetup")[0]
-            first_postion = float(ZStackSetup.find("First/Distance/Value").text)
-            last_postion = float(ZStackSetup.find("Last/Distance/Value").text)
-            z_stack_range = abs(last_postion - first_postion)
-            return z_stack_range
+        return self._get_info_value("z_stack_range", "ZStackSetup")
+
+    def _get_info_value(self, field, tag):
+        """Get value extracted from experiment file.
+
+        Input:
+         field: name of field in ExperimentInfo
+
+         tag: name of tag in experiment file that defines value
+
+        Output:
+         value: value of field
+        """
+        value = getattr(self.info, field)
+        if value is None:
+            raise ValueError(
+                "Experiment {} does not define valid {}".format(
+                    self.experiment_path, tag
+                )
+            )
+        return value
@@ -16,6 +16,7 @@ Docs: https://docs.pytest.org/en/latest/example/simple.html
       https://docs.pytest.org/en/latest/plugins.html#requiring-loading-plugins-in-a-test-module-or-conftest-file
 """
 
+import os
 import pytest
 import numpy as np
 from microscope_automation.util.image_AICS import ImageAICS
@@ -24,6 +25,16 @@ import microscope_automation.settings.preferences as preferences
 import microscope_automation.hardware.hardware_components as h_comp
 import microscope_automation.samples.samples as samples
 import microscope_automation.orchestrator.microscope_automation as mic_auto
+from microscope_automation.util import image_writer
+
+
+@pytest.fixture(autouse=True)
+def flush_image_writer():
+    """Wait until images submitted by test to shared writer pool are written.
+    Errors are reported for the test that submitted the image.
+    """
+    yield
+    image_writer.flush_writer_pool()
 
 
 @pytest.fixture
@@ -679,3 +690,19 @@ def helpers():
     microscope_automation package.
     """
     return Helpers
+
+
+@pytest.fixture
+def benchmark_limit():
+    """Function to select limit for run time of benchmarks.
+    Strict limits depend on machine and load and are used only
+    if environment variable MICROSCOPE_AUTOMATION_BENCHMARKS is set.
+    Otherwise loose limits catch large regressions.
+    """
+
+    def select_limit(strict, loose):
+        if os.environ.get("MICROSCOPE_AUTOMATION_BENCHMARKS"):
+            return strict
+        return loose
+
+    return select_limit
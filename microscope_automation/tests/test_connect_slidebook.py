@@ -4,21 +4,30 @@ Created on Jan 27, 2020
 
 @author: winfriedw
 """
+
 import pytest
+import os
+import time
 import requests
 import numpy as np
 import skimage
+from mock import patch
 
 # Import the resource/controllers we're testing
 from microscope_automation.util.automation_exceptions import (
     HardwareCommandNotDefinedError,
+    HardwareError,
 )
 from microscope_automation.util.image_AICS import ImageAICS
 from microscope_automation.connectors.connect_slidebook import ConnectMicroscope
-
+from microscope_automation.connectors import connect_slidebook
+from microscope_automation.connectors import slidebook_services_dummy
 
 # Set to True if you want to skip all tests, e.g. when developing a new function
+# Tests require command and data services running on localhost
 skip_all_functions = True
+# Tests using local stand-in for command and data services
+skip_local_service_tests = False
 
 
 @pytest.fixture
@@ -32,6 +41,26 @@ def connection_object(
     return connection
 
 
+@pytest.fixture
+def local_services():
+    """Start local command and data services on free ports"""
+    cmd_server, data_server = slidebook_services_dummy.start_services(
+        stage_location=(100, 200, 300)
+    )
+    yield cmd_server, data_server
+    cmd_server.stop()
+    data_server.stop()
+
+
+@pytest.fixture
+def local_connection(local_services):
+    """Return connection object to local command and data services"""
+    cmd_server, data_server = local_services
+    connection = ConnectMicroscope(cmd_server.url, data_server.url)
+    yield connection
+    connection.close()
+
+
 @pytest.fixture
 def image():
     """Image for testing"""
@@ -221,3 +250,212 @@ def test_live_mode_stop(connection_object):
     """Start live mode not supported for Slidebook"""
     with pytest.raises(HardwareCommandNotDefinedError):
         assert connection_object.live_mode_stop("")
+
+
+# Tests with local stand-in for command and data services
+@pytest.mark.skipif(skip_local_service_tests, reason="Testing disabled")
+def test_local_connection_pooling(local_services, local_connection):
+    """All requests reuse one connection to each service"""
+    cmd_server, data_server = local_services
+    assert local_connection.cmd_server_info["name"] == "Command_API"
+    assert local_connection.data_server_info["name"] == "Data_API"
+    for _ in range(20):
+        assert local_connection.get_stage_pos() == [100, 200, 300]
+    assert local_connection.get_focus_pos() == 300
+    assert cmd_server.application.number_requests == 22
+    assert cmd_server.number_connections == 1
+    assert data_server.number_connections == 1
+
+
+@pytest.mark.skipif(skip_local_service_tests, reason="Testing disabled")
+def test_local_experiment_queue(local_services, local_connection, experiment):
+    """Post many experiments with one request and work through queue"""
+    cmd_server, _ = local_services
+    posted = local_connection.post_experiments([experiment] * 3)
+    assert [e["id_counter"] for e in posted] == [1, 2, 3]
+    assert cmd_server.application.number_requests == 2
+    assert local_connection.count_experiments() == 3
+
+    next_experiment = local_connection.get_next_experiment()
+    assert next_experiment == posted[0]
+    remaining = local_connection.delete_experiment(next_experiment["experiment_id"])
+    assert list(remaining) == [e["experiment_id"] for e in posted[1:]]
+    assert local_connection.get_experiment(next_experiment["experiment_id"]) == {}
+
+    local_connection.clear_experiments()
+    assert local_connection.get_experiment_dict() == {}
+    assert local_connection.get_next_experiment() is None
+
+
+@pytest.mark.skipif(skip_local_service_tests, reason="Testing disabled")
+def test_local_post_experiments_without_bulk(local_services, local_connection):
+    """Post experiments one by one if service does not support bulk endpoint"""
+    cmd_server, _ = local_services
+    handle = cmd_server.application.handle
+
+    def handle_without_bulk(method, path, body):
+        if path[-1] == "bulk":
+            return "404 Not Found", {}, "application/json"
+        return handle(method, path, body)
+
+    experiments = [
+        dict(local_connection.default_experiment, objective=str(i)) for i in range(3)
+    ]
+    with patch.object(
+        cmd_server.application, "handle", side_effect=handle_without_bulk
+    ):
+        posted = local_connection.post_experiments(experiments)
+    assert [e["objective"] for e in posted] == ["0", "1", "2"]
+    assert local_connection.count_experiments() == 3
+
+
+@pytest.mark.skipif(skip_local_service_tests, reason="Testing disabled")
+def test_local_load_image(local_services, local_connection, image, meta_data):
+    """Load image posted to local data service"""
+    data_url = local_connection.data_url
+    meta_data["image_dimensions"] = image.shape
+    meta_data["format"] = str(image.dtype)
+    data_id = requests.post(data_url + "/meta_data", json=meta_data).json()["data_id"]
+    requests.post(data_url + "/binary/" + data_id, data=image.tobytes())
+    return_image = local_connection.load_image(image=None)
+    assert np.array_equal(return_image.data, image)
+    local_connection.remove_all()
+    assert local_services[1].application.images == {}
+
+
+@pytest.mark.skipif(skip_local_service_tests, reason="Testing disabled")
+def test_local_get_stage_pos_without_position(local_services, local_connection):
+    """Repeat request for stage position with growing waits"""
+    cmd_server = local_services[0]
+    cmd_server.application.recent_position = {}
+    number_requests = cmd_server.application.number_requests
+    start_time = time.monotonic()
+    with patch(
+        "microscope_automation.util.polling.time.sleep", side_effect=time.sleep
+    ) as sleep:
+        with pytest.raises(requests.exceptions.Timeout):
+            local_connection.get_stage_pos(repetitions=4, wait=0.05)
+    # total wait is repetitions * wait
+    assert time.monotonic() - start_time >= 0.2
+    waits = [call[0][0] for call in sleep.call_args_list]
+    assert waits[0] < waits[1] and max(waits) <= 0.05
+    assert cmd_server.application.number_requests - number_requests == len(waits) + 1
+
+
+@pytest.mark.skipif(skip_local_service_tests, reason="Testing disabled")
+def test_retry_connection_error(local_services):
+    """Retry requests with jittered backoff if service is not reachable"""
+    cmd_server, data_server = local_services
+    cmd_server.stop()
+    # dummy connection does not request information from services
+    connection = ConnectMicroscope(
+        cmd_server.url, data_server.url, dummy=True, retries=2
+    )
+    with patch(
+        "microscope_automation.connectors.connect_slidebook.time.sleep"
+    ) as sleep:
+        with pytest.raises(requests.exceptions.ConnectionError):
+            connection.count_experiments()
+    assert sleep.call_count == 2
+    assert sleep.call_args_list[0][0][0] <= connect_slidebook.RETRY_WAIT
+    assert sleep.call_args_list[1][0][0] <= 2 * connect_slidebook.RETRY_WAIT
+
+
+@pytest.mark.skipif(skip_local_service_tests, reason="Testing disabled")
+def test_retry_post_connection_refused(local_services, experiment):
+    """Repeat requests with side effects only if they were not sent"""
+    cmd_server, data_server = local_services
+    cmd_server.stop()
+    connection = ConnectMicroscope(
+        cmd_server.url, data_server.url, dummy=True, retries=2
+    )
+    with patch(
+        "microscope_automation.connectors.connect_slidebook.time.sleep"
+    ) as sleep:
+        with pytest.raises(requests.exceptions.ConnectionError) as error:
+            connection.post_experiment(experiment)
+    assert connect_slidebook.request_not_sent(error.value)
+    assert sleep.call_count == 2
+    assert not connect_slidebook.request_not_sent(
+        requests.exceptions.ConnectionError("Connection aborted.")
+    )
+
+
+@pytest.mark.skipif(skip_local_service_tests, reason="Testing disabled")
+def test_benchmark_commands(local_services, local_connection):
+    """Measure throughput of commands with local services"""
+    results = slidebook_services_dummy.benchmark_commands(
+        local_connection, number_commands=50
+    )
+    assert set(results) == {"get_stage_pos", "post_experiment", "post_experiments"}
+    assert results["post_experiments"] > results["post_experiment"]
+    assert local_services[0].number_connections == 1
+
+
+def post_image(data_url, image, meta_data):
+    """Post image and meta data to data service like MatLab code"""
+    meta_data = dict(meta_data, image_dimensions=image.shape, format=str(image.dtype))
+    data_id = requests.post(data_url + "/meta_data", json=meta_data).json()["data_id"]
+    requests.post(data_url + "/binary/" + data_id, data=image.tobytes())
+    return data_id
+
+
+def count_binary_requests(handle_mock):
+    """Count requests for image data received by data service"""
+    return len(
+        [
+            call
+            for call in handle_mock.call_args_list
+            if call[0][0] == "GET" and "binary" in call[0][1]
+        ]
+    )
+
+
+@pytest.mark.skipif(skip_local_service_tests, reason="Testing disabled")
+def test_local_load_image_streamed(local_connection, meta_data, tmp_path):
+    """Stream image larger than chunk size into memory and into memmap"""
+    z_stack = np.arange(3 * 512 * 512, dtype=np.uint16).reshape(3, 512, 512)
+    assert z_stack.nbytes > connect_slidebook.CHUNK_SIZE
+    post_image(local_connection.data_url, z_stack, meta_data)
+
+    return_image = local_connection.load_image(image=None)
+    assert return_image.data.flags.writeable
+    assert np.array_equal(return_image.data, z_stack)
+
+    memmap_path = str(tmp_path / "z_stack.raw")
+    return_image = local_connection.load_image(image=None, memmap_path=memmap_path)
+    assert isinstance(return_image.data, np.memmap)
+    assert np.array_equal(return_image.data, z_stack)
+    assert os.path.getsize(memmap_path) == z_stack.nbytes
+
+
+@pytest.mark.skipif(skip_local_service_tests, reason="Testing disabled")
+def test_local_load_image_wrong_size(local_connection, image, meta_data):
+    """Raise exception if size of image does not match meta data"""
+    meta_data = dict(meta_data, image_dimensions=(10, 10), format="uint8")
+    data_url = local_connection.data_url
+    data_id = requests.post(data_url + "/meta_data", json=meta_data).json()["data_id"]
+    requests.post(data_url + "/binary/" + data_id, data=image.tobytes())
+    with pytest.raises(HardwareError):
+        local_connection.load_image(image=None)
+
+
+@pytest.mark.skipif(skip_local_service_tests, reason="Testing disabled")
+def test_local_load_image_prefetch(local_services, local_connection, image, meta_data):
+    """Download next image while current image is processed"""
+    data_service = local_services[1].application
+    with patch.object(data_service, "handle", wraps=data_service.handle) as mock_handle:
+        post_image(local_connection.data_url, image, meta_data)
+        first_image = local_connection.load_image(image=None, prefetch=True)
+        assert np.array_equal(first_image.data, image)
+
+        # new image is downloaded in background and used by next call
+        post_image(local_connection.data_url, image[::-1], meta_data)
+        second_image = local_connection.load_image(image=None, prefetch=True)
+        assert np.array_equal(second_image.data, image[::-1])
+        assert count_binary_requests(mock_handle) == 2
+
+        # no new image: prefetch is cancelled and current image is loaded again
+        third_image = local_connection.load_image(image=None)
+        assert np.array_equal(third_image.data, image[::-1])
+        assert count_binary_requests(mock_handle) == 3
@@ -0,0 +1,113 @@
+"""
+Test timing model and simulated clock of ZEN blue dummy
+"""
+
+import pytest
+import os
+import time
+from microscope_automation.connectors import connect_zen_blue_dummy
+from microscope_automation.connectors.connect_zen_blue_dummy import (
+    TimingModel,
+    SimulatedClock,
+)
+
+os.chdir(os.path.dirname(__file__))
+
+# set skip_all_tests = True to focus on single test
+skip_all_tests = False
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    "distance, expected",
+    [
+        (0, 0),
+        # short move: stage does not reach maximum speed
+        (100, 2 * (100 / 1000) ** 0.5),
+        (-100, 2 * (100 / 1000) ** 0.5),
+        # long move: acceleration, constant speed, deceleration
+        (10000, 10000 / 500 + 500 / 1000),
+    ],
+)
+def test_stage_axis_time(distance, expected):
+    timing_model = TimingModel(stage_speed=500, stage_acceleration=1000)
+    assert timing_model.stage_axis_time(distance) == pytest.approx(expected)
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_simulated_clock():
+    clock = SimulatedClock()
+    clock.advance(1.0, "stage")
+    clock.start_step("Scan")
+    clock.advance(2.0, "stage")
+    clock.advance(0.5, "acquisition")
+    clock.start_step("Segment")
+    clock.start_step("Scan")
+    clock.advance(1.0, "acquisition")
+    assert clock.time == pytest.approx(4.5)
+    assert clock.get_step_times() == {"Scan": 3.5, "Segment": 0}
+    assert clock.get_operation_times() == {"stage": 3.0, "acquisition": 1.5}
+    clock.reset()
+    assert clock.time == 0
+    assert clock.get_step_times() == {}
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_execute_experiment_time(tmp_path):
+    timing_model = TimingModel(
+        stage_speed=1000,
+        stage_acceleration=1000,
+        focus_speed=100,
+        objective_switch_time=3,
+        exposure_time=0.2,
+        readout_time=0.1,
+        save_bandwidth=1e6,
+    )
+    zen = connect_zen_blue_dummy.GetActiveObject("Zen", timing_model=timing_model)
+    clock = zen.simulated_clock
+    experiment = zen.Acquisition.Experiments.GetByName("Scan_10x")
+    # stage starts at (60000, 40000, 500)
+    experiment.AddSinglePosition(0, 62000, 40000, 500)
+    experiment.AddSinglePosition(0, 62000, 40500, 600)
+    start_time = time.monotonic()
+    image = zen.Acquisition.Execute(experiment)
+    # no real waiting
+    assert time.monotonic() - start_time < 0.5
+
+    operation_times = clock.get_operation_times()
+    assert operation_times["objective"] == 3
+    assert operation_times["stage"] == pytest.approx(2 + 1 + 2 * (500 / 1000) ** 0.5)
+    assert operation_times["focus"] == pytest.approx(1)
+    assert operation_times["acquisition"] == pytest.approx(0.6)
+
+    # objective is already in place for next experiment
+    zen.Acquisition.AcquireImage_3("Snap_10x")
+    assert clock.get_operation_times()["objective"] == 3
+
+    file_path = str(tmp_path / "image.czi")
+    with open(file_path, "wb") as f:
+        f.write(bytes(500000))
+    image.Save_2(file_path)
+    assert clock.get_operation_times()["save"] == pytest.approx(
+        os.path.getsize(file_path) / 1e6
+    )
+    assert clock.time == pytest.approx(sum(clock.get_operation_times().values()))
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_microscope_simulated_clock(helpers):
+    microscope = helpers.setup_local_microscope("data/preferences_ZSD_test.yml")
+    connection = microscope._get_control_software().connection
+    clock = microscope.get_simulated_clock()
+    connection.Zen.timing_model = TimingModel(
+        stage_speed=1000, stage_acceleration=1e9, focus_speed=100
+    )
+    clock.start_step("Move")
+    stage = microscope._get_microscope_object("Marzhauser")
+    focus_drive = microscope._get_microscope_object("MotorizedFocus")
+    stage.move_to_position(connection, 61000, 40000)
+    focus_drive.move_to_position(connection, 700)
+    assert clock.get_step_times()["Move"] == pytest.approx(1 + 2, abs=1e-3)
+
+    microscope_3i = helpers.setup_local_microscope("data/preferences_3i_test.yml")
+    assert microscope_3i.get_simulated_clock() is None
@@ -9,7 +9,9 @@ import os
 import pytest
 import numpy as np
 from microscope_automation.util.image_AICS import ImageAICS
+from microscope_automation.settings.preferences import Preferences
 from microscope_automation.samples import correct_background
+from microscope_automation.samples import samples
 
 os.chdir(os.path.dirname(__file__))
 
@@ -188,3 +190,113 @@ def test_illumination_correction(
     for row in result:
         assert all([a == b for a, b in zip(row, expected[i])])
         i += 1
+
+
+def random_references(shape, number_channels, seed=0):
+    """Black and illumination references with positive gain for all pixels."""
+    rng = np.random.default_rng(seed)
+    black_references = [
+        rng.integers(90, 110, shape).astype(np.uint16) for _ in range(number_channels)
+    ]
+    illumination_references = [
+        black + rng.integers(1000, 2000, shape).astype(np.uint16)
+        for black in black_references
+    ]
+    return black_references, illumination_references
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize("memmap_threshold", [correct_background.MEMMAP_THRESHOLD, 0])
+def test_flat_field_cache_correct(memmap_threshold, tmpdir):
+    shape = (16, 24)
+    black_references, illumination_references = random_references(shape, 2)
+    # second channel has no references and is not corrected
+    black_references.append(None)
+    illumination_references.append(None)
+    cache = correct_background.FlatFieldCache(
+        memmap_threshold=memmap_threshold, memmap_dir=str(tmpdir)
+    )
+    key = ("Experiment", "10x", "Camera1")
+    cache.register(key, black_references, illumination_references, names=["Black"])
+    assert cache.is_registered(key)
+
+    rng = np.random.default_rng(1)
+    stack = rng.integers(0, 4000, (5,) + shape + (3,)).astype(np.float32)
+    expected = stack.copy()
+    result = cache.correct(key, stack)
+    # float32 stacks are corrected in place
+    assert result is stack
+    for image, corrected in zip(expected, result):
+        for channel in range(2):
+            np.testing.assert_allclose(
+                corrected[:, :, channel],
+                correct_background.illumination_correction(
+                    image[:, :, channel].astype(float),
+                    black_references[channel].astype(float),
+                    illumination_references[channel].astype(float),
+                ),
+                rtol=1e-5,
+            )
+        np.testing.assert_array_equal(corrected[:, :, 2], image[:, :, 2])
+
+    # other data types are converted, single channel images are accepted
+    image = expected[0, :, :, 0].astype(np.uint16)
+    result = cache.correct(key, image)
+    assert result.dtype == np.float32 and result.shape == shape
+    np.testing.assert_allclose(result, cache.correct(key, expected[:1])[0, :, :, 0])
+
+    cache.remove_reference("Black")
+    assert not cache.is_registered(key)
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_flat_field_cache_shape_mismatch():
+    cache = correct_background.FlatFieldCache()
+    with pytest.raises(ValueError):
+        cache.register("key", [np.zeros((4, 4))], [np.ones((4, 5))])
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_background_correction_images():
+    settings = Preferences(pref_path="data/preferences_ZSD_test.yml").get_pref_as_meta(
+        "ScanPlate"
+    )
+    shape = (16, 24)
+    (black_reference,), (illumination_reference,) = random_references(shape, 1)
+    plate_holder = samples.PlateHolder()
+    plate_holder.add_attached_image(
+        "BlackReferenceTransmitted10x", ImageAICS(data=black_reference)
+    )
+    plate_holder.add_attached_image(
+        "BackgroundTransmitted10x", ImageAICS(data=illumination_reference)
+    )
+    well = samples.Well(plate_object=plate_holder)
+
+    rng = np.random.default_rng(2)
+    meta = {"aics_Experiment": "Scan", "aics_objectiveName": "10x"}
+    images = [
+        ImageAICS(data=rng.integers(0, 4000, shape + (2,)), meta=dict(meta))
+        for _ in range(4)
+    ]
+    expected = [image.get_data().copy() for image in images]
+    corrected_images = well.background_correction_images(images, settings)
+    # flat-field is calculated once for all images
+    assert plate_holder.get_flat_field_cache().number_registered == 1
+    for corrected, data in zip(corrected_images, expected):
+        np.testing.assert_allclose(
+            corrected.get_data()[:, :, 0],
+            correct_background.illumination_correction(
+                data[:, :, 0], black_reference, illumination_reference
+            ),
+            rtol=1e-5,
+        )
+        np.testing.assert_array_equal(corrected.get_data()[:, :, 1], data[:, :, 1])
+
+    well.background_correction(images[0], settings)
+    assert plate_holder.get_flat_field_cache().number_registered == 1
+    # new reference image invalidates flat-field
+    plate_holder.add_attached_image(
+        "BackgroundTransmitted10x", ImageAICS(data=illumination_reference)
+    )
+    well.background_correction(images[1], settings)
+    assert plate_holder.get_flat_field_cache().number_registered == 2
@@ -0,0 +1,65 @@
+"""
+Test tools to find positions for imaging
+"""
+
+import pytest
+import os
+import time
+import numpy
+from mock import patch
+from microscope_automation.orchestrator import find_positions
+
+os.chdir(os.path.dirname(__file__))
+
+# set skip_all_tests = True to focus on single test
+skip_all_tests = False
+
+
+def fake_segment_well_image(image_data, segmentation_settings=None):
+    """Replace segmentation, first images take longest and negative images fail."""
+    if image_data.min() < 0:
+        raise ValueError("Cannot segment image")
+    time.sleep(0.05 / (1 + image_data.max()))
+    return [(int(image_data.max()), segmentation_settings["offset"])]
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize("workers", [0, 1, 3])
+def test_segment_well_images(workers):
+    image_data_list = [numpy.full((4, 4), value) for value in [0, 1, -1, 3, 4]]
+    with patch.object(find_positions, "segment_well_image", fake_segment_well_image):
+        results = list(
+            find_positions.segment_well_images(
+                image_data_list, {"offset": 7}, workers=workers
+            )
+        )
+
+    assert [index for index, _, _ in results] == [0, 1, 2, 3, 4]
+    assert [positions for _, positions, _ in results] == [
+        [(0, 7)],
+        [(1, 7)],
+        None,
+        [(3, 7)],
+        [(4, 7)],
+    ]
+    assert [type(error).__name__ for _, _, error in results] == [
+        "NoneType",
+        "NoneType",
+        "ValueError",
+        "NoneType",
+        "NoneType",
+    ]
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_segment_well_images_stop_early():
+    image_data_list = [numpy.full((4, 4), value) for value in range(6)]
+    with patch.object(find_positions, "segment_well_image", fake_segment_well_image):
+        results = find_positions.segment_well_images(
+            image_data_list, {"offset": 0}, workers=2
+        )
+        assert next(results) == (0, [(0, 0)], None)
+        # closing the generator stops processes for remaining wells
+        results.close()
+    with pytest.raises(StopIteration):
+        next(results)
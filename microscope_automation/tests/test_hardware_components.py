@@ -6,6 +6,7 @@ Created on July 7, 2020
 """
 
 import pytest
+import time
 import numpy
 from lxml import etree
 from mock import patch
@@ -974,6 +975,149 @@ def test_show_safe_areas(
         assert False
 
 
+# L-shaped stage area and a pump area that overlaps with it
+L_SHAPE = [
+    (0, 0),
+    (100000, 0),
+    (100000, 20000),
+    (20000, 20000),
+    (20000, 70000),
+    (0, 70000),
+]
+PUMP_AREA = [(10000, 60000), (30000, 60000), (30000, 90000), (10000, 90000)]
+
+
+def setup_l_shaped_safety(helpers):
+    safety = helpers.setup_local_safety("ZSD_01_immersion")
+    safety.add_safe_area(L_SHAPE, "StageArea", 9900)
+    safety.add_safe_area(PUMP_AREA, "PumpArea", 100)
+    return safety
+
+
+def legacy_is_safe_travel_path(safety, path, z, safe_area_id="Compound"):
+    """Test travel path by interpolating it with one point per um."""
+    safe_area = safety.get_safe_area(safe_area_id)
+    length = 0.0
+    for vert in path.iter_segments():
+        if vert[1] == mpl_path.MOVETO:
+            start = vert[0]
+        if vert[1] == mpl_path.LINETO:
+            length = length + numpy.hypot(vert[0][0] - start[0], vert[0][1] - start[1])
+            start = vert[0]
+    if int(length) > 0:
+        return (
+            safe_area["path"].contains_path(path.interpolated(int(length)))
+            and safe_area["z_max"] > z
+        )
+    return True
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    "start, end, safe_area_id, expected",
+    [
+        # within arm of L
+        ((1000, 1000), (90000, 15000), "StageArea", True),
+        ((1000, 1000), (15000, 65000), "StageArea", True),
+        # both ends are safe, but path cuts corner of L
+        ((90000, 15000), (15000, 65000), "StageArea", False),
+        # path crosses small gap outside of area and enters again
+        ((1000, 65000), (25000, 65000), "StageArea", False),
+        ((1000, 65000), (25000, 65000), "Compound", True),
+        ((15000, 65000), (15000, 85000), "Compound", True),
+        ((15000, 65000), (25000, 85000), "StageArea", False),
+        ((25000, 15000), (25000, 85000), "Compound", False),
+        # move along edge of inner corner
+        ((20000, 30000), (20000, 50000), "StageArea", True),
+        ((20000, 20000), (20000, 20000), "StageArea", True),
+        ((50000, 50000), (50000, 50000), "StageArea", False),
+    ],
+)
+def test_check_travel_segments(start, end, safe_area_id, expected, helpers):
+    safety = setup_l_shaped_safety(helpers)
+    result = safety.check_travel_segments([start], [end], safe_area_id)
+    assert result.tolist() == [expected]
+
+    # batch of moves in both directions
+    result = safety.check_travel_segments(
+        [start, end, (1000, 1000)], [end, start, (2000, 2000)], safe_area_id
+    )
+    assert result.tolist() == [expected, expected, True]
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_safe_area_compound_cache(helpers):
+    safety = helpers.setup_local_safety("ZSD_01_immersion")
+    safety.add_safe_area(L_SHAPE, "StageArea", 9900)
+    compound = safety.get_safe_area()
+    assert compound["z_max"] == 9900
+    assert safety.get_safe_area()["path"] is compound["path"]
+    assert not safety.is_safe_position(15000, 80000, 10)
+
+    # compound area is created again after safe areas changed
+    safety.add_safe_area(PUMP_AREA, "PumpArea", 100)
+    assert safety.get_safe_area()["path"] is not compound["path"]
+    assert safety.get_safe_area()["z_max"] == 100
+    assert safety.is_safe_position(15000, 80000, 10)
+    safety.safe_areas.pop("PumpArea")
+    assert not safety.is_safe_position(15000, 80000, 10)
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    "route, z_max_pos, expected",
+    [
+        ([(1000, 1000), (90000, 1000), (90000, 15000)], 50, True),
+        ([(1000, 1000, 10), (15000, 1000, 20), (15000, 85000, 30)], 50, True),
+        ([(1000, 1000), (15000, 1000), (15000, 85000)], 100, False),
+        ([(1000, 1000, 10), (15000, 1000, 20), (15000, 85000, 100)], 50, False),
+        ([(1000, 1000), (90000, 15000), (15000, 65000)], 50, False),
+        ([(1000, 1000), (150000, 1000)], 50, False),
+    ],
+)
+def test_is_safe_route(route, z_max_pos, expected, helpers):
+    safety = setup_l_shaped_safety(helpers)
+    assert safety.is_safe_route(route, z_max_pos) == expected
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_is_safe_travel_path_benchmark(helpers, benchmark_limit):
+    """Compare exact test with interpolation of path used before."""
+    safety = setup_l_shaped_safety(helpers)
+    random = numpy.random.RandomState(1)
+    # moves of up to 50 mm, stage moves first along x and then along y axis
+    starts = random.uniform(0, 50000, size=(20, 2)) + (500, 500)
+    ends = starts + random.uniform(-50000, 50000, size=(20, 2))
+    paths = [
+        mpl_path([start, (end[0], start[1]), end]) for start, end in zip(starts, ends)
+    ]
+
+    # compare results
+    start_time = time.perf_counter()
+    expected = [legacy_is_safe_travel_path(safety, path, 10) for path in paths]
+    legacy_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    result = [safety.is_safe_travel_path(path, 10, verbose=False) for path in paths]
+    exact_time = time.perf_counter() - start_time
+    assert result == expected
+    assert 0 < sum(result) < len(result)
+
+    # all moves in one pass
+    route = numpy.vstack([path.vertices for path in paths])
+    start_time = time.perf_counter()
+    route_result = safety.check_travel_segments(route[:-1], route[1:])
+    route_time = time.perf_counter() - start_time
+    assert len(route_result) == len(route) - 1
+
+    print(
+        "\nSafe travel path for {} moves: interpolated {:.4f} s, exact {:.4f} s, "
+        "route in one pass {:.4f} s".format(
+            len(paths), legacy_time, exact_time, route_time
+        )
+    )
+    assert exact_time * benchmark_limit(1, 0.5) < legacy_time
+
+
 ###############################################################################
 #
 # Tests for the Camera class
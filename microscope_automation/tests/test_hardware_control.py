@@ -16,6 +16,8 @@ from microscope_automation.util.automation_exceptions import (
     LoadNotDefinedError,
 )
 import os
+import threading
+from microscope_automation.hardware.hardware_components import HardwareStateCache
 
 os.chdir(os.path.dirname(__file__))
 
@@ -142,6 +144,91 @@ def test_reference_position(prefs_path, find_surface, ref_obj_id, expected, help
     assert result == expected
 
 
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    "use_autofocus, expected",
+    [(False, None), (True, "HardwareCommandNotDefinedError")],
+)
+def test_validate_position_list(use_autofocus, expected, helpers):
+    """Test validation of travel path for acquisition with single experiment"""
+    (
+        microscope,
+        stage_id,
+        focus_id,
+        autofocus_id,
+        obj_changer_id,
+        safety_id,
+    ) = helpers.microscope_for_samples_testing(helpers, "data/preferences_ZSD_test.yml")
+    connection = microscope._get_control_software().connection
+    auto_focus = microscope._get_microscope_object(autofocus_id)
+    # drift stored with last recall focus
+    auto_focus.last_delta_z = 5
+    offset = microscope._get_microscope_object(
+        obj_changer_id
+    ).get_objective_information(connection)
+    safety = microscope._get_microscope_object(safety_id)
+    pos_list = [(1000, 2000, 300), (1500, 2000, 400)]
+    try:
+        with patch.object(
+            auto_focus, "get_use_autofocus", return_value=use_autofocus
+        ), patch.object(safety, "is_safe_route", return_value=True) as mock_route:
+            result = microscope.validate_position_list(
+                pos_list,
+                stage_id=stage_id,
+                focus_drive_id=focus_id,
+                objective_changer_id=obj_changer_id,
+                auto_focus_id=autofocus_id,
+                safety_id=safety_id,
+            )
+    except Exception as err:
+        result = type(err).__name__
+
+    if expected is not None:
+        assert result == expected
+    else:
+        assert result == [
+            (x + offset["x_offset"], y + offset["y_offset"], z + offset["z_offset"] + 5)
+            for x, y, z in pos_list
+        ]
+        # focus is not retracted between positions,
+        # route is validated at imaging positions
+        route, z_max_pos = mock_route.call_args[0][0:2]
+        assert z_max_pos == max(connection.get_focus_pos(), result[1][2])
+        assert route[-1] == result[-1]
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_reference_position_objective_moving(helpers):
+    """Test that wait for objective does not use cached objective position"""
+    microscope = helpers.setup_local_microscope("data/preferences_ZSD_test.yml")
+    connection = microscope._get_control_software().connection
+    objective_changer = microscope._get_microscope_object("6xMotorizedNosepiece")
+    with patch.object(
+        microscope, "_get_objective_changer_id", return_value="6xMotorizedNosepiece"
+    ), patch.object(
+        objective_changer, "get_init_experiment", return_value="WellTile_10x_true"
+    ), patch(
+        "microscope_automation.settings.zen_experiment_info.ZenExperiment"
+        ".get_objective_position",
+        return_value=2,
+    ), patch.object(
+        connection, "get_objective_name", return_value="Plan-Apochromat 10x/0.45"
+    ), patch.object(
+        connection, "get_objective_position", side_effect=[1, 2, 2, 2]
+    ) as mock_objective_position, patch.object(
+        microscope, "_get_reference_position", return_value=(0, 0, 0)
+    ), patch.object(
+        microscope, "_update_objective_offset", return_value={}
+    ), patch.object(
+        microscope, "set_objective_is_ready"
+    ) as mock_objective_is_ready:
+        microscope.reference_position(reference_object_id="Plate", verbose=False)
+    # objective moved into position between first and second poll
+    assert mock_objective_position.call_count == 2
+    mock_objective_is_ready.assert_called_once_with({}, "Plate")
+    assert objective_changer.get_information(connection)["position"] == 2
+
+
 @pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
 @pytest.mark.parametrize(
     (
@@ -1420,3 +1507,143 @@ def test_remove_images(prefs_path, software, expected, helpers):
         result = type(err).__name__
 
     assert result == expected
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_hardware_state_cache(helpers):
+    microscope = helpers.setup_local_microscope("data/preferences_ZSD_test.yml")
+    connection = microscope._get_control_software().connection
+    stage = microscope._get_microscope_object("Marzhauser")
+    focus_drive = microscope._get_microscope_object("MotorizedFocus")
+    with patch.object(
+        connection, "get_stage_pos", wraps=connection.get_stage_pos
+    ) as mock_stage_pos, patch.object(
+        connection, "get_focus_pos", wraps=connection.get_focus_pos
+    ) as mock_focus_pos:
+        for _ in range(3):
+            positions = microscope.get_information(["Marzhauser", "MotorizedFocus"])
+        assert positions["Marzhauser"]["absolute"] == (60000, 40000)
+        assert mock_stage_pos.call_count == 1
+        assert mock_focus_pos.call_count == 1
+
+        # positions returned by move commands are stored in cache
+        stage.move_to_position(connection, 100, 200)
+        focus_drive.move_to_position(connection, 300)
+        positions = microscope.get_information(["Marzhauser", "MotorizedFocus"])
+        assert positions["Marzhauser"]["absolute"] == (100, 200)
+        assert positions["MotorizedFocus"]["absolute"] == 300
+        assert mock_stage_pos.call_count == 1
+        assert mock_focus_pos.call_count == 1
+
+        # user might move stage while dialog is shown
+        with patch(
+            "microscope_automation.util.automation_messages_form_layout"
+            ".get_dialog_count",
+            return_value=1,
+        ):
+            microscope.get_information(["Marzhauser"])
+        assert mock_stage_pos.call_count == 2
+
+        microscope.invalidate_hardware_state()
+        microscope.get_information(["Marzhauser"])
+        assert mock_stage_pos.call_count == 3
+
+    statistics = microscope.get_hardware_state_statistics()
+    assert statistics["RoundTripsSaved"] > statistics["RoundTrips"]
+    assert statistics["Updates"] == 2
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_hardware_state_cache_move_without_z(helpers):
+    microscope = helpers.setup_local_microscope("data/preferences_ZSD_test.yml")
+    connection = microscope._get_control_software().connection
+    stage = microscope._get_microscope_object("Marzhauser")
+    microscope.get_information(["Marzhauser", "MotorizedFocus"])
+    with patch.object(
+        connection, "move_stage_to", return_value=[100, 200, None]
+    ), patch.object(
+        connection, "get_stage_pos", return_value=(100, 200, 300)
+    ) as mock_stage_pos, patch.object(
+        connection, "get_focus_pos", wraps=connection.get_focus_pos
+    ) as mock_focus_pos:
+        stage.move_to_position(connection, 100, 200)
+        positions = microscope.get_information(["Marzhauser", "MotorizedFocus"])
+    # z was not reported, stage position is read from hardware,
+    # focus position is still known
+    assert positions["Marzhauser"]["absolute"] == (100, 200, 300)
+    assert mock_stage_pos.call_count == 1
+    assert mock_focus_pos.call_count == 0
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_hardware_state_cache_threads():
+    cache = HardwareStateCache()
+    number_threads = 8
+    number_updates = 1000
+
+    def update_states(thread_id):
+        for i in range(number_updates):
+            cache.update(thread_id, "position", i)
+            assert cache.get(thread_id, "position", lambda: None) is not None
+            cache.invalidate(thread_id)
+
+    threads = [
+        threading.Thread(target=update_states, args=(thread_id,))
+        for thread_id in range(number_threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    statistics = cache.get_statistics()
+    assert statistics["Updates"] == number_threads * number_updates
+    assert statistics["RoundTripsSaved"] == number_threads * number_updates
+    assert statistics["Invalidations"] == number_threads * number_updates
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    "change, expected",
+    [
+        (lambda cache: cache.update("Stage", "position", 2), 2),
+        (lambda cache: cache.invalidate("Stage", "position"), 3),
+        (lambda cache: cache.invalidate("Stage"), 3),
+        (lambda cache: cache.invalidate(), 3),
+    ],
+)
+def test_hardware_state_cache_change_during_query(change, expected):
+    cache = HardwareStateCache()
+    query_started = threading.Event()
+    change_done = threading.Event()
+    hardware_positions = iter([1, 3])
+
+    def slow_query():
+        position = next(hardware_positions)
+        if position == 1:
+            query_started.set()
+            change_done.wait(5)
+        return position
+
+    thread = threading.Thread(target=cache.get, args=("Stage", "position", slow_query))
+    thread.start()
+    assert query_started.wait(5)
+    # stage moves while first query is running
+    change(cache)
+    change_done.set()
+    thread.join()
+    # outdated result of first query was not stored
+    assert cache.get("Stage", "position", slow_query) == expected
+
+
+@patch("microscope_automation.util.automation_exceptions.HardwareError.error_dialog")
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_hardware_state_cache_recover_hardware(mock_error_dialog, helpers):
+    microscope = helpers.setup_local_microscope("data/preferences_ZSD_test.yml")
+    connection = microscope._get_control_software().connection
+    with patch.object(
+        connection, "get_stage_pos", wraps=connection.get_stage_pos
+    ) as mock_stage_pos:
+        microscope.get_information(["Marzhauser"])
+        microscope.recover_hardware(HardwareError("Stage failed"))
+        microscope.get_information(["Marzhauser"])
+    assert mock_stage_pos.call_count == 2
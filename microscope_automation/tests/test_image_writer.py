@@ -0,0 +1,243 @@
+"""
+Test writing of OME-TIFF files in background processes
+"""
+
+import pytest
+import os
+import sys
+import subprocess
+import numpy as np
+import tifffile
+import microscope_automation
+from microscope_automation.util import image_writer
+from microscope_automation.util.image_writer import ImageWriterPool
+from microscope_automation.util.image_AICS import ImageAICS
+from microscope_automation.util.automation_exceptions import IOError
+from microscope_automation.samples import tile_images
+
+os.chdir(os.path.dirname(__file__))
+
+# set skip_all_tests = True to focus on single test
+skip_all_tests = False
+
+
+def list_shared_memory():
+    """Names of shared memory blocks created by SharedMemory on Linux."""
+    if not os.path.isdir("/dev/shm"):
+        return set()
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+
+def ome_tiff_writer_works(tmp_path):
+    """aicsimageio 3 cannot write with tifffile versions that removed 'compress'."""
+    from aicsimageio.writers import ome_tiff_writer
+
+    writer = ome_tiff_writer.OmeTiffWriter(
+        str(tmp_path / "check.ome.tif"), overwrite_file=True
+    )
+    try:
+        writer.save(np.zeros((1, 2, 2), dtype=np.uint8))
+    except TypeError:
+        return False
+    return True
+
+
+@pytest.fixture(scope="module")
+def writer_pool():
+    pool = ImageWriterPool(number_writers=2, max_pending=2)
+    yield pool
+    pool.close()
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_write_images(writer_pool, tmp_path):
+    if not ome_tiff_writer_works(tmp_path):
+        pytest.skip("OmeTiffWriter is not compatible with installed tifffile")
+    shared_memory_before = list_shared_memory()
+    images = [
+        np.random.randint(0, 4096, size=(3, 64, 80), dtype=np.uint16) for _ in range(5)
+    ]
+    for i, data in enumerate(images):
+        writer_pool.submit(data, str(tmp_path / "image_{}.ome.tif".format(i)))
+        # backpressure: submit waits until a slot is free
+        assert writer_pool.get_number_pending() <= writer_pool.max_pending
+    writer_pool.flush()
+    assert writer_pool.get_number_pending() == 0
+    assert writer_pool.number_written == 5
+
+    for i, data in enumerate(images):
+        written = tifffile.imread(str(tmp_path / "image_{}.ome.tif".format(i)))
+        assert np.array_equal(written.squeeze(), data)
+    # shared memory blocks are released
+    assert list_shared_memory() == shared_memory_before
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_file_block():
+    # fallback for Python versions without multiprocessing.shared_memory
+    data = np.arange(24, dtype=np.uint16).reshape(2, 3, 4)
+    block = image_writer._FileBlock(create=True, size=data.nbytes)
+    np.copyto(np.ndarray(data.shape, dtype=data.dtype, buffer=block.buf), data)
+    reader = image_writer._FileBlock(name=block.name)
+    read = np.ndarray(data.shape, dtype=data.dtype, buffer=reader.buf)
+    assert np.array_equal(read, data)
+    del read
+    reader.close()
+    block.close()
+    block.unlink()
+    assert not os.path.exists(block.name)
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize("pyramid", [False, True])
+def test_write_unsupported_dtype(writer_pool, tmp_path, pyramid):
+    shared_memory_before = list_shared_memory()
+    # OME-TIFF has no pixel type for 64 bit integers
+    with pytest.raises(TypeError):
+        writer_pool.submit(
+            np.ones((1, 8, 8), dtype=np.int64),
+            str(tmp_path / "image.ome.tif"),
+            pyramid=pyramid,
+        )
+    assert writer_pool.get_number_pending() == 0
+    assert list_shared_memory() == shared_memory_before
+    writer_pool.flush()
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_write_error(writer_pool, tmp_path):
+    shared_memory_before = list_shared_memory()
+    file_paths = [
+        str(tmp_path / "missing_dir" / "image_{}.ome.tif".format(i)) for i in range(4)
+    ]
+    messages = []
+    submitted = []
+    for file_path in file_paths:
+        # submit reports errors of earlier images and does not queue new image
+        try:
+            writer_pool.submit(np.zeros((1, 8, 8), dtype=np.uint8), file_path)
+            submitted.append(file_path)
+        except IOError as error:
+            messages.append(error.message)
+        assert writer_pool.get_number_pending() <= writer_pool.max_pending
+    try:
+        writer_pool.flush()
+    except IOError as error:
+        messages.append(error.message)
+    for file_path in submitted:
+        assert file_path in "\n".join(messages)
+    # errors are reported once and shared memory is released after failures
+    writer_pool.flush()
+    assert list_shared_memory() == shared_memory_before
+
+    # flush waits for all images
+    writer_pool.submit(np.zeros((1, 8, 8), dtype=np.uint8), file_paths[0])
+    with pytest.raises(IOError):
+        writer_pool.flush()
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_tile_images_writes_in_background(tmp_path):
+    if not ome_tiff_writer_works(tmp_path):
+        pytest.skip("OmeTiffWriter is not compatible with installed tifffile")
+    images = []
+    for x in [0, 10]:
+        image = ImageAICS(
+            data=np.full((10, 10), x, dtype=np.uint16),
+            meta={"aics_imageObjectPosX": x, "aics_imageObjectPosY": 0},
+        )
+        images.append(image)
+    file_path = str(tmp_path / "tiled.ome.tif")
+    tiled_image = tile_images.tile_images(
+        images, method="stack", output_image=True, image_output_path=file_path
+    )[0]
+    image_writer.flush_writer_pool()
+    written = tifffile.imread(file_path)
+    assert written.size == tiled_image.get_data().size
+    assert np.array_equal(written.squeeze(), tiled_image.get_data()[:, :, 0])
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_flush_on_exit(tmp_path):
+    if not ome_tiff_writer_works(tmp_path):
+        pytest.skip("OmeTiffWriter is not compatible with installed tifffile")
+    file_path = str(tmp_path / "image.ome.tif")
+    package_root = os.path.dirname(os.path.dirname(microscope_automation.__file__))
+    script = (
+        "import numpy as np\n"
+        "from microscope_automation.util import image_writer\n"
+        "image_writer.get_writer_pool().submit("
+        "np.ones((1, 16, 16), dtype=np.uint8), {!r})\n".format(file_path)
+    )
+    subprocess.run(
+        [sys.executable, "-c", script],
+        env=dict(os.environ, PYTHONPATH=package_root),
+        check=True,
+        timeout=120,
+    )
+    assert tifffile.imread(file_path).sum() == 16 * 16
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_downsample_level():
+    data = np.arange(2 * 5 * 4, dtype=np.uint16).reshape(2, 5, 4)
+    level = image_writer.downsample_level(data)
+    assert level.shape == (2, 2, 2)
+    assert level.dtype == np.uint16
+    assert level[0, 0, 0] == np.rint(np.mean([0, 1, 4, 5]))
+    assert image_writer.get_number_pyramid_levels((2, 1000, 300), 256) == 2
+    assert image_writer.get_number_pyramid_levels((2, 200, 300), 256) == 1
+    assert image_writer.get_number_pyramid_levels((2, 200, 100), 256) == 0
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_write_pyramid(writer_pool, tmp_path):
+    data = np.random.randint(0, 4096, size=(2, 1100, 600), dtype=np.uint16)
+    file_path = str(tmp_path / "pyramid.ome.tif")
+    writer_pool.submit(data, file_path, pyramid=True)
+    writer_pool.flush()
+    assert image_writer.get_pyramid_shapes(file_path) == [
+        (2, 1100, 600),
+        (2, 550, 300),
+        (2, 275, 150),
+        (2, 137, 75),
+    ]
+    assert np.array_equal(image_writer.read_pyramid_level(file_path), data)
+    assert np.array_equal(
+        image_writer.read_pyramid_level(file_path, 1),
+        image_writer.downsample_level(data),
+    )
+    # levels beyond coarsest level return coarsest level
+    assert image_writer.read_pyramid_level(file_path, 10).shape == (2, 137, 75)
+    with tifffile.TiffFile(file_path) as tif:
+        assert tif.is_ome
+        # reduced levels are stored as SubIFDs and not as additional images
+        assert len(tif.series) == 1
+
+    file_path = str(tmp_path / "two_levels.ome.tif")
+    writer_pool.submit(data, file_path, pyramid=True, pyramid_levels=1)
+    writer_pool.flush()
+    assert len(image_writer.get_pyramid_shapes(file_path)) == 2
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_tile_images_pyramid(tmp_path):
+    images = []
+    for x in [0, 300]:
+        image = ImageAICS(
+            data=np.full((300, 400), x + 1, dtype=np.uint16),
+            meta={"aics_imageObjectPosX": x, "aics_imageObjectPosY": 0},
+        )
+        images.append(image)
+    file_path = str(tmp_path / "tiled.ome.tif")
+    tiled_image = tile_images.tile_images(
+        images,
+        method="stack",
+        output_image=True,
+        image_output_path=file_path,
+        pyramid=True,
+    )[0]
+    image_writer.flush_writer_pool()
+    expected = np.transpose(tiled_image.get_data(), (2, 0, 1))
+    assert np.array_equal(image_writer.read_pyramid_level(file_path, 0), expected)
+    assert image_writer.read_pyramid_level(file_path, 1).shape == (1, 200, 300)
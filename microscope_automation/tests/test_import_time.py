@@ -0,0 +1,86 @@
+"""
+Test that importing the automation software does not load scientific and GUI packages
+"""
+
+import pytest
+import os
+import sys
+import subprocess
+import microscope_automation
+
+os.chdir(os.path.dirname(__file__))
+
+# set skip_all_tests = True to focus on single test
+skip_all_tests = False
+
+MAIN_MODULE = "microscope_automation.orchestrator.microscope_automation"
+# packages loaded only when they are used for the first time
+HEAVY_PACKAGES = [
+    "matplotlib",
+    "pyqtgraph",
+    "PyQt5",
+    "formlayout",
+    "skimage",
+    "scipy",
+    "pandas",
+    "pyarrow",
+    "aicsimageio",
+    "tifffile",
+    "tkinter",
+]
+# import took about 2.3 s when all packages were imported at start up
+IMPORT_TIME_THRESHOLD = 1.0
+IMPORT_TIME_LOOSE_THRESHOLD = 2.0
+
+
+def run_python(arguments):
+    """Run python in new process to start with empty module cache."""
+    package_root = os.path.dirname(os.path.dirname(microscope_automation.__file__))
+    env = dict(os.environ, PYTHONPATH=package_root)
+    return subprocess.run(
+        [sys.executable] + arguments,
+        env=env,
+        cwd=package_root,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def import_time(module_name):
+    """Cumulative import time of module in s measured with python -X importtime."""
+    result = run_python(["-X", "importtime", "-c", "import " + module_name])
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module_name:
+            return int(fields[1]) / 1e6
+    raise ValueError("No import time reported for {}".format(module_name))
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    "module_name",
+    [
+        MAIN_MODULE,
+        "microscope_automation.samples.samples",
+        "microscope_automation.hardware.setup_microscope",
+    ],
+)
+def test_import_without_heavy_packages(module_name):
+    result = run_python(
+        [
+            "-c",
+            "import sys, {}; print(' '.join(sorted(sys.modules)))".format(module_name),
+        ]
+    )
+    loaded_modules = set(result.stdout.split())
+    assert [package for package in HEAVY_PACKAGES if package in loaded_modules] == []
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_import_time_benchmark(benchmark_limit):
+    # best of three runs to reduce influence of file system caches
+    best_time = min(import_time(MAIN_MODULE) for _ in range(3))
+    assert best_time < benchmark_limit(
+        IMPORT_TIME_THRESHOLD, IMPORT_TIME_LOOSE_THRESHOLD
+    )
@@ -0,0 +1,120 @@
+"""
+Test display of images with reduced resolution in interactive location picker
+"""
+
+import pytest
+import os
+import time
+import numpy as np
+import pyqtgraph
+from microscope_automation.samples.interactive_location_picker_pyqtgraph import (
+    ImageLocationPicker,
+)
+
+os.chdir(os.path.dirname(__file__))
+
+# set skip_all_tests = True to focus on single test
+skip_all_tests = False
+
+
+@pytest.fixture(scope="module")
+def app():
+    return pyqtgraph.mkQApp()
+
+
+def create_image(size_x, size_y):
+    return np.random.default_rng(0).integers(0, 4096, (size_x, size_y), np.uint16)
+
+
+def expected_value(picker, level, x, y):
+    """Mean of full resolution pixels shown by pixel of level at (x, y)."""
+    factor = 2**level
+    block = picker.image[x : x + factor, y : y + factor].astype(float)
+    return np.rint(block.mean())
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_pyramid_levels(app):
+    image = create_image(5000, 3001)
+    picker = ImageLocationPicker(image, [(10, 20)], app)
+    assert picker.get_number_levels() == 3
+    assert picker.get_pyramid_level(2).shape == (1250, 750)
+    assert picker.select_level(0.5) == 0
+    assert picker.select_level(2.5) == 1
+    assert picker.select_level(100) == 2
+    # coordinates are flipped in y
+    assert picker.location_list == [(10, 3001 - 20)]
+
+    # consume precomputed levels
+    level_1 = picker.get_pyramid_level(1) + 1
+    picker = ImageLocationPicker(image, [], app, pyramid=[level_1])
+    assert picker.get_pyramid_level(1) is level_1
+    # levels (C, Y, X) as read from pyramidal OME-TIFF file
+    picker = ImageLocationPicker(
+        image, [], app, pyramid=[np.stack([level_1 - 1, level_1])], channel=1
+    )
+    assert picker.get_pyramid_level(1) is not level_1
+    assert np.array_equal(picker.get_pyramid_level(1), level_1)
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize("level", [0, 1, 2])
+def test_get_display_region(level, app):
+    picker = ImageLocationPicker(create_image(1000, 1001), [], app)
+    view_range = ((300.5, 500.2), (600.0, 700.7))
+    data, (x, y, width, height) = picker.get_display_region(level, view_range)
+    factor = 2**level
+    assert data.shape == (width // factor, height // factor)
+    # displayed region includes visible region
+    assert x <= 300.5 and x + width >= 500.2
+    assert y <= 600 and y + height >= 700.7
+    # each displayed pixel shows full resolution pixels at same position
+    for i, j in [(0, 0), (5, 7), (data.shape[0] - 1, data.shape[1] - 1)]:
+        assert data[i, j] == expected_value(
+            picker, level, x + i * factor, y + j * factor
+        )
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_update_display(app):
+    picker = ImageLocationPicker(create_image(6000, 5001), [], app)
+    window = pyqtgraph.GraphicsLayoutWidget()
+    window.resize(1000, 1000)
+    view_box = window.addViewBox()
+    picker.image_item = pyqtgraph.ImageItem()
+    view_box.addItem(picker.image_item)
+    window.show()
+    app.processEvents()
+
+    # whole image shown with reduced resolution
+    view_box.setRange(xRange=(0, 6000), yRange=(0, 5001), padding=0)
+    picker.update_display(view_box)
+    level, rect = picker._displayed
+    assert level >= 2
+    assert rect[2] >= 6000 - 2**level
+    assert max(picker.image_item.image.shape) <= 2048
+
+    # zoom in shows full resolution of visible region
+    view_box.setRange(xRange=(1000, 1200), yRange=(2000, 2200), padding=0)
+    picker.update_display(view_box)
+    level, rect = picker._displayed
+    assert level == 0
+    assert max(picker.image_item.image.shape) < 1000
+    # position in view is position in full resolution image
+    pixel = picker.image_item.mapFromView(pyqtgraph.Point(1100.5, 2100.5))
+    assert picker.image_item.image[int(pixel.x()), int(pixel.y())] == (
+        picker.image[1100, 2100]
+    )
+    window.close()
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_open_large_image_benchmark(app, benchmark_limit):
+    image = create_image(10000, 10000)
+    start_time = time.perf_counter()
+    picker = ImageLocationPicker(image, [], app)
+    level = picker.get_number_levels() - 1
+    full_range = ((0, 10000), (0, 10000))
+    data, _ = picker.get_display_region(level, full_range)
+    assert max(data.shape) <= 2048
+    assert time.perf_counter() - start_time < benchmark_limit(1, 5)
@@ -0,0 +1,100 @@
+"""
+Test writing of meta data to file
+"""
+
+import pytest
+import os
+import pandas
+from mock import patch
+from microscope_automation.settings import meta_data_file
+from microscope_automation.settings.meta_data_file import MetaDataFile
+
+os.chdir(os.path.dirname(__file__))
+
+# set skip_all_tests = True to focus on single test
+skip_all_tests = False
+
+META_DATA = [
+    {"aics_well": "B2", "aics_imagePosX": 1.5},
+    {"aics_well": "B3", "aics_imagePosX": 2.5},
+    {"aics_well": "B4", "aics_barcode": "1234", "aics_list": [1, 2]},
+    {"aics_imagePosX": None, "aics_barcode": "1234"},
+]
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_write_meta_csv(tmp_path):
+    file_path = str(tmp_path / "MetaData.csv")
+    meta_file = MetaDataFile(file_path, "csv")
+    with patch.object(
+        meta_file, "_migrate_csv", wraps=meta_file._migrate_csv
+    ) as mock_migrate:
+        for meta in META_DATA:
+            meta_file.write_meta(meta)
+    # file is only rewritten when new columns appear
+    assert mock_migrate.call_count == 1
+
+    with open(file_path) as f:
+        header = f.readline().strip().split(",")
+        number_lines = len(f.readlines())
+    assert header == [
+        "IndexRow",
+        "aics_well",
+        "aics_imagePosX",
+        "MetaDataSavedDate",
+        "MetaDataSavedTime",
+        "aics_barcode",
+        "aics_list",
+    ]
+    assert number_lines == len(META_DATA)
+
+    meta_data = meta_file.read_meta()
+    assert list(meta_data.index) == [0, 1, 2, 3]
+    assert list(meta_data["aics_well"].fillna("")) == ["B2", "B3", "B4", ""]
+    assert meta_data["aics_imagePosX"].tolist()[0:2] == [1.5, 2.5]
+    assert pandas.isna(meta_data["aics_imagePosX"].tolist()[3])
+    assert list(meta_data["aics_barcode"].fillna(0)) == [0, 0, 1234, 1234]
+    assert meta_data["aics_list"][2] == "[1, 2]"
+    assert meta_data["MetaDataSavedDate"].notna().all()
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_write_meta_csv_replace_file(tmp_path):
+    file_path = str(tmp_path / "MetaData.csv")
+    with open(file_path, "w") as f:
+        f.write("IndexRow,old\n0,1\n")
+    meta_file = MetaDataFile(file_path)
+    meta_file.write_meta(pandas.DataFrame({"aics_well": ["B2"]}, index=[1]))
+    assert list(meta_file.read_meta().columns) == [
+        "aics_well",
+        "MetaDataSavedDate",
+        "MetaDataSavedTime",
+    ]
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_write_meta_parquet(tmp_path):
+    pytest.importorskip("pyarrow")
+    file_path = str(tmp_path / "MetaData.csv")
+    meta_file = MetaDataFile(file_path, "parquet", row_group_size=3)
+    for meta in META_DATA:
+        meta_file.write_meta(meta)
+    # first group of rows is written, last row is waiting
+    assert os.listdir(meta_file.file_path) == ["part-00000.parquet"]
+    meta_file.close()
+    assert len(os.listdir(meta_file.file_path)) == 2
+
+    meta_data = meta_file.read_meta()
+    assert list(meta_data.index) == [0, 1, 2, 3]
+    assert list(meta_data["aics_well"]) == ["B2", "B3", "B4", None]
+    assert list(meta_data["aics_barcode"]) == [None, None, "1234", "1234"]
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_write_meta_parquet_without_pyarrow(tmp_path):
+    file_path = str(tmp_path / "MetaData.csv")
+    with patch.object(meta_data_file, "PYARROW_AVAILABLE", False):
+        meta_file = MetaDataFile(file_path, "parquet")
+    assert meta_file.format == "csv"
+    meta_file.write_meta(META_DATA[0])
+    assert os.path.isfile(file_path)
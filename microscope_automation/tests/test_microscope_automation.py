@@ -8,13 +8,19 @@ Created on December 1, 2020
 import pytest
 import os
 import datetime
+import time
+import threading
 from shutil import copyfile
 from mock import patch
 from collections.abc import Mapping
 from microscope_automation.util.image_AICS import ImageAICS
 from microscope_automation.settings.preferences import Preferences
 from microscope_automation.samples import samples
+from microscope_automation.orchestrator.microscope_automation import (
+    MicroscopeAutomation,
+)
 from microscope_automation.util.automation_messages_form_layout import stop_script
+from microscope_automation.util.automation_exceptions import StopCollectingError
 
 os.chdir(os.path.dirname(__file__))
 
@@ -1074,6 +1080,173 @@ def test_scan_all_objects(
     assert result == expected
 
 
+@patch("microscope_automation.util.automation_messages_form_layout.information_message")
+@patch(
+    "microscope_automation.orchestrator.microscope_automation.MicroscopeAutomation._find_next_objects"  # noqa
+)
+@patch(
+    "microscope_automation.orchestrator.microscope_automation.MicroscopeAutomation._load_next_images"  # noqa
+)
+@patch(
+    "microscope_automation.orchestrator.microscope_automation.MicroscopeAutomation.scan_single_ROI"  # noqa
+)
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    (
+        "prefs_path, find_type, analysis_workers, max_in_flight, stop_after,"
+        "manual_refocus"
+    ),
+    [
+        ("data/preferences_ZSD_2_test.yml", "CenterMassCellProfiler", 0, 1, 0, False),
+        ("data/preferences_ZSD_2_test.yml", "CenterMassCellProfiler", 3, 2, 0, False),
+        ("data/preferences_ZSD_2_test.yml", "CenterMassCellProfiler", 4, 8, 0, False),
+        ("data/preferences_ZSD_2_test.yml", "Interactive", 2, 2, 0, False),
+        ("data/preferences_ZSD_2_test.yml", "CenterMassCellProfiler", 4, 8, 5, False),
+        ("data/preferences_ZSD_2_test.yml", "CenterMassCellProfiler", 0, 1, 0, True),
+        ("data/preferences_ZSD_2_test.yml", "CenterMassCellProfiler", 4, 8, 0, True),
+    ],
+)
+def test_scan_all_objects_pipelined(
+    mock_scan,
+    mock_load,
+    mock_find,
+    mock_info,
+    prefs_path,
+    find_type,
+    analysis_workers,
+    max_in_flight,
+    stop_after,
+    manual_refocus,
+    helpers,
+):
+    main_thread = threading.current_thread()
+    load_threads = set()
+    analysis_threads = set()
+    selected_positions = []
+
+    def load_next_images(imaging_settings, sample_object, images):
+        load_threads.add(threading.current_thread())
+        return images
+
+    def find_next_objects(imaging_settings, sample_object, images, experiment, ft):
+        analysis_threads.add(threading.current_thread())
+        # finish analysis out of order
+        time.sleep(0.01 * (len(images) % 3))
+        name = sample_object.get_name()
+        return [("Colonies", [name] * len(images), {name: name})]
+
+    def scan_single_ROI(**kwargs):
+        number_images = int(kwargs["sample_object"].get_name()[1:])
+        selected_positions.append(kwargs["number_selected_postions"])
+        return {
+            "Image": [None] * number_images,
+            "Continue": number_images != stop_after,
+        }
+
+    mock_scan.side_effect = scan_single_ROI
+    mock_load.side_effect = load_next_images
+    mock_find.side_effect = find_next_objects
+
+    camera_id = "Camera1 (back)"
+    (
+        microscope,
+        stage_id,
+        focus_id,
+        autofocus_id,
+        obj_changer_id,
+        safety_id,
+    ) = helpers.microscope_for_samples_testing(helpers, prefs_path)
+    plate_holder_object = helpers.create_sample_object(
+        "plate_holder",
+        microscope_obj=microscope,
+        camera_ids=[camera_id],
+        focus_id=focus_id,
+        stage_id=stage_id,
+        autofocus_id=autofocus_id,
+        obj_changer_id=obj_changer_id,
+        safety_id=safety_id,
+    )
+    plate_object = helpers.create_sample_object("plate", container=plate_holder_object)
+    sample_list = []
+    for index in range(1, 8):
+        sample = helpers.create_sample_object("well", container=plate_object)
+        sample.set_name("B{}".format(index))
+        sample.set_reference_object(plate_object)
+        plate_object.add_wells({sample.get_name(): sample})
+        sample_list.append(sample)
+
+    imaging_settings = Preferences(prefs_path).get_pref_as_meta("ScanPlate")
+    imaging_settings.prefs["FindType"] = find_type
+    imaging_settings.prefs["AnalysisWorkers"] = analysis_workers
+    imaging_settings.prefs["AnalysisMaxInFlight"] = max_in_flight
+    imaging_settings.prefs["ManualRefocus"] = manual_refocus
+    imaging_settings.prefs["ManualRefocusAfterRepetitions"] = 0
+    experiment = {
+        "Experiment": "ScanPlate",
+        "Repetitions": 1,
+        "Input": None,
+        "Output": {"Colonies": "Colony"},
+        "WorkflowList": ["ScanPlate"],
+        "WorkflowType": "new",
+    }
+
+    mic_auto = MicroscopeAutomation(Preferences(prefs_path), app=None)
+    try:
+        mic_auto.scan_all_objects(
+            imaging_settings,
+            sample_list,
+            plate_object,
+            experiment,
+            wait_after_image={"Status": False},
+        )
+    except StopCollectingError:
+        assert stop_after
+    else:
+        assert not stop_after
+
+    # results of all imaged objects are added in order of acquisition
+    imaged_samples = sample_list[: stop_after or len(sample_list)]
+    assert plate_object.get_from_image_dir("Colonies") == [
+        sample.get_name()
+        for number_images, sample in enumerate(imaged_samples, 1)
+        for _ in range(number_images)
+    ]
+    assert load_threads == {main_thread}
+    if manual_refocus:
+        # user sees number of positions selected for previous object
+        assert selected_positions == list(range(len(sample_list)))
+    if analysis_workers == 0 or find_type == "Interactive":
+        assert analysis_threads == {main_thread}
+    else:
+        assert main_thread not in analysis_threads
+        assert len(analysis_threads) <= analysis_workers
+
+
+@patch("microscope_automation.util.automation_messages_form_layout.information_message")
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    "experiments, less_dialog, expected_problems",
+    [
+        (["ScanPlate", "SegmentWells"], False, 0),
+        (["ScanPlate", "ScanCells"], False, 1),
+        (["ScanPlate", "ScanCells"], True, 1),
+    ],
+)
+def test_compile_workflow_prefs(mock_info, experiments, less_dialog, expected_problems):
+    mock_info.return_value = 1
+    mic_auto = MicroscopeAutomation(
+        Preferences("data/preferences_ZSD_test.yml"), app=None
+    )
+    mic_auto.less_dialog = less_dialog
+    experiment_prefs = mic_auto.compile_workflow_prefs(experiments)
+
+    assert list(experiment_prefs.keys()) == experiments
+    assert experiment_prefs["ScanPlate"].FindType == "InteractiveDistanceMap"
+    # all problems are reported in a single dialog
+    expected_calls = 1 if expected_problems and not less_dialog else 0
+    assert mock_info.call_count == expected_calls
+
+
 @patch(
     "microscope_automation.samples.samples.Well.set_interactive_positions",  # noqa
     return_value=[(0, 0)],
@@ -0,0 +1,160 @@
+"""
+Test waiting for hardware with growing poll intervals
+"""
+
+import pytest
+import os
+import time
+import threading
+from mock import patch, PropertyMock
+from microscope_automation.util import polling
+from microscope_automation.util.automation_exceptions import (
+    HardwareTimeoutError,
+    WaitCancelledError,
+)
+from microscope_automation.connectors import connect_zen_blue
+from microscope_automation.connectors import connect_zen_blue_dummy
+
+os.chdir(os.path.dirname(__file__))
+
+# set skip_all_tests = True to focus on single test
+skip_all_tests = False
+
+
+class DelayedCondition(object):
+    """Condition that becomes true after delay in s and counts calls."""
+
+    def __init__(self, delay):
+        self.ready_time = time.monotonic() + delay
+        self.number_calls = 0
+
+    def __call__(self):
+        self.number_calls += 1
+        return time.monotonic() >= self.ready_time
+
+
+def change_objective_later(zen, objective_name, delay):
+    """Simulate objective changer of dummy microscope that needs time to move."""
+
+    def change():
+        zen.Devices.ObjectiveChanger._microscope_status.objective_name = objective_name
+
+    timer = threading.Timer(delay, change)
+    timer.start()
+    return timer
+
+
+@pytest.fixture(autouse=True)
+def reset_histograms():
+    polling.reset_latency_histograms()
+    yield
+    polling.reset_latency_histograms()
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_wait_until_immediate():
+    assert polling.wait_until(lambda: "ready", name="test") == "ready"
+    histogram = polling.get_latency_histogram("test")
+    assert histogram.get_count() == 1
+    assert histogram.number_polls == 1
+    assert histogram.counts[0] == 1
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_wait_until_delay():
+    condition = DelayedCondition(0.2)
+    start_time = time.monotonic()
+    assert polling.wait_until(condition, name="test", max_interval=0.05)
+    wait_time = time.monotonic() - start_time
+    assert 0.2 <= wait_time < 0.5
+    # intervals grow, the condition is not checked in a busy loop
+    assert 2 < condition.number_calls < 30
+    histogram = polling.get_latency_histogram("test")
+    assert histogram.number_polls == condition.number_calls
+    # percentile is upper edge of bin limited by longest wait
+    assert histogram.get_percentile(50) == histogram.max_time
+    assert histogram.max_time == pytest.approx(wait_time, abs=0.01)
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_wait_until_timeout():
+    start_time = time.monotonic()
+    with pytest.raises(HardwareTimeoutError):
+        polling.wait_until(lambda: False, name="test", timeout=0.1)
+    # last interval is shortened to deadline
+    assert 0.1 <= time.monotonic() - start_time < 0.3
+    histogram = polling.get_latency_histogram("test")
+    assert histogram.number_timeouts == 1
+    assert histogram.get_count() == 0
+    assert histogram.get_mean() is None
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_wait_until_cancel():
+    cancel_event = threading.Event()
+    threading.Timer(0.1, cancel_event.set).start()
+    start_time = time.monotonic()
+    with pytest.raises(WaitCancelledError):
+        polling.wait_until(
+            lambda: False,
+            name="test",
+            timeout=None,
+            cancel_event=cancel_event,
+            min_interval=10,
+        )
+    # waiting process wakes up when event is set
+    assert time.monotonic() - start_time < 1
+    assert polling.get_latency_histogram("test").number_cancelled == 1
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_latency_histogram():
+    histogram = polling.LatencyHistogram("test", bin_edges=[0.1, 1, 10])
+    for latency in [0.05, 0.5, 0.6, 0.7, 20]:
+        histogram.add(latency)
+    assert histogram.counts == [1, 3, 0, 1]
+    assert histogram.get_mean() == pytest.approx(21.85 / 5)
+    assert histogram.get_percentile(20) == 0.1
+    assert histogram.get_percentile(50) == 1
+    assert histogram.get_percentile(100) == 20
+    summary = histogram.as_dict()
+    assert summary["Count"] == 5
+    assert summary["Bins"][-1] == (float("inf"), 1)
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_zen_blue_wait_for_objective():
+    microscope = connect_zen_blue.ConnectMicroscope(connect_dll=False)
+    objective = "Plan-Apochromat 20x/0.8 M27"
+    change_objective_later(microscope.Zen, objective, 0.1)
+    microscope.wait_for_objective(objective)
+    assert microscope.get_objective_name() == objective
+
+    histogram = polling.get_latency_histogram("zen_blue.wait_for_objective")
+    assert histogram.get_count() == 1
+    assert histogram.max_time >= 0.1
+
+    with pytest.raises(HardwareTimeoutError):
+        microscope.wait_for_objective("Plan-Apochromat 10x/0.45", timeout=0.05)
+    assert histogram.number_timeouts == 1
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_zen_blue_wait_for_experiment():
+    microscope = connect_zen_blue.ConnectMicroscope(connect_dll=False)
+    start_experiment = connect_zen_blue_dummy.Experiment("Start")
+    start_experiment.name = "Start.czexp"
+    target_experiment = connect_zen_blue_dummy.Experiment("Target")
+    target_experiment.name = "Target.czexp"
+    # experiment becomes active after the third request
+    with patch.object(
+        connect_zen_blue_dummy.Experiments,
+        "ActiveExperiment",
+        new_callable=PropertyMock,
+        side_effect=[start_experiment, start_experiment, target_experiment],
+    ) as mock_active:
+        microscope.wait_for_experiment("Target.czexp")
+    assert mock_active.call_count == 3
+    histogram = polling.get_latency_histogram("zen_blue.wait_for_experiment")
+    assert histogram.get_count() == 1
+    assert histogram.number_polls == 3
@@ -7,6 +7,7 @@ Created on Nov 24, 2020
 
 import pytest
 from mock import patch
+from microscope_automation.settings import preferences
 from microscope_automation.settings.preferences import Preferences
 import os
 
@@ -89,6 +90,23 @@ def test_get_prefs(mock_pull_down, prefs_path, name, valid_values, expected):
     assert result == expected
 
 
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    "prefs_path, sub_prefs_name, name, default, expected",
+    [
+        ("data/preferences_ZSD_test.yml", "ScanPlate", "OptionalPref", "None", "None"),
+        ("data/preferences_ZSD_test.yml", "ScanPlate", "Load", True, False),
+        ("data/preferences_ZSD_test.yml", "ScanPlate", "MetaDataFormat", "x", "csv"),
+    ],
+)
+def test_get_pref_default(prefs_path, sub_prefs_name, name, default, expected):
+    prefs = Preferences(prefs_path)
+    sub_prefs = prefs.get_pref_as_meta(sub_prefs_name)
+    result = sub_prefs.get_pref(name, default=default)
+
+    assert result == expected
+
+
 @pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
 @pytest.mark.parametrize(
     "prefs_path, name, expected",
@@ -121,3 +139,102 @@ def test_set_pref(prefs_path, default, name, val_to_set):
     prefs.set_pref(name, val_to_set)
     print()
     assert prefs.get_pref(name) == val_to_set
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    "pref_dict, schema, required, expected_values, expected_problems",
+    [
+        (
+            {"Verbose": False, "Tile": "Fixed"},
+            {"Verbose": [True, False], "Tile": ["Fixed", "Well"]},
+            None,
+            {"Verbose": False, "Tile": "Fixed"},
+            0,
+        ),
+        # required keys are resolved from parent preferences
+        (
+            {"Verbose": False},
+            {"Verbose": [True, False], "LessDialog": [True, False]},
+            ["MetaDataPath", "LessDialog"],
+            {"Verbose": False, "LessDialog": False, "MetaDataPath": "MetaData.csv"},
+            0,
+        ),
+        (
+            {"Verbose": "maybe", "Wells": ["A1", "Z99"]},
+            {"Verbose": [True, False], "Wells": ["A1", "A2"]},
+            ["Camera", "Verbose"],
+            {"Verbose": "maybe", "Wells": ["A1", "Z99"]},
+            3,
+        ),
+    ],
+)
+def test_compile(pref_dict, schema, required, expected_values, expected_problems):
+    parent_prefs = Preferences("data/preferences_ZSD_test.yml")
+    prefs = Preferences(pref_dict=pref_dict, parent_prefs=parent_prefs)
+    snapshot, problems = prefs.compile(schema, required)
+    assert len(problems) == expected_problems
+    for name, value in expected_values.items():
+        assert getattr(snapshot, name) == value
+        assert snapshot[name] == value
+    assert snapshot.get_parent_prefs() is parent_prefs
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_preferences_snapshot():
+    parent_prefs = Preferences("data/preferences_ZSD_test.yml")
+    prefs = parent_prefs.get_pref_as_meta("ScanPlate")
+    snapshot, problems = prefs.compile({"Tile": ["Automatic"]})
+    assert problems == []
+
+    # snapshot cannot be changed and is independent of original preferences
+    with pytest.raises(AttributeError):
+        snapshot.Tile = "Fixed"
+    with pytest.raises(TypeError):
+        snapshot.prefs["Tile"] = "Fixed"
+    prefs.set_pref("Tile", "Fixed")
+    assert snapshot.Tile == "Automatic"
+    with pytest.raises(AttributeError):
+        snapshot.NotDefined
+
+    assert snapshot.get_pref("Tile", valid_values=["Automatic", "Well"]) == "Automatic"
+    assert snapshot.get_pref("NotDefined", default=3) == 3
+    assert snapshot.get_pref("MetaDataPath") == "MetaData.csv"
+    assert isinstance(snapshot.get_pref_as_meta("Filters"), Preferences)
+    with patch(
+        "microscope_automation.util.automation_messages_form_layout.pull_down_select_dialog"  # noqa
+    ) as mock_select:
+        mock_select.return_value = "Well"
+        assert snapshot.get_pref("Tile", valid_values=["Well"]) == "Well"
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_compile_workflow():
+    prefs = Preferences("data/preferences_ZSD_test.yml")
+    schema = {"FunctionName": ["scan_plate", "scan_samples"], "Tile": ["Automatic"]}
+    required_prefs = {None: ["Wait"], "scan_samples": ["UseReference"]}
+    with patch(
+        "microscope_automation.util.automation_messages_form_layout.read_string"
+    ) as mock_read:
+        snapshots, problems = preferences.compile_workflow(
+            prefs,
+            schema,
+            required_prefs,
+            experiments=["ScanPlate", "ScanCells", "Undefined"],
+        )
+    # all problems are reported without asking user
+    mock_read.assert_not_called()
+    assert list(snapshots.keys()) == ["ScanPlate", "ScanCells"]
+    assert snapshots["ScanPlate"].Tile == "Automatic"
+    assert snapshots["ScanPlate"].Wait["Image"] is False
+    assert problems == [
+        "ScanCells: Key UseReference is not defined",
+        "ScanCells: Value NoTiling for key Tile is not valid. "
+        "Valid values: ['Automatic']",
+        "Undefined: experiment is not defined",
+    ]
+
+    snapshots, _ = preferences.compile_workflow(prefs)
+    assert list(snapshots.keys()) == [
+        step["Experiment"] for step in prefs.get_pref("Workflow")
+    ]
@@ -0,0 +1,101 @@
+"""
+Test planning of visiting order for sample objects
+"""
+
+import pytest
+import os
+from microscope_automation.samples import samples
+from microscope_automation.orchestrator import route_planner
+
+os.chdir(os.path.dirname(__file__))
+
+# set skip_all_tests = True to focus on single test
+skip_all_tests = False
+
+
+def setup_colonies(well_centers, colony_centers):
+    """Create colonies in wells on a grid.
+    Colonies are listed in a zigzag order that keeps wells together.
+
+    Input:
+     well_centers: dictionary {well_name: (x, y, z)}
+
+     colony_centers: list with (x, y, z) centers of colonies relative to well center
+
+    Output:
+     colony_list: list with colony objects
+    """
+    colony_list = []
+    for well_name, well_center in well_centers.items():
+        well_object = samples.Well(name=well_name, center=well_center, y_flip=1)
+        for index, colony_center in enumerate(colony_centers):
+            colony_list.append(
+                samples.Colony(
+                    name="{}_{}".format(well_name, index),
+                    center=colony_center,
+                    well_object=well_object,
+                    y_flip=1,
+                )
+            )
+    return colony_list
+
+
+WELL_CENTERS = {
+    "A1": (0, 0, 0),
+    "B2": (9000, 9000, 0),
+    "A2": (9000, 0, 0),
+    "B1": (0, 9000, 0),
+}
+COLONY_CENTERS = [(-1000, 0, 0), (1000, 0, 0), (-900, 100, 0), (900, 100, 0)]
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    "strategy, expected_wells",
+    [
+        ("None", ["A1", "B2", "A2", "B1"]),
+        ("Serpentine", ["A1", "A2", "B2", "B1"]),
+        ("NearestNeighbour", ["A1", "A2", "B2", "B1"]),
+        ("TwoOpt", ["A1", "A2", "B2", "B1"]),
+    ],
+)
+def test_plan_route(strategy, expected_wells):
+    colony_list = setup_colonies(WELL_CENTERS, COLONY_CENTERS)
+    ordered_list, route_info = route_planner.plan_route(colony_list, strategy)
+
+    # wells are visited once and all colonies of a well are kept together
+    well_names = [colony.get_well_object().get_name() for colony in ordered_list]
+    well_order = [
+        name for i, name in enumerate(well_names) if well_names[i - 1 : i] != [name]
+    ]
+    assert well_order == expected_wells
+    assert sorted(c.get_name() for c in ordered_list) == sorted(
+        c.get_name() for c in colony_list
+    )
+    assert route_info["OriginalDistance"] == pytest.approx(
+        route_info["PlannedDistance"] + route_info["SavedDistance"]
+    )
+    if strategy == "None":
+        assert route_info["SavedDistance"] == 0
+    else:
+        assert route_info["SavedDistance"] > 0
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_plan_route_invalid_strategy():
+    colony_list = setup_colonies(WELL_CENTERS, COLONY_CENTERS)
+    with pytest.raises(ValueError):
+        route_planner.plan_route(colony_list, "Random")
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    "positions, start_position, expected",
+    [
+        ([(0, 0), (3, 4)], None, 5),
+        ([(0, 0), (3, 4)], (0, 4), 9),
+        ([(1, 1)], None, 0),
+    ],
+)
+def test_route_length(positions, start_position, expected):
+    assert route_planner.route_length(positions, start_position) == expected
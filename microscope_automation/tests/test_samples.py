@@ -2260,6 +2260,125 @@ def test_acquire_images(
     assert final_result == expected
 
 
+@patch("microscope_automation.hardware.hardware_components.ObjectiveChanger.initialize")
+@patch(
+    "microscope_automation.hardware.hardware_control.BaseMicroscope.recover_hardware"
+)
+@patch("microscope_automation.hardware.hardware_components.Safety.show_safe_areas")
+@patch("microscope_automation.connectors.connect_zen_blue.ConnectMicroscope.save_image")
+@patch(
+    "microscope_automation.connectors.connect_zen_blue.ConnectMicroscope.close_experiment"  # noqa
+)
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    ("experiment, pos_list, load, use_autofocus, prefs_path, expected"),
+    [
+        (
+            "WellTile_10x_true.czexp",
+            [(1000, 2000, 300), (1500, 2000, 300), (1500, 2500, 300)],
+            False,
+            False,
+            "data/preferences_ZSD_test.yml",
+            [0, 1, 2],
+        ),
+        (
+            "WellTile_10x_true.czexp",
+            [(1000, 2000, 300), (200000, 2000, 300)],
+            False,
+            False,
+            "data/preferences_ZSD_test.yml",
+            "CrashDangerError",
+        ),
+        # focus cannot move to load position between positions,
+        # acquire positions one by one
+        (
+            "WellTile_10x_true.czexp",
+            [(1000, 2000, 300), (1500, 2000, 300)],
+            True,
+            False,
+            "data/preferences_ZSD_test.yml",
+            [None, None],
+        ),
+        # focus cannot be recalled between positions
+        (
+            "WellTile_10x_true.czexp",
+            [(1000, 2000, 300), (1500, 2000, 300)],
+            False,
+            True,
+            "data/preferences_ZSD_test.yml",
+            [None, None],
+        ),
+    ],
+)
+def test_acquire_images_batch(
+    mock_close,
+    mock_save,
+    mock_show,
+    mock_recover,
+    mock_init,
+    experiment,
+    pos_list,
+    load,
+    use_autofocus,
+    prefs_path,
+    expected,
+    helpers,
+):
+    (
+        microscope,
+        stage_id,
+        focus_id,
+        autofocus_id,
+        obj_changer_id,
+        safety_id,
+    ) = helpers.microscope_for_samples_testing(helpers, prefs_path)
+    microscope.add_microscope_object(helpers.setup_local_camera("Camera1 (back)"))
+    container = helpers.create_sample_object(
+        "plate_holder",
+        microscope_obj=microscope,
+        focus_id=focus_id,
+        stage_id=stage_id,
+        autofocus_id=autofocus_id,
+        obj_changer_id=obj_changer_id,
+        safety_id=safety_id,
+    )
+    sample = helpers.create_sample_object(
+        "img_sys",
+        container=container,
+        microscope_obj=microscope,
+        focus_id=focus_id,
+        stage_id=stage_id,
+        autofocus_id=autofocus_id,
+        obj_changer_id=obj_changer_id,
+        safety_id=safety_id,
+    )
+
+    try:
+        with patch.object(sample, "get_use_autofocus", return_value=use_autofocus):
+            images = sample.acquire_images(
+                experiment,
+                "Camera1 (back)",
+                pos_list=pos_list,
+                load=load,
+                use_reference=False,
+                batch=True,
+            )
+        result = [image.get_meta("aics_scene") for image in images]
+    except Exception as err:
+        result = type(err).__name__
+
+    assert result == expected
+    if isinstance(expected, list) and expected[0] is not None:
+        # one experiment moved stage through all positions
+        zen = microscope._get_control_software().connection.Zen
+        assert zen.Devices.Stage.ActualPositionX == pos_list[-1][0] + 20
+        for image, position in zip(images, pos_list):
+            assert (
+                image.get_meta("aics_imageObjectPosX")
+                == sample.get_pos_from_abs_pos(*position, verbose=False)[0]
+            )
+
+
 @patch(
     "microscope_automation.util.automation_messages_form_layout.read_string",
     return_value="",
@@ -2600,11 +2719,12 @@ def test_background_correction(
 
 @pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
 @pytest.mark.parametrize(
-    ("container_type, image_list, prefs_path, pref_name, expected"),
+    ("container_type, image_list, dtype, prefs_path, pref_name, expected"),
     [
         (
             "plate_holder",
             [None],
+            None,
             "data/preferences_ZSD_test.yml",
             "ScanPlate",
             "TypeError",
@@ -2612,21 +2732,33 @@ def test_background_correction(
         (
             "plate_holder",
             ["test_image_all_black", "test_image_all_white"],
+            np.uint16,
             "data/preferences_ZSD_test.yml",
             "ScanPlate",
             ["<class 'microscope_automation.util.image_AICS.ImageAICS'>", [5], [5]],
         ),
+        # OME-TIFF has no pixel type for 64 bit integers
+        (
+            "plate_holder",
+            ["test_image_all_black", "test_image_all_white"],
+            np.int64,
+            "data/preferences_ZSD_test.yml",
+            "ScanPlate",
+            "TypeError",
+        ),
     ],
 )
 def test_tile_images(
     container_type,
     image_list,
+    dtype,
     prefs_path,
     pref_name,
     expected,
     helpers,
     test_image_all_black,
     test_image_all_white,
+    tmp_path,
 ):
     images = []
     for image_name in image_list:
@@ -2636,6 +2768,10 @@ def test_tile_images(
             images.append(test_image_all_white)
         else:
             images.append(ImageAICS())
+    for image in images:
+        if image.get_data() is not None:
+            image.data = image.get_data().astype(dtype)
+            image.add_meta({"Type": dtype})
 
     if prefs_path:
         prefs = Preferences(pref_path=prefs_path)
@@ -2656,7 +2792,11 @@ def test_tile_images(
     img_sys = helpers.setup_local_imaging_system(helpers, container=container)
 
     try:
-        result = img_sys.tile_images(images, image_settings)
+        with patch(
+            "microscope_automation.samples.samples.get_images_path",
+            return_value=str(tmp_path),
+        ):
+            result = img_sys.tile_images(images, image_settings)
         result[0] = str(result[0].__class__)
     except Exception as err:
         result = type(err).__name__
@@ -4274,3 +4414,182 @@ def test_find_cell_interactive_distance_map(name, location, expected, helpers):
         assert list(result.keys()) == expected
     except Exception as err:
         assert type(err).__name__ == expected
+
+
+def setup_transform_hierarchy():
+    """Create plate holder, plate, well, and colony with flips, corrections,
+    and slope corrections."""
+    plate_holder = samples.ImagingSystem(
+        name="PlateHolder",
+        x_zero=100,
+        y_zero=-200,
+        z_zero=10,
+        x_flip=1,
+        y_flip=-1,
+        x_correction=1.01,
+        y_correction=0.99,
+        z_correction=1,
+        z_correction_x_slope=0.001,
+        z_correction_y_slope=-0.002,
+        z_correction_z_slope=1,
+    )
+    plate = samples.ImagingSystem(
+        container=plate_holder,
+        name="Plate",
+        x_zero=5000,
+        y_zero=3000,
+        z_zero=100,
+        x_correction=1,
+        y_correction=1,
+        z_correction=1,
+    )
+    well = samples.ImagingSystem(
+        container=plate,
+        name="B2",
+        x_zero=9000,
+        y_zero=9000,
+        z_zero=0,
+        x_flip=-1,
+        x_correction=1.02,
+        y_correction=1,
+        z_correction=0.98,
+        z_correction_x_slope=0.003,
+        z_correction_y_slope=0.001,
+        z_correction_z_slope=2,
+    )
+    well.set_correction(
+        1.02,
+        1,
+        0.98,
+        z_correction_x_slope=0.003,
+        z_correction_y_slope=0.001,
+        z_correction_z_slope=2,
+        z_correction_offset=5,
+    )
+    colony = samples.ImagingSystem(
+        container=well,
+        name="B2_0001",
+        x_zero=-150,
+        y_zero=250,
+        z_zero=3,
+        x_correction=1,
+        y_correction=1,
+        z_correction=1,
+    )
+    return [plate_holder, plate, well, colony]
+
+
+def reference_abs_pos_from_obj_pos(sample, x, y, z):
+    """Transform one level at a time."""
+    while sample is not None:
+        x, y, z = sample.get_container_pos_from_obj_pos(x, y, z, verbose=False)
+        sample = sample.get_container()
+    return x, y, z
+
+
+def reference_pos_from_abs_pos(sample, x, y, z):
+    """Transform one level at a time."""
+    hierarchy = []
+    while sample is not None:
+        hierarchy.insert(0, sample)
+        sample = sample.get_container()
+    x, y, z = x - hierarchy[0].x_zero, y - hierarchy[0].y_zero, z - hierarchy[0].z_zero
+    for sample in hierarchy[1:]:
+        x, y, z = sample.get_obj_pos_from_container_pos(x, y, z, verbose=False)
+    return x, y, z
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize("level", [0, 1, 2, 3])
+@pytest.mark.parametrize("position", [(0, 0, 0), (120.5, -30, 7), (-4000, 2500, -12)])
+def test_cached_transforms(level, position):
+    sample = setup_transform_hierarchy()[level]
+    x, y, z = position
+    expected = reference_abs_pos_from_obj_pos(sample, x, y, z)
+    assert sample.get_abs_pos_from_obj_pos(x, y, z, verbose=False) == pytest.approx(
+        expected
+    )
+    x_abs, y_abs, _ = sample.get_abs_pos_from_obj_pos(x, y, verbose=False)
+    assert (x_abs, y_abs) == pytest.approx(expected[0:2])
+
+    expected = reference_pos_from_abs_pos(sample, x, y, z)
+    assert sample.get_pos_from_abs_pos(x, y, z, verbose=False) == pytest.approx(
+        expected
+    )
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    "change",
+    [
+        ("set_zero", (1, 2, 3)),
+        ("update_zero", (None, 7, None)),
+        ("set_flip", (-1, 1, -1)),
+        ("set_correction", (1.1, 0.9, 1.2, 0.01, 0.02, 1, 4)),
+        ("update_correction", (1.1, 0.9, 1.2, 1, 1, 1, 1)),
+    ],
+)
+@pytest.mark.parametrize("level", [0, 1, 2])
+def test_cached_transforms_invalidate(change, level):
+    hierarchy = setup_transform_hierarchy()
+    colony = hierarchy[-1]
+    before = colony.get_abs_pos_from_obj_pos(10, 20, 30, verbose=False)
+    assert colony.get_pos_from_abs_pos(*before, verbose=False) == pytest.approx(
+        reference_pos_from_abs_pos(colony, *before)
+    )
+
+    method, args = change
+    getattr(hierarchy[level], method)(*args)
+    after = colony.get_abs_pos_from_obj_pos(10, 20, 30, verbose=False)
+    assert after != pytest.approx(before)
+    assert after == pytest.approx(reference_abs_pos_from_obj_pos(colony, 10, 20, 30))
+    assert colony.get_pos_from_abs_pos(*after, verbose=False) == pytest.approx(
+        reference_pos_from_abs_pos(colony, *after)
+    )
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize("level", [1, 3])
+def test_transforms_many(level):
+    sample = setup_transform_hierarchy()[level]
+    positions = np.array([[0, 0, 0], [120.5, -30, 7], [-4000, 2500, -12]])
+
+    abs_positions = sample.get_abs_pos_from_obj_pos_many(positions)
+    assert abs_positions.shape == (3, 3)
+    for position, abs_position in zip(positions, abs_positions):
+        assert abs_position == pytest.approx(
+            sample.get_abs_pos_from_obj_pos(*position, verbose=False)
+        )
+        assert sample.get_pos_from_abs_pos_many([position])[0] == pytest.approx(
+            sample.get_pos_from_abs_pos(*position, verbose=False)
+        )
+        container_position = sample.get_container_pos_from_obj_pos_many(position)[0]
+        assert container_position == pytest.approx(
+            sample.get_container_pos_from_obj_pos(*position, verbose=False)
+        )
+
+    # x, y positions only
+    assert np.allclose(
+        sample.get_abs_pos_from_obj_pos_many(positions[:, 0:2]), abs_positions[:, 0:2]
+    )
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_transforms_many_zero_correction():
+    sample = samples.ImagingSystem(name="Test", x_correction=1, y_correction=1)
+    assert np.allclose(sample.get_abs_pos_from_obj_pos_many([[1, 2]]), [[1, 2]])
+    with pytest.raises(ZeroDivisionError):
+        sample.get_abs_pos_from_obj_pos_many([[1, 2, 3]])
+    sample.set_correction(0, 1, 1)
+    with pytest.raises(ZeroDivisionError):
+        sample.get_abs_pos_from_obj_pos_many([[1, 2]])
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_cached_transforms_set_container():
+    plate_holder, plate, well, colony = setup_transform_hierarchy()
+    before = colony.get_abs_pos_from_obj_pos(10, 20, 30, verbose=False)
+    well.set_container(plate_holder)
+    after = colony.get_abs_pos_from_obj_pos(10, 20, 30, verbose=False)
+    assert after != pytest.approx(before)
+    assert after == pytest.approx(reference_abs_pos_from_obj_pos(colony, 10, 20, 30))
@@ -0,0 +1,146 @@
+"""
+Test filters for segmented objects
+"""
+
+import math
+import pytest
+import time
+import numpy
+from mock import patch
+from scipy import ndimage
+from microscope_automation.samples import segmentation_filters
+
+# set skip_all_tests = True to focus on single test
+skip_all_tests = False
+
+
+def create_objects(shape=(400, 500), number_objects=60, seed=0):
+    """Objects with different sizes at random positions on a grid."""
+    rng = numpy.random.default_rng(seed)
+    image = numpy.zeros(shape, dtype=bool)
+    cell = int(math.sqrt(shape[0] * shape[1] / number_objects))
+    positions = [
+        (row, column)
+        for row in range(0, shape[0] - cell + 1, cell)
+        for column in range(0, shape[1] - cell + 1, cell)
+    ]
+    sizes = 4 + rng.permutation(len(positions)) * ((cell - 1) ** 2 - 4) // len(
+        positions
+    )
+    for (row, column), size in zip(positions, sizes):
+        # fill size pixels of block row by row
+        block = numpy.zeros((cell - 1) ** 2, dtype=bool)
+        block[:size] = True
+        image[row : row + cell - 1, column : column + cell - 1] = block.reshape(
+            cell - 1, cell - 1
+        )
+    return image
+
+
+def filter_by_size_relabel(input_image, filter_values):
+    """Size filter that labels the image itself."""
+    label_objects, nb_labels = ndimage.label(input_image)
+    sizes = numpy.bincount(label_objects.ravel())
+    max_area = filter_values[1] if len(filter_values) == 2 else max(sizes)
+    size_mask = (sizes > filter_values[0]) & (sizes < max_area)
+    size_mask[0] = 0
+    return size_mask[label_objects]
+
+
+def filter_by_distance_relabel(input_image, filter_values):
+    """Distance filter that labels the image itself."""
+    label_objects, nb_labels = ndimage.label(input_image)
+    centers = numpy.array(
+        ndimage.center_of_mass(input_image, label_objects, range(1, nb_labels + 1))
+    ).reshape(-1, 2)
+    distances = numpy.linalg.norm(centers - numpy.array(input_image.shape) / 2, axis=1)
+    distance_mask = numpy.concatenate([[False], distances < filter_values[0]])
+    sizes = numpy.bincount(label_objects.ravel()) * distance_mask
+    top_sizes = numpy.zeros(distance_mask.shape, dtype=bool)
+    if filter_values[1] != 0:
+        top_sizes[numpy.argsort(sizes, kind="stable")[-filter_values[1] :]] = True
+    return (distance_mask & top_sizes)[label_objects]
+
+
+FILTER_RELABEL_MAPPING = {
+    "minArea": filter_by_size_relabel,
+    "distFromCenter": filter_by_distance_relabel,
+}
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    "filters_dict",
+    [
+        {"minArea": [50]},
+        {"minArea": [50, 200]},
+        {"distFromCenter": [150, 10]},
+        {"distFromCenter": [1000, 100]},
+        {"distFromCenter": [150, 0]},
+        {"minArea": [50], "distFromCenter": [150, 10]},
+        {"distFromCenter": [200, 20], "minArea": [30, 300]},
+    ],
+)
+def test_apply_filters(filters_dict):
+    image = create_objects()
+    expected = image
+    for filter_name, filter_values in filters_dict.items():
+        expected = FILTER_RELABEL_MAPPING[filter_name](expected, filter_values)
+
+    # chain of filters labels image once
+    with patch.object(
+        segmentation_filters.ndimage, "label", wraps=ndimage.label
+    ) as label:
+        label_table = segmentation_filters.apply_filters(image, filters_dict)
+    assert label.call_count == 1
+    numpy.testing.assert_array_equal(label_table.get_image(), expected)
+    labels, number_labels = label_table.get_labels()
+    expected_labels, expected_number_labels = ndimage.label(expected)
+    numpy.testing.assert_array_equal(labels, expected_labels)
+    assert number_labels == expected_number_labels
+
+    # single filters
+    for filter_name, filter_values in filters_dict.items():
+        numpy.testing.assert_array_equal(
+            segmentation_filters.apply_filter(filter_name, image, filter_values),
+            FILTER_RELABEL_MAPPING[filter_name](image, filter_values),
+        )
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_label_table_measurements():
+    image = numpy.zeros((10, 20), dtype=bool)
+    image[1:3, 1:4] = True
+    image[5:10, 10:12] = True
+    label_table = segmentation_filters.LabelTable(image)
+    assert label_table.number_labels == 2
+    assert list(label_table.get_sizes()) == [184, 6, 10]
+    numpy.testing.assert_allclose(label_table.get_centers()[1:], [[1.5, 2], [7, 10.5]])
+    numpy.testing.assert_allclose(
+        label_table.get_distances_from_center()[1:],
+        [math.hypot(3.5, 8), math.hypot(2, 0.5)],
+    )
+    label_table.keep[1] = False
+    assert list(label_table.get_sizes()) == [190, 0, 10]
+    labels, number_labels = label_table.get_labels()
+    assert number_labels == 1
+    numpy.testing.assert_array_equal(labels, image & (label_table.labels == 2))
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize("filter_name", ["minArea", "distFromCenter"])
+def test_apply_filters_no_values(filter_name):
+    with pytest.raises(ValueError):
+        segmentation_filters.apply_filters(create_objects(), {filter_name: []})
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_apply_filters_benchmark(benchmark_limit):
+    # time budget in s for chain of filters on image with about 5000 objects
+    time_budget = benchmark_limit(0.5, 2)
+    image = create_objects((2000, 2000), 5000)
+    start_time = time.perf_counter()
+    segmentation_filters.apply_filters(
+        image, {"distFromCenter": [800, 2000], "minArea": [10]}
+    )
+    assert time.perf_counter() - start_time < time_budget
@@ -0,0 +1,181 @@
+"""
+Test saving and recovery of software state
+"""
+
+import pytest
+import os
+import pickle
+from microscope_automation.samples import samples
+from microscope_automation.util import software_state
+
+os.chdir(os.path.dirname(__file__))
+
+# set skip_all_tests = True to focus on single test
+skip_all_tests = False
+
+
+def setup_state(recovery_file_path):
+    """Create state with one well and two cells for next experiment."""
+    state = software_state.State(recovery_file_path)
+    well = samples.Well(name="A1", center=(0, 0, 0))
+    cells = [
+        samples.Cell(name="A1_0001", center=[1, 2, 0], colony_object=well),
+        samples.Cell(name="A1_0002", center=[3, 4, 0], colony_object=well),
+    ]
+    state.reference_object = well
+    state.add_next_experiment_object("ScanCells", cells)
+    return state
+
+
+def recover(recovery_file_path):
+    """Recover state into new State object."""
+    recovered = software_state.State(recovery_file_path)
+    (
+        next_objects,
+        reference_object,
+        last_objects,
+        hardware_status,
+    ) = recovered.recover_objects(recovery_file_path)
+    return next_objects, reference_object, last_objects, hardware_status
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_save_state_journal(tmp_path):
+    recovery_file_path = str(tmp_path / "recovery.pickle")
+    journal_path = recovery_file_path + software_state.JOURNAL_SUFFIX
+    state = setup_state(recovery_file_path)
+    state.save_state()
+    snapshot = open(recovery_file_path, "rb").read()
+    assert os.path.getsize(journal_path) == 0
+
+    # imaged objects and hardware status only append to journal
+    state.add_last_experiment_object("A1_0001")
+    state.save_state()
+    state.hardware_status_dict = {"Plan-Apochromat 10x/0.45": True}
+    state.add_last_experiment_object("A1_0002")
+    state.save_state()
+    # nothing changed, nothing written
+    state.save_state()
+    assert open(recovery_file_path, "rb").read() == snapshot
+    assert len(software_state.read_journal(journal_path)) == 3
+
+    next_objects, reference_object, last_objects, hardware_status = recover(
+        recovery_file_path
+    )
+    assert last_objects == ["A1_0001", "A1_0002"]
+    assert hardware_status == {"Plan-Apochromat 10x/0.45": True}
+    assert [cell.get_name() for cell in next_objects["ScanCells"]] == [
+        "A1_0001",
+        "A1_0002",
+    ]
+    # sample objects share the same tree as in one pickle
+    assert next_objects["ScanCells"][0].get_container() is reference_object
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize("change", ["next_objects", "reference", "limit", "forced"])
+def test_save_state_snapshot(tmp_path, change):
+    recovery_file_path = str(tmp_path / "recovery.pickle")
+    journal_path = recovery_file_path + software_state.JOURNAL_SUFFIX
+    state = setup_state(recovery_file_path)
+    state.journal_limit = 2
+    state.save_state()
+    state.add_last_experiment_object("A1_0001")
+    state.save_state()
+    assert len(software_state.read_journal(journal_path)) == 1
+
+    snapshot = False
+    if change == "next_objects":
+        state.next_experiment_objects["ScanCells"].append(
+            samples.Cell(name="A1_0003", center=[5, 6, 0])
+        )
+    elif change == "reference":
+        state.reference_object = samples.Well(name="B1", center=(0, 0, 0))
+    elif change == "limit":
+        state.add_last_experiment_object("A1_0002")
+        state.save_state()
+    else:
+        snapshot = True
+    state.add_last_experiment_object("A1_0004")
+    state.save_state(snapshot=snapshot)
+
+    # complete state in snapshot, journal is empty
+    assert os.path.getsize(journal_path) == 0
+    with open(recovery_file_path, "rb") as f:
+        pickle_dict = pickle.load(f)
+    assert pickle_dict[software_state.LAST_EXP_OBJECTS][-1] == "A1_0004"
+    assert recover(recovery_file_path)[2] == state.last_experiment_objects
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize(
+    "journal_tail, expected",
+    [
+        (b"", ["A1_0001", "A1_0002"]),
+        # record was not completely written before crash
+        (b"\x10\x00\x00\x00\x00\x00", ["A1_0001", "A1_0002"]),
+        (b"garbage", ["A1_0001", "A1_0002"]),
+    ],
+)
+def test_recover_objects_journal(tmp_path, journal_tail, expected):
+    recovery_file_path = str(tmp_path / "recovery.pickle")
+    journal_path = recovery_file_path + software_state.JOURNAL_SUFFIX
+    state = setup_state(recovery_file_path)
+    state.save_state()
+    state.add_last_experiment_object("A1_0001")
+    state.add_last_experiment_object("A1_0002")
+    state.save_state()
+    journal = open(journal_path, "rb").read()
+
+    # records of an older snapshot are ignored
+    state.save_state(snapshot=True)
+    with open(journal_path, "wb") as f:
+        f.write(journal + journal_tail)
+    assert recover(recovery_file_path)[2] == expected
+
+    state.next_experiment_objects.clear()
+    state.last_experiment_objects = []
+    state.save_state()
+    with open(journal_path, "ab") as f:
+        f.write(journal + journal_tail)
+    assert recover(recovery_file_path)[2] == []
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize("recovered", [False, True])
+def test_recover_objects_stale_journal(tmp_path, recovered):
+    recovery_file_path = str(tmp_path / "recovery.pickle")
+    journal_path = recovery_file_path + software_state.JOURNAL_SUFFIX
+    state = setup_state(recovery_file_path)
+    state.save_state()
+    state.add_last_experiment_object("A1_0001")
+    state.save_state()
+    journal = open(journal_path, "rb").read()
+    if recovered:
+        # continue with state recovered after restart
+        state = software_state.State(recovery_file_path)
+        state.recover_objects(recovery_file_path)
+    else:
+        # failed save starts over with snapshot
+        state._reset_journal_tracking()
+
+    # crash after new snapshot was written, before journal was truncated
+    state.save_state()
+    with open(journal_path, "wb") as f:
+        f.write(journal)
+    assert recover(recovery_file_path)[2] == ["A1_0001"]
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_recover_objects_without_journal(tmp_path):
+    # recovery files written before journal was introduced
+    recovery_file_path = str(tmp_path / "recovery.pickle")
+    pickle_dict = {
+        software_state.NEXT_EXP_OBJECTS: {},
+        software_state.REFERENCE_OBJECT: None,
+        software_state.LAST_EXP_OBJECTS: ["A1_0001"],
+        software_state.HARDWARE_STATUS: {},
+    }
+    with open(recovery_file_path, "wb") as f:
+        pickle.dump(pickle_dict, f)
+    assert recover(recovery_file_path) == ({}, None, ["A1_0001"], {})
@@ -0,0 +1,202 @@
+"""
+Test stitching of tiles into preallocated images
+"""
+
+import pytest
+import os
+import time
+import numpy as np
+from microscope_automation.samples import tile_images
+from microscope_automation.util.image_AICS import ImageAICS
+
+os.chdir(os.path.dirname(__file__))
+
+# set skip_all_tests = True to focus on single test
+skip_all_tests = False
+
+
+def create_tiles(positions, shape=(4, 6, 2), dtype="uint16"):
+    """Tiles with pixel values identifying tile index."""
+    tiles = []
+    for index, (x, y) in enumerate(positions):
+        tiles.append(
+            ImageAICS(
+                data=np.full(shape, index + 1, dtype=dtype),
+                meta={
+                    "aics_imageObjectPosX": x,
+                    "aics_imageObjectPosY": y,
+                    "Type": dtype,
+                },
+            )
+        )
+    return tiles
+
+
+def stack_tiles(tiles):
+    """Stitch tiles with np.hstack and np.vstack as reference."""
+    positions = sorted(
+        (-tile.get_meta("aics_imageObjectPosY"), tile.get_meta("aics_imageObjectPosX"))
+        + (index,)
+        for index, tile in enumerate(tiles)
+    )
+    rows = {}
+    for y, _, index in positions:
+        rows.setdefault(y, []).append(np.transpose(tiles[index].get_data(), (1, 0, 2)))
+    return np.vstack([np.hstack(row) for row in rows.values()])
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize("memmap", [False, True])
+def test_tile_hard_rectangle(memmap, tmp_path):
+    positions = [(x, y) for y in [0, 10] for x in [0, 6, 12]]
+    tiles = create_tiles(positions)
+    expected = stack_tiles(tiles)
+    memmap_path = str(tmp_path / "canvas.dat") if memmap else None
+
+    tiled_image, x_border_list, y_border_list = tile_images._tile_hard_rectangle(
+        tiles[::-1], {"aics_well": "B2"}, memmap_path=memmap_path, release_tiles=True
+    )
+    data = tiled_image.get_data()
+    assert isinstance(data, np.memmap) == memmap
+    assert data.shape == (12, 12, 2)
+    assert np.array_equal(data, expected)
+    assert tiled_image.get_meta("aics_well") == "B2"
+    assert x_border_list == [] and y_border_list == []
+    assert all(tile.get_data() is None for tile in tiles)
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_tile_hard_rectangle_wrong_size():
+    tiles = create_tiles([(0, 0), (6, 0), (0, 10)])
+    tiles[2].add_data(np.zeros((4, 5, 2), dtype="uint16"))
+    with pytest.raises(ValueError):
+        tile_images._tile_hard_rectangle(tiles, {})
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize("memmap", [False, True])
+def test_tile_hard_any_shape(memmap, tmp_path):
+    # L-shaped tile region with tiles of 4 x 6 pixels
+    positions = [(100, 200), (104, 200), (100, 206), (104, 212)]
+    tiles = create_tiles(positions)
+    memmap_path = str(tmp_path / "canvas.dat") if memmap else None
+
+    tiled_image, x_border_list, y_border_list = tile_images._tile_hard_any_shape(
+        tiles, {}, memmap_path=memmap_path, release_tiles=True
+    )
+    data = tiled_image.get_data()
+    assert isinstance(data, np.memmap) == memmap
+    assert data.shape == (8, 18, 2)
+    assert x_border_list == [4]
+    assert y_border_list == [6, 12]
+    # y axis is flipped, missing tile stays empty
+    assert data[0, 17, 0] == 1
+    assert data[4, 17, 0] == 2
+    assert data[0, 11, 0] == 3
+    assert data[4, 5, 0] == 4
+    assert data[0, 0, 0] == 0
+    assert all(tile.get_data() is None for tile in tiles)
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_tile_images_keeps_tiles():
+    tiles = create_tiles([(0, 0), (6, 0)], shape=(4, 6))
+    tiled_image = tile_images.tile_images(tiles, method="stack", output_image=False)[0]
+    assert tiled_image.get_data().shape == (6, 8, 1)
+    assert tiles[0].get_data() is not None
+
+
+def create_overlapping_tiles(
+    scene, tile_size, number_tiles, overlap=0.1, max_error=6, seed=0
+):
+    """Cut tiles with random stage errors from scene.
+
+    Output:
+     tiles: list of ImageAICS with stage positions without error
+
+     corners: true positions of tiles in scene
+    """
+    rng = np.random.default_rng(seed)
+    step = int(tile_size * (1 - overlap))
+    pixel_size = 0.5
+    tiles = []
+    corners = []
+    for grid_x in range(number_tiles):
+        for grid_y in range(number_tiles):
+            corner = (
+                np.array([grid_x * step, grid_y * step])
+                + max_error
+                + rng.integers(-max_error, max_error + 1, 2)
+            )
+            corners.append(corner)
+            data = scene[
+                corner[0] : corner[0] + tile_size, corner[1] : corner[1] + tile_size
+            ]
+            tiles.append(
+                ImageAICS(
+                    data=np.stack([data, data // 2], axis=2),
+                    meta={
+                        "aics_imageObjectPosX": grid_x * step * pixel_size,
+                        # stage y axis is flipped in respect to image
+                        "aics_imageObjectPosY": -grid_y * step * pixel_size,
+                        "PhysicalSizeX": pixel_size,
+                        "PhysicalSizeY": pixel_size,
+                    },
+                )
+            )
+    return tiles, np.array(corners)
+
+
+def create_scene(tile_size, number_tiles, overlap=0.1, max_error=6):
+    step = int(tile_size * (1 - overlap))
+    size = step * (number_tiles - 1) + tile_size + 2 * max_error
+    return np.random.default_rng(1).integers(0, 4096, (size, size), dtype=np.uint16)
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_tile_registered():
+    scene = create_scene(256, 3)
+    tiles, corners = create_overlapping_tiles(scene, 256, 3)
+    tiled_image, x_border_list, y_border_list = tile_images.tile_images(
+        tiles, method="registration", output_image=False
+    )
+    data = tiled_image.get_data()
+    assert data.dtype == np.uint16
+    # tiled image is identical to scene at true tile positions
+    start = corners.min(axis=0)
+    end = (corners + 256).max(axis=0)
+    assert data.shape == tuple(end - start) + (2,)
+    expected = scene[start[0] : end[0], start[1] : end[1]]
+    covered = np.zeros(data.shape[:2], dtype=bool)
+    for corner in corners - start:
+        covered[corner[0] : corner[0] + 256, corner[1] : corner[1] + 256] = True
+    assert np.array_equal(data[covered, 0], expected[covered])
+    assert np.array_equal(data[covered, 1], expected[covered] // 2)
+    assert len(x_border_list) == 8 and len(y_border_list) == 8
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_tile_registered_without_overlap():
+    # tiles without overlap are placed at stage positions
+    tiles = create_tiles([(100, 200), (104, 200), (100, 206)])
+    for tile in tiles:
+        tile.add_meta({"PhysicalSizeX": 1, "PhysicalSizeY": 1})
+    expected = tile_images._tile_hard_any_shape(
+        create_tiles([(100, 200), (104, 200), (100, 206)]), {}
+    )
+    result = tile_images._tile_registered(tiles, {}, release_tiles=True)
+    assert np.array_equal(result[0].get_data(), expected[0].get_data())
+    assert result[1:] == expected[1:]
+    assert tiles[0].get_data() is None
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_tile_registered_benchmark(benchmark_limit):
+    # time budget in s for tiles with 1024 x 1024 pixels and 2 channels
+    time_budget_per_tile = benchmark_limit(0.5, 2)
+    scene = create_scene(1024, 4)
+    tiles, corners = create_overlapping_tiles(scene, 1024, 4)
+    start_time = time.perf_counter()
+    tile_images._tile_registered(tiles, {})
+    time_per_tile = (time.perf_counter() - start_time) / len(tiles)
+    assert time_per_tile < time_budget_per_tile
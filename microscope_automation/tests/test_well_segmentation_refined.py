@@ -0,0 +1,217 @@
+"""
+Test segmentation of colonies in well overview images
+"""
+
+import pytest
+import time
+import numpy
+from scipy import ndimage
+from skimage import feature, measure, morphology
+from microscope_automation.samples import well_segmentation_refined
+
+# set skip_all_tests = True to focus on single test
+skip_all_tests = False
+
+
+def create_dense_well(size=512, colonies_per_row=12, seed=0):
+    """Round well with irregular colonies on a grid, labelled 1, 2, ..."""
+    rng = numpy.random.default_rng(seed)
+    spacing = size / (colonies_per_row + 1)
+    y, x = numpy.ogrid[:size, :size]
+    labels = numpy.zeros((size, size), dtype=int)
+    label = 0
+    for row in range(1, colonies_per_row + 1):
+        for column in range(1, colonies_per_row + 1):
+            center_y = row * spacing + rng.uniform(-3, 3)
+            center_x = column * spacing + rng.uniform(-3, 3)
+            # colonies at the well edge are masked out during position selection
+            if numpy.hypot(center_y - size / 2, center_x - size / 2) > size / 2.6:
+                continue
+            radius_y, radius_x = rng.uniform(0.25, 0.4, 2) * spacing
+            colony = ((y - center_y) / radius_y) ** 2 + (
+                (x - center_x) / radius_x
+            ) ** 2 <= 1
+            label += 1
+            labels[colony] = label
+    image = rng.normal(1000, 50, (size, size))
+    image[labels > 0] += 500
+    return image, labels
+
+
+def create_segmented_well(size, colonies_per_row, number_positions):
+    image, labels = create_dense_well(size, colonies_per_row)
+    segmented_well = well_segmentation_refined.WellSegmentation(
+        numpy.kron(image, numpy.ones((4, 4))),
+        colony_filters_dict={
+            "distFromCenter": [0, number_positions],
+            "minArea": [16 * 16],
+        },
+    )
+    segmented_well.segmented_colonies = labels
+    return segmented_well
+
+
+def find_positions_full_image(segmented_well, number_colonies, mode):
+    """Select positions with masks of full image size for each colony."""
+    labels = segmented_well.segmented_colonies
+    sizes = numpy.bincount(labels.ravel())[1:]
+    filtered = numpy.zeros(labels.shape)
+    for new_label, obj in enumerate(numpy.argsort(-sizes)[:number_colonies], 1):
+        filtered[numpy.where(labels == obj + 1)] = new_label
+    filtered_colonies = measure.label(filtered)
+    smoothed_well = ndimage.gaussian_filter(segmented_well.downsized_image, 0.35)
+    distance = ndimage.distance_transform_edt(filtered_colonies)
+    points = []
+    for obj in range(1, number_colonies + 1):
+        mask = filtered_colonies == obj
+        center_point = segmented_well.find_center_position(
+            mask, distance, smoothed_well
+        )
+        points.append(center_point)
+        if mode == "C":
+            points.extend(segmented_well.find_edge_ridge_pair(mask, center_point))
+    return sorted(
+        (
+            int(point[0] * well_segmentation_refined.DOWNSCALING_FACTOR),
+            int(point[1] * well_segmentation_refined.DOWNSCALING_FACTOR),
+        )
+        for point in points
+    )
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize("mode", ["A", "C"])
+def test_find_positions(mode):
+    segmented_well = create_segmented_well(256, 6, 10)
+    numpy.random.seed(0)
+    segmented_well.find_positions(mode=mode)
+    numpy.random.seed(0)
+    expected = find_positions_full_image(segmented_well, 12, mode)
+    result = sorted((int(y), int(x)) for y, x in segmented_well.point_locations)
+    if mode == "A":
+        # only positions closest to center of well are kept
+        assert len(result) == 10
+        assert set(result) <= set(expected)
+    else:
+        assert result == expected
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_get_colony_rois():
+    segmented_well = create_segmented_well(64, 2, 4)
+    labels = numpy.zeros((64, 64), dtype=int)
+    labels[0:5, 10:20] = 1
+    labels[30:40, 60:64] = 3
+    rois = segmented_well.get_colony_rois(labels, margin=2)
+    assert rois == [
+        (slice(0, 7), slice(8, 22)),
+        None,
+        (slice(28, 42), slice(58, 64)),
+    ]
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_find_positions_benchmark(benchmark_limit):
+    # dense well with about 100 colonies, all colonies are processed
+    number_colonies = create_dense_well(512, 14)[1].max()
+    segmented_well = create_segmented_well(512, 14, number_colonies - 2)
+    numpy.random.seed(0)
+    start_time = time.perf_counter()
+    segmented_well.find_positions(mode="C")
+    cropped_time = time.perf_counter() - start_time
+
+    numpy.random.seed(0)
+    start_time = time.perf_counter()
+    expected = find_positions_full_image(segmented_well, number_colonies, "C")
+    full_image_time = time.perf_counter() - start_time
+
+    assert (
+        sorted((int(y), int(x)) for y, x in segmented_well.point_locations) == expected
+    )
+    print(
+        "find_positions: {:.2f} s cropped, {:.2f} s full image".format(
+            cropped_time, full_image_time
+        )
+    )
+    assert cropped_time * benchmark_limit(5, 2) < full_image_time
+
+
+def find_colony_markers_neighbourhood(distance_map_max):
+    """Find colony markers with morphology and peak_local_max neighbourhoods."""
+    binary_colony_mask = (distance_map_max > 0).astype(float)
+    erode = morphology.erosion(binary_colony_mask, morphology.disk(20))
+    distance_map = ndimage.distance_transform_edt(erode)
+    distance_map[distance_map < 10] = 0
+    local_maxi = numpy.zeros(distance_map.shape, dtype=bool)
+    local_maxi[
+        tuple(feature.peak_local_max(distance_map, footprint=numpy.ones((200, 200))).T)
+    ] = True
+    dilate_maxi = morphology.dilation(local_maxi, morphology.disk(10))
+    lab_dis_obj = measure.label(
+        morphology.dilation(distance_map > 0, morphology.disk(10))
+    )
+    for obj in numpy.unique(lab_dis_obj[lab_dis_obj > 0]):
+        if not dilate_maxi[lab_dis_obj == obj].any():
+            dilate_maxi[lab_dis_obj == obj] = 1
+    filter_max = (distance_map_max >= 10).astype(float)
+    label_objects = measure.label(filter_max, connectivity=1)
+    sizes = numpy.bincount(label_objects.ravel())
+    small_obj = (sizes <= 2500)[label_objects] & (label_objects > 0)
+    final_small = morphology.dilation(small_obj, morphology.disk(5))
+    return measure.label(numpy.logical_or(dilate_maxi, final_small))
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize("size", [3, 10, 100])
+def test_find_local_maxima(size):
+    rng = numpy.random.default_rng(size)
+    image = ndimage.gaussian_filter(rng.random((300, 200)), 5)
+    # plateaus are returned as a whole
+    image[100:110, 50:60] = 2
+    expected = numpy.zeros(image.shape, dtype=bool)
+    expected[
+        tuple(feature.peak_local_max(image, footprint=numpy.ones((size, size))).T)
+    ] = True
+    result = well_segmentation_refined.find_local_maxima(image, size)
+    numpy.testing.assert_array_equal(result, expected)
+    assert not well_segmentation_refined.find_local_maxima(
+        numpy.ones((20, 20)), size
+    ).any()
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+@pytest.mark.parametrize("radius", [1, 5, 10])
+def test_dilate_disk(radius):
+    binary_image = numpy.random.default_rng(radius).random((100, 120)) > 0.995
+    numpy.testing.assert_array_equal(
+        well_segmentation_refined.dilate_disk(binary_image, radius),
+        morphology.dilation(binary_image, morphology.disk(radius)),
+    )
+    assert not well_segmentation_refined.dilate_disk(
+        numpy.zeros((10, 10)), radius
+    ).any()
+
+
+@pytest.mark.skipif(skip_all_tests, reason="Exclude all tests")
+def test_find_colony_markers_benchmark(benchmark_limit):
+    image, labels = create_dense_well(1024, 8)
+    segmented_well = create_segmented_well(64, 2, 4)
+    distance_map_max = ndimage.distance_transform_edt(labels > 0)
+
+    start_time = time.perf_counter()
+    markers = segmented_well.find_colony_markers(distance_map_max)
+    fast_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    expected = find_colony_markers_neighbourhood(distance_map_max)
+    neighbourhood_time = time.perf_counter() - start_time
+
+    # markers are identical (tolerance 0 pixels)
+    assert markers.max() > 0
+    numpy.testing.assert_array_equal(markers, expected)
+    print(
+        "find_colony_markers: {:.2f} s, with neighbourhoods {:.2f} s".format(
+            fast_time, neighbourhood_time
+        )
+    )
+    assert fast_time * benchmark_limit(3, 1.5) < neighbourhood_time
@@ -1,6 +1,10 @@
 import pytest
 import pathlib
 import os
+import shutil
+from lxml import etree
+from mock import patch
+from microscope_automation.settings import zen_experiment_info
 from microscope_automation.settings.zen_experiment_info import ZenExperiment
 
 os.chdir(os.path.dirname(__file__))
@@ -43,3 +47,99 @@ def test_get_tag_value_default(exp_class):
 def test_get_tag_value_invalid(exp_class):
     with pytest.raises(ValueError):
         exp_class.get_tag_value(exp_class.TAG_PATH_TILE_CENTER_XY + "/badpath")
+
+
+@pytest.mark.parametrize(
+    "name, is_z_stack, z_stack_range, is_tile_scan",
+    [
+        ("WellTile_10x_true.czexp", True, 4e-06, True),
+        ("WellTile_10x_false.czexp", False, 0, False),
+    ],
+)
+def test_get_experiment_info(name, is_z_stack, z_stack_range, is_tile_scan):
+    path = "data/Experiment Setup/" + name
+    experiment_info = zen_experiment_info.get_experiment_info(path)
+    assert experiment_info.is_z_stack is is_z_stack
+    assert experiment_info.z_stack_range == pytest.approx(z_stack_range)
+    assert experiment_info.is_tile_scan is is_tile_scan
+    assert experiment_info.objective_position == 1
+    assert len(experiment_info.focus_settings) > 0
+
+    zen_experiment = ZenExperiment(path, name)
+    assert zen_experiment.is_z_stack() is is_z_stack
+    assert zen_experiment.z_stack_range() == pytest.approx(z_stack_range)
+    assert zen_experiment.is_tile_scan() is is_tile_scan
+    assert zen_experiment.get_objective_position() == 1
+
+
+def test_get_experiment_info_cache(experiment_path, tmp_path):
+    path = str(tmp_path / experiment_name)
+    shutil.copyfile(experiment_path, path)
+    with patch.object(
+        zen_experiment_info,
+        "_parse_experiment",
+        wraps=zen_experiment_info._parse_experiment,
+    ) as mock_parse:
+        experiment_info = zen_experiment_info.get_experiment_info(path)
+        for _ in range(3):
+            zen_experiment = ZenExperiment(path, experiment_name)
+            assert zen_experiment.is_z_stack() is False
+        assert zen_experiment_info.get_experiment_info(path) is experiment_info
+        assert mock_parse.call_count == 1
+
+        # updates from automation software are visible immediately
+        zen_experiment.update_tile_positions(1000, 2000, 3)
+        zen_experiment = ZenExperiment(path, experiment_name)
+        assert zen_experiment.get_tag_value(ZenExperiment.TAG_PATH_TILE_CENTER_Z) == "3"
+        assert mock_parse.call_count == 2
+
+        # changes by other programs are detected by modification time
+        tree = etree.parse(path)
+        tree.getroot().xpath(".//ZStackSetup")[0].attrib["IsActivated"] = "true"
+        tree.write(path)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert ZenExperiment(path, experiment_name).is_z_stack() is True
+        assert mock_parse.call_count == 3
+
+    zen_experiment_info.clear_experiment_cache()
+
+
+def test_update_tag_value_shared_tree(experiment_path, tmp_path):
+    path = str(tmp_path / experiment_name)
+    shutil.copyfile(experiment_path, path)
+    experiment_info = zen_experiment_info.get_experiment_info(path)
+    other_experiment = ZenExperiment(path, experiment_name)
+    zen_experiment = ZenExperiment(path, experiment_name)
+    tag_path = ZenExperiment.TAG_PATH_TILE_CENTER_Z
+
+    # failed write does not change cached tree
+    os.remove(path)
+    os.mkdir(path)
+    with pytest.raises(ValueError):
+        zen_experiment.update_tag_value(tag_path, "3")
+    os.rmdir(path)
+    shutil.copyfile(experiment_path, path)
+    assert other_experiment.get_tag_value(tag_path) == "4"
+    assert zen_experiment_info.get_experiment_info(path) is not experiment_info
+
+    zen_experiment.update_tag_value(tag_path, "3")
+    zen_experiment.update_tag_value(ZenExperiment.TAG_PATH_TILE_CENTER_XY, "1,2")
+    assert zen_experiment.get_tag_value(tag_path) == "3"
+    assert ZenExperiment(path, experiment_name).get_tag_value(tag_path) == "3"
+    assert other_experiment.get_tag_value(tag_path) == "4"
+
+    zen_experiment_info.clear_experiment_cache()
+
+
+def test_get_experiment_info_missing_tags(tmp_path):
+    path = str(tmp_path / "Empty.czexp")
+    with open(path, "w") as f:
+        f.write("<HardwareExperiment></HardwareExperiment>")
+    zen_experiment = ZenExperiment(path, "Empty.czexp")
+    assert zen_experiment.info.is_z_stack is None
+    assert zen_experiment.get_focus_settings() == []
+    with pytest.raises(ValueError):
+        zen_experiment.is_z_stack()
+    with pytest.raises(ValueError):
+        zen_experiment.get_objective_position()
@@ -185,6 +185,27 @@ class HardwareCommandNotDefinedError(AutomationError):
         )
 
 
+class HardwareTimeoutError(HardwareError):
+    """Exception if hardware did not reach expected state in time."""
+
+    def error_dialog(self):
+        """Show error message to user.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        return error_message(
+            'Hardware did not respond in time:\n"{}"\n{}'.format(
+                self.message, self.error_component
+            ),
+            return_code=False,
+            blocking=get_error_blocking(),
+        )
+
+
 ################################################################################
 #
 # Autofocus exceptions
@@ -551,3 +572,24 @@ class StopCollectingError(AutomationError):
             return_code=False,
             blocking=get_error_blocking(),
         )
+
+
+class WaitCancelledError(AutomationError):
+    """Wait for hardware was cancelled."""
+
+    def error_dialog(self):
+        """Show error message to user.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        return error_message(
+            ("Wait for hardware was cancelled.\n" "Message:\n'{}'").format(
+                self.message
+            ),
+            return_code=False,
+            blocking=get_error_blocking(),
+        )
@@ -17,26 +17,58 @@ Created on Jun 23, 2016
 import os
 import sys
 import re
+import importlib.util
 
 # switch between different versions of PyQt depending on computer system
-try:
+# PyQt and formlayout are only imported when the first dialog is shown
+if importlib.util.find_spec("PyQt5") is not None:
     os.environ["QT_API"] = "pyqt5"
-    from PyQt5 import QtGui
-except ImportError:
-    from PyQt4 import QtGui  # noqa
-
+else:
     os.environ["QT_API"] = "pyqt"
 
-# from PySide import QtGui
-from formlayout import fedit
 from os import listdir
-import pandas
 
 # create logger
 import logging
 
 logger = logging.getLogger("microscope_automation")
 
+# number of dialogs shown so far.
+# Users might operate the microscope while a dialog is open.
+_dialog_count = 0
+
+
+def get_dialog_count():
+    """Get number of dialogs shown so far.
+    A changed count tells that the user might have operated the microscope.
+
+    Input:
+     none
+
+    Return:
+     dialog_count: number of dialogs shown
+    """
+    return _dialog_count
+
+
+def fedit(*args, **kwargs):
+    """Create form dialog with formlayout.fedit.
+    Import formlayout and PyQt with first dialog.
+
+    Input:
+     args, kwargs: arguments for formlayout.fedit
+
+    Return:
+     result: result of formlayout.fedit
+    """
+    global _dialog_count
+    from formlayout import fedit as formlayout_fedit
+
+    try:
+        return formlayout_fedit(*args, **kwargs)
+    finally:
+        _dialog_count += 1
+
 
 def read_string(title, label, default, return_code=False):
     """Ask for user input and allows option to abort script.
@@ -338,6 +370,8 @@ def file_select_dialog(directory, file_pattern=None, comment=None, return_code=F
     # check if directory exists
     if not os.path.isdir(directory):
         logger.warning("Directory for .csv file with colony coordinates does not exist")
+    import pandas
+
     all_files = pandas.Series(listdir(directory))
     try:
         # find all filenames that match
@@ -7,8 +7,6 @@ Created on Jul 11, 2016
 @author: winfriedw
 """
 
-import matplotlib.pyplot as plt
-from tifffile import imsave
 import os
 
 # create logger
@@ -166,6 +164,8 @@ class ImageAICS:
         Output:
          none
         """
+        from tifffile import imsave
+
         data = self.get_data()
         imsave(path, data)
         self.add_meta({"aics_filePath": path})
@@ -185,6 +185,8 @@ class ImageAICS:
         Output:
          none
         """
+        import matplotlib.pyplot as plt
+
         fig, axes = plt.subplots(1, 2)
         fig.canvas.set_window_title(title)
         # display only the first slice for multidimensional images
@@ -0,0 +1,506 @@
+"""
+Write images to OME-TIFF files in background processes.
+A persistent pool of writer processes receives images through shared memory.
+The number of images waiting to be written is bounded to limit memory usage.
+"""
+
+import atexit
+import mmap
+import os
+import tempfile
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python 3.7: images are passed through memory-mapped temporary files
+    shared_memory = None
+
+import numpy as np
+
+from microscope_automation.util.automation_exceptions import IOError
+
+# create logger
+logger = logging.getLogger(__name__.split(".")[0])
+
+# number of writer processes
+NUMBER_WRITERS = 2
+# maximum number of images in shared memory that are queued or being written
+MAX_PENDING = 4
+# size of tiles in pyramidal OME-TIFF files in pixels,
+# pyramids are reduced by factor 2 per level until they fit into one tile
+PYRAMID_TILE_SIZE = 256
+# numpy data types with matching pixel type in OME-XML
+SUPPORTED_DTYPES = [
+    "int8",
+    "int16",
+    "int32",
+    "uint8",
+    "uint16",
+    "uint32",
+    "float32",
+    "float64",
+]
+
+################################################################################
+#
+# Memory blocks shared with writer processes
+#
+################################################################################
+
+
+class _FileBlock(object):
+    """Memory-mapped temporary file with the part of the interface of
+    multiprocessing.shared_memory.SharedMemory used by the writer pool.
+    Used if SharedMemory is not available (Python < 3.8).
+    """
+
+    def __init__(self, name=None, create=False, size=0):
+        """Create new block or attach to existing block.
+
+        Input:
+         name: path of file of existing block
+
+         create: if True create new block
+
+         size: size of new block in bytes
+
+        Output:
+         none
+        """
+        if create:
+            handle, name = tempfile.mkstemp(suffix=".image")
+            os.close(handle)
+            with open(name, "r+b") as new_file:
+                new_file.truncate(size)
+        self.name = name
+        with open(name, "r+b") as block_file:
+            self._mmap = mmap.mmap(block_file.fileno(), 0)
+        self.buf = memoryview(self._mmap)
+
+    def close(self):
+        """Release mapping of file."""
+        self.buf.release()
+        self._mmap.close()
+
+    def unlink(self):
+        """Delete file."""
+        os.remove(self.name)
+
+
+if shared_memory is not None:
+    _SharedBlock = shared_memory.SharedMemory
+else:
+    _SharedBlock = _FileBlock
+
+
+################################################################################
+#
+# Functions executed in writer processes
+#
+################################################################################
+
+
+def _write_ome_tiff(shared_memory_name, shape, dtype, file_path):
+    """Write image from shared memory block to OME-TIFF file.
+
+    Input:
+     shared_memory_name: name of shared memory block with image data
+
+     shape, dtype: shape and numpy data type of image
+
+     file_path: path to OME-TIFF file, existing files are overwritten
+
+    Output:
+     file_path: path to written file
+    """
+    from aicsimageio.writers import ome_tiff_writer
+
+    block = _SharedBlock(name=shared_memory_name)
+    try:
+        data = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        writer = ome_tiff_writer.OmeTiffWriter(file_path, overwrite_file=True)
+        writer.save(data)
+        # release view on buffer before block is closed
+        del data
+    finally:
+        block.close()
+    return file_path
+
+
+def downsample_level(data):
+    """Reduce size of image by factor 2 by averaging blocks of 2 x 2 pixels.
+
+    Input:
+     data: numpy array with image data (C, Y, X)
+
+    Output:
+     level: numpy array with half the number of pixels in x and y
+    """
+    size_y, size_x = data.shape[1] // 2, data.shape[2] // 2
+    # odd rows and columns at the border are dropped,
+    # adding strided views is much faster than mean over reshaped blocks
+    level = data[:, 0 : size_y * 2 : 2, 0 : size_x * 2 : 2].astype(np.float32)
+    level += data[:, 1 : size_y * 2 : 2, 0 : size_x * 2 : 2]
+    level += data[:, 0 : size_y * 2 : 2, 1 : size_x * 2 : 2]
+    level += data[:, 1 : size_y * 2 : 2, 1 : size_x * 2 : 2]
+    level *= 0.25
+    if np.issubdtype(data.dtype, np.integer):
+        np.rint(level, out=level)
+    return level.astype(data.dtype)
+
+
+def get_number_pyramid_levels(shape, tile_size=PYRAMID_TILE_SIZE):
+    """Number of reduced resolution levels until image fits into one tile.
+
+    Input:
+     shape: shape of image (C, Y, X)
+
+     tile_size: size of tiles in pixels
+
+    Output:
+     number_levels: number of levels in addition to full resolution
+    """
+    number_levels = 0
+    size = max(shape[-2:])
+    while size > tile_size:
+        size //= 2
+        number_levels += 1
+    return number_levels
+
+
+def _write_pyramid_tiff(shared_memory_name, shape, dtype, file_path, number_levels):
+    """Write image from shared memory block to tiled pyramidal OME-TIFF file.
+    Reduced resolution levels are stored as SubIFDs of the full resolution image.
+
+    Input:
+     shared_memory_name: name of shared memory block with image data
+
+     shape, dtype: shape (C, Y, X) and numpy data type of image
+
+     file_path: path to OME-TIFF file, existing files are overwritten
+
+     number_levels: number of reduced resolution levels.
+     None: reduce until image fits into one tile
+
+    Output:
+     file_path: path to written file
+    """
+    import tifffile
+
+    if number_levels is None:
+        number_levels = get_number_pyramid_levels(shape)
+    # smallest level has at least one pixel
+    number_levels = min(number_levels, int(np.log2(min(shape[-2:]))))
+    tile = (PYRAMID_TILE_SIZE, PYRAMID_TILE_SIZE)
+    block = _SharedBlock(name=shared_memory_name)
+    try:
+        data = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        with tifffile.TiffWriter(file_path, bigtiff=True, ome=True) as tif:
+            tif.write(data, subifds=number_levels, tile=tile, metadata={"axes": "CYX"})
+            level = data
+            for _ in range(number_levels):
+                level = downsample_level(level)
+                tif.write(level, subfiletype=1, tile=tile)
+        del data, level
+    finally:
+        block.close()
+    return file_path
+
+
+################################################################################
+#
+# Read pyramids
+#
+################################################################################
+
+
+def get_pyramid_shapes(file_path):
+    """Shapes of all resolution levels in pyramidal OME-TIFF file.
+
+    Input:
+     file_path: path to OME-TIFF file
+
+    Output:
+     shapes: list with shapes (C, Y, X), first entry is full resolution
+    """
+    import tifffile
+
+    with tifffile.TiffFile(file_path) as tif:
+        shapes = [level.shape for level in tif.series[0].levels]
+    # tifffile removes single channel dimension
+    return [(1,) + shape if len(shape) == 2 else shape for shape in shapes]
+
+
+def read_pyramid_level(file_path, level=0):
+    """Read one resolution level from pyramidal OME-TIFF file
+    without reading the full resolution image.
+
+    Input:
+     file_path: path to OME-TIFF file
+
+     level: resolution level, 0 is full resolution, each level is reduced by 2.
+     Levels above the coarsest level return the coarsest level.
+
+    Output:
+     data: numpy array with image data (C, Y, X)
+    """
+    import tifffile
+
+    with tifffile.TiffFile(file_path) as tif:
+        levels = tif.series[0].levels
+        data = levels[min(level, len(levels) - 1)].asarray()
+    if data.ndim == 2:
+        data = data[np.newaxis]
+    return data
+
+
+################################################################################
+#
+# Writer pool
+#
+################################################################################
+
+
+class ImageWriterPool(object):
+    """Persistent pool of processes that write images to OME-TIFF files."""
+
+    def __init__(self, number_writers=NUMBER_WRITERS, max_pending=MAX_PENDING):
+        """Create pool. Processes are started when first image is submitted.
+
+        Input:
+         number_writers: number of writer processes
+
+         max_pending: maximum number of images that are queued or being written.
+         submit blocks until an image is written if this number is reached.
+
+        Output:
+         none
+        """
+        self.number_writers = number_writers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pending_slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._all_written = threading.Condition(self._lock)
+        self._futures = set()
+        self._errors = []
+        self.number_written = 0
+
+    def _get_executor(self):
+        """Start writer processes on first use.
+
+        Input:
+         none
+
+        Output:
+         executor: ProcessPoolExecutor with writer processes
+        """
+        with self._lock:
+            if self._executor is None:
+                # spawn processes as on Windows, forking threads of the
+                # user interface is not safe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.number_writers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def submit(self, data, file_path, pyramid=False, pyramid_levels=None):
+        """Copy image into shared memory and queue it for writing.
+        Blocks if max_pending images are waiting to be written.
+
+        Input:
+         data: numpy array with image data.
+         Dimensions as expected by OmeTiffWriter.save (e.g. ZYX)
+         or (C, Y, X) for pyramids.
+
+         file_path: path to OME-TIFF file
+
+         pyramid: if True write tiled pyramidal OME-TIFF with reduced resolutions
+
+         pyramid_levels: number of reduced resolution levels.
+         None: reduce until image fits into one tile of PYRAMID_TILE_SIZE
+
+        Output:
+         none
+
+         Raises TypeError if data type cannot be stored in OME-TIFF file.
+         Raises IOError if an earlier image could not be written.
+        """
+        self.raise_errors()
+        data = np.asarray(data)
+        # fail before image is copied, errors in writer processes are reported late
+        if data.dtype.name not in SUPPORTED_DTYPES:
+            raise TypeError(
+                "Cannot write image with data type {} to {}".format(
+                    data.dtype, file_path
+                )
+            )
+        self._pending_slots.acquire()
+        block = None
+        try:
+            block = _SharedBlock(create=True, size=max(data.nbytes, 1))
+            np.copyto(np.ndarray(data.shape, dtype=data.dtype, buffer=block.buf), data)
+            arguments = [block.name, data.shape, data.dtype.str, file_path]
+            if pyramid:
+                future = self._get_executor().submit(
+                    _write_pyramid_tiff, *arguments, pyramid_levels
+                )
+            else:
+                future = self._get_executor().submit(_write_ome_tiff, *arguments)
+        except BaseException:
+            if block is not None:
+                block.close()
+                block.unlink()
+            self._pending_slots.release()
+            raise
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(lambda future: self._finish(future, block, file_path))
+
+    def _finish(self, future, block, file_path):
+        """Release shared memory and record errors after image was written.
+
+        Input:
+         future: future of write job
+
+         block: SharedMemory with image data
+
+         file_path: path to OME-TIFF file
+
+        Output:
+         none
+        """
+        block.close()
+        block.unlink()
+        with self._lock:
+            self._futures.discard(future)
+            if future.cancelled():
+                self._errors.append("{}: writing was cancelled".format(file_path))
+            elif future.exception() is not None:
+                if isinstance(future.exception(), BrokenProcessPool):
+                    # start new writer processes for next image
+                    self._executor = None
+                self._errors.append("{}: {}".format(file_path, future.exception()))
+                logger.error(
+                    "Could not write {}: {}".format(file_path, future.exception())
+                )
+            else:
+                self.number_written += 1
+            self._all_written.notify_all()
+        self._pending_slots.release()
+
+    def get_number_pending(self):
+        """Number of images that are queued or being written.
+
+        Input:
+         none
+
+        Output:
+         number_pending: number of images not written, yet
+        """
+        with self._lock:
+            return len(self._futures)
+
+    def raise_errors(self):
+        """Report images that could not be written since last call.
+
+        Input:
+         none
+
+        Output:
+         none
+
+         Raises IOError with list of failed files.
+        """
+        with self._lock:
+            errors = self._errors
+            self._errors = []
+        if errors:
+            raise IOError("Could not write images:\n{}".format("\n".join(errors)))
+
+    def flush(self):
+        """Wait until all submitted images are written.
+
+        Input:
+         none
+
+        Output:
+         none
+
+         Raises IOError if images could not be written.
+        """
+        with self._all_written:
+            self._all_written.wait_for(lambda: not self._futures)
+        self.raise_errors()
+
+    def close(self):
+        """Write all submitted images and stop writer processes.
+
+        Input:
+         none
+
+        Output:
+         none
+
+         Raises IOError if images could not be written.
+        """
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                executor = self._executor
+                self._executor = None
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+
+# pool used by tile_images, created on first use
+_writer_pool = None
+_writer_pool_lock = threading.Lock()
+
+
+def get_writer_pool():
+    """Retrieve shared writer pool, create pool if necessary.
+    Images are written before the program exits.
+
+    Input:
+     none
+
+    Output:
+     pool: object of class ImageWriterPool
+    """
+    global _writer_pool
+    with _writer_pool_lock:
+        if _writer_pool is None:
+            _writer_pool = ImageWriterPool()
+            atexit.register(_close_writer_pool)
+        return _writer_pool
+
+
+def flush_writer_pool():
+    """Wait until all images submitted to shared writer pool are written.
+
+    Input:
+     none
+
+    Output:
+     none
+
+     Raises IOError if images could not be written.
+    """
+    if _writer_pool is not None:
+        _writer_pool.flush()
+
+
+def _close_writer_pool():
+    """Write remaining images when program exits."""
+    try:
+        _writer_pool.close()
+    except IOError as error:
+        logger.error(error.message)
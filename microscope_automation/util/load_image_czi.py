@@ -30,7 +30,13 @@ class LoadImageCzi:
         # As for the ordering the microscope, camera, stage, and
         # automation software all have their versions of the
         # ordering. This ordering currently works best for image acquisition and tiling.
-        image_data = importer.get_image_data("XY")
+        # images acquired at multiple positions with one experiment
+        # store each position as separate scene
+        scene = image.get_meta("aics_scene")
+        if scene is None:
+            image_data = importer.get_image_data("XY")
+        else:
+            image_data = importer.get_image_data("XY", S=scene)
         image.add_data(image_data)
         if get_meta_data:
             meta = {}
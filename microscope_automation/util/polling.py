@@ -0,0 +1,317 @@
+"""
+Wait for hardware to reach a state without blocking a CPU core.
+The state is polled with increasing intervals until a deadline is reached
+or the wait is cancelled. The duration of all waits is collected in histograms.
+"""
+import bisect
+import threading
+import time
+import logging
+
+from microscope_automation.util.automation_exceptions import (
+    HardwareTimeoutError,
+    WaitCancelledError,
+)
+
+# create logger
+logger = logging.getLogger(__name__.split(".")[0])
+
+# default maximum time to wait for hardware in s
+DEFAULT_TIMEOUT = 120
+# first poll is immediate, following intervals grow from MIN_INTERVAL
+# by factor BACKOFF up to MAX_INTERVAL (all in s)
+MIN_INTERVAL = 0.005
+MAX_INTERVAL = 0.5
+BACKOFF = 1.5
+# upper edges of histogram bins in s, last bin collects all longer waits
+LATENCY_BIN_EDGES = [
+    0.001,
+    0.002,
+    0.005,
+    0.01,
+    0.02,
+    0.05,
+    0.1,
+    0.2,
+    0.5,
+    1,
+    2,
+    5,
+    10,
+    20,
+    50,
+    100,
+]
+
+
+################################################################################
+#
+# Latency statistics
+#
+################################################################################
+
+
+class LatencyHistogram(object):
+    """Histogram with duration of waits for one type of event."""
+
+    def __init__(self, name, bin_edges=LATENCY_BIN_EDGES):
+        """Create empty histogram.
+
+        Input:
+         name: name of event (e.g. 'wait_for_objective')
+
+         bin_edges: sorted list with upper edges of bins in s.
+         Last bin collects all latencies above last edge.
+
+        Output:
+         none
+        """
+        self.name = name
+        self.bin_edges = list(bin_edges)
+        self.counts = [0] * (len(self.bin_edges) + 1)
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.number_polls = 0
+        self.number_timeouts = 0
+        self.number_cancelled = 0
+        self._lock = threading.Lock()
+
+    def add(self, latency, number_polls=1):
+        """Add duration of successful wait.
+
+        Input:
+         latency: duration of wait in s
+
+         number_polls: number of times the state was checked
+
+        Output:
+         none
+        """
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bin_edges, latency)] += 1
+            self.total_time += latency
+            self.max_time = max(self.max_time, latency)
+            self.number_polls += number_polls
+
+    def add_timeout(self):
+        """Count wait that reached deadline.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        with self._lock:
+            self.number_timeouts += 1
+
+    def add_cancelled(self):
+        """Count wait that was cancelled.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        with self._lock:
+            self.number_cancelled += 1
+
+    def get_count(self):
+        """Number of successful waits.
+
+        Input:
+         none
+
+        Output:
+         count: number of waits added to histogram
+        """
+        return sum(self.counts)
+
+    def get_mean(self):
+        """Mean duration of successful waits.
+
+        Input:
+         none
+
+        Output:
+         mean: mean latency in s, None if histogram is empty
+        """
+        count = self.get_count()
+        if count == 0:
+            return None
+        return self.total_time / count
+
+    def get_percentile(self, percentile):
+        """Estimate percentile of latencies from histogram.
+
+        Input:
+         percentile: percentile between 0 and 100
+
+        Output:
+         latency: upper edge of bin that contains the percentile in s
+         (maximum latency for last bin), None if histogram is empty
+        """
+        count = self.get_count()
+        if count == 0:
+            return None
+        threshold = count * percentile / 100.0
+        cumulative = 0
+        for edge, bin_count in zip(self.bin_edges, self.counts):
+            cumulative += bin_count
+            if cumulative >= threshold and cumulative > 0:
+                return min(edge, self.max_time)
+        return self.max_time
+
+    def as_dict(self):
+        """Summary of histogram, e.g. for log files.
+
+        Input:
+         none
+
+        Output:
+         summary: dictionary with counts, mean, median, 95th percentile, and
+         maximum latency, and list with (bin upper edge, count)
+        """
+        return {
+            "Name": self.name,
+            "Count": self.get_count(),
+            "Timeouts": self.number_timeouts,
+            "Cancelled": self.number_cancelled,
+            "Polls": self.number_polls,
+            "Mean": self.get_mean(),
+            "Median": self.get_percentile(50),
+            "Percentile95": self.get_percentile(95),
+            "Max": self.max_time,
+            "Bins": list(zip(self.bin_edges + [float("inf")], self.counts)),
+        }
+
+
+# histograms for all waits by name of event
+_latency_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def get_latency_histogram(name):
+    """Retrieve histogram for event, create new histogram if necessary.
+
+    Input:
+     name: name of event (e.g. 'wait_for_objective')
+
+    Output:
+     histogram: object of class LatencyHistogram
+    """
+    with _histograms_lock:
+        if name not in _latency_histograms:
+            _latency_histograms[name] = LatencyHistogram(name)
+        return _latency_histograms[name]
+
+
+def get_latency_histograms():
+    """Retrieve histograms for all events.
+
+    Input:
+     none
+
+    Output:
+     histograms: dictionary {name: LatencyHistogram}
+    """
+    with _histograms_lock:
+        return dict(_latency_histograms)
+
+
+def reset_latency_histograms():
+    """Remove all collected latencies.
+
+    Input:
+     none
+
+    Output:
+     none
+    """
+    with _histograms_lock:
+        _latency_histograms.clear()
+
+
+################################################################################
+#
+# Wait functions
+#
+################################################################################
+
+
+def wait_until(
+    condition,
+    name="wait",
+    timeout=DEFAULT_TIMEOUT,
+    cancel_event=None,
+    min_interval=MIN_INTERVAL,
+    max_interval=MAX_INTERVAL,
+    backoff=BACKOFF,
+    error_component=None,
+):
+    """Poll condition until it is true.
+    The first poll is immediate, the interval between polls grows from min_interval
+    to max_interval. Fast events are detected quickly and slow events
+    do not keep the CPU and the hardware interface busy.
+
+    Input:
+     condition: function without arguments, waiting stops if it returns True
+
+     name: name of event used for latency histogram and error messages
+
+     timeout: maximum time to wait in s. None: wait without deadline
+     (Default: DEFAULT_TIMEOUT)
+
+     cancel_event: threading.Event, set event from other thread to stop waiting
+     (Default: None)
+
+     min_interval, max_interval: shortest and longest interval between polls in s
+
+     backoff: factor to increase interval after each poll
+
+     error_component: object that is waiting, added to exceptions (Default: None)
+
+    Output:
+     result: value returned by condition
+
+     Raises HardwareTimeoutError if condition was not true before timeout
+     and WaitCancelledError if cancel_event was set.
+    """
+    histogram = get_latency_histogram(name)
+    start_time = time.monotonic()
+    deadline = None if timeout is None else start_time + timeout
+    interval = min_interval
+    number_polls = 0
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            histogram.add_cancelled()
+            raise WaitCancelledError(
+                "Wait for {} was cancelled".format(name), error_component
+            )
+        result = condition()
+        number_polls += 1
+        now = time.monotonic()
+        if result:
+            histogram.add(now - start_time, number_polls)
+            logger.debug(
+                "Waited {:.3f} s for {} ({} polls)".format(
+                    now - start_time, name, number_polls
+                )
+            )
+            return result
+        if deadline is not None and now >= deadline:
+            histogram.add_timeout()
+            raise HardwareTimeoutError(
+                "Wait for {} timed out after {} s".format(name, timeout),
+                error_component,
+            )
+        sleep_time = interval
+        if deadline is not None:
+            sleep_time = min(sleep_time, deadline - now)
+        if cancel_event is None:
+            time.sleep(sleep_time)
+        else:
+            # wake up immediately when wait is cancelled
+            cancel_event.wait(sleep_time)
+        interval = min(interval * backoff, max_interval)
@@ -2,8 +2,12 @@
 
 @author: winfriedw
 """
+import os
 import pickle
+import struct
 import sys
+import uuid
+import zlib
 from microscope_automation.samples import samples
 from collections import OrderedDict
 
@@ -11,6 +15,18 @@ REFERENCE_OBJECT = "reference_object"
 NEXT_EXP_OBJECTS = "next_objects_dict"
 LAST_EXP_OBJECTS = "last_exp_objects_list"
 HARDWARE_STATUS = "hardware_status_dict"
+JOURNAL_GENERATION = "journal_generation"
+
+# Small changes are appended to a journal next to the recovery file,
+# the complete state is only written as snapshot after JOURNAL_LIMIT records
+# or when the sample object trees change.
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_LIMIT = 1000
+# journal record types
+RECORD_LAST_EXP_OBJECT = "last_exp_object"
+RECORD_HARDWARE_STATUS = "hardware_status"
+# each record is stored with its length and crc32 checksum
+RECORD_HEADER = struct.Struct("<II")
 
 
 # When pickling fails, this method prints out objects it pickled
@@ -39,6 +55,10 @@ class State(object):
         self.hardware_status_dict = {}  # If the objectives were already initialized
         self.recovery_file_path = recovery_file_path
 
+        # Content of last snapshot and journal to find changes
+        self.journal_limit = JOURNAL_LIMIT
+        self._reset_journal_tracking()
+
         # Kruft
         self.zen_instance = None
         self.ref_image = None
@@ -53,11 +73,81 @@ class State(object):
         Output:
          none
         """
-        self.save_state()
+        self.save_state(snapshot=True)
         sys.exit(0)
 
-    def save_state(self):
-        """Function to process the objects and save them by pickling.
+    def save_state(self, snapshot=False):
+        """Function to process the objects and save them.
+        Objects imaged and changes of the hardware status are appended to a journal.
+        The complete state is pickled as snapshot if next experiment objects
+        or the reference object changed or the journal is too long.
+
+        Input:
+         snapshot: if True, always pickle the complete state (Default: False)
+
+        Output:
+         none
+        """
+        try:
+            if snapshot or self._snapshot_required():
+                self._save_snapshot()
+            else:
+                self._save_journal_records()
+        except Exception:
+            print("State was NOT saved.")
+            # Start over with complete snapshot at next save
+            self._reset_journal_tracking()
+
+    def _reset_journal_tracking(self):
+        """Forget what was written to recovery file and journal.
+        Next save will write a complete snapshot.
+
+        Input:
+         none
+
+        Output:
+         none
+        """
+        self._journal_generation = None
+        self._journal_records = 0
+        self._saved_reference_object = None
+        self._saved_next_objects = None
+        self._saved_last_objects = 0
+        self._saved_hardware_status = None
+
+    def _next_objects_fingerprint(self):
+        """Identify content of next experiment objects without comparing objects.
+
+        Input:
+         none
+
+        Output:
+         fingerprint: list with (experiment name, list id, list length)
+        """
+        return [
+            (name, id(object_list), len(object_list))
+            for name, object_list in self.next_experiment_objects.items()
+        ]
+
+    def _snapshot_required(self):
+        """Test if changes can be saved in journal or a snapshot is needed.
+
+        Input:
+         none
+
+        Output:
+         required: True if complete state has to be saved
+        """
+        return (
+            self._journal_generation is None
+            or self._journal_records >= self.journal_limit
+            or self.reference_object is not self._saved_reference_object
+            or self._next_objects_fingerprint() != self._saved_next_objects
+            or len(self.last_experiment_objects) < self._saved_last_objects
+        )
+
+    def _save_snapshot(self):
+        """Pickle complete state to recovery file and start new journal.
 
         Input:
          none
@@ -67,23 +157,64 @@ class State(object):
         """
         pickle_dict = {}
         self.prune_object_dict()
-        pickle_dict[NEXT_EXP_OBJECTS] = self.next_experiment_objects
-        pickle_dict[REFERENCE_OBJECT] = self.reference_object
-        # No need to prune last experiment objects
-        # because it's just a list of names (string)
-        pickle_dict[LAST_EXP_OBJECTS] = self.last_experiment_objects
-        pickle_dict[HARDWARE_STATUS] = self.hardware_status_dict
-        # Generate the file name for the particular interrupt
         try:
-            with open(self.recovery_file_path, "wb") as f:
-                pickle.dump(pickle_dict, f, pickle.DEFAULT_PROTOCOL)
-                print("State was saved in the recovery file")
-                f.close()
-        except Exception:
-            print("State was NOT saved.")
+            # a new generation invalidates the records in the old journal,
+            # also if the journal was not truncated or the state was recovered
+            generation = uuid.uuid4().hex
+            pickle_dict[NEXT_EXP_OBJECTS] = self.next_experiment_objects
+            pickle_dict[REFERENCE_OBJECT] = self.reference_object
+            # No need to prune last experiment objects
+            # because it's just a list of names (string)
+            pickle_dict[LAST_EXP_OBJECTS] = self.last_experiment_objects
+            pickle_dict[HARDWARE_STATUS] = self.hardware_status_dict
+            pickle_dict[JOURNAL_GENERATION] = generation
+            _atomic_write(
+                self.recovery_file_path,
+                pickle.dumps(pickle_dict, pickle.DEFAULT_PROTOCOL),
+            )
+            _atomic_write(self.recovery_file_path + JOURNAL_SUFFIX, b"")
+            print("State was saved in the recovery file")
+        finally:
+            # Need to rehydrate the removed references
+            self.rehydrate_removed_references()
+
+        self._journal_generation = generation
+        self._journal_records = 0
+        self._saved_reference_object = self.reference_object
+        self._saved_next_objects = self._next_objects_fingerprint()
+        self._saved_last_objects = len(self.last_experiment_objects)
+        self._saved_hardware_status = copy_hardware_status(self.hardware_status_dict)
+
+    def _save_journal_records(self):
+        """Append changes since last save to journal.
 
-        # Need to rehydrate the removed references
-        self.rehydrate_removed_references()
+        Input:
+         none
+
+        Output:
+         none
+        """
+        records = [
+            (self._journal_generation, RECORD_LAST_EXP_OBJECT, name)
+            for name in self.last_experiment_objects[self._saved_last_objects :]
+        ]
+        if self.hardware_status_dict != self._saved_hardware_status:
+            hardware_status = copy_hardware_status(self.hardware_status_dict)
+            records.append(
+                (self._journal_generation, RECORD_HARDWARE_STATUS, hardware_status)
+            )
+        if not records:
+            return
+        with open(self.recovery_file_path + JOURNAL_SUFFIX, "ab") as f:
+            for record in records:
+                data = pickle.dumps(record, pickle.DEFAULT_PROTOCOL)
+                f.write(RECORD_HEADER.pack(len(data), zlib.crc32(data)) + data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._journal_records += len(records)
+        self._saved_last_objects = len(self.last_experiment_objects)
+        self._saved_hardware_status = copy_hardware_status(self.hardware_status_dict)
 
     def rehydrate_removed_references(self):
         """In case of auto save, we need the Zen object to be added back
@@ -194,7 +325,8 @@ class State(object):
 
     def recover_objects(self, file_path):
         """Function to return next objects dictionary
-        and the reference object by unpickling the file.
+        and the reference object by unpickling the file
+        and replaying the journal saved with it.
 
         Input:
          filepath: path to the pickled file
@@ -212,6 +344,22 @@ class State(object):
         self.reference_object = pickle_dict[REFERENCE_OBJECT]
         self.last_experiment_objects = pickle_dict[LAST_EXP_OBJECTS]
         self.hardware_status_dict = pickle_dict[HARDWARE_STATUS]
+
+        # Replay changes saved after snapshot.
+        # Recovery files without generation were saved without journal.
+        generation = pickle_dict.get(JOURNAL_GENERATION)
+        if generation is not None:
+            for record in read_journal(file_path + JOURNAL_SUFFIX):
+                record_generation, record_type, value = record
+                if record_generation != generation:
+                    continue
+                if record_type == RECORD_LAST_EXP_OBJECT:
+                    self.last_experiment_objects.append(value)
+                elif record_type == RECORD_HARDWARE_STATUS:
+                    self.hardware_status_dict = value
+
+        # Next save will write a complete snapshot
+        self._reset_journal_tracking()
         return (
             self.next_experiment_objects,
             self.reference_object,
@@ -230,3 +378,72 @@ class State(object):
          none
         """
         self.last_experiment_objects.append(exp_object_name)
+
+
+def copy_hardware_status(hardware_status_dict):
+    """Copy hardware status to detect later changes.
+
+    Input:
+     hardware_status_dict: dictionary with hardware status
+
+    Output:
+     hardware_status_copy: copy of dictionary, None if dictionary is None
+    """
+    if hardware_status_dict is None:
+        return None
+    return {
+        key: value.copy() if isinstance(value, dict) else value
+        for key, value in hardware_status_dict.items()
+    }
+
+
+def _atomic_write(file_path, data):
+    """Replace file with data. The file is either completely written or unchanged.
+
+    Input:
+     file_path: path to file
+
+     data: bytes to write
+
+    Output:
+     none
+    """
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, file_path)
+    # make rename durable
+    if hasattr(os, "O_DIRECTORY"):
+        directory = os.open(os.path.dirname(os.path.abspath(file_path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+def read_journal(journal_path):
+    """Read records from journal.
+    Reading stops at a record that was not completely written.
+
+    Input:
+     journal_path: path to journal file
+
+    Output:
+     records: list with tuples (generation, record_type, value)
+    """
+    records = []
+    if not os.path.exists(journal_path):
+        return records
+    with open(journal_path, "rb") as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            length, crc = RECORD_HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length or zlib.crc32(data) != crc:
+                break
+            records.append(pickle.loads(data))
+    return records